@@ -11,12 +11,6 @@ from crmApp.services.gemini_service import GeminiService
 
 service = GeminiService()
 
-# Create a mock user context
-user_context = {'user_id': 1, 'organization_id': 1, 'role': 'vendor', 'permissions': []}
-
-# Create tools
-tools = service._create_crm_tools(user_context)
-
 # Get all tool handlers
 print('=' * 70)
 print('ACTUALLY IMPLEMENTED TELEGRAM BOT FEATURES')
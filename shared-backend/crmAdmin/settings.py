@@ -69,6 +69,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'crmApp.middleware.OrganizationContextMiddleware',  # Organization context after auth
+    'crmApp.middleware.RealtimeBatchMiddleware',  # One Pusher batch per request, sent off-thread
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -100,9 +101,43 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Tests use a file too: the in-memory test database is shared-cache,
+        # which fails concurrent writers with "database table is locked"
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Cache Settings
+# RBAC permission sets, request contexts and presence are cached and invalidated
+# across processes (web workers, manage.py run_jobs, run_telegram_worker).
+# Set REDIS_URL to share the cache between them. CACHE_TABLE selects the
+# database cache instead (create it with: python manage.py createcachetable).
+# Otherwise each process has its own cache (LocMem), whose entries are only
+# kept for LOCAL_CACHE_MAX_TIMEOUT seconds.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_TABLE'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_TABLE'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+LOCAL_CACHE_MAX_TIMEOUT = int(os.getenv('LOCAL_CACHE_MAX_TIMEOUT', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -155,15 +190,24 @@ PUSHER_KEY = os.getenv('PUSHER_KEY', '5ea9fef4e6e142b94ac4')
 PUSHER_SECRET = os.getenv('PUSHER_SECRET', '4e0299e5aa14e5a4cf75')
 PUSHER_CLUSTER = os.getenv('PUSHER_CLUSTER', 'ap2')
 
+# Realtime Dispatcher Settings
+# Pusher events are batched per request and sent by background threads
+REALTIME_BACKEND = os.getenv('REALTIME_BACKEND', 'crmApp.services.realtime_dispatcher.PusherBackend')
+REALTIME_DISPATCH_ASYNC = os.getenv('REALTIME_DISPATCH_ASYNC', 'true').lower() == 'true'  # False = send when the request ends
+REALTIME_DISPATCH_WORKERS = int(os.getenv('REALTIME_DISPATCH_WORKERS', '2'))
+REALTIME_QUEUE_SIZE = int(os.getenv('REALTIME_QUEUE_SIZE', '1000'))  # Batches waiting before new ones are dropped
+REALTIME_BATCH_SIZE = int(os.getenv('REALTIME_BATCH_SIZE', '10'))  # Pusher accepts at most 10 events per batch call
+REALTIME_MAX_RETRIES = int(os.getenv('REALTIME_MAX_RETRIES', '3'))
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # JWT authentication (primary)
-        'rest_framework.authentication.TokenAuthentication',  # Legacy token support (fallback)
-        'rest_framework.authentication.SessionAuthentication',  # For browsable API
+        'crmApp.authentication.ContextJWTAuthentication',  # JWT authentication (primary)
+        'crmApp.authentication.ContextTokenAuthentication',  # Legacy token support (fallback)
+        'crmApp.authentication.ContextSessionAuthentication',  # For browsable API
     ],
     'DEFAULT_PAGINATION_CLASS': 'crmApp.pagination.StandardResultsSetPagination',
     'PAGE_SIZE': 25,
@@ -307,11 +351,32 @@ LOGGING = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Outbound HTTP Settings
+# Shared clients for third-party APIs (crmApp.services.http_client): one keep-alive pool per integration
+HTTP_CLIENT_POOL_SIZE = int(os.getenv('HTTP_CLIENT_POOL_SIZE', '10'))  # Connections kept per host
+HTTP_CLIENT_TIMEOUT = float(os.getenv('HTTP_CLIENT_TIMEOUT', '10'))  # Default read timeout (seconds)
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv('HTTP_CLIENT_CONNECT_TIMEOUT', '5'))
+HTTP_CLIENT_MAX_RETRIES = int(os.getenv('HTTP_CLIENT_MAX_RETRIES', '2'))  # Retries of connection errors and 502/503/504
+HTTP_CLIENT_BACKOFF = float(os.getenv('HTTP_CLIENT_BACKOFF', '0.5'))  # Base of the jittered exponential backoff (seconds)
+# Consecutive failures that open an integration's circuit, and seconds before it is tried again
+HTTP_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('HTTP_CIRCUIT_FAILURE_THRESHOLD', '5'))
+HTTP_CIRCUIT_RESET_TIMEOUT = float(os.getenv('HTTP_CIRCUIT_RESET_TIMEOUT', '30'))
+
 # Linear Integration Settings
 # Note: os and dotenv already imported at the top
 LINEAR_API_KEY = os.getenv('LINEAR_API_KEY', '')
 LINEAR_WEBHOOK_SECRET = os.getenv('LINEAR_WEBHOOK_SECRET', '')
 LINEAR_TEAM_ID = os.getenv('LINEAR_TEAM_ID', 'b95250db-8430-4dbc-88f8-9fc109369df0')  # Default team for new organizations
+LINEAR_API_URL = os.getenv('LINEAR_API_URL', 'https://api.linear.app/graphql')
+LINEAR_TEAM_CACHE_TIMEOUT = int(os.getenv('LINEAR_TEAM_CACHE_TIMEOUT', '300'))  # Seconds team workflow states are cached
+LINEAR_MAX_RETRIES = int(os.getenv('LINEAR_MAX_RETRIES', '3'))  # Retries of rate-limited requests
+# Bulk sync: mutations per GraphQL request and requests in flight
+LINEAR_SYNC_BATCH_SIZE = int(os.getenv('LINEAR_SYNC_BATCH_SIZE', '10'))
+LINEAR_SYNC_CONCURRENCY = int(os.getenv('LINEAR_SYNC_CONCURRENCY', '3'))
+LINEAR_SYNC_WORKER_MODE = os.getenv('LINEAR_SYNC_WORKER_MODE', 'thread')  # 'thread' or 'inline'
+LINEAR_SYNC_JOB_WORKERS = int(os.getenv('LINEAR_SYNC_JOB_WORKERS', '2'))
+# Days processed webhook delivery ids are kept for deduplication (pruned by manage.py pull_linear_changes)
+LINEAR_WEBHOOK_DEDUP_DAYS = int(os.getenv('LINEAR_WEBHOOK_DEDUP_DAYS', '7'))
 
 # 8x8 Video (Jitsi) Integration Settings
 JITSI_8X8_APP_ID = os.getenv('JITSI_8X8_APP_ID', '')  # Your 8x8 AppID
@@ -324,10 +389,31 @@ JITSI_USE_PUBLIC_SERVER = os.getenv('JITSI_USE_PUBLIC_SERVER', 'false')  # Force
 
 # Gemini AI Integration Settings
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
+# Maximum rounds of function calls per chat message before Gemini must answer in text
+GEMINI_MAX_TOOL_ROUNDS = int(os.getenv('GEMINI_MAX_TOOL_ROUNDS', '5'))
+# Idle genai clients kept per API key for reuse across requests
+GEMINI_CLIENT_POOL_SIZE = int(os.getenv('GEMINI_CLIENT_POOL_SIZE', '8'))
+# Earlier turns sent with each chat message: at most this many, within a
+# rough token budget (about 4 characters per token)
+GEMINI_HISTORY_MAX_TURNS = int(os.getenv('GEMINI_HISTORY_MAX_TURNS', '20'))
+GEMINI_HISTORY_TOKEN_BUDGET = int(os.getenv('GEMINI_HISTORY_TOKEN_BUDGET', '8000'))
+# Turns that fall out of that window are kept as truncated lines in a rolling summary of at most this many tokens
+GEMINI_SUMMARY_TOKEN_BUDGET = int(os.getenv('GEMINI_SUMMARY_TOKEN_BUDGET', '500'))
 
 # Telegram Bot Integration Settings
 TG_BOT_TOKEN = os.getenv('TG_BOT_TOKEN', '')
 TG_WEBHOOK_SECRET = os.getenv('TG_WEBHOOK_SECRET', '')
+# Who processes webhook updates: 'thread' (workers in the web process, which pick up
+# stored updates with its first request), 'external' (manage.py run_telegram_worker)
+# or 'inline' (synchronously, for tests)
+TELEGRAM_WORKER_MODE = os.getenv('TELEGRAM_WORKER_MODE', 'thread')
+TELEGRAM_WORKER_THREADS = int(os.getenv('TELEGRAM_WORKER_THREADS', '4'))
+# Seconds after which an update still marked processing is treated as left behind by a crashed worker
+TELEGRAM_UPDATE_STALE_AFTER = int(os.getenv('TELEGRAM_UPDATE_STALE_AFTER', '300'))
+# Updates a single chat may have waiting before further ones are dropped
+TELEGRAM_CHAT_BACKLOG_LIMIT = int(os.getenv('TELEGRAM_CHAT_BACKLOG_LIMIT', '5'))
+# Minimum seconds between edits of a streamed reply (Telegram rate-limits edits)
+TELEGRAM_STREAM_EDIT_INTERVAL = float(os.getenv('TELEGRAM_STREAM_EDIT_INTERVAL', '1.5'))
 
 # Django Channels Configuration (WebSocket support for video calls)
 ASGI_APPLICATION = 'crmAdmin.asgi.application'
@@ -342,11 +428,45 @@ CHANNEL_LAYERS = {
         # },
     }
 }
+
+# Presence Settings
+# Users are online while WebSocket pings / heartbeats keep their cache entry alive.
+# Needs the shared cache (see Cache Settings); with a per-process cache presence stays in the database.
+PRESENCE_TTL_SECONDS = int(os.getenv('PRESENCE_TTL_SECONDS', '90'))  # Clients ping/heartbeat every 30s
 # MCP Server Settings
 MCP_SERVER_TITLE = os.getenv('MCP_SERVER_TITLE', 'Too Good CRM MCP Server')
 MCP_SERVER_INSTRUCTIONS = os.getenv('MCP_SERVER_INSTRUCTIONS', 'A Django-based CRM MCP server for managing customer relationships, orders, activities, and issues.')
 MCP_SERVER_VERSION = os.getenv('MCP_SERVER_VERSION', '1.0.0')
 
+# Request Context Settings
+# Resolved profile/organization context is shared across requests for this many seconds (0 = per request only)
+REQUEST_CONTEXT_CACHE_TIMEOUT = int(os.getenv('REQUEST_CONTEXT_CACHE_TIMEOUT', '60'))
+
+# Audit Log Writer Settings
+# Audit entries are buffered and bulk-written after commit by a background thread
+AUDIT_LOG_ASYNC = os.getenv('AUDIT_LOG_ASYNC', 'true').lower() == 'true'  # False = flush right after commit
+AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', '200'))  # Max entries per bulk_create
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv('AUDIT_LOG_FLUSH_INTERVAL', '0.5'))  # Seconds between background flushes
+
+# Background Job Queue Settings
+# Slow side effects (Linear sync, SMS, call activities) run as jobs stored in the database.
+# Who runs them: 'thread' (worker in the web process, started by its first request),
+# 'external' (manage.py run_jobs) or 'inline' (tests)
+JOB_QUEUE_MODE = os.getenv('JOB_QUEUE_MODE', 'thread')
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv('JOB_QUEUE_POLL_INTERVAL', '1.0'))  # Seconds between polls for due jobs
+JOB_QUEUE_DEFAULT_CONCURRENCY = int(os.getenv('JOB_QUEUE_DEFAULT_CONCURRENCY', '2'))
+# Jobs of a queue running at once per worker
+JOB_QUEUE_CONCURRENCY = {
+    'default': int(os.getenv('JOB_QUEUE_DEFAULT_QUEUE_CONCURRENCY', '4')),
+    'linear': int(os.getenv('JOB_QUEUE_LINEAR_CONCURRENCY', '2')),
+    'sms': int(os.getenv('JOB_QUEUE_SMS_CONCURRENCY', '2')),
+}
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', '5'))  # Then the job is dead-lettered
+JOB_QUEUE_RETRY_BACKOFF = float(os.getenv('JOB_QUEUE_RETRY_BACKOFF', '10'))  # Seconds, doubled per attempt (jittered)
+JOB_QUEUE_RETRY_BACKOFF_MAX = float(os.getenv('JOB_QUEUE_RETRY_BACKOFF_MAX', '3600'))
+JOB_QUEUE_RETENTION_DAYS = int(os.getenv('JOB_QUEUE_RETENTION_DAYS', '7'))  # Succeeded jobs are pruned after this
+JOB_QUEUE_STALE_AFTER = int(os.getenv('JOB_QUEUE_STALE_AFTER', '600'))  # Seconds; longer-running jobs are requeued (crashed worker)
+
 # Security Settings (for production)
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
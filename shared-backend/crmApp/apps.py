@@ -7,6 +7,16 @@ class CrmappConfig(AppConfig):
     
     def ready(self):
         """
-        Import signal handlers when app is ready.
+        Import signal handlers when app is ready, and start the background
+        job worker and the Telegram update recovery with the first request.
         """
-        import crmApp.signals.audit_signals  # noqa: F401
\ No newline at end of file
+        import crmApp.signals.audit_signals  # noqa: F401
+        import crmApp.signals.rbac_signals  # noqa: F401
+        import crmApp.signals.analytics_signals  # noqa: F401
+        import crmApp.signals.context_signals  # noqa: F401
+        import crmApp.signals.search_signals  # noqa: F401
+        
+        from crmApp.services.job_queue import start_worker_on_first_request
+        from crmApp.services.telegram_update_queue import recover_on_first_request
+        start_worker_on_first_request()
+        recover_on_first_request()
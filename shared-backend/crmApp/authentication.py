@@ -0,0 +1,37 @@
+"""
+DRF authentication classes that attach the request context.
+
+Token-authenticated requests reach OrganizationContextMiddleware as
+anonymous, so the profile/organization context is resolved here instead,
+once, right after DRF authenticates the user.
+"""
+
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from crmApp.utils.request_context import RequestContext
+
+
+class RequestContextMixin:
+    """Resolve RequestContext for the authenticated user and expose it on request.user."""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user = result[0]
+            context = RequestContext.for_user(user)
+            if context is not None:
+                context.apply(user)
+        return result
+
+
+class ContextJWTAuthentication(RequestContextMixin, JWTAuthentication):
+    """JWT authentication (primary) with request context."""
+
+
+class ContextTokenAuthentication(RequestContextMixin, TokenAuthentication):
+    """Legacy token authentication with request context."""
+
+
+class ContextSessionAuthentication(RequestContextMixin, SessionAuthentication):
+    """Session authentication (browsable API) with request context."""
@@ -1,6 +1,7 @@
 """
 WebSocket Consumer for Video Call Notifications
-Provides real-time updates for Jitsi video calls without Pusher
+Provides real-time updates for Jitsi video calls without Pusher.
+The connection also drives the user's presence (see PresenceService).
 """
 import json
 import logging
@@ -8,6 +9,8 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 
+from crmApp.services.presence_service import PresenceService
+
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
@@ -16,8 +19,12 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time video call notifications
     Each user connects to their private channel: video_call_{user_id}
+    and to the presence group of each of their organizations
     """
     
+    presence_groups = []
+    presence_connected = False
+    
     async def connect(self):
         """Handle WebSocket connection"""
         try:
@@ -45,6 +52,13 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             
             logger.info(f"[WebSocket] User {self.user_id} connected successfully to {self.room_group_name}")
             
+            # Subscribe to organization presence and come online
+            self.presence_groups = await database_sync_to_async(PresenceService.organization_groups)(int(self.user_id))
+            for group_name in self.presence_groups:
+                await self.channel_layer.group_add(group_name, self.channel_name)
+            await database_sync_to_async(PresenceService.connect)(int(self.user_id))
+            self.presence_connected = True
+            
         except Exception as e:
             logger.error(f"[WebSocket] Connection error: {e}")
             await self.close()
@@ -60,6 +74,11 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             
+            for group_name in self.presence_groups:
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+            if self.presence_connected:
+                await database_sync_to_async(PresenceService.disconnect)(int(self.user_id))
+            
         except Exception as e:
             logger.error(f"[WebSocket] Disconnect error: {e}")
     
@@ -68,8 +87,9 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
         try:
             data = json.loads(text_data)
             
-            # Handle ping for keep-alive
+            # Handle ping for keep-alive (also keeps the user online)
             if data.get('type') == 'ping':
+                await database_sync_to_async(PresenceService.ping)(int(self.user_id))
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'timestamp': data.get('timestamp')
@@ -90,3 +110,15 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             
         except Exception as e:
             logger.error(f"[WebSocket] Send error: {e}")
+    
+    async def presence_event(self, event):
+        """
+        Handle presence changes of organization members from channel layer
+        """
+        try:
+            await self.send(text_data=json.dumps({
+                'type': 'presence',
+                **event['data']
+            }))
+        except Exception as e:
+            logger.error(f"[WebSocket] Presence send error: {e}")
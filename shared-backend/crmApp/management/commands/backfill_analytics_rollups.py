@@ -0,0 +1,100 @@
+"""
+Management command to backfill and reconcile the daily analytics rollups
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from crmApp.models import Organization
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Backfill (or check) the daily analytics rollups from the raw Lead/Deal/Customer/Activity tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization-id',
+            type=int,
+            help='Process a specific organization only',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only rebuild days on or after this date (YYYY-MM-DD); default is the full history',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Report drift between stored rollups and the raw tables without writing',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='With --check, rebuild organizations that show drift or were invalidated',
+        )
+
+    def handle(self, *args, **options):
+        organization_id = options.get('organization_id')
+        check = options.get('check', False)
+        fix = options.get('fix', False)
+
+        since = None
+        if options.get('since'):
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+
+        if organization_id:
+            organizations = Organization.objects.filter(id=organization_id)
+            if not organizations.exists():
+                raise CommandError(f'Organization with ID {organization_id} not found')
+        else:
+            organizations = Organization.objects.all()
+
+        total_buckets = 0
+        drifted = 0
+
+        for organization in organizations.order_by('id'):
+            if check:
+                drift = AnalyticsRollupService.find_drift(organization.id, since)
+                invalidated = AnalyticsRollupService.needs_rebuild(organization.id)
+                if not drift and not invalidated:
+                    self.stdout.write(f"  {organization.name} (ID: {organization.id}): in sync")
+                    continue
+
+                drifted += 1
+                if invalidated:
+                    self.stdout.write(self.style.WARNING(
+                        f"  {organization.name} (ID: {organization.id}): invalidated by a failed update"
+                    ))
+                if drift:
+                    self.stdout.write(self.style.WARNING(
+                        f"  {organization.name} (ID: {organization.id}): {len(drift)} bucket(s) drifted"
+                    ))
+                for item in drift[:20]:
+                    _, day, metric, dimension, dimension_value = item['bucket']
+                    self.stdout.write(
+                        f"    {day} {metric}/{dimension}={dimension_value or '-'}: "
+                        f"stored {item['stored']} expected {item['expected']}"
+                    )
+                if len(drift) > 20:
+                    self.stdout.write(f"    ... {len(drift) - 20} more")
+
+                if not fix:
+                    continue
+
+            buckets = AnalyticsRollupService.rebuild(organization.id, since)
+            total_buckets += buckets
+            self.stdout.write(self.style.SUCCESS(
+                f"  ✓ {organization.name} (ID: {organization.id}): {buckets} bucket(s) rebuilt"
+            ))
+
+        if check:
+            summary = f'{drifted} organization(s) with drift'
+            self.stdout.write(self.style.WARNING(summary) if drifted else self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'\nRebuilt {total_buckets} rollup bucket(s)'))
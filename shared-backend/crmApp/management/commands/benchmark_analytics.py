@@ -0,0 +1,269 @@
+"""
+Management command to benchmark analytics queries
+Seeds a throwaway organization with leads/deals/audit logs and compares the
+per-choice count() implementations with the grouped AnalyticsService queries.
+All seeded data is rolled back when the command finishes.
+"""
+
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from crmApp.models import (
+    AuditLog, Customer, Deal, Lead, Organization, Pipeline, PipelineStage,
+)
+from crmApp.services import AnalyticsService
+
+
+# Legacy implementations (one count()/aggregate() per status, source, choice or stage)
+
+def legacy_lead_stats(queryset):
+    total = queryset.count()
+    converted = queryset.filter(is_converted=True).count()
+    stats = {
+        'totalLeads': total,
+        'statusCounts': {
+            status: queryset.filter(qualification_status=status).count()
+            for status in ['new', 'contacted', 'qualified', 'unqualified', 'lost']
+        },
+        'by_source': {},
+    }
+    stats['statusCounts']['converted'] = converted
+    for source in queryset.values_list('source', flat=True).distinct():
+        stats['by_source'][source] = queryset.filter(source=source).count()
+    return stats
+
+
+def legacy_deal_stats(queryset):
+    return {
+        'total_deals': queryset.count(),
+        'total_value': queryset.aggregate(total=Sum('value'))['total'],
+        'expected_revenue': queryset.aggregate(total=Sum('expected_revenue'))['total'],
+        'won': queryset.filter(is_won=True).count(),
+        'lost': queryset.filter(is_lost=True).count(),
+        'open': queryset.filter(is_won=False, is_lost=False).count(),
+        'by_priority': {
+            priority: queryset.filter(priority=priority).count()
+            for priority, _ in Deal.PRIORITY_CHOICES
+        },
+    }
+
+
+def legacy_sales_funnel(organization_ids, start_date, end_date):
+    deals = Deal.objects.filter(
+        organization_id__in=organization_ids,
+        created_at__gte=start_date,
+        created_at__lte=end_date
+    )
+    funnel = []
+    for stage in PipelineStage.objects.filter(
+        pipeline__organization_id__in=organization_ids,
+        pipeline__is_active=True
+    ).order_by('order'):
+        stage_deals = deals.filter(stage=stage)
+        funnel.append({
+            'stage': stage.name,
+            'count': stage_deals.count(),
+            'value': stage_deals.aggregate(total=Sum('value'))['total'] or 0,
+        })
+    return funnel
+
+
+def legacy_dashboard_stats(organization_ids):
+    deals = Deal.objects.filter(organization_id__in=organization_ids)
+    won_deals = deals.filter(is_won=True)
+    return {
+        'total_customers': Customer.objects.filter(organization_id__in=organization_ids).count(),
+        'total_leads': Lead.objects.filter(organization_id__in=organization_ids).count(),
+        'total_deals': deals.count(),
+        'won_deals_count': won_deals.count(),
+        'lost_deals_count': deals.filter(is_lost=True, is_won=False).count(),
+        'total_revenue': won_deals.aggregate(total=Sum('value'))['total'] or 0,
+        'active_deals_value': deals.filter(is_won=False, is_lost=False).aggregate(
+            total=Sum('value')
+        )['total'] or 0,
+    }
+
+
+def legacy_audit_log_stats(queryset):
+    last_24h = timezone.now() - timedelta(hours=24)
+    return {
+        'total_logs': queryset.count(),
+        'recent_activity_24h': queryset.filter(created_at__gte=last_24h).count(),
+        'by_action': {
+            action: queryset.filter(action=action).count()
+            for action, _ in AuditLog.ACTION_CHOICES
+        },
+        'by_resource': {
+            resource: queryset.filter(resource_type=resource).count()
+            for resource, _ in AuditLog.RESOURCE_TYPE_CHOICES
+        },
+        'by_profile_type': {
+            profile_type: queryset.filter(user_profile_type=profile_type).count()
+            for profile_type in ['vendor', 'employee', 'customer']
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark analytics/stats queries: legacy per-choice counts vs grouped aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--leads',
+            type=int,
+            default=50000,
+            help='Number of leads to seed (default: 50000)',
+        )
+        parser.add_argument(
+            '--deals',
+            type=int,
+            default=50000,
+            help='Number of deals to seed (default: 50000)',
+        )
+        parser.add_argument(
+            '--audit-logs',
+            type=int,
+            default=20000,
+            help='Number of audit log entries to seed (default: 20000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of timed runs per implementation (best run is reported)',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            organization = self.seed(options['leads'], options['deals'], options['audit_logs'])
+            self.run_benchmarks(organization, options['repeat'])
+            # Never keep benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('\nSeeded data rolled back.'))
+
+    def seed(self, lead_count, deal_count, audit_log_count):
+        """Bulk-create benchmark data (bypasses signals)."""
+        self.stdout.write(f'Seeding {lead_count} leads, {deal_count} deals, {audit_log_count} audit logs...')
+        rng = random.Random(42)
+
+        suffix = int(time.time())
+        organization = Organization.objects.create(
+            name=f'Analytics Benchmark {suffix}',
+            slug=f'analytics-benchmark-{suffix}'
+        )
+        pipeline = Pipeline.objects.create(organization=organization, name='Benchmark Pipeline')
+        stages = [
+            PipelineStage.objects.create(pipeline=pipeline, name=name, order=order)
+            for order, name in enumerate(['Prospect', 'Qualified', 'Proposal', 'Negotiation', 'Won', 'Lost'])
+        ]
+
+        sources = [choice for choice, _ in Lead.LEAD_SOURCE_CHOICES]
+        statuses = [choice for choice, _ in Lead.QUALIFICATION_STATUS_CHOICES]
+        Lead.objects.bulk_create([
+            Lead(
+                organization=organization,
+                name=f'Lead {i}',
+                email=f'lead{i}@benchmark.test',
+                source=rng.choice(sources),
+                qualification_status=rng.choice(statuses),
+                lead_score=rng.randint(0, 100),
+                estimated_value=Decimal(rng.randint(100, 100000)),
+                is_converted=rng.random() < 0.1,
+            )
+            for i in range(lead_count)
+        ], batch_size=2000)
+
+        priorities = [choice for choice, _ in Deal.PRIORITY_CHOICES]
+        deals = []
+        for i in range(deal_count):
+            outcome = rng.random()
+            deals.append(Deal(
+                organization=organization,
+                title=f'Deal {i}',
+                pipeline=pipeline,
+                stage=rng.choice(stages),
+                value=Decimal(rng.randint(100, 100000)),
+                priority=rng.choice(priorities),
+                is_won=outcome < 0.2,
+                is_lost=0.2 <= outcome < 0.35,
+            ))
+        Deal.objects.bulk_create(deals, batch_size=2000)
+
+        actions = [choice for choice, _ in AuditLog.ACTION_CHOICES]
+        resources = [choice for choice, _ in AuditLog.RESOURCE_TYPE_CHOICES]
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                organization=organization,
+                user_email='benchmark@benchmark.test',
+                user_profile_type=rng.choice(['vendor', 'employee', 'customer']),
+                action=rng.choice(actions),
+                resource_type=rng.choice(resources),
+                description='Benchmark entry',
+            )
+            for _ in range(audit_log_count)
+        ], batch_size=2000)
+
+        return organization
+
+    def measure(self, func, repeat):
+        """Return (query_count, best_wall_time_ms) for func."""
+        best = None
+        query_count = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                func()
+                elapsed = (time.perf_counter() - started) * 1000
+            query_count = len(queries)
+            best = elapsed if best is None else min(best, elapsed)
+        return query_count, best
+
+    def run_benchmarks(self, organization, repeat):
+        org_ids = [organization.id]
+        start_date = timezone.now() - timedelta(days=30)
+        end_date = timezone.now() + timedelta(minutes=1)
+        leads = Lead.objects.filter(organization_id__in=org_ids)
+        deals = Deal.objects.filter(organization_id__in=org_ids)
+        audit_logs = AuditLog.objects.filter(organization_id__in=org_ids)
+
+        cases = [
+            ('lead stats',
+             lambda: legacy_lead_stats(leads),
+             lambda: AnalyticsService.lead_stats(leads)),
+            ('deal stats',
+             lambda: legacy_deal_stats(deals),
+             lambda: AnalyticsService.deal_stats(deals)),
+            ('sales funnel',
+             lambda: legacy_sales_funnel(org_ids, start_date, end_date),
+             lambda: AnalyticsService.sales_funnel(org_ids, start_date, end_date)),
+            ('dashboard totals',
+             lambda: legacy_dashboard_stats(org_ids),
+             lambda: (
+                 Customer.objects.filter(organization_id__in=org_ids).count(),
+                 Lead.objects.filter(organization_id__in=org_ids).count(),
+                 AnalyticsService.deal_totals(org_ids),
+             )),
+            ('audit log stats',
+             lambda: legacy_audit_log_stats(audit_logs),
+             lambda: AnalyticsService.audit_log_stats(audit_logs)),
+        ]
+
+        self.stdout.write('')
+        self.stdout.write(f'{"endpoint":<20}{"queries before":>16}{"queries after":>15}{"ms before":>12}{"ms after":>12}')
+        self.stdout.write('-' * 75)
+        for name, legacy, grouped in cases:
+            legacy_queries, legacy_ms = self.measure(legacy, repeat)
+            grouped_queries, grouped_ms = self.measure(grouped, repeat)
+            self.stdout.write(
+                f'{name:<20}{legacy_queries:>16}{grouped_queries:>15}'
+                f'{legacy_ms:>12.1f}{grouped_ms:>12.1f}'
+            )
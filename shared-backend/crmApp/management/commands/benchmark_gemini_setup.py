@@ -0,0 +1,106 @@
+"""
+Management command to benchmark the per-request setup cost of a Gemini chat
+Compares what chat_stream used to do before streaming the first token
+(new genai.Client, freshly built tool declarations, freshly rendered system
+prompt) with the pooled client, shared declarations and cached prompt.
+Timings are steady state (after a warm-up pass over the same requests).
+No request is sent to Gemini and no database access is needed.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from google import genai
+from google.genai import types
+
+from crmApp.services.gemini_service import GeminiClientPool, GeminiService
+from crmApp.services.gemini_tools import CRM_TOOLS, FUNCTION_DECLARATIONS, CRMToolContext
+from crmApp.services.prompt_builder import render_system_prompt
+
+
+def sample_user_context(index):
+    return {
+        'user_id': index % 50,
+        'organization_id': index % 5,
+        'role': ('vendor', 'employee', 'customer')[index % 3],
+        'permissions': [f'resource{n}:read' for n in range(index % 3 * 10)],
+        'is_superuser': False,
+        'is_staff': False,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-request Gemini setup: new client/tools/prompt vs pooled and cached'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Number of simulated chat requests per implementation (default: 50)',
+        )
+
+    def handle(self, *args, **options):
+        request_count = options['requests']
+        service = GeminiService()
+        api_key = service.api_key or 'benchmark-key'
+        pool = GeminiClientPool()
+
+        # Legacy: everything built from scratch for every message
+        def legacy_client(index):
+            genai.Client(api_key=api_key)
+
+        def legacy_tools(index):
+            # Stands in for re-running the declaration/closure builder
+            declarations = [declaration.model_copy(deep=True) for declaration in FUNCTION_DECLARATIONS]
+            [types.Tool(function_declarations=declarations)]
+
+        def legacy_prompt(index):
+            context = sample_user_context(index)
+            render_system_prompt(context['role'], context['organization_id'], context['user_id'], len(context['permissions']))
+
+        # Current: pooled client, shared declarations, cached prompts
+        def pooled_client(index):
+            pool.release(api_key, pool.acquire(api_key))
+
+        def shared_tools(index):
+            CRMToolContext(sample_user_context(index))
+            CRM_TOOLS
+
+        def cached_prompt(index):
+            service._build_system_prompt(sample_user_context(index))
+
+        cases = [
+            ('client', legacy_client, pooled_client),
+            ('tool declarations', legacy_tools, shared_tools),
+            ('system prompt', legacy_prompt, cached_prompt),
+        ]
+
+        self.stdout.write(f'\nSimulating {request_count} chat requests...\n')
+        self.stdout.write(f'{"setup step":<20}{"ms before":>12}{"ms after":>12}{"speedup":>10}')
+        self.stdout.write('-' * 54)
+        total_before = total_after = 0.0
+        for name, legacy, current in cases:
+            before = self.measure(legacy, request_count)
+            after = self.measure(current, request_count)
+            total_before += before
+            total_after += after
+            self.stdout.write(f'{name:<20}{before:>12.3f}{after:>12.3f}{self.speedup(before, after):>10}')
+        self.stdout.write('-' * 54)
+        self.stdout.write(
+            f'{"per request":<20}{total_before:>12.3f}{total_after:>12.3f}'
+            f'{self.speedup(total_before, total_after):>10}'
+        )
+
+    def measure(self, func, request_count):
+        """Mean wall time per request in milliseconds, after one warm-up pass."""
+        for index in range(request_count):
+            func(index)
+        started = time.perf_counter()
+        for index in range(request_count):
+            func(index)
+        return (time.perf_counter() - started) * 1000 / request_count
+
+    @staticmethod
+    def speedup(before, after):
+        return f'{before / after:.0f}x' if after else '-'
@@ -0,0 +1,125 @@
+"""
+Management command to benchmark search lookups
+Seeds a throwaway organization with leads, builds its search index and
+compares the OR'd __icontains filters with SearchIndexService.search for a
+set of typed-as-you-go queries. All seeded data is rolled back when the
+command finishes.
+"""
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from crmApp.models import Lead, Organization, SearchToken
+from crmApp.services.search_index_service import SearchIndexService
+
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Grace', 'Linus', 'Margaret', 'Dennis', 'Barbara', 'Ken', 'Frances', 'Edsger',
+    'Radia', 'Donald', 'Hedy', 'Tim', 'Katherine', 'John', 'Shafi', 'Niklaus', 'Sophie', 'Bjarne',
+]
+LAST_NAMES = [
+    'Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Hamilton', 'Ritchie', 'Liskov', 'Thompson', 'Allen',
+    'Dijkstra', 'Perlman', 'Knuth', 'Lamarr', 'Berners', 'Johnson', 'Backus', 'Goldwasser', 'Wirth',
+]
+COMPANY_WORDS = [
+    'Northwind', 'Contoso', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Acme', 'Hooli',
+    'Vandelay', 'Wonka', 'Tyrell', 'Cyberdyne', 'Soylent', 'Aperture', 'Massive', 'Dynamic',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark search: __icontains scans vs the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000000,
+            help='Number of leads to seed (default: 1000000)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of timed runs per query (median is reported)',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            organization = self.seed(options['rows'])
+            self.run_benchmarks(organization, options['repeat'])
+            # Never keep benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('\nSeeded data rolled back.'))
+
+    def seed(self, row_count):
+        """Bulk-create leads (bypasses signals) and build the organization's index."""
+        self.stdout.write(f'Seeding {row_count} leads...')
+        rng = random.Random(42)
+
+        suffix = int(time.time())
+        organization = Organization.objects.create(
+            name=f'Search Benchmark {suffix}',
+            slug=f'search-benchmark-{suffix}'
+        )
+
+        batch = []
+        for i in range(row_count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            company = f'{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)}'
+            batch.append(Lead(
+                organization=organization,
+                name=f'{first} {last} {i}',
+                email=f'{first.lower()}.{last.lower()}{i}@{company.split()[0].lower()}.test',
+                organization_name=company,
+                phone=f'+1 555 {i:07d}',
+            ))
+            if len(batch) == 5000:
+                Lead.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Lead.objects.bulk_create(batch)
+
+        started = time.perf_counter()
+        SearchIndexService.rebuild(organization.id)
+        postings = SearchToken.objects.filter(organization=organization).count()
+        self.stdout.write(
+            f'Index built in {time.perf_counter() - started:.1f}s ({postings} postings)'
+        )
+        return organization
+
+    def run_benchmarks(self, organization, repeat):
+        queries = ['lov', 'lovelace', 'ada lovel', 'northwind glob', 'hopper 12345', '15550000042', 'zzz']
+
+        def legacy(query):
+            return list(Lead.objects.filter(organization=organization).filter(
+                Q(name__icontains=query) |
+                Q(email__icontains=query) |
+                Q(organization_name__icontains=query) |
+                Q(phone__icontains=query)
+            ).values_list('id', flat=True)[:20])
+
+        def indexed(query):
+            return SearchIndexService.search([organization.id], query, entity_types=['lead'], limit=20)
+
+        self.stdout.write(f'\n{"query":<18}{"ms icontains":>14}{"ms index":>12}{"hits":>6}')
+        self.stdout.write('-' * 50)
+        for query in queries:
+            before = self.measure(legacy, query, repeat)
+            after = self.measure(indexed, query, repeat)
+            self.stdout.write(f'{query:<18}{before:>14.2f}{after:>12.2f}{len(indexed(query)):>6}')
+
+    def measure(self, func, query, repeat):
+        """Median wall time in milliseconds, after one warm-up run."""
+        func(query)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,63 @@
+"""
+Management command to move JSON conversation histories into ConversationTurn
+Copies GeminiConversation.messages and TelegramUser.conversation_history into
+the append-only conversation_turns table and empties the JSON columns.
+Safe to re-run: histories that were already moved are empty. Conversations
+that are opened before this runs are moved on first read.
+"""
+from django.core.management.base import BaseCommand
+from crmApp.models import GeminiConversation, TelegramUser
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Move Gemini and Telegram JSON conversation histories into the conversation_turns table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Conversations loaded per query (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the histories that would be moved',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        gemini = GeminiConversation.objects.exclude(messages=[])
+        telegram = TelegramUser.objects.exclude(conversation_history=[])
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'{gemini.count()} Gemini conversation(s) and '
+                f'{telegram.count()} Telegram history(ies) to move'
+            )
+            return
+
+        conversations, turns = self._migrate(gemini, batch_size, lambda item: item.import_legacy_messages())
+        self.stdout.write(f'  Gemini: {turns} turns from {conversations} conversation(s)')
+
+        histories, telegram_turns = self._migrate(telegram, batch_size, lambda item: item.import_legacy_history())
+        self.stdout.write(f'  Telegram: {telegram_turns} turns from {histories} user(s)')
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {turns + telegram_turns} conversation turns'))
+
+    def _migrate(self, queryset, batch_size, import_history):
+        items = 0
+        turns = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                return items, turns
+            for item in batch:
+                turns += import_history(item)
+                items += 1
+            last_pk = batch[-1].pk
@@ -0,0 +1,82 @@
+"""
+Management command that pulls issue changes from Linear into the CRM
+Each run only asks Linear for issues updated since the team's watermark
+(see IssueLinearService.pull_team_changes), so it can run on a schedule
+(cron, or --interval) to catch changes whose webhooks were missed.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crmApp.models import LinearWebhookDelivery, Organization
+from crmApp.services.issue_linear_service import IssueLinearService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Pull issues changed in Linear since the last run into the CRM'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--team-id',
+            action='append',
+            dest='team_ids',
+            help='Linear team to pull (repeatable; default: every team linked to an organization)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Ignore the watermarks and reconcile every issue',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running, pulling every this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        full = options['full']
+        try:
+            while True:
+                self.pull(options.get('team_ids'), full)
+                self.prune_deliveries()
+                if not options.get('interval'):
+                    break
+                # Only the first pass of a --full run ignores the watermarks
+                full = False
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping Linear pull sync')
+
+    def pull(self, team_ids, full):
+        if not team_ids:
+            team_ids = Organization.objects.exclude(linear_team_id__isnull=True).exclude(
+                linear_team_id=''
+            ).values_list('linear_team_id', flat=True).distinct()
+
+        sync_service = IssueLinearService()
+        for team_id in team_ids:
+            try:
+                result = sync_service.pull_team_changes(team_id, full=full)
+            except Exception as e:
+                logger.error(f"Linear pull sync failed for team {team_id}: {e}", exc_info=True)
+                self.stdout.write(self.style.ERROR(f'Team {team_id}: {e}'))
+                continue
+            self.stdout.write(
+                f"Team {team_id}: {result['fetched_count']} changed in Linear, "
+                f"{result['updated_count']} CRM issue(s) updated"
+            )
+
+    def prune_deliveries(self):
+        """Forget webhook deliveries older than Linear would redeliver."""
+        days = getattr(settings, 'LINEAR_WEBHOOK_DEDUP_DAYS', 7)
+        deleted, _ = LinearWebhookDelivery.objects.filter(
+            received_at__lt=timezone.now() - timedelta(days=days)
+        ).delete()
+        if deleted:
+            self.stdout.write(f'Pruned {deleted} old webhook delivery record(s)')
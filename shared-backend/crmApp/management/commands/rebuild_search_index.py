@@ -0,0 +1,38 @@
+"""
+Management command to (re)build the search index of organizations
+"""
+from django.core.management.base import BaseCommand, CommandError
+from crmApp.models import Organization
+from crmApp.services.search_index_service import SearchIndexService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index (customers, leads, deals, issues, activities) from the raw tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization-id',
+            type=int,
+            help='Process a specific organization only',
+        )
+
+    def handle(self, *args, **options):
+        organization_id = options.get('organization_id')
+
+        if organization_id:
+            organizations = Organization.objects.filter(id=organization_id)
+            if not organizations.exists():
+                raise CommandError(f'Organization with ID {organization_id} not found')
+        else:
+            organizations = Organization.objects.all()
+
+        total = 0
+        for organization in organizations.order_by('id'):
+            count = SearchIndexService.rebuild(organization.id)
+            total += count
+            self.stdout.write(f'  {organization.name}: {count} documents indexed')
+
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({total} documents)'))
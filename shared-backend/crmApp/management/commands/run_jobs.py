@@ -0,0 +1,85 @@
+"""
+Management command that runs queued background jobs
+Use with JOB_QUEUE_MODE='external' so web processes only enqueue jobs; any
+number of these workers can share the queue. Each queue's jobs run on their
+own thread pool sized by JOB_QUEUE_CONCURRENCY.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from crmApp.services.job_queue import JobQueue, JobWorker
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (worker for JOB_QUEUE_MODE=external)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Only run jobs of this queue (repeatable; default: all queues)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            help='Seconds between polls for due jobs (default: JOB_QUEUE_POLL_INTERVAL)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            help='Requeue jobs stuck in running for this many seconds, on startup and periodically '
+                 '(default: JOB_QUEUE_STALE_AFTER)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the currently due jobs and exit',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue depth and latency per queue and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(JobQueue.stats(), indent=2, default=str))
+            return
+
+        worker = JobWorker(
+            queues=options.get('queues'),
+            poll_interval=options.get('poll_interval'),
+            stale_after=options.get('stale_after')
+        )
+        requeued = worker.requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s)'))
+        pruned = JobQueue.prune()
+        if pruned:
+            self.stdout.write(f'Pruned {pruned} succeeded job(s) older than {settings.JOB_QUEUE_RETENTION_DAYS} day(s)')
+
+        self.stdout.write(f"Job worker started (queues: {', '.join(options.get('queues') or ['all'])})")
+        started = 0
+        try:
+            if options['once']:
+                while True:
+                    submitted = worker.poll()
+                    started += submitted
+                    if not submitted and not worker.running:
+                        break
+                    time.sleep(0.05)
+            else:
+                worker.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping, waiting for running jobs...')
+        finally:
+            worker.stop(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Job worker stopped ({started} job(s) started)'))
@@ -0,0 +1,74 @@
+"""
+Management command that processes persisted Telegram webhook updates
+Use with TELEGRAM_WORKER_MODE='external' so the web process only stores and
+acknowledges updates; this worker polls pending updates and processes them
+with the same per-chat ordering and backpressure as the in-process queue.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from crmApp.services.telegram_update_queue import TelegramUpdateQueue, requeue_stale
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Process pending Telegram webhook updates (worker for TELEGRAM_WORKER_MODE=external)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of worker threads (default: TELEGRAM_WORKER_THREADS)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds between polls for new updates (default: 1.0)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Maximum pending updates fetched per poll (default: 100)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            help='On startup, requeue updates stuck in processing for this many seconds '
+                 '(default: TELEGRAM_UPDATE_STALE_AFTER)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the currently pending updates and exit',
+        )
+
+    def handle(self, *args, **options):
+        queue = TelegramUpdateQueue(workers=options.get('workers'))
+
+        requeued = requeue_stale(options.get('stale_after'))
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale update(s)'))
+
+        self.stdout.write(f'Telegram worker started with {queue.workers} thread(s)')
+        processed = 0
+        try:
+            while True:
+                submitted = queue.submit_pending(options['batch_size'])
+                processed += submitted
+
+                if options['once']:
+                    queue.join()
+                    break
+                if not submitted:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping, waiting for running updates...')
+        finally:
+            queue.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f'Telegram worker stopped ({processed} update(s) queued)'))
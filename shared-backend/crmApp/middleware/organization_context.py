@@ -6,12 +6,7 @@ Uses UserProfile to determine organization context based on profile type
 
 import threading
 from django.utils.deprecation import MiddlewareMixin
-from crmApp.models import UserProfile, Organization
-from crmApp.utils.profile_context import (
-    get_user_active_profile,
-    get_user_accessible_organizations,
-    get_customer_vendor_organizations,
-)
+from crmApp.utils.request_context import RequestContext
 
 # Thread-local storage for current user (for signal handlers)
 _thread_locals = threading.local()
@@ -32,6 +27,7 @@ class OrganizationContextMiddleware(MiddlewareMixin):
     Middleware to set the active organization context for each request.
     
     Uses active UserProfile to determine which organization the user is working with.
+    The context is resolved once per request through RequestContext.
     
     Rules:
     - Vendor: Uses organization from vendor profile
@@ -59,35 +55,9 @@ class OrganizationContextMiddleware(MiddlewareMixin):
             request.user.accessible_organization_ids = []
             return None
         
-        # Get active profile
-        active_profile = get_user_active_profile(request.user)
-        request.user.active_profile = active_profile
-        
-        if not active_profile:
-            request.user.current_organization = None
-            request.user.accessible_organization_ids = []
-            return None
-        
-        # Get organization based on profile type
-        if active_profile.profile_type in ['vendor', 'employee']:
-            # Vendor and Employee have a single organization
-            request.user.current_organization = active_profile.organization
-            request.user.accessible_organization_ids = [active_profile.organization.id] if active_profile.organization else []
-        elif active_profile.profile_type == 'customer':
-            # Customer can access multiple vendor organizations
-            from crmApp.utils.profile_context import get_customer_vendor_organizations
-            customer_orgs = get_customer_vendor_organizations(request.user)
-            request.user.current_organization = customer_orgs[0] if customer_orgs else None
-            request.user.accessible_organization_ids = [org.id for org in customer_orgs]
-        else:
-            request.user.current_organization = None
-            request.user.accessible_organization_ids = []
-        
-        # Set is_organization_owner (only vendors own their organization)
-        request.user.is_organization_owner = (
-            active_profile.profile_type == 'vendor' and 
-            active_profile.organization is not None
-        )
+        # Resolve profile/organization context once; DRF authentication classes
+        # do the same for token-authenticated users (see crmApp.authentication)
+        RequestContext.for_user(request.user).apply(request.user)
         
         return None
     
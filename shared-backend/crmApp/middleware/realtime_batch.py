@@ -0,0 +1,21 @@
+"""
+Realtime Batch Middleware
+Collects the realtime (Pusher) events of a request and sends them together
+after the response is ready
+"""
+
+from crmApp.services.realtime_dispatcher import realtime_dispatcher
+
+
+class RealtimeBatchMiddleware:
+    """
+    Wraps each request in realtime_dispatcher.batch(), so all events it
+    publishes go out as one batch from the dispatcher's worker threads.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with realtime_dispatcher.batch():
+            return self.get_response(request)
@@ -57,6 +57,7 @@ from .deal import (
 # Issue models
 from .issue import Issue
 from .issue_comment import IssueComment
+from .linear_sync import LinearSyncJob, LinearSyncState, LinearWebhookDelivery
 
 # Order models
 from .order import (
@@ -67,24 +68,37 @@ from .order import (
 # Payment model
 from .payment import Payment
 
+# Document number sequences
+from .sequence import NumberSequence
+
 # Activity model
 from .activity import Activity
 
 # Audit Log model
 from .audit_log import AuditLog
 
+# Analytics rollup models
+from .analytics import AnalyticsDailyRollup, AnalyticsRollupState
+
+# Search index models
+from .search import SearchDocument, SearchToken, SearchIndexState
+
 # Notification model
 from .notification import NotificationPreferences
 
 # Message models
 from .message import Message, Conversation, GeminiConversation
+from .conversation_turn import ConversationTurn
 
 # Telegram models
-from .telegram import TelegramUser
+from .telegram import TelegramUser, TelegramUpdate
 
 # Phone verification model
 from .phone_verification import PhoneVerification
 
+# Background job queue
+from .background_job import BackgroundJob
+
 # Export all models for backward compatibility
 __all__ = [
     # Authentication
@@ -122,11 +136,24 @@ __all__ = [
     # Operations
     'Issue',
     'IssueComment',
+    'LinearSyncJob',
+    'LinearSyncState',
+    'LinearWebhookDelivery',
     'Order',
     'OrderItem',
     'Payment',
+    'NumberSequence',
     'Activity',
     
+    # Analytics
+    'AnalyticsDailyRollup',
+    'AnalyticsRollupState',
+    
+    # Search
+    'SearchDocument',
+    'SearchToken',
+    'SearchIndexState',
+    
     # Notifications
     'NotificationPreferences',
     
@@ -134,10 +161,15 @@ __all__ = [
     'Message',
     'Conversation',
     'GeminiConversation',
+    'ConversationTurn',
     
     # Telegram
     'TelegramUser',
+    'TelegramUpdate',
     
     # Phone Verification
     'PhoneVerification',
+    
+    # Background Jobs
+    'BackgroundJob',
 ]
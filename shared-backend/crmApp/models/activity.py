@@ -2,10 +2,10 @@
 Activity tracking models for customer interactions and communications.
 """
 from django.db import models
-from .base import TimestampedModel
+from .base import TimestampedModel, TrackedFieldsMixin
 
 
-class Activity(TimestampedModel):
+class Activity(TimestampedModel, TrackedFieldsMixin):
     """
     Activity model for tracking customer interactions, communications, and tasks.
     Supports multiple activity types: calls, emails, telegram messages, meetings, notes, tasks.
@@ -138,6 +138,7 @@ class Activity(TimestampedModel):
         verbose_name = 'Activity'
         verbose_name_plural = 'Activities'
         indexes = [
+            models.Index(fields=['organization', '-created_at']),
             models.Index(fields=['organization', 'activity_type']),
             models.Index(fields=['organization', 'status']),
             models.Index(fields=['customer']),
@@ -0,0 +1,90 @@
+"""
+Analytics Rollup Models
+Per-organization daily aggregates maintained incrementally from model signals
+so dashboards do not have to scan raw CRM tables.
+"""
+
+from django.db import models
+from .base import TimestampedModel
+
+
+class AnalyticsDailyRollup(models.Model):
+    """
+    One row per (organization, day, metric, dimension, dimension value).
+
+    Examples:
+        metric='deal',     dimension='stage',  dimension_value='12' -> deals created that day in stage 12
+        metric='deal_won', dimension='total',  dimension_value=''   -> deals won that day and their revenue
+        metric='lead',     dimension='source', dimension_value='referral'
+    """
+
+    METRIC_CHOICES = [
+        ('lead', 'Leads Created'),
+        ('deal', 'Deals Created'),
+        ('deal_won', 'Deals Won'),
+        ('customer', 'Customers Created'),
+        ('activity', 'Activities Created'),
+    ]
+
+    DIMENSION_CHOICES = [
+        ('total', 'Total'),
+        ('stage', 'Stage'),
+        ('source', 'Source'),
+        ('status', 'Status'),
+        ('owner', 'Owner'),
+    ]
+
+    organization = models.ForeignKey(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='analytics_rollups'
+    )
+    date = models.DateField()
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    dimension_value = models.CharField(max_length=100, blank=True, default='')
+
+    count = models.BigIntegerField(default=0)
+    value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_rollups'
+        verbose_name = 'Analytics Daily Rollup'
+        verbose_name_plural = 'Analytics Daily Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'date', 'metric', 'dimension', 'dimension_value'],
+                name='unique_analytics_rollup_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['organization', 'metric', 'dimension', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} {self.date} {self.metric}/{self.dimension}={self.dimension_value}: {self.count}"
+
+
+class AnalyticsRollupState(TimestampedModel):
+    """
+    Tracks which part of an organization's history the rollups cover.
+
+    Rollups are only trusted once a backfill has run. covered_from is the first
+    day included in the backfill (null means the organization's full history).
+    """
+
+    organization = models.OneToOneField(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='analytics_rollup_state'
+    )
+    backfilled_at = models.DateTimeField(null=True, blank=True)
+    covered_from = models.DateField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'analytics_rollup_states'
+        verbose_name = 'Analytics Rollup State'
+        verbose_name_plural = 'Analytics Rollup States'
+
+    def __str__(self):
+        return f"Rollup state for organization {self.organization_id}"
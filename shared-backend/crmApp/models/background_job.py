@@ -0,0 +1,67 @@
+"""
+Background Job Model
+Slow side effects (third-party calls, follow-up records) queued in the
+database and run by crmApp.services.job_queue workers
+"""
+
+from django.db import models
+from django.utils import timezone
+from .base import TimestampedModel
+
+
+class BackgroundJob(TimestampedModel):
+    """
+    One queued call of a job function.
+    Failed runs are retried with backoff until max_attempts, then the job
+    is dead-lettered (status 'dead') for inspection and manual retry.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_DEAD = 'dead'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_DEAD, 'Dead (out of attempts)'),
+    ]
+    
+    queue = models.CharField(max_length=50, default='default')
+    task = models.CharField(max_length=255, help_text='Dotted path of the job function')
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text='Higher runs first')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    lock_key = models.CharField(
+        max_length=255, null=True, blank=True,
+        help_text='Jobs with the same lock key never run at the same time'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text='Not run before this time')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'background_jobs'
+        verbose_name = 'Background Job'
+        verbose_name_plural = 'Background Jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'queue', 'run_at']),
+            models.Index(fields=['status', 'finished_at']),
+        ]
+        constraints = [
+            # Claiming a second job of a running lock key fails
+            models.UniqueConstraint(
+                fields=['lock_key'],
+                condition=models.Q(status='running'),
+                name='unique_running_job_lock_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Job #{self.pk} {self.task} ({self.queue}, {self.status})"
@@ -1,6 +1,8 @@
 """
 Base abstract models and mixins for the CRM application.
 """
+import copy
+
 from django.db import models
 
 
@@ -74,3 +76,73 @@ class StatusMixin(models.Model):
     
     class Meta:
         abstract = True
+
+
+class TrackedFieldsMixin(models.Model):
+    """
+    Abstract mixin that remembers the column values an instance was loaded
+    with (and, after each save, the values it saved).
+
+    Signal handlers diff a save against get_loaded_values() instead of
+    re-reading the row in pre_save. The snapshot lives on the instance, so
+    it is released with it and is never shared between threads.
+    """
+    
+    class Meta:
+        abstract = True
+    
+    def _snapshot_values(self, attnames=None):
+        """Current column values (attname -> value), skipping deferred fields."""
+        values = {}
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if attnames is not None and attname not in attnames:
+                continue
+            if attname not in self.__dict__:
+                continue
+            value = self.__dict__[attname]
+            # JSON values are mutable - copy so in-place edits still show up as changes
+            values[attname] = copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        return values
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._snapshot_values()
+        return instance
+    
+    def get_loaded_values(self):
+        """
+        Column values as last loaded from or saved to the database, or None
+        for instances that were never loaded (e.g. built by hand with a pk).
+        """
+        return self.__dict__.get('_loaded_values')
+    
+    def save_base(self, *args, **kwargs):
+        if self.get_loaded_values() is None and self.pk is not None:
+            # Built by hand with an existing pk - read the stored row once
+            self._loaded_values = type(self)._base_manager.using(
+                kwargs.get('using') or self._state.db or 'default'
+            ).filter(pk=self.pk).values(
+                *[field.attname for field in self._meta.concrete_fields]
+            ).first()
+        
+        super().save_base(*args, **kwargs)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._loaded_values = self._snapshot_values()
+        else:
+            attnames = {self._meta.get_field(name).attname for name in update_fields}
+            loaded = self.get_loaded_values()
+            if loaded is not None:
+                loaded.update(self._snapshot_values(attnames))
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        loaded = self.get_loaded_values()
+        if loaded is None:
+            self._loaded_values = self._snapshot_values()
+        else:
+            loaded.update(self._snapshot_values())
+
@@ -0,0 +1,160 @@
+"""
+Conversation Turn Model
+Append-only message history of assistant conversations (web Gemini chat
+and the Telegram bot)
+"""
+
+from typing import Dict, List, Optional
+
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text or '') // 4 + 1
+
+
+class ConversationTurn(models.Model):
+    """
+    One message of a Gemini or Telegram conversation.
+    
+    Turns are only ever inserted: adding a message is a single INSERT
+    however long the conversation is, and history is read as a window of
+    the latest turns through the (conversation, seq) index.
+    Exactly one of gemini_conversation / telegram_user is set.
+    """
+    ROLE_USER = 'user'
+    ROLE_ASSISTANT = 'assistant'
+    
+    ROLE_CHOICES = [
+        (ROLE_USER, 'User'),
+        (ROLE_ASSISTANT, 'Assistant'),
+    ]
+    
+    gemini_conversation = models.ForeignKey(
+        'GeminiConversation',
+        on_delete=models.CASCADE,
+        related_name='turns',
+        null=True,
+        blank=True
+    )
+    telegram_user = models.ForeignKey(
+        'TelegramUser',
+        on_delete=models.CASCADE,
+        related_name='turns',
+        null=True,
+        blank=True
+    )
+    seq = models.IntegerField(help_text="Position in the conversation (increasing)")
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    content = models.TextField()
+    token_estimate = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'conversation_turns'
+        verbose_name = 'Conversation Turn'
+        verbose_name_plural = 'Conversation Turns'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['gemini_conversation', 'seq'],
+                condition=models.Q(gemini_conversation__isnull=False),
+                name='uniq_turn_gemini_conversation_seq'
+            ),
+            models.UniqueConstraint(
+                fields=['telegram_user', 'seq'],
+                condition=models.Q(telegram_user__isnull=False),
+                name='uniq_turn_telegram_user_seq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.role}: {self.content[:50]}"
+    
+    @classmethod
+    def append(cls, role: str, content: str, **owner) -> 'ConversationTurn':
+        """
+        Add a turn after the owner's latest one.
+        
+        owner is gemini_conversation=... or telegram_user=...; the next seq
+        comes from an index lookup, and a concurrent append that took the
+        same seq makes this one retry.
+        """
+        for attempt in range(3):
+            last_seq = cls.objects.filter(**owner).order_by('-seq').values_list('seq', flat=True).first()
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(
+                        seq=(last_seq or 0) + 1,
+                        role=role,
+                        content=content,
+                        token_estimate=estimate_tokens(content),
+                        **owner
+                    )
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+    
+    @classmethod
+    def window(
+        cls,
+        limit: int,
+        token_budget: Optional[int] = None,
+        **owner
+    ) -> List[Dict[str, str]]:
+        """
+        The owner's latest turns, oldest first, as [{role, content}].
+        
+        Reads at most limit rows; with a token_budget, older turns are
+        dropped once the newer ones use it up.
+        """
+        if limit <= 0:
+            return []
+        rows = cls.objects.filter(**owner).order_by('-seq').values_list(
+            'role', 'content', 'token_estimate'
+        )[:limit]
+        
+        turns = []
+        used = 0
+        for role, content, tokens in rows:
+            if token_budget is not None and used + tokens > token_budget:
+                break
+            used += tokens
+            turns.append({'role': role, 'content': content})
+        turns.reverse()
+        return turns
+    
+    @classmethod
+    def import_history(cls, messages: List[Dict], **owner) -> int:
+        """
+        Copy a legacy JSON history [{role, content, timestamp}] in front of
+        the owner's existing turns.
+        
+        Returns:
+            Number of turns created
+        """
+        messages = [message for message in messages or [] if message.get('role') and message.get('content')]
+        if not messages:
+            return 0
+        
+        first_seq = cls.objects.filter(**owner).order_by('seq').values_list('seq', flat=True).first()
+        start = (first_seq if first_seq is not None else len(messages) + 1) - len(messages)
+        now = timezone.now()
+        
+        turns = []
+        for offset, message in enumerate(messages):
+            created_at = parse_datetime(message.get('timestamp') or '') or now
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at)
+            turns.append(cls(
+                seq=start + offset,
+                role=cls.ROLE_USER if message['role'] == cls.ROLE_USER else cls.ROLE_ASSISTANT,
+                content=message['content'],
+                token_estimate=estimate_tokens(message['content']),
+                created_at=created_at,
+                **owner
+            ))
+        cls.objects.bulk_create(turns)
+        return len(turns)
@@ -2,7 +2,7 @@
 Customer management models.
 """
 from django.db import models
-from .base import TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin
+from .base import TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin, TrackedFieldsMixin
 
 
 class CustomerOrganization(TimestampedModel):
@@ -82,7 +82,7 @@ class CustomerOrganization(TimestampedModel):
         return f"{self.customer.name} - {self.organization.name}"
 
 
-class Customer(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin):
+class Customer(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin, TrackedFieldsMixin):
     """
     Customer model for managing clients and accounts.
     Supports both individual and business customers.
@@ -158,6 +158,7 @@ class Customer(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, Stat
         verbose_name = 'Customer'
         verbose_name_plural = 'Customers'
         indexes = [
+            models.Index(fields=['organization', '-created_at']),
             models.Index(fields=['organization', 'status']),
             models.Index(fields=['organization', 'customer_type']),
             models.Index(fields=['assigned_to']),
@@ -2,10 +2,10 @@
 Deal and pipeline management models.
 """
 from django.db import models
-from .base import TimestampedModel, CodeMixin, StatusMixin
+from .base import TimestampedModel, CodeMixin, StatusMixin, TrackedFieldsMixin
 
 
-class Pipeline(TimestampedModel, CodeMixin):
+class Pipeline(TimestampedModel, CodeMixin, TrackedFieldsMixin):
     """
     Sales pipeline definition model.
     Each organization can have multiple pipelines for different sales processes.
@@ -29,7 +29,7 @@ class Pipeline(TimestampedModel, CodeMixin):
         return f"{self.name} ({self.organization.name})"
 
 
-class PipelineStage(TimestampedModel):
+class PipelineStage(TimestampedModel, TrackedFieldsMixin):
     """
     Pipeline stage model defining the steps in a sales pipeline.
     Each stage has a probability of closing and an order position.
@@ -62,7 +62,7 @@ class PipelineStage(TimestampedModel):
         return f"{self.pipeline.name} - {self.name}"
 
 
-class Deal(TimestampedModel, CodeMixin, StatusMixin):
+class Deal(TimestampedModel, CodeMixin, StatusMixin, TrackedFieldsMixin):
     """
     Deal/Opportunity model for managing sales opportunities.
     Tracks deals through pipeline stages to closure.
@@ -2,10 +2,10 @@
 Employee management models.
 """
 from django.db import models
-from .base import TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin
+from .base import TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin, TrackedFieldsMixin
 
 
-class Employee(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin):
+class Employee(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin, TrackedFieldsMixin):
     """
     Employee model for managing organization staff.
     Supports hierarchical structure with manager relationships.
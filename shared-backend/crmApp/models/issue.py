@@ -2,10 +2,10 @@
 Issue management models for tracking vendor and order issues.
 """
 from django.db import models, IntegrityError
-from .base import TimestampedModel, CodeMixin
+from .base import TimestampedModel, CodeMixin, TrackedFieldsMixin
 
 
-class Issue(TimestampedModel, CodeMixin):
+class Issue(TimestampedModel, CodeMixin, TrackedFieldsMixin):
     """
     Issue model for tracking problems with vendors, orders, and services.
     Allows organization to log and manage issues throughout their lifecycle.
@@ -42,7 +42,7 @@ class Issue(TimestampedModel, CodeMixin):
     )
     
     # Basic information
-    issue_number = models.CharField(max_length=50, unique=True)
+    issue_number = models.CharField(max_length=50)
     title = models.CharField(max_length=255)
     description = models.TextField()
     
@@ -153,7 +153,7 @@ class Issue(TimestampedModel, CodeMixin):
         db_table = 'issues'
         verbose_name = 'Issue'
         verbose_name_plural = 'Issues'
-        unique_together = [('organization', 'code')]
+        unique_together = [('organization', 'code'), ('organization', 'issue_number')]
         indexes = [
             models.Index(fields=['organization', 'status']),
             models.Index(fields=['organization', 'priority']),
@@ -162,6 +162,7 @@ class Issue(TimestampedModel, CodeMixin):
             models.Index(fields=['order']),
             models.Index(fields=['assigned_to']),
             models.Index(fields=['issue_number']),
+            models.Index(fields=['linear_issue_id']),
         ]
         ordering = ['-created_at']
     
@@ -172,48 +173,7 @@ class Issue(TimestampedModel, CodeMixin):
         """Generate issue number if not provided."""
         if not self.issue_number:
             # Generate issue number: ISS-YYYY-NNNN
-            from django.utils import timezone
-            from django.db import IntegrityError
-            from django.db import transaction
-            
-            year = timezone.now().year
-            
-            # Simple approach: query for last issue and increment
-            # Don't use select_for_update to avoid transaction conflicts
-            try:
-                last_issue = Issue.objects.filter(
-                    organization=self.organization,
-                    issue_number__startswith=f'ISS-{year}'
-                ).order_by('-issue_number').first()
-                
-                if last_issue:
-                    try:
-                        last_num = int(last_issue.issue_number.split('-')[-1])
-                        new_num = last_num + 1
-                    except (ValueError, IndexError):
-                        new_num = 1
-                else:
-                    new_num = 1
-                
-                # Generate issue number
-                self.issue_number = f'ISS-{year}-{new_num:04d}'
-                
-            except Exception:
-                # If query fails, use timestamp as fallback
-                import time
-                timestamp = int(time.time() * 1000) % 10000
-                self.issue_number = f'ISS-{year}-{timestamp:04d}'
+            from crmApp.services.sequence_service import SequenceService
+            self.issue_number = SequenceService.next_number('issue', self.organization_id)
         
-        # Save the issue
-        try:
-            super().save(*args, **kwargs)
-        except IntegrityError as e:
-            # If unique constraint fails, add timestamp to make it unique
-            if 'issue_number' in str(e) and not self.issue_number.endswith(str(int(__import__('time').time() * 1000) % 10000)):
-                import time
-                timestamp = int(time.time() * 1000) % 10000
-                base_number = self.issue_number.rsplit('-', 1)[0] if '-' in self.issue_number else f'ISS-{year}'
-                self.issue_number = f'{base_number}-{timestamp:04d}'
-                super().save(*args, **kwargs)
-            else:
-                raise
+        super().save(*args, **kwargs)
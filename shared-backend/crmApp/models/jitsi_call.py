@@ -168,7 +168,8 @@ class JitsiCallSession(TimestampedModel):
 class UserPresence(TimestampedModel):
     """
     Tracks user online status and availability for calls.
-    Updated via heartbeat/websocket pings.
+    Written on presence transitions only; liveness between transitions is
+    kept in the cache by PresenceService (heartbeats / websocket pings).
     """
     
     STATUS_CHOICES = [
@@ -193,7 +194,7 @@ class UserPresence(TimestampedModel):
     
     last_seen = models.DateTimeField(
         auto_now=True,
-        help_text="Last activity timestamp"
+        help_text="Last presence change"
     )
     
     # Call availability
@@ -228,15 +229,13 @@ class UserPresence(TimestampedModel):
     @property
     def is_online(self):
         """Check if user is currently online"""
-        from django.utils import timezone
-        from datetime import timedelta
+        from crmApp.services.presence_service import PresenceService
         
-        # Consider online if seen in last 5 minutes
         if self.status == 'offline':
             return False
         
-        threshold = timezone.now() - timedelta(minutes=5)
-        return self.last_seen >= threshold
+        # Online while heartbeats keep the presence entry alive
+        return PresenceService.is_live(self.user_id, last_seen=self.last_seen)
     
     @property
     def is_available(self):
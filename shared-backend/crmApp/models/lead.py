@@ -2,10 +2,10 @@
 Lead management models.
 """
 from django.db import models
-from .base import TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin
+from .base import TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin, TrackedFieldsMixin
 
 
-class Lead(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin):
+class Lead(TimestampedModel, CodeMixin, ContactInfoMixin, AddressMixin, StatusMixin, TrackedFieldsMixin):
     """
     Lead model for managing potential customers.
     Tracks lead qualification and conversion to customers.
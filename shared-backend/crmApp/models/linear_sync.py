@@ -0,0 +1,106 @@
+"""
+Linear Sync Models
+Background bulk syncs of issues to Linear and their progress, pull sync
+watermarks and processed webhook deliveries
+"""
+
+from django.db import models
+from .base import TimestampedModel
+
+
+class LinearSyncJob(TimestampedModel):
+    """
+    One bulk sync of issues to Linear, run off the request.
+    Counters and results are updated as batches complete.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    organization = models.ForeignKey(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='linear_sync_jobs'
+    )
+    created_by = models.ForeignKey(
+        'User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='linear_sync_jobs'
+    )
+    team_id = models.CharField(max_length=100)
+    issue_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total = models.PositiveIntegerField(default=0)
+    synced_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=list, blank=True)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'linear_sync_jobs'
+        verbose_name = 'Linear Sync Job'
+        verbose_name_plural = 'Linear Sync Jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['organization', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Linear sync #{self.pk} ({self.status}, {self.synced_count + self.failed_count}/{self.total})"
+    
+    @property
+    def processed_count(self):
+        return self.synced_count + self.failed_count
+
+
+class LinearSyncState(TimestampedModel):
+    """
+    Pull sync watermark of a Linear team: the newest updatedAt seen, so the
+    next pull only asks Linear for issues changed since then.
+    """
+    team_id = models.CharField(max_length=100, unique=True)
+    last_updated_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Newest Linear updatedAt applied (null = next pull is a full one)'
+    )
+    last_pulled_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'linear_sync_states'
+        verbose_name = 'Linear Sync State'
+        verbose_name_plural = 'Linear Sync States'
+    
+    def __str__(self):
+        return f"Linear team {self.team_id} synced up to {self.last_updated_at}"
+
+
+class LinearWebhookDelivery(models.Model):
+    """
+    A processed Linear webhook delivery (Linear-Delivery header), recorded
+    so redelivered events are acknowledged without being applied twice.
+    """
+    delivery_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=50, blank=True)
+    action = models.CharField(max_length=20, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'linear_webhook_deliveries'
+        verbose_name = 'Linear Webhook Delivery'
+        verbose_name_plural = 'Linear Webhook Deliveries'
+    
+    def __str__(self):
+        return f"{self.event_type} {self.action} ({self.delivery_id})"
@@ -122,7 +122,7 @@ class Message(TimestampedModel):
         indexes = [
             models.Index(fields=['sender', 'recipient']),
             models.Index(fields=['recipient', 'is_read']),
-            models.Index(fields=['organization']),
+            models.Index(fields=['organization', '-created_at']),
         ]
     
     def __str__(self):
@@ -140,6 +140,10 @@ class GeminiConversation(TimestampedModel):
     """
     Stores conversation history with Gemini AI assistant
     Persists chat messages for later retrieval
+    
+    Messages are ConversationTurn rows (self.turns); the messages JSON
+    column only holds histories not yet moved over by
+    `manage.py migrate_conversation_history`.
     """
     
     user = models.ForeignKey(
@@ -173,7 +177,25 @@ class GeminiConversation(TimestampedModel):
     
     messages = models.JSONField(
         default=list,
-        help_text="Array of messages [{role, content, timestamp}]"
+        blank=True,
+        help_text="Legacy array of messages [{role, content, timestamp}], see ConversationTurn"
+    )
+    
+    message_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of turns"
+    )
+    
+    history_summary = models.TextField(
+        blank=True,
+        default='',
+        help_text="Rolling summary of turns that no longer fit the prompt's history window"
+    )
+    
+    history_summary_seq = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text="Last turn seq folded into history_summary"
     )
     
     last_message_at = models.DateTimeField(
@@ -195,31 +217,74 @@ class GeminiConversation(TimestampedModel):
         title = self.title or f"Conversation {self.conversation_id[:8]}"
         return f"{self.user.email} - {title}"
     
+    @property
+    def turn_filter(self):
+        """ConversationTurn filter for this conversation's turns"""
+        return {'gemini_conversation': self}
+    
     def add_message(self, role: str, content: str):
-        """Add a message to the conversation"""
+        """Append a message to the conversation"""
+        from django.db.models import F
         from django.utils import timezone
+        from .conversation_turn import ConversationTurn
         
-        if not self.messages:
-            self.messages = []
-        
-        self.messages.append({
-            'role': role,
-            'content': content,
-            'timestamp': timezone.now().isoformat()
-        })
+        ConversationTurn.append(role, content, gemini_conversation=self)
         
+        updates = {'message_count': F('message_count') + 1, 'last_message_at': timezone.now()}
         # Auto-generate title from first user message
         if not self.title and role == 'user':
             # Take first 50 chars of first message as title
             self.title = content[:50] + ('...' if len(content) > 50 else '')
+            updates['title'] = self.title
+        GeminiConversation.objects.filter(pk=self.pk).update(**updates)
+        self.message_count += 1
+        self.last_message_at = updates['last_message_at']
+    
+    def import_legacy_messages(self) -> int:
+        """Move the legacy messages JSON into turns; returns how many were moved"""
+        from django.db.models import F
+        from crmApp.utils.write_transaction import write_transaction
+        from .conversation_turn import ConversationTurn
         
-        self.save()
+        if not self.messages:
+            return 0
+        with write_transaction():
+            # Locked and re-read so concurrent callers move the history once
+            legacy = GeminiConversation.objects.select_for_update().filter(
+                pk=self.pk
+            ).values_list('messages', flat=True).first()
+            created = ConversationTurn.import_history(legacy or [], gemini_conversation=self)
+            GeminiConversation.objects.filter(pk=self.pk).update(
+                messages=[],
+                message_count=F('message_count') + created
+            )
+        self.messages = []
+        self.message_count += created
+        return created
+    
+    def recent_messages(self, limit: int, token_budget=None):
+        """The latest messages, oldest first, as [{role, content}]"""
+        from .conversation_turn import ConversationTurn
+        
+        return ConversationTurn.window(limit, token_budget, gemini_conversation=self)
+    
+    def all_messages(self):
+        """Every message, oldest first, as [{role, content, timestamp}]"""
+        return [
+            {'role': role, 'content': content, 'timestamp': created_at.isoformat()}
+            for role, content, created_at in self.turns.order_by('seq').values_list('role', 'content', 'created_at')
+        ]
 
 
 class Conversation(TimestampedModel):
     """
     Represents a conversation thread between two users
     Groups messages for easier management
+    
+    The conversation is the inbox's source of truth: it carries the last
+    message (and a preview of it) and each participant's unread counter.
+    participant1 is always the user with the smaller id. Counters are only
+    changed with F() updates (see MessageService), never read-modify-save.
     """
     
     participant1 = models.ForeignKey(
@@ -255,6 +320,12 @@ class Conversation(TimestampedModel):
         blank=True
     )
     
+    last_message_preview = models.CharField(
+        max_length=255,
+        blank=True,
+        default=''
+    )
+    
     # Unread count for each participant
     unread_count_participant1 = models.IntegerField(default=0)
     unread_count_participant2 = models.IntegerField(default=0)
@@ -265,6 +336,10 @@ class Conversation(TimestampedModel):
         verbose_name_plural = 'Conversations'
         unique_together = [['participant1', 'participant2', 'organization']]
         ordering = ['-last_message_at']
+        indexes = [
+            models.Index(fields=['participant1', 'organization', '-last_message_at']),
+            models.Index(fields=['participant2', 'organization', '-last_message_at']),
+        ]
     
     def __str__(self):
         return f"Conversation: {self.participant1.email} <-> {self.participant2.email}"
@@ -277,10 +352,17 @@ class Conversation(TimestampedModel):
     
     def get_unread_count(self, user):
         """Get unread count for a specific user"""
-        if user == self.participant1:
+        if user.pk == self.participant1_id:
             return self.unread_count_participant1
         return self.unread_count_participant2
     
+    @staticmethod
+    def unread_field_for(user_id, other_user_id):
+        """Name of the unread counter of user_id in its conversation with other_user_id"""
+        if user_id <= other_user_id:
+            return 'unread_count_participant1'
+        return 'unread_count_participant2'
+    
     def update_unread_count(self, user, count):
         """Update unread count for a user"""
         if user == self.participant1:
@@ -2,10 +2,10 @@
 Order management models for tracking purchases and service orders.
 """
 from django.db import models
-from .base import TimestampedModel, CodeMixin, StatusMixin
+from .base import TimestampedModel, CodeMixin, StatusMixin, TrackedFieldsMixin
 
 
-class Order(TimestampedModel, CodeMixin, StatusMixin):
+class Order(TimestampedModel, CodeMixin, StatusMixin, TrackedFieldsMixin):
     """
     Order model for managing purchase orders and service orders.
     Tracks orders from vendors and for customers.
@@ -34,7 +34,7 @@ class Order(TimestampedModel, CodeMixin, StatusMixin):
     )
     
     # Basic information
-    order_number = models.CharField(max_length=50, unique=True)
+    order_number = models.CharField(max_length=50)
     title = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     
@@ -110,7 +110,7 @@ class Order(TimestampedModel, CodeMixin, StatusMixin):
         db_table = 'orders'
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
-        unique_together = [('organization', 'code')]
+        unique_together = [('organization', 'code'), ('organization', 'order_number')]
         indexes = [
             models.Index(fields=['organization', 'status']),
             models.Index(fields=['organization', 'order_type']),
@@ -129,20 +129,8 @@ class Order(TimestampedModel, CodeMixin, StatusMixin):
         """Generate order number if not provided."""
         if not self.order_number:
             # Generate order number: ORD-YYYY-NNNN
-            from django.utils import timezone
-            year = timezone.now().year
-            last_order = Order.objects.filter(
-                organization=self.organization,
-                order_number__startswith=f'ORD-{year}'
-            ).order_by('-order_number').first()
-            
-            if last_order:
-                last_num = int(last_order.order_number.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            
-            self.order_number = f'ORD-{year}-{new_num:04d}'
+            from crmApp.services.sequence_service import SequenceService
+            self.order_number = SequenceService.next_number('order', self.organization_id)
         
         super().save(*args, **kwargs)
 
@@ -2,10 +2,10 @@
 Payment management models for tracking financial transactions.
 """
 from django.db import models
-from .base import TimestampedModel, CodeMixin
+from .base import TimestampedModel, CodeMixin, TrackedFieldsMixin
 
 
-class Payment(TimestampedModel, CodeMixin):
+class Payment(TimestampedModel, CodeMixin, TrackedFieldsMixin):
     """
     Payment model for managing payments, invoices, and financial transactions.
     Can be linked to orders, vendors, and customers.
@@ -43,7 +43,7 @@ class Payment(TimestampedModel, CodeMixin):
     )
     
     # Basic information
-    payment_number = models.CharField(max_length=50, unique=True)
+    payment_number = models.CharField(max_length=50)
     invoice_number = models.CharField(max_length=50, null=True, blank=True)
     reference_number = models.CharField(max_length=100, null=True, blank=True)
     
@@ -122,7 +122,7 @@ class Payment(TimestampedModel, CodeMixin):
         db_table = 'payments'
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
-        unique_together = [('organization', 'code')]
+        unique_together = [('organization', 'code'), ('organization', 'payment_number')]
         indexes = [
             models.Index(fields=['organization', 'status']),
             models.Index(fields=['organization', 'payment_type']),
@@ -142,20 +142,8 @@ class Payment(TimestampedModel, CodeMixin):
         """Generate payment number if not provided."""
         if not self.payment_number:
             # Generate payment number: PAY-YYYY-NNNN
-            from django.utils import timezone
-            year = timezone.now().year
-            last_payment = Payment.objects.filter(
-                organization=self.organization,
-                payment_number__startswith=f'PAY-{year}'
-            ).order_by('-payment_number').first()
-            
-            if last_payment:
-                last_num = int(last_payment.payment_number.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            
-            self.payment_number = f'PAY-{year}-{new_num:04d}'
+            from crmApp.services.sequence_service import SequenceService
+            self.payment_number = SequenceService.next_number('payment', self.organization_id)
         
         # Auto-set processed_at when status changes to completed
         if self.status == 'completed' and not self.processed_at:
@@ -0,0 +1,115 @@
+"""
+Search Index Models
+Per-organization inverted index over customers, leads, deals, issues and
+activities, maintained incrementally from model signals.
+"""
+
+from django.db import models
+
+
+class SearchDocument(models.Model):
+    """
+    One indexed record: what a search result shows for it.
+    """
+
+    ENTITY_CHOICES = [
+        ('customer', 'Customer'),
+        ('lead', 'Lead'),
+        ('deal', 'Deal'),
+        ('issue', 'Issue'),
+        ('activity', 'Activity'),
+    ]
+
+    organization = models.ForeignKey(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='search_documents'
+    )
+    entity_type = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    subtitle = models.CharField(max_length=255, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'search_documents'
+        verbose_name = 'Search Document'
+        verbose_name_plural = 'Search Documents'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['entity_type', 'object_id'],
+                name='unique_search_document'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['organization', 'entity_type']),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_type} #{self.object_id}: {self.title}"
+
+
+class SearchToken(models.Model):
+    """
+    Posting: a normalized token occurring in a document, with its field weight.
+
+    organization and entity_type are copied from the document so a lookup is
+    a single range scan of the (organization, token, ...) index.
+    """
+
+    document = models.ForeignKey(
+        'SearchDocument',
+        on_delete=models.CASCADE,
+        related_name='tokens'
+    )
+    organization = models.ForeignKey(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    entity_type = models.CharField(max_length=20)
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        db_table = 'search_tokens'
+        verbose_name = 'Search Token'
+        verbose_name_plural = 'Search Tokens'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'token'],
+                name='unique_search_token'
+            ),
+        ]
+        indexes = [
+            # Covers prefix lookups without touching the table
+            models.Index(fields=['organization', 'token', 'entity_type', 'document', 'weight']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.document_id} ({self.weight})"
+
+
+class SearchIndexState(models.Model):
+    """
+    Whether an organization's records have been indexed.
+
+    The index is only used for an organization once a rebuild has run;
+    until then searches fall back to substring filters.
+    """
+
+    organization = models.OneToOneField(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='search_index_state'
+    )
+    built_at = models.DateTimeField(null=True, blank=True)
+    document_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'search_index_states'
+        verbose_name = 'Search Index State'
+        verbose_name_plural = 'Search Index States'
+
+    def __str__(self):
+        return f"Search index state for organization {self.organization_id}"
@@ -0,0 +1,45 @@
+"""
+Document Number Sequence Models
+Per-organization counters behind ISS-/ORD-/PAY-YYYY-NNNN numbers
+"""
+
+from django.db import models
+
+
+class NumberSequence(models.Model):
+    """
+    Last number handed out for one (organization, kind, year).
+
+    Rows are only ever advanced with a single atomic UPDATE (see
+    crmApp.services.sequence_service), so concurrent creators never read the
+    same value and never need to retry.
+    """
+
+    KIND_CHOICES = [
+        ('issue', 'Issue'),
+        ('order', 'Order'),
+        ('payment', 'Payment'),
+    ]
+
+    organization = models.ForeignKey(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='number_sequences'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    year = models.PositiveSmallIntegerField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'number_sequences'
+        verbose_name = 'Number Sequence'
+        verbose_name_plural = 'Number Sequences'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'kind', 'year'],
+                name='unique_number_sequence'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.year} for organization {self.organization_id}: {self.last_value}"
@@ -57,9 +57,13 @@ class TelegramUser(TimestampedModel):
         default='none'
     )
     
-    # Conversation history for Gemini (stored as JSON)
+    # Conversation history for Gemini lives in ConversationTurn (self.turns);
+    # this JSON column only holds histories not yet migrated
     conversation_history = models.JSONField(default=list, blank=True)
     conversation_id = models.CharField(max_length=100, null=True, blank=True)
+    # Rolling summary of turns that no longer fit the prompt's history window
+    history_summary = models.TextField(blank=True, default='')
+    history_summary_seq = models.IntegerField(null=True, blank=True)
     
     # Last activity
     last_message_at = models.DateTimeField(null=True, blank=True)
@@ -113,26 +117,90 @@ class TelegramUser(TimestampedModel):
             'pending_email', 'auth_code', 'auth_code_expires_at'
         ])
     
+    @property
+    def turn_filter(self):
+        """ConversationTurn filter for this user's turns."""
+        return {'telegram_user': self}
+    
     def add_to_conversation_history(self, role, content):
-        """Add message to conversation history for Gemini context."""
-        if not self.conversation_history:
-            self.conversation_history = []
+        """Append a message to the conversation history for Gemini context."""
+        from .conversation_turn import ConversationTurn
         
-        self.conversation_history.append({
-            'role': role,  # 'user' or 'assistant'
-            'content': content,
-            'timestamp': timezone.now().isoformat()
-        })
+        ConversationTurn.append(role, content, telegram_user=self)
+    
+    def recent_conversation_history(self, limit=10, token_budget=None):
+        """The latest messages, oldest first, as [{role, content}]."""
+        from .conversation_turn import ConversationTurn
         
-        # Keep only last 20 messages to avoid token limits
-        if len(self.conversation_history) > 20:
-            self.conversation_history = self.conversation_history[-20:]
+        self.import_legacy_history()
+        return ConversationTurn.window(limit, token_budget, telegram_user=self)
+    
+    def import_legacy_history(self):
+        """Move the legacy conversation_history JSON into turns; returns how many were moved."""
+        from crmApp.utils.write_transaction import write_transaction
+        from .conversation_turn import ConversationTurn
         
-        self.save(update_fields=['conversation_history'])
+        if not self.conversation_history:
+            return 0
+        with write_transaction():
+            # Locked and re-read so concurrent callers move the history once
+            legacy = TelegramUser.objects.select_for_update().filter(
+                pk=self.pk
+            ).values_list('conversation_history', flat=True).first()
+            created = ConversationTurn.import_history(legacy or [], telegram_user=self)
+            TelegramUser.objects.filter(pk=self.pk).update(conversation_history=[])
+        self.conversation_history = []
+        return created
     
     def clear_conversation_history(self):
         """Clear conversation history."""
+        self.turns.all().delete()
         self.conversation_history = []
         self.conversation_id = None
-        self.save(update_fields=['conversation_history', 'conversation_id'])
+        self.history_summary = ''
+        self.history_summary_seq = None
+        self.save(update_fields=[
+            'conversation_history', 'conversation_id', 'history_summary', 'history_summary_seq'
+        ])
+
 
+class TelegramUpdate(TimestampedModel):
+    """
+    Incoming webhook update, persisted before it is processed.
+    The unique update_id makes Telegram redeliveries no-ops.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_DROPPED = 'dropped'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_DROPPED, 'Dropped (chat backlog full)'),
+    ]
+    
+    update_id = models.BigIntegerField(unique=True)
+    chat_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'telegram_updates'
+        verbose_name = 'Telegram Update'
+        verbose_name_plural = 'Telegram Updates'
+        ordering = ['update_id']
+        indexes = [
+            models.Index(fields=['status', 'update_id']),
+            models.Index(fields=['chat_id', 'update_id']),
+        ]
+    
+    def __str__(self):
+        return f"Update {self.update_id} (chat {self.chat_id}, {self.status})"
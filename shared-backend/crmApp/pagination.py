@@ -2,7 +2,15 @@
 Custom pagination classes for the CRM API
 """
 
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -21,3 +29,117 @@ class LargeResultsSetPagination(PageNumberPagination):
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 200
+
+
+class CursorResultsSetPagination(StandardResultsSetPagination):
+    """
+    Page-number pagination with an opt-in keyset (cursor) mode.
+
+    Without a ``cursor`` parameter this behaves exactly like
+    StandardResultsSetPagination. Passing ``?cursor=`` (empty for the first
+    page) switches to keyset pagination on (-created_at, -id): each page is
+    an index range scan starting after the previous page's last row, with no
+    OFFSET and no COUNT(*), so page N costs the same as page 1. Keyset pages
+    are always ordered newest first, so ``?ordering=`` is rejected with a
+    400 in cursor mode instead of being silently ignored.
+
+    ``&count=approximate`` adds a count that stops at
+    ``approximate_count_limit`` rows.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    approximate_count_limit = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        if self.ordering_query_param in request.query_params:
+            raise ValidationError({
+                self.ordering_query_param: 'Cursor pages are ordered newest first; ordering cannot be combined with cursor.'
+            })
+
+        # The browsable API's page links only exist for page numbers
+        self.display_page_controls = False
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        backwards, position = self.decode_cursor(request.query_params[self.cursor_query_param])
+
+        page_queryset = queryset
+        if position is not None:
+            created_at, pk = position
+            if backwards:
+                page_queryset = page_queryset.filter(created_at__gte=created_at).filter(
+                    Q(created_at__gt=created_at) | Q(id__gt=pk)
+                )
+            else:
+                # created_at__lte bounds the index range; the Q breaks ties
+                page_queryset = page_queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                )
+        ordering = ('created_at', 'id') if backwards else ('-created_at', '-id')
+        rows = list(page_queryset.order_by(*ordering)[:page_size + 1])
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_position = self.position_of(rows[-1]) if rows and has_next else None
+        self.previous_position = self.position_of(rows[0]) if rows and has_previous else None
+
+        self.approximate_count = None
+        if request.query_params.get(self.count_query_param) == 'approximate':
+            self.approximate_count = queryset.order_by()[:self.approximate_count_limit + 1].count()
+
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+
+        response = {
+            'next': self.get_cursor_link(False, self.next_position),
+            'previous': self.get_cursor_link(True, self.previous_position),
+            'results': data,
+        }
+        if self.approximate_count is not None:
+            response['count'] = min(self.approximate_count, self.approximate_count_limit)
+            response['count_is_exact'] = self.approximate_count <= self.approximate_count_limit
+        return Response(response)
+
+    @staticmethod
+    def position_of(instance):
+        return instance.created_at, instance.pk
+
+    def get_cursor_link(self, backwards, position):
+        if position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(backwards, position))
+
+    @staticmethod
+    def encode_cursor(backwards, position):
+        created_at, pk = position
+        raw = f"{'p' if backwards else 'n'}|{created_at.isoformat()}|{pk}"
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """(backwards, (created_at, pk) or None for the first page)"""
+        if not cursor:
+            return False, None
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            direction, created_at, pk = raw.split('|')
+            if direction not in ('n', 'p'):
+                raise ValueError(direction)
+            return direction == 'p', (datetime.fromisoformat(created_at), int(pk))
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
@@ -85,6 +85,7 @@ from .issue import (
     IssueListSerializer,
     IssueCreateSerializer,
     IssueUpdateSerializer,
+    LinearSyncJobSerializer,
 )
 
 from .issue_comment import (
@@ -118,6 +119,8 @@ from .notification import (
     NotificationPreferencesSerializer,
 )
 
+from .background_job import BackgroundJobSerializer
+
 __all__ = [
     # Auth
     'UserSerializer',
@@ -192,6 +195,7 @@ __all__ = [
     'IssueListSerializer',
     'IssueCreateSerializer',
     'IssueUpdateSerializer',
+    'LinearSyncJobSerializer',
     'IssueCommentSerializer',
     'CreateIssueCommentSerializer',
     
@@ -216,4 +220,7 @@ __all__ = [
     
     # Notification
     'NotificationPreferencesSerializer',
+    
+    # Background Jobs
+    'BackgroundJobSerializer',
 ]
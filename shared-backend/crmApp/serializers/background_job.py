@@ -0,0 +1,19 @@
+"""
+Background Job Serializers
+"""
+
+from rest_framework import serializers
+from crmApp.models import BackgroundJob
+
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    """A queued, running, finished or dead-lettered background job"""
+    
+    class Meta:
+        model = BackgroundJob
+        fields = [
+            'id', 'queue', 'task', 'args', 'kwargs', 'priority', 'status',
+            'idempotency_key', 'lock_key', 'attempts', 'max_attempts', 'run_at',
+            'created_at', 'started_at', 'finished_at', 'last_error'
+        ]
+        read_only_fields = fields
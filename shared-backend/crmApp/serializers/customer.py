@@ -61,32 +61,8 @@ class CustomerListSerializer(serializers.ModelSerializer):
     
     def get_total_value(self, obj):
         """Calculate total value from won deals linked to customer or converted lead"""
-        from django.db.models import Sum, Q
-        from crmApp.models import Deal
-        
-        # Build query to find all won deals for this customer
-        # Deals can be linked directly to customer OR to the lead that was converted to this customer
-        query = Q(is_won=True)
-        
-        # Add customer filter
-        customer_filter = Q(customer=obj)
-        
-        # Add lead filter if customer was converted from a lead
-        if obj.converted_from_lead:
-            lead_filter = Q(lead=obj.converted_from_lead)
-            query = query & (customer_filter | lead_filter)
-        else:
-            query = query & customer_filter
-        
-        # Sum values from all matching deals
-        total = Deal.objects.filter(query).aggregate(total=Sum('value'))['total']
-        deal_total = float(total) if total else 0.0
-        
-        # If no deals found and customer was converted from a lead, use lead's estimated_value
-        if deal_total == 0.0 and obj.converted_from_lead and obj.converted_from_lead.estimated_value:
-            return float(obj.converted_from_lead.estimated_value)
-        
-        return deal_total
+        from crmApp.services.customer_service import CustomerService
+        return CustomerService.get_total_value(obj)
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -128,32 +104,8 @@ class CustomerSerializer(serializers.ModelSerializer):
     
     def get_total_value(self, obj):
         """Calculate total value from won deals linked to customer or converted lead"""
-        from django.db.models import Sum, Q
-        from crmApp.models import Deal
-        
-        # Build query to find all won deals for this customer
-        # Deals can be linked directly to customer OR to the lead that was converted to this customer
-        query = Q(is_won=True)
-        
-        # Add customer filter
-        customer_filter = Q(customer=obj)
-        
-        # Add lead filter if customer was converted from a lead
-        if obj.converted_from_lead:
-            lead_filter = Q(lead=obj.converted_from_lead)
-            query = query & (customer_filter | lead_filter)
-        else:
-            query = query & customer_filter
-        
-        # Sum values from all matching deals
-        total = Deal.objects.filter(query).aggregate(total=Sum('value'))['total']
-        deal_total = float(total) if total else 0.0
-        
-        # If no deals found and customer was converted from a lead, use lead's estimated_value
-        if deal_total == 0.0 and obj.converted_from_lead and obj.converted_from_lead.estimated_value:
-            return float(obj.converted_from_lead.estimated_value)
-        
-        return deal_total
+        from crmApp.services.customer_service import CustomerService
+        return CustomerService.get_total_value(obj)
     
     def get_converted_from_lead(self, obj):
         if obj.converted_from_lead:
@@ -3,7 +3,7 @@ Issue related serializers
 """
 
 from rest_framework import serializers
-from crmApp.models import Issue
+from crmApp.models import Issue, LinearSyncJob
 from .vendor import VendorListSerializer
 from .employee import EmployeeListSerializer
 
@@ -148,3 +148,18 @@ class IssueUpdateSerializer(serializers.ModelSerializer):
             'priority', 'category', 'status', 'assigned_to',
             'resolution_notes'
         ]
+
+
+class LinearSyncJobSerializer(serializers.ModelSerializer):
+    """Progress of a bulk sync to Linear"""
+    
+    processed_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = LinearSyncJob
+        fields = [
+            'id', 'status', 'team_id', 'total', 'processed_count',
+            'synced_count', 'failed_count', 'results', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
@@ -2,6 +2,7 @@
 Message Serializers
 """
 
+from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from crmApp.models import Message, Conversation
 from crmApp.serializers.auth import UserSerializer
@@ -70,12 +71,42 @@ class MessageCreateSerializer(serializers.Serializer):
         return value
 
 
+class ParticipantSerializer(serializers.ModelSerializer):
+    """Compact user representation for inbox rows (no profile/organization lookups)"""
+    
+    full_name = serializers.CharField(read_only=True)
+    
+    class Meta:
+        model = get_user_model()
+        fields = [
+            'id', 'email', 'username', 'first_name', 'last_name',
+            'full_name', 'profile_image'
+        ]
+        read_only_fields = fields
+
+
+class ConversationMessageSerializer(serializers.ModelSerializer):
+    """Last message of a conversation, as shown in the inbox"""
+    
+    sender = ParticipantSerializer(read_only=True)
+    recipient = ParticipantSerializer(read_only=True)
+    
+    class Meta:
+        model = Message
+        fields = [
+            'id', 'sender', 'recipient', 'message_type', 'subject',
+            'content', 'organization', 'is_read', 'read_at',
+            'attachments', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
 class ConversationSerializer(serializers.ModelSerializer):
     """Serializer for Conversation model"""
     
-    participant1 = UserSerializer(read_only=True)
-    participant2 = UserSerializer(read_only=True)
-    last_message = MessageSerializer(read_only=True)
+    participant1 = ParticipantSerializer(read_only=True)
+    participant2 = ParticipantSerializer(read_only=True)
+    last_message = ConversationMessageSerializer(read_only=True)
     other_participant = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
     
@@ -84,6 +115,7 @@ class ConversationSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'participant1', 'participant2', 'other_participant',
             'organization', 'last_message', 'last_message_at',
+            'last_message_preview',
             'unread_count_participant1', 'unread_count_participant2',
             'unread_count', 'created_at', 'updated_at'
         ]
@@ -93,9 +125,9 @@ class ConversationSerializer(serializers.ModelSerializer):
         """Get the other participant (not the current user)"""
         request = self.context.get('request')
         if request and request.user:
-            if obj.participant1 == request.user:
-                return UserSerializer(obj.participant2).data
-            return UserSerializer(obj.participant1).data
+            if obj.participant1_id == request.user.pk:
+                return ParticipantSerializer(obj.participant2).data
+            return ParticipantSerializer(obj.participant1).data
         return None
     
     def get_unread_count(self, obj):
@@ -12,6 +12,13 @@ from .deal_service import DealService
 from .rbac_service import RBACService
 from .linear_service import LinearService
 from .issue_linear_service import IssueLinearService
+from .analytics_service import AnalyticsService
+from .analytics_rollup_service import AnalyticsRollupService
+from .audit_log_writer import AuditLogWriter
+from .telegram_update_queue import TelegramUpdateQueue
+from .sequence_service import SequenceService
+from .presence_service import PresenceService
+from .activity_timeline_service import ActivityTimelineService
 
 __all__ = [
     'AuthService',
@@ -21,4 +28,11 @@ __all__ = [
     'RBACService',
     'LinearService',
     'IssueLinearService',
+    'AnalyticsService',
+    'AnalyticsRollupService',
+    'AuditLogWriter',
+    'TelegramUpdateQueue',
+    'SequenceService',
+    'PresenceService',
+    'ActivityTimelineService',
 ]
@@ -0,0 +1,314 @@
+"""
+Activity Timeline Service
+One newest-first feed of an organization's activities, audit log entries and
+video calls (the activities page, the Gemini list_activities tool and the MCP
+list_activities tool).
+
+Every filter is applied in SQL and each source reads at most one page (plus
+one row) newest first; the sources are then merged lazily with a heap. Pages
+are keyset-paginated on (created_at, source, id), so the next page starts
+after the previous page's last row without OFFSET.
+"""
+
+import heapq
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db.models import Q
+
+from crmApp.models import Activity, AuditLog, JitsiCallSession
+
+logger = logging.getLogger(__name__)
+
+# Rank of each source among rows created at the same instant
+SOURCE_ACTIVITY = 2
+SOURCE_AUDIT_LOG = 1
+SOURCE_CALL = 0
+
+# Activity status -> call statuses
+CALL_STATUSES = {
+    'scheduled': ['pending', 'ringing'],
+    'in_progress': ['active'],
+    'completed': ['completed'],
+    'cancelled': ['cancelled', 'rejected', 'missed', 'failed'],
+}
+
+# Call status -> activity status
+CALL_ACTIVITY_STATUS = {
+    call_status: activity_status
+    for activity_status, call_statuses in CALL_STATUSES.items()
+    for call_status in call_statuses
+}
+
+Position = Tuple[datetime, int, int]
+
+
+class InvalidTimelineCursor(ValueError):
+    """Cursor that was not returned by a previous timeline page"""
+
+
+def _user_display_name(row: Dict[str, Any], prefix: str) -> Optional[str]:
+    """Full name (or username) of a user joined into a values() row under prefix"""
+    full_name = f"{row[prefix + '__first_name'] or ''} {row[prefix + '__last_name'] or ''}".strip()
+    return full_name or row[prefix + '__username']
+
+
+class ActivityTimelineService:
+    """Merged, paginated timeline of activities, audit logs and video calls"""
+
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 100
+
+    @staticmethod
+    def encode_cursor(position: Position) -> str:
+        created_at, source, pk = position
+        raw = f"{created_at.isoformat()}|{source}|{pk}"
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: Optional[str]) -> Optional[Position]:
+        """Position after which the page starts (None for the first page)"""
+        if not cursor:
+            return None
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created_at, source, pk = raw.split('|')
+            return datetime.fromisoformat(created_at), int(source), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise InvalidTimelineCursor('Invalid cursor')
+
+    @staticmethod
+    def _after(queryset, source: int, position: Optional[Position]):
+        """Rows of one source that come after position in (-created_at, -source, -id) order"""
+        if position is None:
+            return queryset
+        created_at, cursor_source, pk = position
+        if source < cursor_source:
+            return queryset.filter(created_at__lte=created_at)
+        if source > cursor_source:
+            return queryset.filter(created_at__lt=created_at)
+        return queryset.filter(created_at__lte=created_at).filter(
+            Q(created_at__lt=created_at) | Q(id__lt=pk)
+        )
+
+    @staticmethod
+    def _activities(
+        organization_ids: List[int],
+        activity_type: Optional[str] = None,
+        status: Optional[str] = None,
+        customer_id: Optional[int] = None,
+        lead_id: Optional[int] = None,
+        deal_id: Optional[int] = None,
+        assigned_to: Optional[int] = None,
+        search: Optional[str] = None,
+    ):
+        queryset = Activity.objects.filter(organization_id__in=organization_ids)
+        if activity_type:
+            queryset = queryset.filter(activity_type=activity_type)
+        if status:
+            queryset = queryset.filter(status=status)
+        if customer_id:
+            queryset = queryset.filter(customer_id=customer_id)
+        if lead_id:
+            queryset = queryset.filter(lead_id=lead_id)
+        if deal_id:
+            queryset = queryset.filter(deal_id=deal_id)
+        if assigned_to:
+            queryset = queryset.filter(assigned_to_id=assigned_to)
+        if search:
+            queryset = queryset.filter(
+                Q(title__icontains=search) |
+                Q(description__icontains=search) |
+                Q(customer_name__icontains=search)
+            )
+        return queryset
+
+    @staticmethod
+    def _audit_logs(
+        organization_ids: List[int],
+        activity_type: Optional[str] = None,
+        status: Optional[str] = None,
+        customer_id: Optional[int] = None,
+        lead_id: Optional[int] = None,
+        deal_id: Optional[int] = None,
+        assigned_to: Optional[int] = None,
+        search: Optional[str] = None,
+    ):
+        # Audit log entries are completed notes that are never assigned
+        if activity_type not in (None, '', 'note') or status not in (None, '', 'completed') or assigned_to:
+            return None
+        queryset = AuditLog.objects.filter(organization_id__in=organization_ids)
+        if customer_id:
+            queryset = queryset.filter(related_customer_id=customer_id)
+        if lead_id:
+            queryset = queryset.filter(related_lead_id=lead_id)
+        if deal_id:
+            queryset = queryset.filter(related_deal_id=deal_id)
+        if search:
+            queryset = queryset.filter(
+                Q(description__icontains=search) |
+                Q(resource_name__icontains=search) |
+                Q(user_email__icontains=search)
+            )
+        return queryset
+
+    @staticmethod
+    def _calls(
+        organization_ids: List[int],
+        activity_type: Optional[str] = None,
+        status: Optional[str] = None,
+        customer_id: Optional[int] = None,
+        lead_id: Optional[int] = None,
+        deal_id: Optional[int] = None,
+        assigned_to: Optional[int] = None,
+        search: Optional[str] = None,
+    ):
+        # Calls are not linked to customers, leads, deals or assigned employees
+        if activity_type not in (None, '', 'call') or customer_id or lead_id or deal_id or assigned_to:
+            return None
+        queryset = JitsiCallSession.objects.filter(organization_id__in=organization_ids)
+        if status:
+            if status not in CALL_STATUSES:
+                return None
+            queryset = queryset.filter(status__in=CALL_STATUSES[status])
+        if search:
+            queryset = queryset.filter(
+                Q(room_name__icontains=search) |
+                Q(notes__icontains=search)
+            )
+        return queryset
+
+    @staticmethod
+    def _activity_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        row['source'] = SOURCE_ACTIVITY
+        return row
+
+    @staticmethod
+    def _audit_log_row(log: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'id': f"audit-{log['id']}",
+            'pk': log['id'],
+            'source': SOURCE_AUDIT_LOG,
+            'activity_type': 'note',
+            'title': log['description'] or f"{log['action']} {log['resource_type']}",
+            'description': log['resource_name'] or log['description'] or '',
+            'customer_name': log['user_email'] or 'System',
+            'status': 'completed',
+            'created_at': log['created_at'],
+            'scheduled_at': log['created_at'],
+            'completed_at': log['created_at'],
+        }
+
+    @staticmethod
+    def _call_row(call: Dict[str, Any]) -> Dict[str, Any]:
+        recipient_name = _user_display_name(call, 'recipient') or _user_display_name(call, 'initiator') or 'Unknown'
+        call_type = call['call_type'] or 'audio'
+        title = f"{call_type.title()} Call"
+        title += f" with {recipient_name}" if call['status'] == 'completed' else f" to {recipient_name}"
+
+        duration = call['duration_seconds']
+        duration_note = f" ({duration // 60:02d}:{duration % 60:02d})" if duration else ''
+        return {
+            'id': f"call-{call['id']}",
+            'pk': call['id'],
+            'source': SOURCE_CALL,
+            'activity_type': 'call',
+            'title': title,
+            'description': call['notes'] or f"{call_type} call - {call['status']}{duration_note}",
+            'customer_name': recipient_name,
+            'status': CALL_ACTIVITY_STATUS.get(call['status'], 'completed'),
+            'created_at': call['created_at'],
+            'scheduled_at': call['started_at'] or call['created_at'],
+            'completed_at': call['ended_at'],
+        }
+
+    @staticmethod
+    def _rows(queryset, fields: Iterable[str], to_row, size: int) -> Iterator[Dict[str, Any]]:
+        """Newest-first timeline rows of one source, read with a single bounded query"""
+        for row in queryset.order_by('-created_at', '-id').values(*fields)[:size]:
+            yield to_row(row)
+
+    @staticmethod
+    def page(
+        organization_ids: Iterable[int],
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        **filters
+    ) -> Dict[str, Any]:
+        """
+        One timeline page, newest first.
+
+        filters are activity_type, status, customer_id, lead_id, deal_id,
+        assigned_to and search. A source that cannot match them is not
+        queried at all.
+
+        Returns:
+            {'activities': rows, 'more_available': bool, 'next_cursor': str or None}
+
+        Raises:
+            InvalidTimelineCursor: cursor was not returned by a previous page
+        """
+        organization_ids = [org_id for org_id in organization_ids if org_id]
+        size = min(max(int(limit or ActivityTimelineService.DEFAULT_LIMIT), 1), ActivityTimelineService.MAX_LIMIT)
+        position = ActivityTimelineService.decode_cursor(cursor)
+
+        sources = [
+            (
+                SOURCE_ACTIVITY,
+                ActivityTimelineService._activities(organization_ids, **filters),
+                ('id', 'activity_type', 'title', 'description', 'customer_name', 'status',
+                 'customer_id', 'lead_id', 'deal_id', 'assigned_to_id',
+                 'scheduled_at', 'completed_at', 'created_at'),
+                ActivityTimelineService._activity_row,
+            ),
+            (
+                SOURCE_AUDIT_LOG,
+                ActivityTimelineService._audit_logs(organization_ids, **filters),
+                ('id', 'action', 'resource_type', 'resource_name', 'description', 'user_email', 'created_at'),
+                ActivityTimelineService._audit_log_row,
+            ),
+            (
+                SOURCE_CALL,
+                ActivityTimelineService._calls(organization_ids, **filters),
+                ('id', 'call_type', 'status', 'notes', 'duration_seconds', 'started_at', 'ended_at', 'created_at',
+                 'initiator__first_name', 'initiator__last_name', 'initiator__username',
+                 'recipient__first_name', 'recipient__last_name', 'recipient__username'),
+                ActivityTimelineService._call_row,
+            ),
+        ]
+        streams = [
+            ActivityTimelineService._rows(
+                ActivityTimelineService._after(queryset, source, position), fields, to_row, size + 1
+            )
+            for source, queryset, fields, to_row in sources
+            if queryset is not None and organization_ids
+        ]
+
+        merged = heapq.merge(
+            *streams,
+            key=lambda row: (row['created_at'], row['source'], row.get('pk', row['id'])),
+            reverse=True,
+        )
+        rows = list(islice(merged, size + 1))
+        more_available = len(rows) > size
+        rows = rows[:size]
+
+        next_cursor = None
+        if more_available:
+            last = rows[-1]
+            next_cursor = ActivityTimelineService.encode_cursor(
+                (last['created_at'], last['source'], last.get('pk', last['id']))
+            )
+        for row in rows:
+            row.pop('pk', None)
+            row.pop('source', None)
+
+        logger.debug(f"Timeline page of {len(rows)} row(s) for orgs {organization_ids} (more_available={more_available})")
+        return {
+            'activities': rows,
+            'more_available': more_available,
+            'next_cursor': next_cursor,
+        }
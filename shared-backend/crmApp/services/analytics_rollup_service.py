@@ -0,0 +1,555 @@
+"""
+Analytics Rollup Service
+
+Maintains the per-organization daily rollup table (AnalyticsDailyRollup) and
+answers analytics questions from it.
+
+Rollups are kept current incrementally: model signals compute the difference
+between a record's loaded and new contribution and apply it with F() updates.
+The backfill_analytics_rollups management command rebuilds (and reconciles)
+them from the raw tables. Reads only trust an organization's rollups once
+it has been backfilled and the requested range is covered; a failed
+incremental update withdraws that trust until the next rebuild.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, CharField, Count, DecimalField, F, Q, QuerySet, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from crmApp.models import (
+    Activity, AnalyticsDailyRollup, AnalyticsRollupState, Customer, Deal, Lead,
+)
+from crmApp.utils.write_transaction import write_transaction
+
+logger = logging.getLogger(__name__)
+
+# (organization_id, date, metric, dimension, dimension_value)
+BucketKey = Tuple[int, date, str, str, str]
+
+
+class _Derived:
+    """A dimension computed from several fields, in Python and in SQL."""
+
+    def __init__(self, fields: Tuple[str, ...], python: Callable[[Dict], str], sql):
+        self.fields = fields
+        self.python = python
+        self.sql = sql
+
+
+def _deal_status(values: Dict) -> str:
+    if values['is_won']:
+        return 'won'
+    if values['is_lost']:
+        return 'lost'
+    return 'open'
+
+
+DEAL_STATUS = _Derived(
+    fields=('is_won', 'is_lost'),
+    python=_deal_status,
+    sql=Case(
+        When(is_won=True, then=Value('won')),
+        When(is_lost=True, then=Value('lost')),
+        default=Value('open'),
+        output_field=CharField(),
+    ),
+)
+
+
+class RollupSpec:
+    """
+    How one metric is derived from one model.
+
+    date_field is a DateTimeField (bucketed by local date) or a DateField.
+    condition/sql_condition restrict which records contribute.
+    """
+
+    def __init__(
+        self,
+        metric: str,
+        model,
+        date_field: str,
+        dimensions: Dict[str, object],
+        value_field: Optional[str] = None,
+        condition: Optional[Callable[[Dict], bool]] = None,
+        sql_condition: Optional[Q] = None,
+        condition_fields: Tuple[str, ...] = (),
+    ):
+        self.metric = metric
+        self.model = model
+        self.date_field = date_field
+        self.dimensions = dimensions
+        self.value_field = value_field
+        self.condition = condition
+        self.sql_condition = sql_condition
+        self.condition_fields = condition_fields
+
+    @property
+    def fields(self) -> List[str]:
+        fields = {'organization_id', self.date_field, *self.condition_fields}
+        if self.value_field:
+            fields.add(self.value_field)
+        for source in self.dimensions.values():
+            fields.update(source.fields if isinstance(source, _Derived) else (source,))
+        return sorted(fields)
+
+
+ROLLUP_SPECS: List[RollupSpec] = [
+    RollupSpec(
+        metric='lead',
+        model=Lead,
+        date_field='created_at',
+        value_field='estimated_value',
+        dimensions={
+            'stage': 'stage_id',
+            'source': 'source',
+            'status': 'qualification_status',
+            'owner': 'assigned_to_id',
+        },
+    ),
+    RollupSpec(
+        metric='deal',
+        model=Deal,
+        date_field='created_at',
+        value_field='value',
+        dimensions={
+            'stage': 'stage_id',
+            'status': DEAL_STATUS,
+            'owner': 'assigned_to_id',
+        },
+    ),
+    RollupSpec(
+        metric='deal_won',
+        model=Deal,
+        date_field='actual_close_date',
+        value_field='value',
+        dimensions={'owner': 'assigned_to_id'},
+        condition=lambda values: bool(values['is_won']) and values['actual_close_date'] is not None,
+        sql_condition=Q(is_won=True, actual_close_date__isnull=False),
+        condition_fields=('is_won',),
+    ),
+    RollupSpec(
+        metric='customer',
+        model=Customer,
+        date_field='created_at',
+        dimensions={
+            'status': 'status',
+            'source': 'source',
+            'owner': 'assigned_to_id',
+        },
+    ),
+    RollupSpec(
+        metric='activity',
+        model=Activity,
+        date_field='created_at',
+        dimensions={
+            'status': 'status',
+            'owner': 'assigned_to_id',
+        },
+    ),
+]
+
+ROLLUP_MODELS = tuple({spec.model for spec in ROLLUP_SPECS})
+
+
+def specs_for_model(model) -> List[RollupSpec]:
+    """Rollup specs fed by the given model class."""
+    return [spec for spec in ROLLUP_SPECS if spec.model is model]
+
+
+def tracked_fields(model) -> List[str]:
+    """Field attnames whose values determine a record's rollup contribution."""
+    fields = set()
+    for spec in specs_for_model(model):
+        fields.update(spec.fields)
+    return sorted(fields)
+
+
+def _to_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _to_decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0')
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _dimension_value(value) -> str:
+    return '' if value is None else str(value)
+
+
+class AnalyticsRollupService:
+    """Service class for maintaining and reading analytics rollups"""
+
+    # ------------------------------------------------------------------
+    # Incremental maintenance
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def snapshot(instance) -> Dict:
+        """Capture the tracked field values of a model instance."""
+        return {field: getattr(instance, field, None) for field in tracked_fields(type(instance))}
+
+    @staticmethod
+    def contributions(model, values: Optional[Dict]) -> Dict[BucketKey, List]:
+        """
+        Buckets a record contributes to, as {bucket_key: [count, value]}.
+
+        Args:
+            model: Rollup source model class
+            values: Tracked field values (None for a record that does not exist)
+        """
+        result: Dict[BucketKey, List] = {}
+        if not values or not values.get('organization_id'):
+            return result
+
+        for spec in specs_for_model(model):
+            if spec.condition and not spec.condition(values):
+                continue
+            day = _to_date(values.get(spec.date_field))
+            if day is None:
+                continue
+            amount = _to_decimal(values.get(spec.value_field)) if spec.value_field else Decimal('0')
+
+            buckets = [('total', '')]
+            for dimension, source in spec.dimensions.items():
+                raw = source.python(values) if isinstance(source, _Derived) else values.get(source)
+                buckets.append((dimension, _dimension_value(raw)))
+
+            for dimension, dimension_value in buckets:
+                key = (values['organization_id'], day, spec.metric, dimension, dimension_value)
+                result[key] = [1, amount]
+        return result
+
+    @staticmethod
+    def record_change(model, old_values: Optional[Dict], new_values: Optional[Dict]) -> None:
+        """
+        Apply the difference between a record's old and new contribution.
+
+        Pass old_values=None for creates and new_values=None for deletes.
+        """
+        deltas: Dict[BucketKey, List] = defaultdict(lambda: [0, Decimal('0')])
+        for key, (count, amount) in AnalyticsRollupService.contributions(model, old_values).items():
+            deltas[key][0] -= count
+            deltas[key][1] -= amount
+        for key, (count, amount) in AnalyticsRollupService.contributions(model, new_values).items():
+            deltas[key][0] += count
+            deltas[key][1] += amount
+        AnalyticsRollupService.apply_deltas(deltas)
+
+    @staticmethod
+    def apply_deltas(deltas: Dict[BucketKey, List]) -> None:
+        """Add {bucket_key: [count, value]} deltas to the rollup table, skipping no-ops."""
+        for (organization_id, day, metric, dimension, dimension_value), (count, amount) in deltas.items():
+            if not count and not amount:
+                continue
+            bucket = AnalyticsDailyRollup.objects.filter(
+                organization_id=organization_id,
+                date=day,
+                metric=metric,
+                dimension=dimension,
+                dimension_value=dimension_value
+            )
+            updated = bucket.update(count=F('count') + count, value=F('value') + amount)
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    AnalyticsDailyRollup.objects.create(
+                        organization_id=organization_id,
+                        date=day,
+                        metric=metric,
+                        dimension=dimension,
+                        dimension_value=dimension_value,
+                        count=count,
+                        value=amount
+                    )
+            except IntegrityError:
+                # Another writer created the bucket first
+                bucket.update(count=F('count') + count, value=F('value') + amount)
+
+    @staticmethod
+    def bulk_update(queryset: QuerySet, **fields) -> int:
+        """
+        QuerySet.update() that keeps rollups in sync.
+
+        update() bypasses model signals, so the affected records' tracked
+        fields are read (and locked) before and after the update and the net
+        difference is applied in one pass.
+
+        Returns:
+            Number of rows updated
+        """
+        model = queryset.model
+        if model not in ROLLUP_MODELS:
+            return queryset.update(**fields)
+
+        columns = ['pk', *tracked_fields(model)]
+        with write_transaction():
+            before = {row['pk']: row for row in queryset.select_for_update().values(*columns)}
+            updated = queryset.update(**fields)
+            after = model.objects.filter(pk__in=before.keys()).values(*columns)
+
+            deltas: Dict[BucketKey, List] = defaultdict(lambda: [0, Decimal('0')])
+            for row in after:
+                for key, (count, amount) in AnalyticsRollupService.contributions(model, before.get(row['pk'])).items():
+                    deltas[key][0] -= count
+                    deltas[key][1] -= amount
+                for key, (count, amount) in AnalyticsRollupService.contributions(model, row).items():
+                    deltas[key][0] += count
+                    deltas[key][1] += amount
+            AnalyticsRollupService.apply_deltas(deltas)
+        return updated
+
+    # ------------------------------------------------------------------
+    # Backfill / reconcile
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _spec_date_expression(spec: RollupSpec):
+        field = spec.model._meta.get_field(spec.date_field)
+        if field.get_internal_type() == 'DateTimeField':
+            return TruncDate(spec.date_field)
+        return F(spec.date_field)
+
+    @staticmethod
+    def compute(organization_id: int, since: Optional[date] = None) -> Dict[BucketKey, List]:
+        """
+        Compute rollup buckets for an organization straight from the raw tables.
+
+        One GROUP BY (day, dimension) query per metric and dimension.
+        """
+        buckets: Dict[BucketKey, List] = {}
+        for spec in ROLLUP_SPECS:
+            queryset = spec.model.objects.filter(organization_id=organization_id)
+            if spec.sql_condition is not None:
+                queryset = queryset.filter(spec.sql_condition)
+            queryset = queryset.annotate(rollup_day=AnalyticsRollupService._spec_date_expression(spec))
+            if since:
+                queryset = queryset.filter(rollup_day__gte=since)
+
+            value_expression = (
+                Coalesce(Sum(spec.value_field), Value(Decimal('0')), output_field=DecimalField())
+                if spec.value_field else Value(Decimal('0'), output_field=DecimalField())
+            )
+
+            dimensions = [('total', Value('', output_field=CharField()))]
+            for dimension, source in spec.dimensions.items():
+                expression = source.sql if isinstance(source, _Derived) else Cast(source, CharField())
+                dimensions.append((dimension, expression))
+
+            for dimension, expression in dimensions:
+                grouped = queryset.annotate(rollup_dimension=expression).order_by().values(
+                    'rollup_day', 'rollup_dimension'
+                ).annotate(rollup_count=Count('pk'), rollup_value=value_expression)
+                for row in grouped:
+                    key = (
+                        organization_id,
+                        _to_date(row['rollup_day']),
+                        spec.metric,
+                        dimension,
+                        _dimension_value(row['rollup_dimension'])
+                    )
+                    buckets[key] = [row['rollup_count'], _to_decimal(row['rollup_value'])]
+        return buckets
+
+    @staticmethod
+    def _stored(organization_id: int, since: Optional[date] = None) -> QuerySet:
+        rows = AnalyticsDailyRollup.objects.filter(organization_id=organization_id)
+        if since:
+            rows = rows.filter(date__gte=since)
+        return rows
+
+    @staticmethod
+    def rebuild(organization_id: int, since: Optional[date] = None) -> int:
+        """
+        Replace an organization's rollups (from `since` onwards) with freshly
+        computed values and mark the organization as backfilled.
+
+        Returns:
+            Number of rollup rows written
+        """
+        with write_transaction():
+            state, _ = AnalyticsRollupState.objects.select_for_update().get_or_create(
+                organization_id=organization_id
+            )
+            buckets = AnalyticsRollupService.compute(organization_id, since)
+            AnalyticsRollupService._stored(organization_id, since).delete()
+            AnalyticsDailyRollup.objects.bulk_create([
+                AnalyticsDailyRollup(
+                    organization_id=org_id,
+                    date=day,
+                    metric=metric,
+                    dimension=dimension,
+                    dimension_value=dimension_value,
+                    count=count,
+                    value=amount
+                )
+                for (org_id, day, metric, dimension, dimension_value), (count, amount) in buckets.items()
+                if count
+            ], batch_size=1000)
+
+            # A partial rebuild keeps previously covered history; a full one covers everything
+            if since is None or state.backfilled_at is None:
+                state.covered_from = since
+            elif state.covered_from and since < state.covered_from:
+                state.covered_from = since
+            state.backfilled_at = timezone.now()
+            state.save()
+
+        logger.info(f"Rebuilt {len(buckets)} analytics rollup buckets for organization {organization_id}")
+        return len(buckets)
+
+    @staticmethod
+    def invalidate(organization_ids: Iterable[int]) -> int:
+        """
+        Mark organizations' rollups as not covered (e.g. after a failed
+        incremental update), so reads fall back to the raw tables until
+        they are rebuilt.
+
+        Returns:
+            Number of organizations invalidated
+        """
+        organization_ids = {org_id for org_id in organization_ids if org_id}
+        if not organization_ids:
+            return 0
+        invalidated = AnalyticsRollupState.objects.filter(
+            organization_id__in=organization_ids,
+            backfilled_at__isnull=False
+        ).update(backfilled_at=None)
+        if invalidated:
+            logger.warning(f"Analytics rollups of organizations {sorted(organization_ids)} need a rebuild")
+        return invalidated
+
+    @staticmethod
+    def needs_rebuild(organization_id: int) -> bool:
+        """True when the organization was backfilled once but its rollups were invalidated since"""
+        return AnalyticsRollupState.objects.filter(
+            organization_id=organization_id,
+            backfilled_at__isnull=True
+        ).exists()
+
+    @staticmethod
+    def find_drift(organization_id: int, since: Optional[date] = None) -> List[Dict]:
+        """
+        Compare stored rollups with the raw tables.
+
+        Returns:
+            List of {'bucket', 'stored', 'expected'} entries that disagree
+        """
+        expected = AnalyticsRollupService.compute(organization_id, since)
+        stored = {
+            (organization_id, row.date, row.metric, row.dimension, row.dimension_value): [row.count, row.value]
+            for row in AnalyticsRollupService._stored(organization_id, since)
+        }
+
+        drift = []
+        zero = [0, Decimal('0')]
+        for key in set(expected) | set(stored):
+            stored_count, stored_value = stored.get(key, zero)
+            expected_count, expected_value = expected.get(key, zero)
+            if stored_count != expected_count or _to_decimal(stored_value) != _to_decimal(expected_value):
+                drift.append({
+                    'bucket': key,
+                    'stored': (stored_count, stored_value),
+                    'expected': (expected_count, expected_value),
+                })
+        return sorted(drift, key=lambda item: item['bucket'][1:])
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_covered(organization_ids: Iterable[int], start: Optional[date] = None) -> bool:
+        """
+        True when every organization is backfilled from `start` (or from the
+        beginning of its history when start is None).
+        """
+        organization_ids = set(organization_ids)
+        if not organization_ids:
+            return False
+
+        states = AnalyticsRollupState.objects.filter(
+            organization_id__in=organization_ids,
+            backfilled_at__isnull=False
+        )
+        if start is None:
+            states = states.filter(covered_from__isnull=True)
+        else:
+            states = states.filter(Q(covered_from__isnull=True) | Q(covered_from__lte=start))
+        return states.count() == len(organization_ids)
+
+    @staticmethod
+    def totals(
+        organization_ids: Iterable[int],
+        metric: str,
+        dimension: str = 'total',
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> Dict[str, Tuple[int, Decimal]]:
+        """
+        Summed (count, value) per dimension value over an inclusive day range.
+
+        Returns:
+            {dimension_value: (count, value)}; use '' for the 'total' dimension
+        """
+        rows = AnalyticsDailyRollup.objects.filter(
+            organization_id__in=organization_ids,
+            metric=metric,
+            dimension=dimension
+        )
+        if start:
+            rows = rows.filter(date__gte=start)
+        if end:
+            rows = rows.filter(date__lte=end)
+
+        grouped = rows.order_by().values('dimension_value').annotate(
+            total_count=Sum('count'),
+            total_value=Sum('value')
+        )
+        return {
+            row['dimension_value']: (row['total_count'] or 0, _to_decimal(row['total_value']))
+            for row in grouped
+        }
+
+    @staticmethod
+    def daily_series(
+        organization_ids: Iterable[int],
+        metric: str,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> List[Tuple[date, int, Decimal]]:
+        """Per-day (date, count, value) totals for a metric over an inclusive day range."""
+        rows = AnalyticsDailyRollup.objects.filter(
+            organization_id__in=organization_ids,
+            metric=metric,
+            dimension='total'
+        )
+        if start:
+            rows = rows.filter(date__gte=start)
+        if end:
+            rows = rows.filter(date__lte=end)
+
+        grouped = rows.order_by('date').values('date').annotate(
+            total_count=Sum('count'),
+            total_value=Sum('value')
+        )
+        return [
+            (row['date'], row['total_count'] or 0, _to_decimal(row['total_value']))
+            for row in grouped
+        ]
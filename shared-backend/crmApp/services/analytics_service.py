@@ -0,0 +1,499 @@
+"""
+Analytics Service
+
+Grouped and conditional aggregate queries for dashboards and stats endpoints.
+Each method computes its statistics in one or two queries (COUNT(...) FILTER /
+GROUP BY) instead of issuing a separate count() per status, source or stage,
+while returning exactly the JSON shapes the web and mobile clients expect.
+
+Organization-wide dashboard numbers are read from the daily rollup table
+(see AnalyticsRollupService) whenever the requested range is covered, so
+their cost does not grow with an organization's history.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.db.models import Avg, Count, Q, QuerySet, Sum
+from django.utils import timezone
+
+from crmApp.models import Activity, AuditLog, Customer, Deal, Lead, PipelineStage
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService
+
+REVENUE_PERIODS = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def _count_by(values: Iterable, field: str, prefix: str) -> Dict[str, Count]:
+    """
+    Build conditional COUNT aggregates, one per value of field.
+
+    Example:
+        _count_by(['low', 'high'], 'priority', 'priority_')
+        -> {'priority_low': Count('id', filter=Q(priority='low')), ...}
+    """
+    return {
+        f"{prefix}{value}": Count('id', filter=Q(**{field: value}))
+        for value in values
+    }
+
+
+def _rollup_days(start_date: datetime, end_date: datetime) -> Optional[Tuple[date, date]]:
+    """
+    Inclusive (first_day, last_day) when [start_date, end_date] consists of
+    whole local days, otherwise None (partial days must hit the raw tables).
+
+    end_date counts as a day boundary when it is 23:59:59.999999 or not
+    earlier than now (today's rollup is always current).
+    """
+    local_start = timezone.localtime(start_date) if timezone.is_aware(start_date) else start_date
+    local_end = timezone.localtime(end_date) if timezone.is_aware(end_date) else end_date
+    if local_start.time() != time.min:
+        return None
+    if local_end.time() != time.max and end_date < timezone.now():
+        return None
+    return local_start.date(), local_end.date()
+
+
+def _period_start(day: date, period: str) -> date:
+    """First day of the day/week/month/quarter/year containing day."""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if period == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+class AnalyticsService:
+    """Service class for analytics and statistics queries"""
+
+    @staticmethod
+    def lead_stats(queryset: QuerySet) -> Dict:
+        """
+        Lead statistics in two queries: one conditional aggregate and one GROUP BY source.
+
+        Args:
+            queryset: Lead queryset already scoped to the user's organizations
+
+        Returns:
+            Dictionary with lead statistics
+        """
+        statuses = ['new', 'contacted', 'qualified', 'unqualified', 'lost']
+        totals = queryset.aggregate(
+            total=Count('id'),
+            converted=Count('id', filter=Q(is_converted=True)),
+            avg_score=Avg('lead_score'),
+            total_value=Sum('estimated_value'),
+            **_count_by(statuses, 'qualification_status', 'status_')
+        )
+
+        total = totals['total']
+        converted = totals['converted']
+        conversion_rate = (converted / total * 100) if total > 0 else 0
+
+        by_source = queryset.order_by().values('source').annotate(count=Count('id'))
+
+        return {
+            'totalLeads': total,
+            'statusCounts': {
+                'new': totals['status_new'],
+                'contacted': totals['status_contacted'],
+                'qualified': totals['status_qualified'],
+                'unqualified': totals['status_unqualified'],
+                'converted': converted,
+                'lost': totals['status_lost'],
+            },
+            'averageScore': round(totals['avg_score'] or 0, 2),
+            'totalEstimatedValue': float(totals['total_value'] or 0),
+            'conversionRate': round(conversion_rate, 2),
+            'by_source': {row['source']: row['count'] for row in by_source},
+        }
+
+    @staticmethod
+    def deal_stats(queryset: QuerySet) -> Dict:
+        """
+        Deal statistics in two queries: one conditional aggregate and one GROUP BY stage.
+
+        Args:
+            queryset: Deal queryset already scoped to the user's organizations
+
+        Returns:
+            Dictionary with deal statistics
+        """
+        priorities = [choice for choice, _ in Deal.PRIORITY_CHOICES]
+        totals = queryset.aggregate(
+            total=Count('id'),
+            total_value=Sum('value'),
+            expected_revenue=Sum('expected_revenue'),
+            won=Count('id', filter=Q(is_won=True)),
+            lost=Count('id', filter=Q(is_lost=True)),
+            open=Count('id', filter=Q(is_won=False, is_lost=False)),
+            **_count_by(priorities, 'priority', 'priority_')
+        )
+
+        stages = queryset.order_by().values('stage__name').annotate(
+            count=Count('id'),
+            total_value=Sum('value')
+        )
+
+        return {
+            'total_deals': totals['total'],
+            'total_value': float(totals['total_value'] or 0),
+            'expected_revenue': float(totals['expected_revenue'] or 0),
+            'won': totals['won'],
+            'lost': totals['lost'],
+            'open': totals['open'],
+            'by_stage': [
+                {
+                    'stage_name': stage['stage__name'],
+                    'count': stage['count'],
+                    'total_value': float(stage['total_value'] or 0)
+                }
+                for stage in stages if stage['stage__name']
+            ],
+            'by_priority': {
+                priority: totals[f'priority_{priority}'] for priority in priorities
+            },
+        }
+
+    @staticmethod
+    def issue_stats(queryset: QuerySet) -> Dict:
+        """
+        Issue statistics in a single conditional aggregate query.
+
+        Args:
+            queryset: Issue queryset already scoped to the user's organizations
+
+        Returns:
+            Dictionary with issue statistics
+        """
+        statuses = ['open', 'in_progress', 'resolved', 'closed']
+        priorities = ['low', 'medium', 'high', 'critical']
+        categories = ['quality', 'delivery', 'payment', 'communication', 'other']
+
+        totals = queryset.aggregate(
+            total=Count('id'),
+            client_raised=Count('id', filter=Q(is_client_issue=True)),
+            internal=Count('id', filter=Q(is_client_issue=False)),
+            synced=Count('id', filter=Q(synced_to_linear=True)),
+            not_synced=Count('id', filter=Q(synced_to_linear=False)),
+            **_count_by(statuses, 'status', 'status_'),
+            **_count_by(priorities, 'priority', 'priority_'),
+            **_count_by(categories, 'category', 'category_')
+        )
+
+        return {
+            'total': totals['total'],
+            'by_status': {value: totals[f'status_{value}'] for value in statuses},
+            'by_priority': {value: totals[f'priority_{value}'] for value in priorities},
+            'by_category': {value: totals[f'category_{value}'] for value in categories},
+            'by_source': {
+                'client_raised': totals['client_raised'],
+                'internal': totals['internal'],
+            },
+            'linear_sync': {
+                'synced': totals['synced'],
+                'not_synced': totals['not_synced'],
+            }
+        }
+
+    @staticmethod
+    def audit_log_stats(queryset: QuerySet) -> Dict:
+        """
+        Audit log statistics in two queries: one conditional aggregate and
+        one GROUP BY (action, resource_type).
+
+        Args:
+            queryset: AuditLog queryset already scoped to the user's organizations
+
+        Returns:
+            Dictionary with audit log statistics
+        """
+        last_24h = timezone.now() - timedelta(hours=24)
+        profile_types = ['vendor', 'employee', 'customer']
+
+        totals = queryset.aggregate(
+            total=Count('id'),
+            recent=Count('id', filter=Q(created_at__gte=last_24h)),
+            **_count_by(profile_types, 'user_profile_type', 'profile_')
+        )
+
+        action_totals: Dict[str, int] = {}
+        resource_totals: Dict[str, int] = {}
+        grouped = queryset.order_by().values('action', 'resource_type').annotate(count=Count('id'))
+        for row in grouped:
+            action_totals[row['action']] = action_totals.get(row['action'], 0) + row['count']
+            resource_totals[row['resource_type']] = resource_totals.get(row['resource_type'], 0) + row['count']
+
+        # Keep choice order and only report choices that occurred
+        action_counts = {
+            action: {'label': label, 'count': action_totals[action]}
+            for action, label in AuditLog.ACTION_CHOICES
+            if action_totals.get(action)
+        }
+        resource_counts = {
+            resource: {'label': label, 'count': resource_totals[resource]}
+            for resource, label in AuditLog.RESOURCE_TYPE_CHOICES
+            if resource_totals.get(resource)
+        }
+
+        return {
+            'total_logs': totals['total'],
+            'recent_activity_24h': totals['recent'],
+            'by_action': action_counts,
+            'by_resource': resource_counts,
+            'by_profile_type': {
+                profile_type: totals[f'profile_{profile_type}'] for profile_type in profile_types
+            },
+        }
+
+    @staticmethod
+    def deal_totals(organization_ids: List[int], use_rollups: Optional[bool] = None) -> Dict:
+        """
+        Deal counts and revenue for dashboards, from the rollups when the
+        organizations are fully backfilled, otherwise in a single conditional
+        aggregate query.
+
+        Args:
+            organization_ids: Accessible organization IDs
+            use_rollups: Skip the coverage check when the caller already knows
+
+        Returns:
+            Dictionary with total/won/lost/active counts and revenue totals
+        """
+        if use_rollups is None:
+            use_rollups = AnalyticsRollupService.is_covered(organization_ids)
+        if use_rollups:
+            by_status = AnalyticsRollupService.totals(organization_ids, 'deal', 'status')
+            won_count, won_value = by_status.get('won', (0, 0))
+            lost_count, _ = by_status.get('lost', (0, 0))
+            open_count, open_value = by_status.get('open', (0, 0))
+            return {
+                'total': won_count + lost_count + open_count,
+                'won': won_count,
+                'lost': lost_count,
+                'active': open_count,
+                'revenue': float(won_value),
+                'active_value': float(open_value),
+            }
+
+        closed = Q(is_won=True) | Q(is_lost=True)
+        totals = Deal.objects.filter(organization_id__in=organization_ids).aggregate(
+            total=Count('id'),
+            won=Count('id', filter=Q(is_won=True)),
+            lost=Count('id', filter=Q(is_lost=True, is_won=False)),
+            active=Count('id', filter=~closed),
+            revenue=Sum('value', filter=Q(is_won=True)),
+            active_value=Sum('value', filter=~closed),
+        )
+        return {
+            'total': totals['total'],
+            'won': totals['won'],
+            'lost': totals['lost'],
+            'active': totals['active'],
+            'revenue': float(totals['revenue'] or 0),
+            'active_value': float(totals['active_value'] or 0),
+        }
+
+    @staticmethod
+    def record_counts(organization_ids: List[int], use_rollups: Optional[bool] = None) -> Dict:
+        """
+        Total customers and leads across the organizations.
+
+        Returns:
+            Dictionary with 'customers' and 'leads' counts
+        """
+        if use_rollups is None:
+            use_rollups = AnalyticsRollupService.is_covered(organization_ids)
+        if use_rollups:
+            customers = AnalyticsRollupService.totals(organization_ids, 'customer')
+            leads = AnalyticsRollupService.totals(organization_ids, 'lead')
+            return {
+                'customers': customers.get('', (0, 0))[0],
+                'leads': leads.get('', (0, 0))[0],
+            }
+
+        return {
+            'customers': Customer.objects.filter(organization_id__in=organization_ids).count(),
+            'leads': Lead.objects.filter(organization_id__in=organization_ids).count(),
+        }
+
+    @staticmethod
+    def quick_stats(organization_ids: List[int]) -> Dict:
+        """
+        Headline counts for the current user's organizations.
+
+        Returns:
+            Dictionary with customer/lead/deal counts and revenue
+        """
+        use_rollups = AnalyticsRollupService.is_covered(organization_ids)
+        counts = AnalyticsService.record_counts(organization_ids, use_rollups)
+        deal_totals = AnalyticsService.deal_totals(organization_ids, use_rollups)
+        return {
+            'total_customers': counts['customers'],
+            'total_leads': counts['leads'],
+            'total_deals': deal_totals['total'],
+            'active_deals': deal_totals['active'],
+            'won_deals': deal_totals['won'],
+            'total_revenue': deal_totals['revenue']
+        }
+
+    @staticmethod
+    def dashboard_stats(
+        organization_ids: List[int],
+        start_date: datetime,
+        end_date: datetime
+    ) -> Dict:
+        """
+        Dashboard statistics: organization-wide totals (from the rollups when
+        covered) and one query for recent activities.
+
+        Args:
+            organization_ids: Accessible organization IDs
+            start_date: Start of the recent-activity window
+            end_date: End of the recent-activity window
+
+        Returns:
+            Dictionary with dashboard statistics (activities are serialized)
+        """
+        from crmApp.serializers import ActivitySerializer
+
+        use_rollups = AnalyticsRollupService.is_covered(organization_ids)
+        counts = AnalyticsService.record_counts(organization_ids, use_rollups)
+        deal_totals = AnalyticsService.deal_totals(organization_ids, use_rollups)
+        total_deals = deal_totals['total']
+        conversion_rate = (deal_totals['won'] / total_deals * 100) if total_deals > 0 else 0
+
+        recent_activities = Activity.objects.filter(
+            organization_id__in=organization_ids,
+            created_at__gte=start_date,
+            created_at__lte=end_date
+        ).select_related(
+            'customer', 'lead', 'deal', 'assigned_to', 'created_by'
+        ).order_by('-created_at')[:10]
+
+        return {
+            'total_leads': counts['leads'],
+            'total_deals': total_deals,
+            'total_customers': counts['customers'],
+            'total_revenue': deal_totals['revenue'],
+            'active_deals_value': deal_totals['active_value'],
+            'won_deals_count': deal_totals['won'],
+            'lost_deals_count': deal_totals['lost'],
+            'conversion_rate': round(conversion_rate, 2),
+            'recent_activities': ActivitySerializer(recent_activities, many=True).data
+        }
+
+    @staticmethod
+    def sales_funnel(
+        organization_ids: List[int],
+        start_date: datetime,
+        end_date: datetime
+    ) -> List[Dict]:
+        """
+        Sales funnel in two queries: active stages and one GROUP BY stage over
+        deals (or over the deal/stage rollups when the range is whole days and
+        covered).
+
+        Args:
+            organization_ids: Accessible organization IDs
+            start_date: Deals created on or after this date
+            end_date: Deals created on or before this date
+
+        Returns:
+            List of funnel rows ordered by stage order
+        """
+        stages = PipelineStage.objects.filter(
+            pipeline__organization_id__in=organization_ids,
+            pipeline__is_active=True
+        ).order_by('order').values_list('id', 'name')
+
+        by_stage: Dict[int, Tuple[int, Optional[float]]]
+        days = _rollup_days(start_date, end_date)
+        if days and AnalyticsRollupService.is_covered(organization_ids, days[0]):
+            rollup = AnalyticsRollupService.totals(organization_ids, 'deal', 'stage', *days)
+            by_stage = {
+                int(stage_id): totals for stage_id, totals in rollup.items() if stage_id
+            }
+        else:
+            grouped = Deal.objects.filter(
+                organization_id__in=organization_ids,
+                created_at__gte=start_date,
+                created_at__lte=end_date,
+                stage__isnull=False
+            ).order_by().values('stage_id').annotate(count=Count('id'), value=Sum('value'))
+            by_stage = {
+                row['stage_id']: (row['count'], row['value']) for row in grouped
+            }
+
+        funnel_data = []
+        for stage_id, stage_name in stages:
+            count, value = by_stage.get(stage_id, (0, None))
+            funnel_data.append({
+                'stage': stage_name,
+                'count': count,
+                'value': float(value or 0),
+                'conversion_rate': None  # Could calculate if needed
+            })
+        return funnel_data
+
+    @staticmethod
+    def revenue_by_period(
+        organization_ids: List[int],
+        start_date: datetime,
+        end_date: datetime,
+        period: str = 'month'
+    ) -> List[Dict]:
+        """
+        Won-deal revenue grouped by close date.
+
+        Daily totals come from the deal_won rollups when the range is covered,
+        otherwise from one GROUP BY actual_close_date query; days are then
+        folded into the requested period.
+
+        Args:
+            organization_ids: Accessible organization IDs
+            start_date: Deals closed on or after this day
+            end_date: Deals closed on or before this day
+            period: One of REVENUE_PERIODS
+
+        Returns:
+            List of {'period', 'revenue', 'deals_count', 'average_deal_value'} rows
+        """
+        if period not in REVENUE_PERIODS:
+            raise ValueError(f"Invalid period: {period}")
+
+        first_day = timezone.localtime(start_date).date() if timezone.is_aware(start_date) else start_date.date()
+        last_day = timezone.localtime(end_date).date() if timezone.is_aware(end_date) else end_date.date()
+
+        if AnalyticsRollupService.is_covered(organization_ids, first_day):
+            daily = AnalyticsRollupService.daily_series(organization_ids, 'deal_won', first_day, last_day)
+        else:
+            grouped = Deal.objects.filter(
+                organization_id__in=organization_ids,
+                is_won=True,
+                actual_close_date__gte=first_day,
+                actual_close_date__lte=last_day
+            ).order_by('actual_close_date').values('actual_close_date').annotate(
+                count=Count('id'),
+                revenue=Sum('value')
+            )
+            daily = [(row['actual_close_date'], row['count'], row['revenue'] or 0) for row in grouped]
+
+        buckets: Dict[date, List] = {}
+        for day, count, revenue in daily:
+            bucket = buckets.setdefault(_period_start(day, period), [0, 0])
+            bucket[0] += count
+            bucket[1] += float(revenue or 0)
+
+        return [
+            {
+                'period': period_start.isoformat(),
+                'revenue': revenue,
+                'deals_count': count,
+                'average_deal_value': (revenue / count) if count else 0
+            }
+            for period_start, (count, revenue) in sorted(buckets.items())
+        ]
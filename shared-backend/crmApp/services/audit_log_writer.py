@@ -0,0 +1,161 @@
+"""
+Audit Log Writer
+
+Buffers AuditLog entries in memory and writes them with bulk_create instead
+of issuing one INSERT inside every audited save.
+
+Entries are only handed to the buffer once the surrounding transaction
+commits (rolled-back changes are never logged). A background thread drains
+the buffer every AUDIT_LOG_FLUSH_INTERVAL seconds or as soon as
+AUDIT_LOG_BATCH_SIZE entries are waiting, and the remaining entries are
+flushed at interpreter exit so nothing is lost on a normal shutdown.
+
+With AUDIT_LOG_ASYNC = False the buffer is flushed synchronously right after
+commit (useful for tests and one-off scripts).
+"""
+
+import atexit
+import logging
+import threading
+from collections import deque
+from functools import partial
+from typing import List
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from crmApp.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """In-process, batched AuditLog writer"""
+
+    def __init__(self):
+        self._buffer = deque()
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    @property
+    def asynchronous(self) -> bool:
+        return getattr(settings, 'AUDIT_LOG_ASYNC', True)
+
+    @property
+    def batch_size(self) -> int:
+        return getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 200)
+
+    @property
+    def flush_interval(self) -> float:
+        return getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 0.5)
+
+    @property
+    def pending(self) -> int:
+        """Number of committed entries waiting to be written."""
+        return len(self._buffer)
+
+    def enqueue(self, entry: AuditLog) -> None:
+        """
+        Queue an unsaved AuditLog for writing once the current transaction
+        commits (immediately when not inside a transaction).
+        """
+        transaction.on_commit(partial(self._submit, entry))
+
+    def _submit(self, entry: AuditLog) -> None:
+        self._buffer.append(entry)
+
+        if not self.asynchronous:
+            self.flush()
+            return
+
+        self._ensure_worker()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Write every buffered entry in batches of batch_size.
+
+        Returns:
+            Number of entries written
+        """
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                written += self._write(batch)
+        return written
+
+    def _write(self, batch: List[AuditLog]) -> int:
+        try:
+            AuditLog.objects.bulk_create(batch)
+            return len(batch)
+        except Exception as e:
+            # One bad entry (e.g. its organization was deleted meanwhile) must not drop the batch
+            logger.error(f"Bulk audit log write failed, retrying {len(batch)} entries individually: {e}")
+
+        written = 0
+        for entry in batch:
+            try:
+                entry.save()
+                written += 1
+            except Exception as e:
+                logger.error(
+                    f"Failed to write audit log ({entry.action} {entry.resource_type} #{entry.resource_id}): {e}",
+                    exc_info=True
+                )
+        return written
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='audit-log-writer',
+                daemon=True
+            )
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self._buffer:
+                continue
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit log writer flush failed: {e}", exc_info=True)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the background worker and write whatever is still buffered."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join(timeout)
+            self._thread = None
+
+        try:
+            written = self.flush()
+            if written:
+                logger.info(f"Flushed {written} audit log entries on shutdown")
+        except Exception as e:
+            logger.error(f"Failed to flush audit logs on shutdown: {e}", exc_info=True)
+
+
+audit_log_writer = AuditLogWriter()
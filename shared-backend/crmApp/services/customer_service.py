@@ -10,10 +10,12 @@ Handles customer-related business logic:
 
 from typing import Dict, List, Optional
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Count, Q, F, OuterRef, Subquery, Sum, QuerySet
 from decimal import Decimal
 
 from crmApp.models import Customer, Lead, Organization, User, UserProfile
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService
+from crmApp.services.search_index_service import SearchIndexService
 
 
 class CustomerService:
@@ -125,6 +127,74 @@ class CustomerService:
             
             return customer
     
+    @staticmethod
+    def annotate_total_value(queryset: QuerySet) -> QuerySet:
+        """
+        Annotate customers with the data needed for `total_value` in one query.
+        
+        Adds:
+        - won_deals_total: SUM of won deals linked to the customer directly
+          or to the lead the customer was converted from
+        - converted_lead_estimated_value: fallback used when there are no won deals
+        
+        Args:
+            queryset: Customer queryset
+            
+        Returns:
+            Annotated Customer queryset
+        """
+        from crmApp.models import Deal
+        
+        won_deals = Deal.objects.filter(
+            Q(customer_id=OuterRef('pk')) | Q(lead_id=OuterRef('converted_from_lead_id')),
+            is_won=True
+        ).order_by().values('is_won').annotate(total=Sum('value')).values('total')
+        
+        return queryset.annotate(
+            won_deals_total=Subquery(won_deals[:1]),
+            converted_lead_estimated_value=F('converted_from_lead__estimated_value'),
+        )
+    
+    @staticmethod
+    def get_total_value(customer: Customer) -> float:
+        """
+        Total value from won deals linked to customer or converted lead.
+        Falls back to the converted lead's estimated value when there are no won deals.
+        
+        Uses the annotations from annotate_total_value() when present and only
+        queries the database for customers loaded without them.
+        
+        Args:
+            customer: Customer instance
+            
+        Returns:
+            Total value as float
+        """
+        if hasattr(customer, 'won_deals_total'):
+            total = customer.won_deals_total
+            lead_estimate = customer.converted_lead_estimated_value
+        else:
+            from crmApp.models import Deal
+            
+            # Deals can be linked directly to customer OR to the lead that was converted to this customer
+            query = Q(customer=customer)
+            if customer.converted_from_lead_id:
+                query |= Q(lead_id=customer.converted_from_lead_id)
+            
+            total = Deal.objects.filter(query, is_won=True).aggregate(total=Sum('value'))['total']
+            lead_estimate = (
+                customer.converted_from_lead.estimated_value
+                if customer.converted_from_lead_id else None
+            )
+        
+        deal_total = float(total) if total else 0.0
+        
+        # If no deals found and customer was converted from a lead, use lead's estimated_value
+        if deal_total == 0.0 and lead_estimate:
+            return float(lead_estimate)
+        
+        return deal_total
+    
     @staticmethod
     def get_customer_statistics(organization: Organization) -> Dict:
         """
@@ -172,7 +242,10 @@ class CustomerService:
         Returns:
             Number of customers updated
         """
-        return Customer.objects.filter(id__in=customer_ids).update(status=status)
+        return AnalyticsRollupService.bulk_update(
+            Customer.objects.filter(id__in=customer_ids),
+            status=status
+        )
     
     @staticmethod
     def search_customers(
@@ -193,14 +266,11 @@ class CustomerService:
         """
         queryset = Customer.objects.filter(organization=organization)
         
-        # Apply search
-        if search_term:
-            queryset = queryset.filter(
-                Q(name__icontains=search_term) |
-                Q(email__icontains=search_term) |
-                Q(phone__icontains=search_term) |
-                Q(company_name__icontains=search_term)
-            )
+        # Apply search (search index, or substring filters until it is built)
+        queryset = SearchIndexService.filter_queryset(
+            queryset, search_term, [organization.id],
+            fallback_fields=['name', 'email', 'phone', 'company_name']
+        )
         
         # Apply filters
         if filters:
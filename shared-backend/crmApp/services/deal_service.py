@@ -16,6 +16,7 @@ from decimal import Decimal
 from datetime import datetime, timedelta
 
 from crmApp.models import Deal, Pipeline, PipelineStage, Organization, Customer, Employee
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService
 
 
 class DealService:
@@ -339,4 +340,7 @@ class DealService:
         Returns:
             Number of deals assigned
         """
-        return Deal.objects.filter(id__in=deal_ids).update(assigned_to=employee)
+        return AnalyticsRollupService.bulk_update(
+            Deal.objects.filter(id__in=deal_ids),
+            assigned_to=employee
+        )
@@ -0,0 +1,2362 @@
+"""
+Gemini CRM Tools
+Function declarations and handlers that let Gemini query and modify CRM data.
+
+The declarations and handlers are built once at import time and shared by
+every conversation. Per-request state (user, organization, role and
+permissions) is passed to each handler as a CRMToolContext instead of being
+captured in closures created for every chat request.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from google.genai import types
+
+from crmApp.models import Activity, Customer, Deal, Issue, Lead
+from crmApp.services.activity_timeline_service import ActivityTimelineService, InvalidTimelineCursor
+from crmApp.services.tool_projections import get_projection
+
+logger = logging.getLogger(__name__)
+
+
+class CRMToolContext:
+    """Request-scoped parameters of the CRM tools"""
+    
+    __slots__ = ('user_context', 'org_id', 'role')
+    
+    def __init__(self, user_context: Dict[str, Any]):
+        self.user_context = user_context
+        self.org_id = user_context.get('organization_id')
+        self.role = user_context.get('role')
+    
+    def check_role_permission(self, resource: str, action: str) -> dict:
+        """
+        Check if the current role can perform action on resource.
+        Returns error dict if denied, None if allowed.
+        """
+        # Superusers and staff always allowed
+        if self.user_context.get('is_superuser') or self.user_context.get('is_staff'):
+            return None
+        
+        # Vendors have full access to their org EXCEPT creating issues
+        # Vendors can: read, update (resolve/change status), delete issues
+        # Vendors CANNOT: create issues
+        if self.role == 'vendor':
+            if resource == 'issue' and action == 'create':
+                return {"error": "Permission denied: Vendors cannot create issues. Only customers can create issues."}
+            # Vendors can read, update, delete issues (to manage/resolve them)
+            return None
+        
+        # Employees have read access, limited write access
+        if self.role == 'employee':
+            if action == 'read':
+                return None
+            # Employees can manage issues (read/update) but CANNOT create them
+            if resource == 'issue':
+                if action == 'create':
+                    return {"error": "Permission denied: Only customers can create issues. Employees can view and manage existing issues."}
+                if action in ['update', 'delete']:
+                    return None
+            # Check if they have explicit permission for other actions
+            permissions = self.user_context.get('permissions', [])
+            if f"{resource}:{action}" in permissions or f"{resource}:*" in permissions:
+                return None
+            return {"error": f"Permission denied: Employees cannot {action} {resource} records without explicit permission"}
+        
+        # Customers have very limited access
+        # Customers can ONLY: create issues, view their own issue status, and view their vendors
+        if self.role == 'customer':
+            if resource == 'issue' and action in ['create', 'read']:
+                return None
+            if resource in ['customer', 'order', 'payment', 'vendor'] and action == 'read':
+                # They can only read their own records (enforced in tool logic)
+                return None
+            return {"error": f"Permission denied: Customers cannot {action} {resource} records"}
+        
+        return {"error": f"Permission denied: Role '{self.role}' cannot {action} {resource}"}
+
+
+# === CUSTOMER TOOLS ===
+async def list_customers_tool(ctx: CRMToolContext, status: str = "active", limit: int = 10, cursor: Optional[str] = None):
+    """List customers in the organization"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('customer', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if ctx.org_id:
+            customers = Customer.objects.filter(organization_id=ctx.org_id, status=status)
+        else:
+            customers = Customer.objects.filter(organization_id__isnull=True, status=status)
+        return get_projection('list_customers').page(customers, limit, cursor)
+    return await fetch()
+
+
+async def get_customer_count_tool(ctx: CRMToolContext):
+    """Get total customer count"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if ctx.org_id:
+            return Customer.objects.filter(organization_id=ctx.org_id).count()
+        else:
+            return Customer.objects.filter(organization_id__isnull=True).count()
+    return await fetch()
+
+
+async def create_customer_tool(ctx: CRMToolContext, name: str, email: str, phone: str = "", customer_type: str = "individual", company_name: str = ""):
+    """Create a new customer"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('customer', 'create')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def create():
+        customer = Customer.objects.create(
+            organization_id=ctx.org_id,
+            name=name,
+            email=email,
+            phone=phone or "",
+            customer_type=customer_type,
+            company_name=company_name or "",
+            status="active"
+        )
+        return {
+            "success": True,
+            "id": customer.id,
+            "name": customer.name,
+            "message": f"Customer '{name}' created successfully"
+        }
+    return await create()
+
+
+async def get_customer_tool(ctx: CRMToolContext, customer_id: int):
+    """Get detailed customer information"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        try:
+            if ctx.org_id:
+                customer = Customer.objects.get(id=customer_id, organization_id=ctx.org_id)
+            else:
+                customer = Customer.objects.get(id=customer_id, organization_id__isnull=True)
+            return {
+                "id": customer.id,
+                "name": customer.name,
+                "email": customer.email,
+                "phone": customer.phone,
+                "status": customer.status,
+                "customer_type": customer.customer_type,
+                "company_name": customer.company_name,
+                "address": customer.address,
+                "city": customer.city,
+                "country": customer.country,
+            }
+        except Customer.DoesNotExist:
+            return {"error": "Customer not found"}
+    return await fetch()
+
+
+async def update_customer_tool(ctx: CRMToolContext, customer_id: int, name: str = None, email: str = None, phone: str = None, status: str = None):
+    """Update an existing customer"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('customer', 'update')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def update():
+        try:
+            if ctx.org_id:
+                customer = Customer.objects.get(id=customer_id, organization_id=ctx.org_id)
+            else:
+                customer = Customer.objects.get(id=customer_id, organization_id__isnull=True)
+            
+            if name:
+                customer.name = name
+            if email:
+                customer.email = email
+            if phone is not None:
+                customer.phone = phone
+            if status:
+                customer.status = status
+            
+            customer.save()
+            return {
+                "success": True,
+                "id": customer.id,
+                "name": customer.name,
+                "message": f"Customer '{customer.name}' updated successfully"
+            }
+        except Customer.DoesNotExist:
+            return {"error": "Customer not found"}
+    return await update()
+
+
+async def delete_customer_tool(ctx: CRMToolContext, customer_id: int):
+    """Delete a customer"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('customer', 'delete')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def delete():
+        try:
+            if ctx.org_id:
+                customer = Customer.objects.get(id=customer_id, organization_id=ctx.org_id)
+            else:
+                customer = Customer.objects.get(id=customer_id, organization_id__isnull=True)
+            name = customer.name
+            customer.delete()
+            return {
+                "success": True,
+                "message": f"Customer '{name}' deleted successfully"
+            }
+        except Customer.DoesNotExist:
+            return {"error": "Customer not found"}
+    return await delete()
+
+
+# === LEAD TOOLS ===
+async def list_leads_tool(ctx: CRMToolContext, status: str = "all", limit: int = 10, cursor: Optional[str] = None):
+    """List leads in the organization. Leads are in any stage of the sales pipeline. Organization ID is automatically determined from the user context."""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('lead', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        # Ensure we have org_id (should always be set from user context)
+        if not ctx.org_id:
+            return {"error": "No organization context found. Please ensure you're logged in."}
+        
+        # Get ALL leads for the organization (regardless of stage)
+        # Leads are any record in the Lead model, regardless of stage
+        queryset = Lead.objects.filter(organization_id=ctx.org_id, status='active')
+        
+        # Optionally filter by qualification_status if specified
+        if status and status.lower() not in ["all", ""]:
+            queryset = queryset.filter(qualification_status=status.lower())
+        
+        result = get_projection('list_leads').page(queryset, limit, cursor)
+        logger.info(f"Found {result['count']} leads for organization_id={ctx.org_id}")
+        return result
+    return await fetch()
+
+
+async def create_lead_tool(ctx: CRMToolContext, name: str, email: str, phone: str = "", source: str = "website"):
+    """Create a new lead"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('lead', 'create')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def create():
+        lead = Lead.objects.create(
+            organization_id=ctx.org_id,
+            name=name,
+            email=email,
+            phone=phone or "",
+            source=source,
+            status="active",
+            qualification_status="new"
+        )
+        return {
+            "success": True,
+            "id": lead.id,
+            "name": lead.name,
+            "message": f"Lead '{name}' created successfully with ID {lead.id}"
+        }
+    return await create()
+
+
+async def get_lead_tool(ctx: CRMToolContext, lead_id: int):
+    """Get detailed information about a specific lead with pipeline stage details"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        try:
+            lead = Lead.objects.select_related('stage', 'stage__pipeline', 'assigned_to').get(
+                id=lead_id,
+                organization_id=ctx.org_id
+            )
+            
+            # Build stage information
+            stage_info = "No stage assigned"
+            stage_status = ""
+            if lead.stage:
+                stage_info = f"{lead.stage.pipeline.name} - {lead.stage.name}" if lead.stage.pipeline else lead.stage.name
+                if lead.stage.is_closed_won:
+                    stage_status = " (CLOSED WON - Lead is now a customer!)"
+                elif lead.stage.is_closed_lost:
+                    stage_status = " (CLOSED LOST - Deal not won)"
+            
+            return {
+                "id": lead.id,
+                "name": lead.name,
+                "email": lead.email or "",
+                "phone": lead.phone or "",
+                "organization_name": lead.organization_name or "",
+                "current_stage": lead.stage.name if lead.stage else "No stage",
+                "stage_info": stage_info + stage_status,
+                "pipeline": lead.stage.pipeline.name if lead.stage and lead.stage.pipeline else "No pipeline",
+                "qualification_status": lead.qualification_status,
+                "status": lead.status,
+                "source": lead.source,
+                "is_converted": lead.is_converted,
+                "converted_to_customer": "Yes - This lead has been converted to a customer" if lead.is_converted else "No - Still a lead",
+                "lead_score": lead.lead_score,
+                "estimated_value": float(lead.estimated_value) if lead.estimated_value else 0,
+                "assigned_to": lead.assigned_to.full_name if lead.assigned_to else "Unassigned",
+                "notes": lead.notes or "",
+            }
+        except Lead.DoesNotExist:
+            return {"error": f"Lead with ID {lead_id} not found"}
+    return await fetch()
+
+
+async def move_lead_stage_tool(ctx: CRMToolContext, lead_id: int, stage: str, notes: str = None):
+    """Move a lead to a different pipeline stage. When moved to Closed Won, lead automatically becomes a customer."""
+    @sync_to_async(thread_sensitive=False)
+    def move():
+        try:
+            from crmApp.models import PipelineStage, LeadStageHistory, Employee
+            lead = Lead.objects.select_related('stage').get(id=lead_id, organization_id=ctx.org_id)
+            
+            # Find stage by name or ID
+            new_stage = None
+            try:
+                stage_id = int(stage)
+                new_stage = PipelineStage.objects.get(id=stage_id, pipeline__organization_id=ctx.org_id)
+            except (ValueError, TypeError):
+                new_stage = PipelineStage.objects.filter(name__iexact=stage, pipeline__organization_id=ctx.org_id).first()
+            
+            if not new_stage:
+                # Provide helpful error with available stages
+                available_stages = PipelineStage.objects.filter(
+                    pipeline__organization_id=ctx.org_id,
+                    is_active=True
+                ).values_list('name', flat=True)
+                return {
+                    "error": f"Pipeline stage '{stage}' not found",
+                    "available_stages": list(available_stages),
+                    "hint": "Available stages: " + ", ".join(available_stages)
+                }
+            
+            previous_stage = lead.stage
+            lead.stage = new_stage
+            lead.save()
+            
+            # Create history entry
+            LeadStageHistory.objects.create(
+                lead=lead,
+                organization_id=ctx.org_id,
+                stage=new_stage,
+                previous_stage=previous_stage,
+                notes=notes or f"Moved by AI assistant"
+            )
+            
+            prev_name = previous_stage.name if previous_stage else 'None'
+            
+            # Build response message
+            message = f"✅ Lead '{lead.name}' moved from '{prev_name}' to '{new_stage.name}'"
+            
+            # Special handling for Closed Won
+            if new_stage.is_closed_won:
+                message += "\n\n🎉 DEAL WON! This lead will be automatically converted to a customer and will appear in the Customers page."
+                message += "\n📊 The lead will remain visible in the sales pipeline history."
+            elif new_stage.is_closed_lost:
+                message += "\n\n❌ Deal marked as lost. The lead remains in the system for future follow-up."
+            
+            return {
+                "success": True,
+                "message": message,
+                "from_stage": prev_name,
+                "to_stage": new_stage.name,
+                "pipeline": new_stage.pipeline.name,
+                "is_closed_won": new_stage.is_closed_won,
+                "is_closed_lost": new_stage.is_closed_lost,
+                "lead_id": lead.id,
+                "lead_name": lead.name
+            }
+        except Lead.DoesNotExist:
+            return {"error": f"Lead with ID {lead_id} not found in your organization"}
+    return await move()
+
+
+async def get_pipeline_stages_tool(ctx: CRMToolContext):
+    """Get all available pipeline stages for leads in the organization"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Pipeline
+        pipelines = Pipeline.objects.filter(organization_id=ctx.org_id, is_active=True).prefetch_related('stages')
+        
+        result = []
+        for pipeline in pipelines:
+            stages = pipeline.stages.filter(is_active=True).order_by('order')
+            result.append({
+                'pipeline_id': pipeline.id,
+                'pipeline_name': pipeline.name,
+                'stages': [
+                    {
+                        'id': stage.id,
+                        'name': stage.name,
+                        'order': stage.order,
+                        'probability': float(stage.probability),
+                        'is_closed_won': stage.is_closed_won,
+                        'is_closed_lost': stage.is_closed_lost
+                    }
+                    for stage in stages
+                ]
+            })
+        return {"success": True, "pipelines": result}
+    return await fetch()
+
+
+async def update_lead_tool(ctx: CRMToolContext, lead_id: int, name: str = None, status: str = None, score: int = None):
+    """Update an existing lead"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('lead', 'update')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def update():
+        try:
+            lead = Lead.objects.get(id=lead_id, organization_id=ctx.org_id)
+            if name:
+                lead.name = name
+            if status:
+                lead.status = status
+            if score is not None:
+                lead.score = score
+            lead.save()
+            return {
+                "success": True,
+                "id": lead.id,
+                "name": lead.name,
+                "message": f"Lead '{lead.name}' updated successfully"
+            }
+        except Lead.DoesNotExist:
+            return {"error": "Lead not found"}
+    return await update()
+
+
+async def qualify_lead_tool(ctx: CRMToolContext, lead_id: int):
+    """Mark a lead as qualified"""
+    @sync_to_async
+    def qualify():
+        try:
+            lead = Lead.objects.get(id=lead_id, organization_id=ctx.org_id)
+            lead.status = "qualified"
+            lead.score = max(lead.score, 70)
+            lead.save()
+            return {
+                "success": True,
+                "id": lead.id,
+                "name": lead.name,
+                "message": f"Lead '{lead.name}' marked as qualified"
+            }
+        except Lead.DoesNotExist:
+            return {"error": "Lead not found"}
+    return await qualify()
+
+
+async def convert_lead_to_customer_tool(ctx: CRMToolContext, lead_id: int):
+    """Convert a lead to a customer and automatically move to Closed Won stage"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('lead', 'update')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def convert():
+        try:
+            from crmApp.models import PipelineStage, LeadStageHistory
+            lead = Lead.objects.get(id=lead_id, organization_id=ctx.org_id)
+            
+            # Create customer
+            customer = Customer.objects.create(
+                organization_id=ctx.org_id,
+                name=lead.name,
+                email=lead.email,
+                phone=lead.phone,
+                company_name=lead.organization_name,
+                status="active",
+                customer_type="business" if lead.organization_name else "individual",
+                source=lead.source,
+                address=lead.address,
+                city=lead.city,
+                state=lead.state,
+                postal_code=lead.postal_code,
+                country=lead.country,
+                converted_from_lead=lead,
+            )
+            
+            # Move lead to "Closed Won" stage
+            closed_won_stage = PipelineStage.objects.filter(
+                pipeline__organization_id=ctx.org_id,
+                is_closed_won=True,
+                is_active=True
+            ).first()
+            
+            stage_info = ""
+            if closed_won_stage:
+                previous_stage = lead.stage
+                lead.stage = closed_won_stage
+                
+                # Create stage history
+                LeadStageHistory.objects.create(
+                    lead=lead,
+                    organization_id=ctx.org_id,
+                    stage=closed_won_stage,
+                    previous_stage=previous_stage,
+                    notes='Automatically moved to Closed Won after conversion to customer via AI assistant'
+                )
+                stage_info = f" Lead moved to '{closed_won_stage.name}' stage."
+            
+            # Mark lead as converted
+            lead.is_converted = True
+            lead.qualification_status = "converted"
+            lead.save()
+            
+            return {
+                "success": True,
+                "customer_id": customer.id,
+                "customer_name": customer.name,
+                "message": f"Lead '{lead.name}' converted to customer successfully.{stage_info}"
+            }
+        except Lead.DoesNotExist:
+            return {"error": "Lead not found"}
+        except Exception as e:
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.error(f"Error converting lead to customer: {str(e)}")
+            return {"error": f"Failed to convert lead: {str(e)}"}
+    return await convert()
+
+
+# === DEAL TOOLS ===
+async def list_deals_tool(ctx: CRMToolContext, stage: str = "negotiation", limit: int = 10, cursor: Optional[str] = None):
+    """List deals in the organization"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        deals = Deal.objects.filter(organization_id=ctx.org_id)
+        if stage:
+            deals = deals.filter(stage__name__iexact=stage)
+        return get_projection('list_deals').page(deals, limit, cursor)
+    return await fetch()
+
+
+async def create_deal_tool(ctx: CRMToolContext, title: str, value: float, customer_id: int = None, stage: str = "prospecting"):
+    """Create a new deal"""
+    @sync_to_async(thread_sensitive=False)
+    def create():
+        deal = Deal.objects.create(
+            organization_id=ctx.org_id,
+            title=title,
+            value=value,
+            customer_id=customer_id,
+            stage=stage,
+            status="open"
+        )
+        return {
+            "success": True,
+            "id": deal.id,
+            "title": deal.title,
+            "value": float(deal.value),
+            "message": f"Deal '{title}' created successfully"
+        }
+    return await create()
+
+
+async def update_deal_tool(ctx: CRMToolContext, deal_id: int, title: str = None, value: float = None, stage: str = None, status: str = None):
+    """Update an existing deal"""
+    @sync_to_async(thread_sensitive=False)
+    def update():
+        try:
+            deal = Deal.objects.get(id=deal_id, organization_id=ctx.org_id)
+            if title:
+                deal.title = title
+            if value is not None:
+                deal.value = value
+            if stage:
+                deal.stage = stage
+            if status:
+                deal.status = status
+            deal.save()
+            return {
+                "success": True,
+                "id": deal.id,
+                "title": deal.title,
+                "message": f"Deal '{deal.title}' updated successfully"
+            }
+        except Deal.DoesNotExist:
+            return {"error": "Deal not found"}
+    return await update()
+
+
+async def mark_deal_won_tool(ctx: CRMToolContext, deal_id: int):
+    """Mark a deal as won"""
+    @sync_to_async
+    def mark_won():
+        try:
+            deal = Deal.objects.get(id=deal_id, organization_id=ctx.org_id)
+            deal.status = "won"
+            deal.stage = "closed"
+            deal.save()
+            return {
+                "success": True,
+                "id": deal.id,
+                "title": deal.title,
+                "value": float(deal.value),
+                "message": f"Deal '{deal.title}' marked as won! 🎉"
+            }
+        except Deal.DoesNotExist:
+            return {"error": "Deal not found"}
+    return await mark_won()
+
+
+async def mark_deal_lost_tool(ctx: CRMToolContext, deal_id: int, reason: str = ""):
+    """Mark a deal as lost"""
+    @sync_to_async
+    def mark_lost():
+        try:
+            deal = Deal.objects.get(id=deal_id, organization_id=ctx.org_id)
+            deal.status = "lost"
+            deal.stage = "closed"
+            if reason:
+                deal.lost_reason = reason
+            deal.save()
+            return {
+                "success": True,
+                "id": deal.id,
+                "title": deal.title,
+                "message": f"Deal '{deal.title}' marked as lost"
+            }
+        except Deal.DoesNotExist:
+            return {"error": "Deal not found"}
+    return await mark_lost()
+
+
+async def get_deal_stats_tool(ctx: CRMToolContext):
+    """Get deal statistics"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from django.db.models import Sum, Count
+        deals = Deal.objects.filter(organization_id=ctx.org_id)
+        return {
+            "total_deals": deals.count(),
+            "total_value": float(deals.aggregate(Sum('value'))['value__sum'] or 0),
+            "won_deals": deals.filter(status='won').count(),
+            "lost_deals": deals.filter(status='lost').count(),
+            "active_deals": deals.filter(status='open').count(),
+        }
+    return await fetch()
+
+
+# === ISSUE TOOLS ===
+async def list_issues_tool(ctx: CRMToolContext, status: str = None, priority: str = None, limit: int = 20, cursor: Optional[str] = None):
+    """List issues/tickets in the organization. If no status is specified, returns all issues."""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('issue', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if not ctx.org_id:
+            return {"error": "No organization context found. Please ensure you're logged in."}
+        
+        logger.info(f"Listing issues for organization_id={ctx.org_id}, status={status}, priority={priority}, limit={limit}")
+        
+        # Start with organization filter
+        queryset = Issue.objects.filter(organization_id=ctx.org_id)
+        
+        # Apply optional filters
+        if status and status.lower() != "all":
+            queryset = queryset.filter(status=status.lower())
+        
+        if priority:
+            queryset = queryset.filter(priority=priority.lower())
+        
+        result = get_projection('list_issues').page(queryset, limit, cursor)
+        logger.info(f"Found {result['count']} issues for org {ctx.org_id}")
+        return result
+    return await fetch()
+
+
+async def list_my_vendors_for_issues_tool(ctx: CRMToolContext):
+    """List all vendors/organizations available in the system. Customers can create issues for any vendor."""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Vendor, Organization
+        
+        # Get all active vendors/organizations
+        vendors = []
+        
+        # Try to get vendors first
+        vendor_list = Vendor.objects.filter(status='active').select_related('organization')
+        
+        if vendor_list.exists():
+            for vendor in vendor_list:
+                org_name = vendor.organization.name if vendor.organization else f"Organization {vendor.organization_id}"
+                vendors.append({
+                    "organization_id": vendor.organization_id,
+                    "organization_name": org_name,
+                    "vendor_name": vendor.name,
+                    "display_name": f"{vendor.name} ({org_name})",
+                    "vendor_email": vendor.email or "",
+                    "vendor_phone": vendor.phone or "",
+                    "contact_person": vendor.contact_person or "",
+                })
+        else:
+            # Fallback: get all organizations if no vendors exist
+            orgs = Organization.objects.all()
+            for org in orgs:
+                org_name = org.name if hasattr(org, 'name') else f"Organization {org.id}"
+                vendors.append({
+                    "organization_id": org.id,
+                    "organization_name": org_name,
+                    "vendor_name": org_name,
+                    "display_name": org_name,
+                    "vendor_email": "",
+                    "vendor_phone": "",
+                    "contact_person": "",
+                })
+        
+        if not vendors:
+            return {"error": "No vendors found in the system. Please contact support."}
+        
+        return {
+            "vendors": vendors,
+            "count": len(vendors),
+            "message": f"You can create issues for any of these {len(vendors)} vendor(s). Use the vendor_name or organization_name when creating an issue."
+        }
+    return await fetch()
+
+
+async def create_issue_tool(ctx: CRMToolContext, title: str, description: str, priority: str = "medium", category: str = "other", vendor_name: str = None, organization_name: str = None, organization_id: int = None, customer_id: int = None):
+    """Create a new issue/ticket. For customers: provide vendor_name, organization_name, OR organization_id to specify which vendor/organization to create issue for."""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('issue', 'create')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def create():
+        target_org_id = None
+        
+        # Handle customers differently - they can create issues for ANY vendor
+        if ctx.role == 'customer':
+            from crmApp.models import Vendor, Organization
+            
+            # Find target organization
+            if organization_id:
+                # Use provided organization_id directly
+                target_org_id = organization_id
+            elif organization_name:
+                # Find organization by organization name
+                try:
+                    org = Organization.objects.get(name__iexact=organization_name)
+                    target_org_id = org.id
+                except Organization.DoesNotExist:
+                    # Try partial match
+                    orgs = Organization.objects.filter(name__icontains=organization_name)
+                    if orgs.count() == 1:
+                        target_org_id = orgs.first().id
+                    elif orgs.count() > 1:
+                        org_names = [o.name for o in orgs]
+                        return {"error": f"Multiple organizations found matching '{organization_name}': {', '.join(org_names)}. Please be more specific."}
+                    else:
+                        return {"error": f"Organization '{organization_name}' not found. Use list_my_vendors_for_issues to see available organizations."}
+                except Organization.MultipleObjectsReturned:
+                    orgs = Organization.objects.filter(name__iexact=organization_name)
+                    org_names = [f"{o.name} (ID: {o.id})" for o in orgs]
+                    return {"error": f"Multiple organizations found with exact name '{organization_name}': {', '.join(org_names)}. Please use organization_id instead."}
+            elif vendor_name:
+                # Find organization by vendor name (search all vendors)
+                try:
+                    vendor = Vendor.objects.get(
+                        name__iexact=vendor_name,
+                        status='active'
+                    )
+                    target_org_id = vendor.organization_id
+                except Vendor.DoesNotExist:
+                    # Try partial match
+                    vendors = Vendor.objects.filter(
+                        name__icontains=vendor_name,
+                        status='active'
+                    )
+                    if vendors.count() == 1:
+                        target_org_id = vendors.first().organization_id
+                    elif vendors.count() > 1:
+                        vendor_names = [v.name for v in vendors]
+                        return {"error": f"Multiple vendors found matching '{vendor_name}': {', '.join(vendor_names)}. Please be more specific."}
+                    else:
+                        return {"error": f"Vendor '{vendor_name}' not found. Use list_my_vendors_for_issues to see available vendors."}
+                except Vendor.MultipleObjectsReturned:
+                    vendors = Vendor.objects.filter(name__iexact=vendor_name, status='active')
+                    vendor_names = [f"{v.name} (ID: {v.organization_id})" for v in vendors]
+                    return {"error": f"Multiple vendors found with exact name '{vendor_name}': {', '.join(vendor_names)}. Please use organization_id instead."}
+            else:
+                # No vendor specified - list available vendors
+                vendors = Vendor.objects.filter(status='active')
+                vendor_names = [v.name for v in vendors[:10]]  # Show first 10
+                return {
+                    "error": "Please specify which vendor/organization to create the issue for.",
+                    "available_vendors": vendor_names,
+                    "instruction": "Use vendor_name, organization_name, or use list_my_vendors_for_issues for full list."
+                }
+        else:
+            # Vendors and employees use their organization context
+            if not ctx.org_id:
+                return {"error": "No organization context found. Please ensure you're logged in."}
+            target_org_id = ctx.org_id
+        
+        logger.info(f"Creating issue for organization_id={target_org_id}: {title}")
+        
+        try:
+            # Get customer if customer_id provided
+            raised_by_customer = None
+            is_client_issue = False
+            
+            # For customers creating issues, mark as client issue
+            if ctx.role == 'customer':
+                is_client_issue = True
+                from crmApp.models import Customer, User
+                
+                # Find or create customer record for this user
+                try:
+                    user = User.objects.get(id=ctx.user_context.get('user_id'))
+                    
+                    # Try to find existing customer record
+                    raised_by_customer = Customer.objects.filter(user=user).first()
+                    
+                    # If no customer record exists, create one
+                    if not raised_by_customer:
+                        logger.info(f"Creating Customer record for user {user.email}")
+                        raised_by_customer = Customer.objects.create(
+                            organization_id=target_org_id,
+                            user=user,
+                            name=f"{user.first_name} {user.last_name}".strip() or user.email,
+                            first_name=user.first_name,
+                            last_name=user.last_name,
+                            email=user.email,
+                            customer_type='individual',
+                            status='active'
+                        )
+                        logger.info(f"Created Customer record {raised_by_customer.id} for user {user.email}")
+                except Exception as e:
+                    logger.error(f"Error creating/finding customer record: {e}", exc_info=True)
+            
+            # If customer_id provided explicitly (for vendors/employees)
+            if customer_id:
+                from crmApp.models import Customer
+                try:
+                    raised_by_customer = Customer.objects.get(id=customer_id, organization_id=target_org_id)
+                    is_client_issue = True
+                except Customer.DoesNotExist:
+                    return {"error": f"Customer with ID {customer_id} not found in the organization"}
+            
+            issue = Issue.objects.create(
+                organization_id=target_org_id,
+                title=title,
+                description=description,
+                priority=priority.lower() if priority else "medium",
+                category=category.lower() if category else "other",
+                raised_by_customer=raised_by_customer,
+                is_client_issue=is_client_issue,
+                status="open"
+            )
+            
+            logger.info(f"Issue {issue.id} created successfully")
+            
+            # Automatically sync to Linear
+            linear_synced = False
+            linear_url = None
+            try:
+                from crmApp.services.issue_linear_service import IssueLinearService
+                from crmApp.models import Organization
+                
+                linear_service = IssueLinearService()
+                organization = Organization.objects.get(id=target_org_id)
+                
+                # Get Linear team ID
+                team_id = linear_service.get_team_id(None, organization, issue)
+                
+                if team_id:
+                    logger.info(f"Syncing issue {issue.id} to Linear (team_id: {team_id})")
+                    success, linear_data, error = linear_service.sync_issue_to_linear(
+                        issue=issue,
+                        team_id=team_id,
+                        update_existing=False
+                    )
+                    
+                    if success and linear_data:
+                        linear_synced = True
+                        linear_url = linear_data.get('url')
+                        logger.info(f"Issue {issue.id} synced to Linear: {linear_url}")
+                    else:
+                        logger.warning(f"Failed to sync issue {issue.id} to Linear: {error}")
+                else:
+                    logger.warning(f"No Linear team ID found for organization {target_org_id}")
+            except Exception as e:
+                logger.error(f"Error syncing issue {issue.id} to Linear: {e}", exc_info=True)
+            
+            # Get vendor name for response
+            vendor_name_display = "the vendor"
+            try:
+                from crmApp.models import Vendor
+                vendor = Vendor.objects.get(organization_id=target_org_id)
+                vendor_name_display = vendor.name
+            except:
+                pass
+            
+            response = {
+                "success": True,
+                "id": issue.id,
+                "title": issue.title,
+                "vendor": vendor_name_display,
+                "message": f"Issue '{title}' created successfully for {vendor_name_display}. Issue ID: {issue.id}"
+            }
+            
+            if linear_synced and linear_url:
+                response["linear_synced"] = True
+                response["linear_url"] = linear_url
+                response["message"] += f" and synced to Linear: {linear_url}"
+            
+            return response
+        except Exception as e:
+            logger.error(f"Error creating issue: {e}", exc_info=True)
+            return {"error": f"Failed to create issue: {str(e)}"}
+    return await create()
+
+
+async def update_issue_tool(ctx: CRMToolContext, issue_id: int, status: str = None, priority: str = None, title: str = None, description: str = None):
+    """Update an existing issue (change status, priority, resolve, etc.)"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('issue', 'update')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def update():
+        if not ctx.org_id:
+            return {"error": "No organization context found. Please ensure you're logged in."}
+        
+        logger.info(f"Updating issue {issue_id} for organization_id={ctx.org_id}")
+        
+        try:
+            issue = Issue.objects.get(id=issue_id, organization_id=ctx.org_id)
+            
+            if status:
+                issue.status = status.lower()
+            if priority:
+                issue.priority = priority.lower()
+            if title:
+                issue.title = title
+            if description:
+                issue.description = description
+            
+            issue.save()
+            
+            logger.info(f"Issue {issue.id} updated successfully")
+            
+            return {
+                "success": True,
+                "id": issue.id,
+                "title": issue.title,
+                "status": issue.status,
+                "priority": issue.priority,
+                "message": f"Issue '{issue.title}' updated successfully"
+            }
+        except Issue.DoesNotExist:
+            logger.warning(f"Issue {issue_id} not found in org {ctx.org_id}")
+            return {"error": f"Issue with ID {issue_id} not found in your organization"}
+        except Exception as e:
+            logger.error(f"Error updating issue: {e}", exc_info=True)
+            return {"error": f"Failed to update issue: {str(e)}"}
+    return await update()
+
+
+async def get_issue_tool(ctx: CRMToolContext, issue_id: int):
+    """Get detailed information about a specific issue"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if not ctx.org_id:
+            return {"error": "No organization context found. Please ensure you're logged in."}
+        
+        try:
+            issue = Issue.objects.select_related('customer', 'assigned_to').get(id=issue_id, organization_id=ctx.org_id)
+            return {
+                "id": issue.id,
+                "title": issue.title,
+                "description": issue.description,
+                "priority": issue.priority,
+                "status": issue.status,
+                "category": issue.category,
+                "customer_name": issue.customer.name if issue.customer else None,
+                "created_at": str(issue.created_at) if hasattr(issue, 'created_at') else None,
+            }
+        except Issue.DoesNotExist:
+            return {"error": f"Issue with ID {issue_id} not found in your organization"}
+    return await fetch()
+
+
+async def resolve_issue_tool(ctx: CRMToolContext, issue_id: int):
+    """Mark an issue as resolved"""
+    @sync_to_async
+    def resolve():
+        if not ctx.org_id:
+            return {"error": "No organization context found. Please ensure you're logged in."}
+        
+        logger.info(f"Resolving issue {issue_id} for organization_id={ctx.org_id}")
+        
+        try:
+            issue = Issue.objects.get(id=issue_id, organization_id=ctx.org_id)
+            issue.status = "resolved"
+            issue.save()
+            
+            logger.info(f"Issue {issue.id} resolved successfully")
+            
+            return {
+                "success": True,
+                "id": issue.id,
+                "title": issue.title,
+                "status": issue.status,
+                "message": f"Issue '{issue.title}' marked as resolved ✓"
+            }
+        except Issue.DoesNotExist:
+            logger.warning(f"Issue {issue_id} not found in org {ctx.org_id}")
+            return {"error": f"Issue with ID {issue_id} not found in your organization"}
+        except Exception as e:
+            logger.error(f"Error resolving issue: {e}", exc_info=True)
+            return {"error": f"Failed to resolve issue: {str(e)}"}
+    return await resolve()
+
+
+async def delete_issue_tool(ctx: CRMToolContext, issue_id: int):
+    """Delete an issue permanently. Only vendors and employees can delete issues."""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('issue', 'delete')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def delete():
+        if not ctx.org_id:
+            return {"error": "No organization context found. Please ensure you're logged in."}
+        
+        logger.info(f"Deleting issue {issue_id} for organization_id={ctx.org_id}")
+        
+        try:
+            issue = Issue.objects.get(id=issue_id, organization_id=ctx.org_id)
+            issue_title = issue.title
+            issue_number = issue.issue_number if hasattr(issue, 'issue_number') else issue.id
+            
+            # Delete the issue
+            issue.delete()
+            
+            logger.info(f"Issue {issue_number} ('{issue_title}') deleted successfully")
+            
+            return {
+                "success": True,
+                "id": issue_id,
+                "title": issue_title,
+                "message": f"Issue '{issue_title}' (ID: {issue_id}) has been permanently deleted ✓"
+            }
+        except Issue.DoesNotExist:
+            logger.warning(f"Issue {issue_id} not found in org {ctx.org_id}")
+            return {"error": f"Issue with ID {issue_id} not found in your organization"}
+        except Exception as e:
+            logger.error(f"Error deleting issue: {e}", exc_info=True)
+            return {"error": f"Failed to delete issue: {str(e)}"}
+    return await delete()
+
+
+# === ANALYTICS TOOLS ===
+async def get_dashboard_stats_tool(ctx: CRMToolContext):
+    """Get comprehensive dashboard statistics"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from django.db.models import Sum, Count
+        return {
+            "customers": {
+                "total": Customer.objects.filter(organization_id=ctx.org_id).count(),
+                "active": Customer.objects.filter(organization_id=ctx.org_id, status='active').count(),
+            },
+            "leads": {
+                "total": Lead.objects.filter(organization_id=ctx.org_id).count(),
+                "new": Lead.objects.filter(organization_id=ctx.org_id, status='new').count(),
+                "qualified": Lead.objects.filter(organization_id=ctx.org_id, status='qualified').count(),
+            },
+            "deals": {
+                "total": Deal.objects.filter(organization_id=ctx.org_id).count(),
+                "total_value": float(Deal.objects.filter(organization_id=ctx.org_id).aggregate(Sum('value'))['value__sum'] or 0),
+                "won": Deal.objects.filter(organization_id=ctx.org_id, status='won').count(),
+            },
+            "issues": {
+                "total": Issue.objects.filter(organization_id=ctx.org_id).count(),
+                "open": Issue.objects.filter(organization_id=ctx.org_id, status='open').count(),
+            },
+            "activities": {
+                "total": Activity.objects.filter(organization_id=ctx.org_id).count(),
+                "completed": Activity.objects.filter(organization_id=ctx.org_id, status='completed').count(),
+                "pending": Activity.objects.filter(organization_id=ctx.org_id, status__in=['scheduled', 'in_progress']).count(),
+            }
+        }
+    return await fetch()
+
+
+# === ACTIVITY TOOLS ===
+async def list_activities_tool(
+    ctx: CRMToolContext,
+    activity_type: Optional[str] = None,
+    status: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    lead_id: Optional[int] = None,
+    deal_id: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: int = 50,  # Increased default from 20 to 50 for better visibility
+    cursor: Optional[str] = None
+):
+    """List activities, audit log entries and video calls in the organization with optional filters"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('activity', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        projection = get_projection('list_activities')
+        try:
+            page = ActivityTimelineService.page(
+                [ctx.org_id],
+                limit=projection.clamp(limit),
+                cursor=cursor,
+                activity_type=activity_type,
+                status=status,
+                customer_id=customer_id,
+                lead_id=lead_id,
+                deal_id=deal_id,
+                assigned_to=assigned_to,
+                search=search,
+            )
+        except InvalidTimelineCursor:
+            return {"error": "Invalid cursor. Call list_activities without a cursor to start over."}
+        
+        logger.info(f"Retrieved {len(page['activities'])} activities for org {ctx.org_id} (limit={limit}, more_available={page['more_available']})")
+        return projection.result(page['activities'], page['next_cursor'])
+    return await fetch()
+
+
+async def get_activity_tool(ctx: CRMToolContext, activity_id: int):
+    """Get detailed information about a specific activity"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('activity', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        try:
+            activity = Activity.objects.select_related(
+                'customer', 'lead', 'deal', 'assigned_to', 'created_by'
+            ).get(id=activity_id, organization_id=ctx.org_id)
+            
+            return {
+                "id": activity.id,
+                "activity_type": activity.activity_type,
+                "title": activity.title,
+                "description": activity.description,
+                "customer_id": activity.customer_id,
+                "customer_name": activity.customer_name or (activity.customer.name if activity.customer else None),
+                "lead_id": activity.lead_id,
+                "deal_id": activity.deal_id,
+                "assigned_to_id": activity.assigned_to_id,
+                "assigned_to_name": f"{activity.assigned_to.first_name} {activity.assigned_to.last_name}".strip() if activity.assigned_to else None,
+                "status": activity.status,
+                "scheduled_at": str(activity.scheduled_at) if activity.scheduled_at else None,
+                "completed_at": str(activity.completed_at) if activity.completed_at else None,
+                "created_at": str(activity.created_at),
+                "duration_minutes": activity.duration_minutes,
+            }
+        except Activity.DoesNotExist:
+            return {"error": f"Activity {activity_id} not found in your organization"}
+    return await fetch()
+
+
+async def get_activity_stats_tool(ctx: CRMToolContext, activity_type: str = None):
+    """Get activity statistics for the organization"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('activity', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        queryset = Activity.objects.filter(organization_id=ctx.org_id)
+        
+        if activity_type:
+            queryset = queryset.filter(activity_type=activity_type)
+        
+        total = queryset.count()
+        by_type = {}
+        by_status = {}
+        
+        for atype in ['call', 'email', 'telegram', 'meeting', 'note', 'task']:
+            count = queryset.filter(activity_type=atype).count()
+            if count > 0:
+                by_type[atype] = count
+        
+        for s in ['scheduled', 'in_progress', 'completed', 'cancelled']:
+            count = queryset.filter(status=s).count()
+            if count > 0:
+                by_status[s] = count
+        
+        return {
+            "total_activities": total,
+            "completed": queryset.filter(status='completed').count(),
+            "pending": queryset.filter(status__in=['scheduled', 'in_progress']).count(),
+            "by_type": by_type,
+            "by_status": by_status
+        }
+    return await fetch()
+
+
+# === ROLE MANAGEMENT TOOLS ===
+async def invite_employee_tool(
+    ctx: CRMToolContext,
+    email: str,
+    first_name: str,
+    last_name: str,
+    phone: Optional[str] = None,
+    department: Optional[str] = None,
+    job_title: Optional[str] = None,
+    role_id: Optional[int] = None
+):
+    """Invite a new or existing employee to join the organization"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('employee', 'create')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def invite():
+        from crmApp.models import User, UserOrganization, UserProfile, Employee, Role, Organization
+        from django.utils.crypto import get_random_string
+        from django.utils import timezone
+        
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        organization = Organization.objects.get(id=ctx.org_id)
+        existing_user = User.objects.filter(email=email).first()
+        user_created = False
+        
+        try:
+            from django.db import transaction
+            with transaction.atomic():
+                if existing_user:
+                    existing_employee = Employee.objects.filter(
+                        organization=organization,
+                        user=existing_user
+                    ).first()
+                    
+                    if existing_employee:
+                        return {"error": f"{existing_user.full_name} is already an employee in this organization"}
+                    
+                    user = existing_user
+                    user_org_link, _ = UserOrganization.objects.get_or_create(
+                        user=user,
+                        organization=organization,
+                        defaults={'is_owner': False, 'is_active': True}
+                    )
+                    if not user_org_link.is_active:
+                        user_org_link.is_active = True
+                        user_org_link.save()
+                    
+                    user_profile, _ = UserProfile.objects.get_or_create(
+                        user=user,
+                        profile_type='employee',
+                        defaults={
+                            'organization': organization,
+                            'is_primary': False,
+                            'status': 'active',
+                            'activated_at': timezone.now()
+                        }
+                    )
+                    message = f'Existing user {user.full_name} added as employee'
+                else:
+                    username = email.split('@')[0]
+                    if User.objects.filter(username=username).exists():
+                        username = f"{username}_{get_random_string(4)}"
+                    
+                    temp_password = get_random_string(12)
+                    user = User.objects.create_user(
+                        username=username,
+                        email=email,
+                        password=temp_password,
+                        first_name=first_name,
+                        last_name=last_name,
+                        phone=phone
+                    )
+                    user_created = True
+                    
+                    UserOrganization.objects.create(
+                        user=user,
+                        organization=organization,
+                        is_owner=False,
+                        is_active=True
+                    )
+                    
+                    user_profile = UserProfile.objects.create(
+                        user=user,
+                        organization=organization,
+                        profile_type='employee',
+                        is_primary=False,
+                        status='active',
+                        activated_at=timezone.now()
+                    )
+                    message = f'New user created and invited as employee'
+                
+                employee_data = {
+                    'organization': organization,
+                    'user': user,
+                    'first_name': first_name,
+                    'last_name': last_name,
+                    'email': email,
+                    'phone': phone,
+                    'department': department,
+                    'job_title': job_title,
+                    'status': 'active',
+                    'hire_date': timezone.now().date()
+                }
+                
+                if role_id:
+                    try:
+                        role = Role.objects.get(id=role_id, organization=organization)
+                        employee_data['role'] = role
+                    except Role.DoesNotExist:
+                        return {"error": f"Role with ID {role_id} not found in your organization"}
+                
+                employee = Employee.objects.create(**employee_data)
+                
+                return {
+                    "success": True,
+                    "message": message,
+                    "employee": {
+                        "id": employee.id,
+                        "name": f"{employee.first_name} {employee.last_name}",
+                        "email": employee.email,
+                        "job_title": employee.job_title,
+                        "department": employee.department,
+                        "role_id": employee.role_id,
+                    },
+                    "user_created": user_created
+                }
+        except Exception as e:
+            logger.error(f"Error inviting employee: {str(e)}", exc_info=True)
+            return {"error": f"Failed to invite employee: {str(e)}"}
+    return await invite()
+
+
+async def list_roles_tool(ctx: CRMToolContext, is_active: Optional[bool] = None, search: Optional[str] = None, limit: int = 20):
+    """List roles in the organization"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Role
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        queryset = Role.objects.filter(organization_id=ctx.org_id)
+        
+        if is_active is not None:
+            queryset = queryset.filter(is_active=is_active)
+        
+        if search:
+            queryset = queryset.filter(name__icontains=search) | queryset.filter(description__icontains=search)
+        
+        roles = queryset.prefetch_related('role_permissions__permission')[:limit]
+        
+        return [
+            {
+                "id": r.id,
+                "name": r.name,
+                "description": r.description,
+                "is_active": r.is_active,
+                "permission_count": r.role_permissions.count(),
+            }
+            for r in roles
+        ]
+    return await fetch()
+
+
+async def create_role_tool(
+    ctx: CRMToolContext,
+    name: str,
+    description: Optional[str] = None,
+    permission_ids: Optional[List[int]] = None
+):
+    """Create a new role in the organization"""
+    # AUTHORIZATION CHECK - vendors can always create roles
+    if ctx.role != 'vendor':
+        auth_error = ctx.check_role_permission('role', 'create')
+        if auth_error:
+            return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def create():
+        from crmApp.models import Role, Permission, RolePermission, Organization
+        from django.utils.text import slugify
+        
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        organization = Organization.objects.get(id=ctx.org_id)
+        base_slug = slugify(name)
+        slug = base_slug
+        counter = 1
+        
+        while Role.objects.filter(organization=organization, slug=slug).exists():
+            slug = f"{base_slug}-{counter}"
+            counter += 1
+        
+        ctx.role = Role.objects.create(
+            organization=organization,
+            name=name,
+            slug=slug,
+            description=description,
+            is_system_role=False,
+            is_active=True
+        )
+        
+        if permission_ids:
+            permissions = Permission.objects.filter(id__in=permission_ids, organization=organization)
+            for permission in permissions:
+                RolePermission.objects.get_or_create(role=ctx.role, permission=permission)
+        
+        return {
+            "success": True,
+            "message": f"Role '{name}' created successfully",
+            "role": {
+                "id": ctx.role.id,
+                "name": ctx.role.name,
+                "description": ctx.role.description,
+                "permission_count": ctx.role.role_permissions.count(),
+            }
+        }
+    return await create()
+
+
+async def assign_permissions_to_role_tool(ctx: CRMToolContext, role_id: int, permission_ids: List[int]):
+    """Assign permissions to a role"""
+    # AUTHORIZATION CHECK
+    if ctx.role != 'vendor':
+        auth_error = ctx.check_role_permission('role', 'update')
+        if auth_error:
+            return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def assign():
+        from crmApp.models import Role, Permission, RolePermission
+        
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        ctx.role = Role.objects.get(id=role_id, organization_id=ctx.org_id)
+        permissions = Permission.objects.filter(id__in=permission_ids, organization_id=ctx.org_id)
+        
+        assigned_count = 0
+        for permission in permissions:
+            _, created = RolePermission.objects.get_or_create(role=ctx.role, permission=permission)
+            if created:
+                assigned_count += 1
+        
+        return {
+            "success": True,
+            "message": f"Assigned {assigned_count} permission(s) to role '{ctx.role.name}'",
+            "role": {
+                "id": ctx.role.id,
+                "name": ctx.role.name,
+                "permission_count": ctx.role.role_permissions.count(),
+            }
+        }
+    return await assign()
+
+
+async def assign_role_to_employee_tool(ctx: CRMToolContext, employee_id: int, role_id: int):
+    """Assign a role to an employee"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('employee', 'update')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def assign():
+        from crmApp.models import Employee, Role, UserRole
+        
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        employee = Employee.objects.get(id=employee_id, organization_id=ctx.org_id)
+        role = Role.objects.get(id=role_id, organization_id=ctx.org_id)
+        
+        employee.role = role
+        employee.save()
+        
+        UserRole.objects.get_or_create(
+            user=employee.user,
+            role=role,
+            organization_id=ctx.org_id,
+            defaults={'assigned_by_id': ctx.user_context.get('user_id'), 'is_active': True}
+        )
+        
+        return {
+            "success": True,
+            "message": f"Role '{role.name}' assigned to employee {employee.first_name} {employee.last_name}",
+            "employee": {
+                "id": employee.id,
+                "name": f"{employee.first_name} {employee.last_name}",
+                "role_id": employee.role_id,
+                "role_name": role.name,
+            }
+        }
+    return await assign()
+
+
+async def list_permissions_tool(ctx: CRMToolContext, resource: Optional[str] = None, action: Optional[str] = None, limit: int = 100):
+    """List available permissions in the organization"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Permission
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        queryset = Permission.objects.filter(organization_id=ctx.org_id)
+        
+        if resource:
+            queryset = queryset.filter(resource=resource)
+        if action:
+            queryset = queryset.filter(action=action)
+        
+        permissions = queryset[:limit]
+        
+        return [
+            {
+                "id": p.id,
+                "resource": p.resource,
+                "action": p.action,
+                "description": p.description,
+                "full_permission": f"{p.resource}:{p.action}",
+            }
+            for p in permissions
+        ]
+    return await fetch()
+
+
+# === EMPLOYEE TOOLS ===
+async def list_employees_tool(ctx: CRMToolContext, status: str = "active", limit: int = 20):
+    """List employees in the organization"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Employee
+        if not ctx.org_id:
+            return {"error": "No organization context found"}
+        
+        queryset = Employee.objects.filter(organization_id=ctx.org_id)
+        
+        if status and status.lower() != "all":
+            queryset = queryset.filter(status=status.lower())
+        
+        employees = queryset.order_by('-created_at')[:limit]
+        
+        return [
+            {
+                "id": e.id,
+                "name": f"{e.first_name} {e.last_name}",
+                "email": e.email,
+                "phone": e.phone or "",
+                "job_title": e.job_title or "",
+                "department": e.department or "",
+                "status": e.status,
+                "employment_type": e.employment_type,
+            }
+            for e in employees
+        ]
+    return await fetch()
+
+
+async def get_employee_tool(ctx: CRMToolContext, employee_id: int):
+    """Get detailed employee information"""
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Employee
+        try:
+            if ctx.org_id:
+                employee = Employee.objects.get(id=employee_id, organization_id=ctx.org_id)
+            else:
+                employee = Employee.objects.get(id=employee_id, organization_id__isnull=True)
+            return {
+                "id": employee.id,
+                "name": f"{employee.first_name} {employee.last_name}",
+                "email": employee.email,
+                "phone": employee.phone or "",
+                "job_title": employee.job_title or "",
+                "department": employee.department or "",
+                "employment_type": employee.employment_type,
+                "status": employee.status,
+                "hire_date": str(employee.hire_date) if employee.hire_date else None,
+                "address": employee.address or "",
+                "city": employee.city or "",
+                "country": employee.country or "",
+            }
+        except Exception as e:
+            return {"error": f"Employee not found: {str(e)}"}
+    return await fetch()
+
+
+# === VENDOR TOOLS ===
+async def list_vendors_tool(ctx: CRMToolContext, status: str = "active", limit: int = 20):
+    """List vendors accessible to the user"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('vendor', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Vendor
+        
+        # For customers, get vendors they are associated with through CustomerOrganization
+        if ctx.role == 'customer':
+            # Get all organizations the customer belongs to
+            from crmApp.models import CustomerOrganization
+            customer_orgs = CustomerOrganization.objects.filter(
+                customer_id=ctx.user_context.get('user_id')
+            ).values_list('organization_id', flat=True)
+            
+            # Get vendors from those organizations
+            queryset = Vendor.objects.filter(organization_id__in=customer_orgs)
+        else:
+            # For vendors/employees, use organization filter
+            if not ctx.org_id:
+                return {"error": "No organization context found"}
+            queryset = Vendor.objects.filter(organization_id=ctx.org_id)
+        
+        # Apply status filter
+        if status and status.lower() != "all":
+            queryset = queryset.filter(status=status.lower())
+        
+        vendors = queryset.order_by('name')[:limit]
+        
+        return [
+            {
+                "id": v.id,
+                "name": v.name,
+                "email": v.email or "",
+                "phone": v.phone or "",
+                "contact_person": v.contact_person or "",
+                "vendor_type": v.vendor_type or "",
+                "status": v.status,
+            }
+            for v in vendors
+        ]
+    return await fetch()
+
+
+async def get_vendor_tool(ctx: CRMToolContext, vendor_id: int):
+    """Get detailed information about a specific vendor"""
+    # AUTHORIZATION CHECK
+    auth_error = ctx.check_role_permission('vendor', 'read')
+    if auth_error:
+        return auth_error
+    
+    @sync_to_async(thread_sensitive=False)
+    def fetch():
+        from crmApp.models import Vendor
+        try:
+            # For customers, verify they have access to this vendor's organization
+            if ctx.role == 'customer':
+                from crmApp.models import CustomerOrganization
+                customer_orgs = CustomerOrganization.objects.filter(
+                    customer_id=ctx.user_context.get('user_id')
+                ).values_list('organization_id', flat=True)
+                vendor = Vendor.objects.get(id=vendor_id, organization_id__in=customer_orgs)
+            else:
+                # For vendors/employees
+                if ctx.org_id:
+                    vendor = Vendor.objects.get(id=vendor_id, organization_id=ctx.org_id)
+                else:
+                    vendor = Vendor.objects.get(id=vendor_id)
+            
+            return {
+                "id": vendor.id,
+                "name": vendor.name,
+                "email": vendor.email or "",
+                "phone": vendor.phone or "",
+                "contact_person": vendor.contact_person or "",
+                "vendor_type": vendor.vendor_type or "",
+                "status": vendor.status,
+                "address": vendor.address or "",
+                "city": vendor.city or "",
+                "country": vendor.country or "",
+                "website": vendor.website or "",
+            }
+        except Exception as e:
+            return {"error": f"Vendor not found or access denied: {str(e)}"}
+    return await fetch()
+
+
+async def get_current_user_context_tool(ctx: CRMToolContext):
+    """Get information about the current logged-in user"""
+    role = ctx.user_context.get('role', '')
+    permissions = ctx.user_context.get('permissions', [])
+    permissions_count = len(permissions)
+    
+    # For vendors, show full access message even if permission count is 0
+    # Vendors have full access via role-based authorization, not explicit permissions
+    if role == 'vendor':
+        permission_message = f"Full access (vendor role) - {permissions_count} explicit permissions"
+        if permissions_count == 0:
+            permission_message = "Full access (vendor role - all permissions granted)"
+    else:
+        permission_message = f"{permissions_count} active permissions"
+    
+    return {
+        "user_id": ctx.user_context.get('user_id'),
+        "organization_id": ctx.user_context.get('organization_id'),
+        "role": role,
+        "permissions_count": permissions_count,
+        "permissions": permissions,
+        "message": f"You are logged in as user ID {ctx.user_context.get('user_id')} with role '{role}' in organization {ctx.user_context.get('organization_id')}. You currently have {permission_message}."
+    }
+
+
+# Function declarations sent to Gemini
+FUNCTION_DECLARATIONS = [
+    # Customer functions
+    types.FunctionDeclaration(
+        name="list_customers",
+        description="List customers in the organization. Returns customer names, emails, phones, and status.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "status": types.Schema(type=types.Type.STRING, description="Filter by status: active, inactive, prospect, vip (default: active)"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 10, max: 50)"),
+                "cursor": types.Schema(type=types.Type.STRING, description="next_cursor of the previous result, to fetch the following page when more_available is true"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_customer_count",
+        description="Get the total number of customers in the organization",
+        parameters=types.Schema(type=types.Type.OBJECT, properties={}),
+    ),
+    types.FunctionDeclaration(
+        name="create_customer",
+        description="Create a new customer in the CRM",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "name": types.Schema(type=types.Type.STRING, description="Customer name (required)"),
+                "email": types.Schema(type=types.Type.STRING, description="Email address (required)"),
+                "phone": types.Schema(type=types.Type.STRING, description="Phone number (optional)"),
+                "customer_type": types.Schema(type=types.Type.STRING, description="Type: individual or business (default: individual)"),
+                "company_name": types.Schema(type=types.Type.STRING, description="Company name for business customers (optional)"),
+            },
+            required=["name", "email"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_customer",
+        description="Get detailed information about a specific customer",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "customer_id": types.Schema(type=types.Type.INTEGER, description="Customer ID"),
+            },
+            required=["customer_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="update_customer",
+        description="Update an existing customer's information",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "customer_id": types.Schema(type=types.Type.INTEGER, description="Customer ID (required)"),
+                "name": types.Schema(type=types.Type.STRING, description="New name (optional)"),
+                "email": types.Schema(type=types.Type.STRING, description="New email (optional)"),
+                "phone": types.Schema(type=types.Type.STRING, description="New phone (optional)"),
+                "status": types.Schema(type=types.Type.STRING, description="New status: active, inactive, prospect, vip (optional)"),
+            },
+            required=["customer_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="delete_customer",
+        description="Delete a customer from the CRM",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "customer_id": types.Schema(type=types.Type.INTEGER, description="Customer ID to delete"),
+            },
+            required=["customer_id"],
+        ),
+    ),
+    # Lead functions
+    types.FunctionDeclaration(
+        name="list_leads",
+        description="""List leads in the user's organization with their current pipeline stage.
+
+IMPORTANT: Organization ID is automatically determined from user context.
+
+Leads move through pipeline stages: Lead → Qualified → Proposal → Negotiation → Closed Won/Closed Lost
+
+Each lead will show:
+- Current pipeline stage (Lead, Qualified, Proposal, Negotiation, Closed Won, Closed Lost)
+- Qualification status (new, contacted, qualified, etc.)
+- Conversion status (is_converted = true when lead reaches Closed Won and becomes customer)
+
+Use this function whenever the user asks about:
+- "my leads", "show leads", "list leads"
+- "leads in [stage name]"
+- "what leads are in negotiation?"
+- "show qualified leads"
+""",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "status": types.Schema(type=types.Type.STRING, description="Optional filter by qualification status: new, contacted, qualified, unqualified, converted, lost, or 'all' for all leads regardless of qualification status (default: all)"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 10, max: 100)"),
+                "cursor": types.Schema(type=types.Type.STRING, description="next_cursor of the previous result, to fetch the following page when more_available is true"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="create_lead",
+        description="Create a new lead in the CRM",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "name": types.Schema(type=types.Type.STRING, description="Lead name (required)"),
+                "email": types.Schema(type=types.Type.STRING, description="Email address (required)"),
+                "phone": types.Schema(type=types.Type.STRING, description="Phone number (optional)"),
+                "source": types.Schema(type=types.Type.STRING, description="Lead source: website, referral, campaign, etc (default: website)"),
+            },
+            required=["name", "email"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="update_lead",
+        description="Update an existing lead's information",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "lead_id": types.Schema(type=types.Type.INTEGER, description="Lead ID (required)"),
+                "name": types.Schema(type=types.Type.STRING, description="New name (optional)"),
+                "status": types.Schema(type=types.Type.STRING, description="New status: new, contacted, qualified, disqualified (optional)"),
+                "score": types.Schema(type=types.Type.INTEGER, description="Lead score 0-100 (optional)"),
+            },
+            required=["lead_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="qualify_lead",
+        description="Mark a lead as qualified (sets status to qualified and increases score)",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "lead_id": types.Schema(type=types.Type.INTEGER, description="Lead ID to qualify"),
+            },
+            required=["lead_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="convert_lead_to_customer",
+        description="Convert a qualified lead into a customer",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "lead_id": types.Schema(type=types.Type.INTEGER, description="Lead ID to convert"),
+            },
+            required=["lead_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_lead",
+        description="Get detailed information about a specific lead by ID",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "lead_id": types.Schema(type=types.Type.INTEGER, description="Lead ID to retrieve"),
+            },
+            required=["lead_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="move_lead_stage",
+        description="""Move a lead through the sales pipeline stages. 
+                
+CRITICAL: ALWAYS allow the stage movement the user requests - there are NO restrictions!
+- Users can move leads to ANY stage from ANY other stage
+- Closed Lost leads CAN be moved back to active stages (reopening deals)
+- Closed Won leads CAN be moved back if needed
+- Users can jump forward or backward in the pipeline freely
+
+The pipeline stages are in order:
+1. Lead (initial stage)
+2. Qualified (lead meets criteria)
+3. Proposal (quote/proposal sent)
+4. Negotiation (discussing terms)
+5. Closed Won (deal won - lead automatically becomes a customer!)
+6. Closed Lost (deal lost)
+
+When you move a lead to 'Closed Won', the system will automatically:
+- Convert the lead to a customer
+- The customer will appear in the customers page
+- Lead history is preserved
+
+Use this function when user says things like:
+- "Move lead to qualified"
+- "Move closed lost lead back to qualified" (ALWAYS ALLOW THIS)
+- "Reopen this lead" (move from Closed Lost to active stage)
+- "Mark lead as proposal sent"
+- "Lead won the deal" (use Closed Won)
+- "Lead is in negotiation"
+- "We lost this lead" (use Closed Lost)""",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "lead_id": types.Schema(type=types.Type.INTEGER, description="Lead ID to move"),
+                "stage": types.Schema(type=types.Type.STRING, description="Stage name to move to. Valid stages: 'Lead', 'Qualified', 'Proposal', 'Negotiation', 'Closed Won', 'Closed Lost'"),
+                "notes": types.Schema(type=types.Type.STRING, description="Optional notes about the stage change (e.g., reason for moving, deal details)"),
+            },
+            required=["lead_id", "stage"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_pipeline_stages",
+        description="Get all available pipeline stages for leads in the organization. Shows the complete sales pipeline with stage order, names, and status. Use this to understand what stages exist before moving leads.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={},
+        ),
+    ),
+    # Deal functions
+    types.FunctionDeclaration(
+        name="list_deals",
+        description="List deals in the organization",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "stage": types.Schema(type=types.Type.STRING, description="Filter by stage: prospecting, qualification, proposal, negotiation, closed"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 10, max: 50)"),
+                "cursor": types.Schema(type=types.Type.STRING, description="next_cursor of the previous result, to fetch the following page when more_available is true"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="create_deal",
+        description="Create a new deal in the CRM",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "title": types.Schema(type=types.Type.STRING, description="Deal title (required)"),
+                "value": types.Schema(type=types.Type.NUMBER, description="Deal value in dollars (required)"),
+                "customer_id": types.Schema(type=types.Type.INTEGER, description="Associated customer ID (optional)"),
+                "stage": types.Schema(type=types.Type.STRING, description="Deal stage: prospecting, qualification, proposal, negotiation, closed (default: prospecting)"),
+            },
+            required=["title", "value"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="update_deal",
+        description="Update an existing deal's information",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "deal_id": types.Schema(type=types.Type.INTEGER, description="Deal ID (required)"),
+                "title": types.Schema(type=types.Type.STRING, description="New title (optional)"),
+                "value": types.Schema(type=types.Type.NUMBER, description="New value (optional)"),
+                "stage": types.Schema(type=types.Type.STRING, description="New stage (optional)"),
+                "status": types.Schema(type=types.Type.STRING, description="New status: open, won, lost (optional)"),
+            },
+            required=["deal_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="mark_deal_won",
+        description="Mark a deal as won and close it",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "deal_id": types.Schema(type=types.Type.INTEGER, description="Deal ID to mark as won"),
+            },
+            required=["deal_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="mark_deal_lost",
+        description="Mark a deal as lost and close it",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "deal_id": types.Schema(type=types.Type.INTEGER, description="Deal ID to mark as lost"),
+                "reason": types.Schema(type=types.Type.STRING, description="Reason for losing the deal (optional)"),
+            },
+            required=["deal_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_deal_stats",
+        description="Get deal statistics including total value, won/lost counts",
+        parameters=types.Schema(type=types.Type.OBJECT, properties={}),
+    ),
+    # Issue functions
+    types.FunctionDeclaration(
+        name="list_issues",
+        description="List issues/tickets in the user's organization. Organization ID is automatically determined from user context. Returns all issues by default unless status filter is specified. Use this function when user asks about 'my issues', 'show issues', 'list issues', 'open issues', etc.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "status": types.Schema(type=types.Type.STRING, description="Optional filter by status: open, in_progress, resolved, closed, or 'all' for all statuses (default: all if not specified)"),
+                "priority": types.Schema(type=types.Type.STRING, description="Optional filter by priority: low, medium, high, critical"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 20, max: 100)"),
+                "cursor": types.Schema(type=types.Type.STRING, description="next_cursor of the previous result, to fetch the following page when more_available is true"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_issue",
+        description="Get detailed information about a specific issue by ID. Organization ID is automatically determined from user context.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "issue_id": types.Schema(type=types.Type.INTEGER, description="Issue ID (required)"),
+            },
+            required=["issue_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="list_my_vendors_for_issues",
+        description="List ALL available vendors/organizations in the system. Customers can create issues for any vendor. IMPORTANT: Call this BEFORE creating an issue to see all available vendors.",
+        parameters=types.Schema(type=types.Type.OBJECT, properties={}),
+    ),
+    types.FunctionDeclaration(
+        name="create_issue",
+        description="Create a new issue/support ticket for ANY vendor/organization. FOR CUSTOMERS: Specify vendor_name, organization_name, or organization_id (get list from list_my_vendors_for_issues).",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "title": types.Schema(type=types.Type.STRING, description="Issue title (required)"),
+                "description": types.Schema(type=types.Type.STRING, description="Issue description (required)"),
+                "priority": types.Schema(type=types.Type.STRING, description="Priority: low, medium, high, critical (default: medium)"),
+                "category": types.Schema(type=types.Type.STRING, description="Category: quality, delivery, payment, communication, other (default: other)"),
+                "vendor_name": types.Schema(type=types.Type.STRING, description="Vendor name (for customers - which vendor the issue is for)"),
+                "organization_name": types.Schema(type=types.Type.STRING, description="Organization name (for customers - which organization the issue is for)"),
+                "organization_id": types.Schema(type=types.Type.INTEGER, description="Organization ID (for customers - alternative to vendor_name/organization_name)"),
+                "customer_id": types.Schema(type=types.Type.INTEGER, description="Associated customer ID (optional)"),
+            },
+            required=["title", "description"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="update_issue",
+        description="Update an existing issue's status, priority, title, or description. Organization ID is automatically determined from user context.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "issue_id": types.Schema(type=types.Type.INTEGER, description="Issue ID (required)"),
+                "status": types.Schema(type=types.Type.STRING, description="New status: open, in_progress, resolved, closed (optional)"),
+                "priority": types.Schema(type=types.Type.STRING, description="New priority: low, medium, high, critical (optional)"),
+                "title": types.Schema(type=types.Type.STRING, description="New title (optional)"),
+                "description": types.Schema(type=types.Type.STRING, description="New description (optional)"),
+            },
+            required=["issue_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="resolve_issue",
+        description="Mark an issue as resolved. Organization ID is automatically determined from user context.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "issue_id": types.Schema(type=types.Type.INTEGER, description="Issue ID to resolve (required)"),
+            },
+            required=["issue_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="delete_issue",
+        description="Permanently delete an issue. Only vendors and employees with delete permissions can delete issues. Customers cannot delete issues.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "issue_id": types.Schema(type=types.Type.INTEGER, description="Issue ID to delete (required)"),
+            },
+            required=["issue_id"],
+        ),
+    ),
+    # Analytics functions
+    types.FunctionDeclaration(
+        name="get_dashboard_stats",
+        description="Get comprehensive dashboard statistics for customers, leads, deals, and issues",
+        parameters=types.Schema(type=types.Type.OBJECT, properties={}),
+    ),
+    # Activity functions
+    types.FunctionDeclaration(
+        name="list_activities",
+        description="List activities (calls, emails, meetings, notes, tasks) in the organization. Activities track customer interactions and communications. Returns a list of activities - display ALL returned activities to the user, do not limit to just one.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "activity_type": types.Schema(type=types.Type.STRING, description="Filter by type: call, email, telegram, meeting, note, task"),
+                "status": types.Schema(type=types.Type.STRING, description="Filter by status: scheduled, in_progress, completed, cancelled"),
+                "customer_id": types.Schema(type=types.Type.INTEGER, description="Filter by customer ID"),
+                "lead_id": types.Schema(type=types.Type.INTEGER, description="Filter by lead ID"),
+                "deal_id": types.Schema(type=types.Type.INTEGER, description="Filter by deal ID"),
+                "assigned_to": types.Schema(type=types.Type.INTEGER, description="Filter by assigned employee ID"),
+                "search": types.Schema(type=types.Type.STRING, description="Search by title, description, or customer name"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 50 for better visibility, max: 100, min: 1). Set to 50-100 when user asks to see activities without a specific count."),
+                "cursor": types.Schema(type=types.Type.STRING, description="next_cursor of the previous result, to fetch the following page when more_available is true"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_activity",
+        description="Get detailed information about a specific activity by ID",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "activity_id": types.Schema(type=types.Type.INTEGER, description="Activity ID (required)"),
+            },
+            required=["activity_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_activity_stats",
+        description="Get activity statistics for the organization, including counts by type and status",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "activity_type": types.Schema(type=types.Type.STRING, description="Filter by activity type (optional)"),
+            },
+        ),
+    ),
+    # Vendor functions
+    types.FunctionDeclaration(
+        name="list_vendors",
+        description="List vendors accessible to the user. For customers, shows vendors they are associated with. For vendors/employees, shows vendors in their organization.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "status": types.Schema(type=types.Type.STRING, description="Filter by status: active, inactive (default: active)"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 20)"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_vendor",
+        description="Get detailed information about a specific vendor by ID. Customers can only access vendors they are associated with.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "vendor_id": types.Schema(type=types.Type.INTEGER, description="Vendor ID (required)"),
+            },
+            required=["vendor_id"],
+        ),
+    ),
+    # Employee functions
+    types.FunctionDeclaration(
+        name="list_employees",
+        description="List employees in the organization. Returns employee names, emails, designations, and departments.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "status": types.Schema(type=types.Type.STRING, description="Filter by status: active, inactive (default: active)"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number to return (default: 20)"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_employee",
+        description="Get detailed information about a specific employee by ID",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "employee_id": types.Schema(type=types.Type.INTEGER, description="Employee ID (required)"),
+            },
+            required=["employee_id"],
+        ),
+    ),
+    # User context functions
+    types.FunctionDeclaration(
+        name="get_current_user_context",
+        description="Get information about the current logged-in user, including their role, organization, and permissions",
+        parameters=types.Schema(type=types.Type.OBJECT, properties={}),
+    ),
+    # Role and permission management functions
+    types.FunctionDeclaration(
+        name="invite_employee",
+        description="Invite a new or existing employee to join the organization. Creates user account if needed and sets up employee profile.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "email": types.Schema(type=types.Type.STRING, description="Employee email address (required)"),
+                "first_name": types.Schema(type=types.Type.STRING, description="Employee first name (required)"),
+                "last_name": types.Schema(type=types.Type.STRING, description="Employee last name (required)"),
+                "phone": types.Schema(type=types.Type.STRING, description="Employee phone number (optional)"),
+                "department": types.Schema(type=types.Type.STRING, description="Employee department (optional)"),
+                "job_title": types.Schema(type=types.Type.STRING, description="Employee job title (optional)"),
+                "role_id": types.Schema(type=types.Type.INTEGER, description="Role ID to assign to employee (optional)"),
+            },
+            required=["email", "first_name", "last_name"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="list_roles",
+        description="List roles in the organization. Useful for finding role IDs to assign to employees.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "is_active": types.Schema(type=types.Type.BOOLEAN, description="Filter by active status (optional)"),
+                "search": types.Schema(type=types.Type.STRING, description="Search by role name or description (optional)"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number of results (default: 20, max: 100)"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="create_role",
+        description="Create a new role in the organization. Roles define sets of permissions that can be assigned to employees.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "name": types.Schema(type=types.Type.STRING, description="Role name (required)"),
+                "description": types.Schema(type=types.Type.STRING, description="Role description (optional)"),
+                "permission_ids": types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(type=types.Type.INTEGER),
+                    description="List of permission IDs to assign to the role (optional, can be added later)"
+                ),
+            },
+            required=["name"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="assign_permissions_to_role",
+        description="Assign permissions to a role. Use list_permissions first to find permission IDs. Existing permissions are preserved.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "role_id": types.Schema(type=types.Type.INTEGER, description="Role ID (required)"),
+                "permission_ids": types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(type=types.Type.INTEGER),
+                    description="List of permission IDs to assign (required)"
+                ),
+            },
+            required=["role_id", "permission_ids"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="assign_role_to_employee",
+        description="Assign a role to an employee. This updates the employee's primary role. Use list_roles to find role IDs and list_employees to find employee IDs.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "employee_id": types.Schema(type=types.Type.INTEGER, description="Employee ID (required)"),
+                "role_id": types.Schema(type=types.Type.INTEGER, description="Role ID to assign (required)"),
+            },
+            required=["employee_id", "role_id"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="list_permissions",
+        description="List available permissions in the organization. Use this to find permission IDs when creating roles or assigning permissions. Permissions are in the format 'resource:action' (e.g., 'customer:read', 'deal:create').",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "resource": types.Schema(type=types.Type.STRING, description="Filter by resource (e.g., 'customer', 'deal', 'activity') (optional)"),
+                "action": types.Schema(type=types.Type.STRING, description="Filter by action (e.g., 'create', 'read', 'update', 'delete') (optional)"),
+                "limit": types.Schema(type=types.Type.INTEGER, description="Maximum number of results (default: 100, max: 200)"),
+            },
+        ),
+    ),
+]
+
+# Shared by every request (built once at import time)
+CRM_TOOLS = [types.Tool(function_declarations=FUNCTION_DECLARATIONS)]
+
+# Tool name -> handler; every handler takes the CRMToolContext first
+TOOL_HANDLERS = {
+    # Customer tools
+    "list_customers": list_customers_tool,
+    "get_customer_count": get_customer_count_tool,
+    "create_customer": create_customer_tool,
+    "get_customer": get_customer_tool,
+    "update_customer": update_customer_tool,
+    "delete_customer": delete_customer_tool,
+    # Lead tools
+    "list_leads": list_leads_tool,
+    "get_lead": get_lead_tool,
+    "create_lead": create_lead_tool,
+    "update_lead": update_lead_tool,
+    "move_lead_stage": move_lead_stage_tool,
+    "get_pipeline_stages": get_pipeline_stages_tool,
+    "qualify_lead": qualify_lead_tool,
+    "convert_lead_to_customer": convert_lead_to_customer_tool,
+    # Deal tools
+    "list_deals": list_deals_tool,
+    "create_deal": create_deal_tool,
+    "update_deal": update_deal_tool,
+    "mark_deal_won": mark_deal_won_tool,
+    "mark_deal_lost": mark_deal_lost_tool,
+    "get_deal_stats": get_deal_stats_tool,
+    # Issue tools
+    "list_issues": list_issues_tool,
+    "get_issue": get_issue_tool,
+    "list_my_vendors_for_issues": list_my_vendors_for_issues_tool,
+    "create_issue": create_issue_tool,
+    "update_issue": update_issue_tool,
+    "resolve_issue": resolve_issue_tool,
+    "delete_issue": delete_issue_tool,
+    # Analytics tools
+    "get_dashboard_stats": get_dashboard_stats_tool,
+    # Activity tools
+    "list_activities": list_activities_tool,
+    "get_activity": get_activity_tool,
+    "get_activity_stats": get_activity_stats_tool,
+    # Vendor tools
+    "list_vendors": list_vendors_tool,
+    "get_vendor": get_vendor_tool,
+    # Employee tools
+    "list_employees": list_employees_tool,
+    "get_employee": get_employee_tool,
+    # User context tools
+    "get_current_user_context": get_current_user_context_tool,
+    # Role and permission management tools
+    "invite_employee": invite_employee_tool,
+    "list_roles": list_roles_tool,
+    "create_role": create_role_tool,
+    "assign_permissions_to_role": assign_permissions_to_role_tool,
+    "assign_role_to_employee": assign_role_to_employee_tool,
+    "list_permissions": list_permissions_tool,
+}
@@ -0,0 +1,306 @@
+"""
+Outbound HTTP Client
+
+Shared HTTP layer for calls to third-party APIs (Linear, Telegram, ...).
+
+Each integration gets one HTTPClient, obtained with ``get_http_client(name)``
+and reused for the life of the process:
+
+- a requests.Session whose keep-alive connection pool (HTTP_CLIENT_POOL_SIZE
+  connections per host) is shared by every thread, so repeated calls skip
+  the TCP/TLS handshake
+- httpx.AsyncClient variants for async code (ASGI/Channels consumers, the
+  Gemini tool loop), one per event loop since an AsyncClient cannot be used
+  across loops
+- default (connect, read) timeouts
+- retries with jittered exponential backoff on connection errors and
+  502/503/504 responses
+- a circuit breaker: after HTTP_CIRCUIT_FAILURE_THRESHOLD consecutive
+  failed calls (a call fails once its retries are used up) calls fail fast
+  with CircuitOpenError for HTTP_CIRCUIT_RESET_TIMEOUT seconds, then a
+  single trial call decides whether the circuit closes again
+
+CircuitOpenError is a requests ConnectionError, so callers already handling
+requests.exceptions.RequestException treat an open circuit like an
+unreachable host.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Gateway errors that usually mean the request never reached the upstream service
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an integration whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker shared by a client's sync and async calls"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let one trial call through
+                self._state = self.HALF_OPEN
+                return
+        raise CircuitOpenError(f"{self.name} circuit is open, not calling it")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"{self.name} circuit closed")
+            self._failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"{self.name} circuit opened after {self._failures} consecutive failure(s)"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+
+
+class HTTPClient:
+    """Pooled, retrying, circuit-broken HTTP client for one integration"""
+
+    def __init__(
+        self,
+        name: str,
+        timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        pool_size: Optional[int] = None
+    ):
+        self.name = name
+        self.timeout = timeout if timeout is not None else getattr(settings, 'HTTP_CLIENT_TIMEOUT', 10.0)
+        self.connect_timeout = (
+            connect_timeout if connect_timeout is not None
+            else getattr(settings, 'HTTP_CLIENT_CONNECT_TIMEOUT', 5.0)
+        )
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'HTTP_CLIENT_MAX_RETRIES', 2)
+        self.pool_size = pool_size if pool_size is not None else getattr(settings, 'HTTP_CLIENT_POOL_SIZE', 10)
+        self.backoff = getattr(settings, 'HTTP_CLIENT_BACKOFF', 0.5)
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=getattr(settings, 'HTTP_CIRCUIT_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'HTTP_CIRCUIT_RESET_TIMEOUT', 30.0)
+        )
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def async_client(self) -> httpx.AsyncClient:
+        """The AsyncClient for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size
+                    )
+                )
+                self._async_clients[loop] = client
+            return client
+
+    def _timeout(self, timeout) -> Tuple[float, float]:
+        if timeout is None:
+            return (self.connect_timeout, self.timeout)
+        if isinstance(timeout, tuple):
+            return timeout
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Full jitter: callers failing together do not retry together
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def request(self, method: str, url: str, *, retries: Optional[int] = None, timeout=None, **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session.
+
+        Args:
+            method: HTTP method
+            url: Full URL
+            retries: Retries on connection errors and gateway errors
+                (defaults to the client's max_retries; pass 0 for calls
+                that must not be repeated)
+            timeout: Read timeout in seconds, or a (connect, read) tuple
+            **kwargs: Passed to requests (json, params, headers, ...)
+
+        Returns:
+            The response; HTTP errors are not raised
+
+        Raises:
+            CircuitOpenError: The integration's circuit is open
+            requests.exceptions.RequestException: The last attempt failed
+        """
+        retries = self.max_retries if retries is None else retries
+        timeout = self._timeout(timeout)
+
+        for attempt in range(retries + 1):
+            self.breaker.before_call()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"{self.name} request failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUSES:
+                if attempt < retries:
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f"{self.name} returned {response.status_code}, retrying in {delay:.2f}s")
+                    response.close()
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    async def arequest(self, method: str, url: str, *, retries: Optional[int] = None, timeout=None, **kwargs) -> httpx.Response:
+        """
+        Async variant of request() using the event loop's httpx.AsyncClient.
+
+        Raises:
+            CircuitOpenError: The integration's circuit is open
+            httpx.TransportError: The last attempt failed
+        """
+        retries = self.max_retries if retries is None else retries
+        if timeout is not None:
+            connect, read = self._timeout(timeout)
+            kwargs['timeout'] = httpx.Timeout(read, connect=connect)
+        client = self.async_client()
+
+        for attempt in range(retries + 1):
+            self.breaker.before_call()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"{self.name} request failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUSES:
+                if attempt < retries:
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f"{self.name} returned {response.status_code}, retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest('GET', url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest('POST', url, **kwargs)
+
+    def close(self) -> None:
+        """Close the pooled session (async clients are dropped with their loops)"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            self._async_clients = weakref.WeakKeyDictionary()
+
+
+_clients: Dict[str, HTTPClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(name: str, **options) -> HTTPClient:
+    """
+    The shared client for an integration.
+
+    options (timeout, connect_timeout, max_retries, pool_size) only apply
+    when the client is first created.
+    """
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = HTTPClient(name, **options)
+            _clients[name] = client
+        return client
+
+
+def close_http_clients() -> None:
+    """Close and forget every client (tests, settings changes)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -2,10 +2,13 @@
 Service for handling Issue-Linear synchronization operations.
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from crmApp.services.job_queue import job
 from crmApp.services.linear_service import LinearService
-from crmApp.models import Issue
+from crmApp.models import Issue, LinearSyncState
 import logging
 
 logger = logging.getLogger(__name__)
@@ -344,47 +347,235 @@ class IssueLinearService:
             logger.error(f"Failed to sync issue {issue.id} from Linear: {error_msg}")
             return False, error_msg
     
-    def bulk_sync_issues_to_linear(self, issues, team_id):
+    @staticmethod
+    def apply_linear_issue(issue, linear_issue):
+        """
+        Copy Linear's title, description, priority and state onto a CRM issue
+        (without saving it). Keys missing from linear_issue are left alone,
+        so partial webhook payloads can be applied too.
+        
+        Args:
+            issue: Issue instance
+            linear_issue: Linear issue data
+            
+        Returns:
+            Names of the fields that changed
+        """
+        changes = {}
+        if 'title' in linear_issue:
+            changes['title'] = linear_issue['title'] or issue.title
+        if 'description' in linear_issue:
+            changes['description'] = linear_issue['description'] or ''
+        if 'priority' in linear_issue:
+            changes['priority'] = LinearService.map_linear_priority_to_crm(linear_issue['priority'])
+        if linear_issue.get('state'):
+            status = LinearService.map_linear_state_to_crm(linear_issue['state'])
+            if status:
+                changes['status'] = status
+                if status == 'resolved' and not issue.resolved_at:
+                    changes['resolved_at'] = timezone.now()
+        
+        changed_fields = []
+        for field, value in changes.items():
+            if getattr(issue, field) != value:
+                setattr(issue, field, value)
+                changed_fields.append(field)
+        return changed_fields
+    
+    def pull_team_changes(self, team_id, full=False):
+        """
+        Apply the Linear issues of a team changed since the last pull to
+        their linked CRM issues.
+        
+        Only issues updated at or after the team's watermark (the newest
+        updatedAt seen by the previous pull) are requested, so steady-state
+        traffic follows the change volume rather than the backlog size.
+        Applying an issue twice is harmless, which is why the watermark
+        itself is requested again.
+        
+        Args:
+            team_id: Linear team ID
+            full: Ignore the watermark and reconcile every issue
+            
+        Returns:
+            Dict with fetched_count, updated_count and the new watermark
+        """
+        state, _ = LinearSyncState.objects.get_or_create(team_id=team_id)
+        since = None if full else state.last_updated_at
+        
+        linear_issues = self.linear_service.get_issues_updated_since(
+            team_id,
+            since.isoformat() if since else None
+        )
+        
+        linear_by_id = {linear_issue['id']: linear_issue for linear_issue in linear_issues}
+        now = timezone.now()
+        updated_count = 0
+        for issue in Issue.objects.filter(linear_issue_id__in=list(linear_by_id)):
+            changed_fields = self.apply_linear_issue(issue, linear_by_id[issue.linear_issue_id])
+            if not changed_fields:
+                continue
+            issue.last_synced_at = now
+            issue.save(update_fields=changed_fields + ['last_synced_at', 'updated_at'])
+            updated_count += 1
+        
+        watermark = since
+        for linear_issue in linear_issues:
+            updated_at = parse_datetime(linear_issue.get('updatedAt') or '')
+            if updated_at and (watermark is None or updated_at > watermark):
+                watermark = updated_at
+        
+        LinearSyncState.objects.filter(pk=state.pk).update(
+            last_updated_at=watermark,
+            last_pulled_at=now,
+            updated_at=now
+        )
+        
+        logger.info(
+            f"Pulled {len(linear_issues)} changed issue(s) from Linear team {team_id}, "
+            f"updated {updated_count} CRM issue(s)"
+        )
+        return {
+            'fetched_count': len(linear_issues),
+            'updated_count': updated_count,
+            'watermark': watermark,
+        }
+    
+    def bulk_sync_issues_to_linear(self, issues, team_id, on_progress=None):
         """
         Bulk sync multiple issues to Linear.
         
+        Mutations are sent LINEAR_SYNC_BATCH_SIZE per GraphQL request, with up
+        to LINEAR_SYNC_CONCURRENCY requests in flight. The team's states are
+        looked up once (and cached) instead of once per issue.
+        
         Args:
             issues: QuerySet or list of Issue instances
             team_id: Linear team ID
+            on_progress: Optional callable(synced_count, failed_count, results)
+                called after each batch
             
         Returns:
             Dict with synced_count, failed_count, and results list
         """
+        from django.conf import settings
+        
+        issues = list(issues)
+        results = []
         synced_count = 0
         failed_count = 0
-        results = []
         
-        for issue in issues:
-            success, linear_data, error = self.sync_issue_to_linear(issue, team_id, update_existing=True)
-            
-            if success:
-                synced_count += 1
-                results.append({
-                    'issue_id': issue.id,
-                    'issue_number': issue.issue_number,
-                    'status': 'success',
-                    'linear_url': issue.linear_issue_url
-                })
-            else:
-                failed_count += 1
-                results.append({
-                    'issue_id': issue.id,
-                    'issue_number': issue.issue_number,
-                    'status': 'failed',
-                    'error': error
-                })
+        if not getattr(settings, 'LINEAR_API_KEY', None):
+            error_msg = "LINEAR_API_KEY not configured in settings"
+            logger.error(f"Cannot bulk sync {len(issues)} issue(s): {error_msg}")
+            results = [self._sync_result(issue, error=error_msg) for issue in issues]
+            return {'synced_count': 0, 'failed_count': len(issues), 'results': results}
+        
+        operations = self._build_operations(issues, team_id)
+        
+        batch_size = max(1, getattr(settings, 'LINEAR_SYNC_BATCH_SIZE', 10))
+        concurrency = max(1, getattr(settings, 'LINEAR_SYNC_CONCURRENCY', 3))
+        batches = [
+            (issues[start:start + batch_size], operations[start:start + batch_size])
+            for start in range(0, len(issues), batch_size)
+        ]
         
+        # Only the HTTP calls run on the pool; issues are saved on this thread
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches) or 1), thread_name_prefix='linear-sync') as pool:
+            futures = {
+                pool.submit(self.linear_service.batch_issue_mutations, batch_operations): batch_issues
+                for batch_issues, batch_operations in batches
+            }
+            for future in as_completed(futures):
+                batch_issues = futures[future]
+                try:
+                    outcomes = future.result()
+                except Exception as e:
+                    logger.error(f"Linear batch of {len(batch_issues)} issue(s) failed: {e}")
+                    outcomes = [(None, str(e))] * len(batch_issues)
+                
+                for issue, (linear_data, error) in zip(batch_issues, outcomes):
+                    if linear_data:
+                        self._record_synced(issue, team_id, linear_data)
+                        synced_count += 1
+                        results.append(self._sync_result(issue))
+                    else:
+                        failed_count += 1
+                        results.append(self._sync_result(issue, error=error))
+                
+                if on_progress:
+                    on_progress(synced_count, failed_count, results)
+        
+        position = {issue.id: index for index, issue in enumerate(issues)}
+        results.sort(key=lambda result: position[result['issue_id']])
+        
+        logger.info(f"Bulk sync to Linear team {team_id}: {synced_count} succeeded, {failed_count} failed")
         return {
             'synced_count': synced_count,
             'failed_count': failed_count,
             'results': results
         }
     
+    def _build_operations(self, issues, team_id):
+        """issueCreate / issueUpdate operations for batch_issue_mutations, one per issue"""
+        state_ids = {}
+        default_state_id = None
+        operations = []
+        
+        for issue in issues:
+            if issue.status not in state_ids:
+                state_ids[issue.status] = self.map_status_to_linear_state(issue.status, team_id)
+            state_id = state_ids[issue.status]
+            
+            input_data = {
+                'title': issue.title,
+                'description': issue.description or '',
+                'priority': self.linear_service.map_priority_to_linear(issue.priority),
+            }
+            
+            if issue.synced_to_linear and issue.linear_issue_id:
+                if state_id:
+                    input_data['stateId'] = state_id
+                operations.append({'action': 'update', 'id': issue.linear_issue_id, 'input': input_data})
+            else:
+                if not state_id:
+                    # Same fallback as create_issue(auto_set_state=True)
+                    default_state_id = default_state_id or self.linear_service.get_default_state_id(team_id)
+                    state_id = default_state_id
+                input_data['teamId'] = team_id
+                if state_id:
+                    input_data['stateId'] = state_id
+                operations.append({'action': 'create', 'input': input_data})
+        
+        return operations
+    
+    def _record_synced(self, issue, team_id, linear_data):
+        update_fields = ['synced_to_linear', 'last_synced_at', 'updated_at']
+        if not (issue.synced_to_linear and issue.linear_issue_id):
+            issue.linear_issue_id = linear_data['id']
+            issue.linear_issue_url = linear_data.get('url', '')
+            issue.linear_team_id = team_id
+            update_fields += ['linear_issue_id', 'linear_issue_url', 'linear_team_id']
+        issue.synced_to_linear = True
+        issue.last_synced_at = timezone.now()
+        issue.save(update_fields=update_fields)
+    
+    @staticmethod
+    def _sync_result(issue, error=None):
+        if error:
+            return {
+                'issue_id': issue.id,
+                'issue_number': issue.issue_number,
+                'status': 'failed',
+                'error': error
+            }
+        return {
+            'issue_id': issue.id,
+            'issue_number': issue.issue_number,
+            'status': 'success',
+            'linear_url': issue.linear_issue_url
+        }
+    
     def add_comment_to_linear(self, issue, comment_text, author_name=None):
         """
         Add a comment to a Linear issue.
@@ -494,3 +685,77 @@ class IssueLinearService:
             logger.error(f"Failed to sync comments from Linear for issue {issue.issue_number}: {error_msg}")
             return False, 0, error_msg
 
+
+def linear_sync_lock_key(issue_id):
+    """Lock key of an issue's Linear sync jobs: they run one at a time, in order"""
+    return f'issue-linear-sync-{issue_id}'
+
+
+@job(queue='linear')
+def sync_new_issue_to_linear(issue_id, team_id):
+    """Background job: create the Linear issue for a CRM issue"""
+    from django.conf import settings
+    
+    issue = Issue.objects.filter(pk=issue_id).first()
+    if not issue or issue.linear_issue_id:
+        # Deleted, or synced by an earlier attempt
+        return
+    if not getattr(settings, 'LINEAR_API_KEY', None):
+        logger.warning(f"LINEAR_API_KEY not configured, issue {issue.issue_number} not synced to Linear")
+        return
+    
+    success, linear_data, error = IssueLinearService().sync_issue_to_linear(
+        issue=issue,
+        team_id=team_id,
+        update_existing=False
+    )
+    if not success:
+        raise RuntimeError(f"Linear sync failed for issue {issue.issue_number}: {error or 'Unknown error'}")
+    
+    logger.info(
+        f"Issue {issue.issue_number} auto-synced to Linear: {linear_data.get('url', 'N/A')} "
+        f"(Linear State: {linear_data.get('state', 'N/A')})"
+    )
+
+
+@job(queue='linear')
+def sync_issue_update_to_linear(issue_id, old_status, fields, team_id=None):
+    """
+    Background job: push an edit of a CRM issue to Linear.
+    
+    Args:
+        issue_id: CRM issue ID
+        old_status: Status before the edit
+        fields: Edited fields among title, description and priority
+        team_id: Team to create the Linear issue in if it is not synced yet
+    """
+    issue = Issue.objects.filter(pk=issue_id).first()
+    if not issue:
+        return
+    
+    if not (issue.synced_to_linear and issue.linear_issue_id):
+        if team_id:
+            sync_new_issue_to_linear(issue.id, team_id)
+        return
+    
+    service = IssueLinearService()
+    success, error = service.sync_issue_status_to_linear(issue=issue, old_status=old_status)
+    if success:
+        logger.info(f"Issue {issue.issue_number} status change synced to Linear")
+    elif error:
+        logger.warning(f"Linear status sync skipped: {error}")
+    
+    # Also sync other field changes (title, description, priority)
+    linear_update_data = {}
+    if 'title' in fields:
+        linear_update_data['title'] = issue.title
+    if 'description' in fields:
+        linear_update_data['description'] = issue.description
+    if 'priority' in fields:
+        linear_update_data['priority'] = service.linear_service.map_priority_to_linear(issue.priority)
+    
+    if linear_update_data:
+        service.linear_service.update_issue(issue_id=issue.linear_issue_id, **linear_update_data)
+        issue.last_synced_at = timezone.now()
+        issue.save(update_fields=['last_synced_at'])
+        logger.info(f"Issue {issue.issue_number} field changes synced to Linear")
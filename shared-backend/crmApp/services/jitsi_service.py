@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from django.conf import settings
 from crmApp.models import JitsiCallSession, UserPresence, User
+from crmApp.services.job_queue import JobQueue, job
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import logging
@@ -342,8 +343,12 @@ class JitsiService:
         
         logger.info(f"Call ended: Room {call_session.room_name}, Duration: {call_session.duration_formatted}")
         
-        # Log the call as an activity
-        self._log_call_activity(call_session)
+        # Log the call as an activity (in the background, once per call)
+        JobQueue.enqueue(
+            log_call_activity,
+            args=[call_session.id],
+            idempotency_key=f'call-activity-{call_session.id}'
+        )
         
         # Send real-time notification to all participants
         for participant_id in call_session.participants:
@@ -415,26 +420,26 @@ class JitsiService:
         """
         Update user's presence status.
         """
-        presence, created = UserPresence.objects.get_or_create(user=user)
-        presence.status = status
-        presence.status_message = status_message
-        presence.available_for_calls = available_for_calls
-        presence.last_seen = timezone.now()
-        presence.save()
-        
-        return presence
+        from crmApp.services.presence_service import PresenceService
+        return PresenceService.set_status(
+            user,
+            status,
+            available_for_calls=available_for_calls,
+            status_message=status_message
+        )
     
     def get_online_users(self, organization=None):
         """
         Get list of users currently online and available for calls.
+        
+        The database only knows who was online at their last state change;
+        the presence cache says who still is (see PresenceService).
         """
-        # Users online in the last 5 minutes
-        recent_time = timezone.now() - timezone.timedelta(minutes=5)
+        from crmApp.services.presence_service import PresenceService
         
         queryset = UserPresence.objects.filter(
-            last_seen__gte=recent_time,
             available_for_calls=True
-        ).select_related('user')
+        ).exclude(status='offline').select_related('user')
         
         if organization:
             # Filter by organization membership
@@ -446,7 +451,9 @@ class JitsiService:
             
             queryset = queryset.filter(user_id__in=org_user_ids)
         
-        return queryset
+        presences = list(queryset)
+        live = PresenceService.live_user_ids([presence.user_id for presence in presences])
+        return [presence for presence in presences if presence.user_id in live]
     
     def _log_call_activity(self, call_session):
         """
@@ -563,3 +570,13 @@ class JitsiService:
 
 # Singleton instance
 jitsi_service = JitsiService()
+
+
+@job()
+def log_call_activity(call_session_id):
+    """Background job: record a completed call as an Activity"""
+    call_session = JitsiCallSession.objects.select_related(
+        'initiator', 'recipient', 'organization'
+    ).filter(pk=call_session_id).first()
+    if call_session:
+        jitsi_service._log_call_activity(call_session)
@@ -0,0 +1,519 @@
+"""
+Background Job Queue
+
+Runs slow side effects (Linear sync, SMS, call activity records) outside
+the request, without an external broker: jobs are rows in background_jobs.
+
+Job functions are declared with @job and queued with .delay() or
+JobQueue.enqueue():
+
+    @job(queue='linear', max_attempts=5)
+    def sync_issue(issue_id):
+        ...
+
+    sync_issue.delay(issue.id)
+    JobQueue.enqueue(sync_issue, args=[issue.id], idempotency_key=f'issue-sync-{issue.id}')
+
+The row is written in the caller's transaction, so a job exists exactly
+when the change that caused it commits, and workers are woken with
+transaction.on_commit. Arguments must be JSON serializable (pass ids, not
+model instances). Enqueueing again with an idempotency key that is already
+in the table returns the existing job. Jobs that share a lock_key (e.g. all
+syncs of one record) run one at a time, in the order they were queued.
+
+Workers claim due jobs (highest priority first) with a conditional update,
+so any number of worker threads and processes can share the table. A job
+that raises is retried after a jittered exponential backoff; after
+max_attempts it is dead-lettered (status 'dead') until retried by hand.
+Workers also requeue jobs left running by a crashed worker for longer than
+JOB_QUEUE_STALE_AFTER seconds, on startup and periodically.
+JOB_QUEUE_CONCURRENCY caps how many jobs of each queue a worker runs at
+once (e.g. to stay under a third party's rate limit).
+
+JOB_QUEUE_MODE selects who runs jobs:
+- 'thread':   a worker thread in the web process, started by its first
+              request (default)
+- 'external': only `manage.py run_jobs`
+- 'inline':   synchronously once the enqueueing transaction commits
+              (tests and debugging)
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from crmApp.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for jobs left running by a crashed worker
+STALE_CHECK_INTERVAL = 60.0
+
+
+def task_path(func: Callable) -> str:
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def job(queue: str = 'default', priority: int = 0, max_attempts: Optional[int] = None):
+    """
+    Mark a module-level function as a background job.
+
+    Adds func.delay(*args, **kwargs), which queues a call with the
+    decorator's options.
+    """
+    def decorator(func):
+        func.job_options = {'queue': queue, 'priority': priority, 'max_attempts': max_attempts}
+        func.delay = lambda *args, **kwargs: JobQueue.enqueue(func, args=args, kwargs=kwargs)
+        return func
+    return decorator
+
+
+def _percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'p50': round(values[len(values) // 2], 1),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+        'max': round(values[-1], 1),
+    }
+
+
+class JobQueue:
+    """Enqueueing, claiming and running background jobs"""
+
+    @staticmethod
+    def enqueue(
+        task: Union[Callable, str],
+        args: Iterable[Any] = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        queue: Optional[str] = None,
+        priority: Optional[int] = None,
+        idempotency_key: Optional[str] = None,
+        lock_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        delay: float = 0
+    ) -> BackgroundJob:
+        """
+        Queue a call of task(*args, **kwargs).
+
+        Args:
+            task: @job function or dotted path of a function
+            queue, priority, max_attempts: Override the @job options
+            idempotency_key: Only one job is ever queued per key
+            lock_key: Jobs with the same key run one at a time
+            delay: Seconds before the job may run
+
+        Returns:
+            The queued job (the existing one for a known idempotency_key)
+        """
+        options = getattr(task, 'job_options', {}) if callable(task) else {}
+        path = task_path(task) if callable(task) else task
+
+        if idempotency_key:
+            existing = BackgroundJob.objects.filter(idempotency_key=idempotency_key).first()
+            if existing:
+                return existing
+
+        fields = {
+            'queue': queue or options.get('queue') or 'default',
+            'task': path,
+            'args': list(args),
+            'kwargs': kwargs or {},
+            'priority': priority if priority is not None else options.get('priority', 0),
+            'idempotency_key': idempotency_key,
+            'lock_key': lock_key,
+            'max_attempts': (
+                max_attempts or options.get('max_attempts')
+                or getattr(settings, 'JOB_QUEUE_MAX_ATTEMPTS', 5)
+            ),
+            'run_at': timezone.now() + timedelta(seconds=delay),
+        }
+        try:
+            with transaction.atomic():
+                queued = BackgroundJob.objects.create(**fields)
+        except IntegrityError:
+            if not idempotency_key:
+                raise
+            # Queued concurrently under the same key
+            return BackgroundJob.objects.get(idempotency_key=idempotency_key)
+
+        job_pk = queued.pk
+        transaction.on_commit(lambda: JobQueue._dispatch(job_pk))
+        return queued
+
+    @staticmethod
+    def _dispatch(job_pk: int) -> None:
+        mode = getattr(settings, 'JOB_QUEUE_MODE', 'thread')
+        if mode == 'inline':
+            JobQueue.run_job(job_pk)
+        elif mode == 'thread':
+            get_worker().wake()
+
+    @staticmethod
+    def due_job_ids(queue: str, limit: int) -> List[int]:
+        """
+        Due jobs of a queue in claim order. A job with a lock key waits while
+        a job with the same key is running or was queued before it.
+        """
+        blocking = BackgroundJob.objects.filter(
+            Q(status=BackgroundJob.STATUS_RUNNING) | Q(status=BackgroundJob.STATUS_PENDING, pk__lt=OuterRef('pk')),
+            lock_key=OuterRef('lock_key')
+        )
+        return list(
+            BackgroundJob.objects.filter(
+                status=BackgroundJob.STATUS_PENDING,
+                queue=queue,
+                run_at__lte=timezone.now()
+            ).exclude(
+                Exists(blocking)
+            ).order_by('-priority', 'run_at', 'id').values_list('pk', flat=True)[:limit]
+        )
+
+    @staticmethod
+    def due_queues() -> List[str]:
+        return list(
+            BackgroundJob.objects.filter(
+                status=BackgroundJob.STATUS_PENDING,
+                run_at__lte=timezone.now()
+            ).order_by().values_list('queue', flat=True).distinct()
+        )
+
+    @staticmethod
+    def claim(job_pk: int) -> bool:
+        """
+        Mark a due job running; False if another worker got it first or a
+        job with the same lock key is running (unique_running_job_lock_key)
+        """
+        try:
+            with transaction.atomic():
+                return bool(BackgroundJob.objects.filter(
+                    pk=job_pk,
+                    status=BackgroundJob.STATUS_PENDING,
+                    run_at__lte=timezone.now()
+                ).update(
+                    status=BackgroundJob.STATUS_RUNNING,
+                    started_at=timezone.now(),
+                    attempts=F('attempts') + 1
+                ))
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def run_job(job_pk: int) -> bool:
+        """
+        Claim a due job and run it.
+
+        Returns:
+            True if this call ran the job
+        """
+        if not JobQueue.claim(job_pk):
+            return False
+        JobQueue.execute(job_pk)
+        return True
+
+    @staticmethod
+    def execute(job_pk: int) -> None:
+        """Run a claimed job and record the outcome"""
+        queued = BackgroundJob.objects.get(pk=job_pk)
+        try:
+            func = import_string(queued.task)
+            func(*queued.args, **queued.kwargs)
+        except Exception as e:
+            JobQueue._fail(queued, e)
+        else:
+            BackgroundJob.objects.filter(pk=job_pk).update(
+                status=BackgroundJob.STATUS_SUCCEEDED,
+                finished_at=timezone.now(),
+                last_error=None
+            )
+
+    @staticmethod
+    def retry_delay(attempts: int) -> float:
+        """Seconds before attempt number attempts + 1"""
+        base = getattr(settings, 'JOB_QUEUE_RETRY_BACKOFF', 10.0)
+        cap = getattr(settings, 'JOB_QUEUE_RETRY_BACKOFF_MAX', 3600.0)
+        delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+        # Half fixed, half random: failed jobs do not all come back at once
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _fail(queued: BackgroundJob, error: Exception) -> None:
+        now = timezone.now()
+        message = f"{type(error).__name__}: {error}"[:2000]
+        if queued.attempts >= queued.max_attempts:
+            logger.error(
+                f"Job #{queued.pk} {queued.task} dead after {queued.attempts} attempt(s): {message}",
+                exc_info=error
+            )
+            BackgroundJob.objects.filter(pk=queued.pk).update(
+                status=BackgroundJob.STATUS_DEAD,
+                finished_at=now,
+                last_error=message
+            )
+            return
+
+        delay = JobQueue.retry_delay(queued.attempts)
+        logger.warning(
+            f"Job #{queued.pk} {queued.task} failed (attempt {queued.attempts}/{queued.max_attempts}), "
+            f"retrying in {delay:.0f}s: {message}"
+        )
+        BackgroundJob.objects.filter(pk=queued.pk).update(
+            status=BackgroundJob.STATUS_PENDING,
+            run_at=now + timedelta(seconds=delay),
+            last_error=message
+        )
+
+    @staticmethod
+    def retry(queued: BackgroundJob) -> bool:
+        """Put a dead job back in the queue with fresh attempts"""
+        retried = BackgroundJob.objects.filter(
+            pk=queued.pk,
+            status=BackgroundJob.STATUS_DEAD
+        ).update(
+            status=BackgroundJob.STATUS_PENDING,
+            attempts=0,
+            run_at=timezone.now(),
+            finished_at=None
+        )
+        if retried:
+            job_pk = queued.pk
+            transaction.on_commit(lambda: JobQueue._dispatch(job_pk))
+        return bool(retried)
+
+    @staticmethod
+    def requeue_stale(stale_after: float) -> int:
+        """Jobs left running by a crashed worker go back to pending"""
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        return BackgroundJob.objects.filter(
+            status=BackgroundJob.STATUS_RUNNING,
+            started_at__lt=cutoff
+        ).update(status=BackgroundJob.STATUS_PENDING, run_at=timezone.now())
+
+    @staticmethod
+    def prune(days: Optional[int] = None) -> int:
+        """Delete succeeded jobs finished more than days ago"""
+        days = days if days is not None else getattr(settings, 'JOB_QUEUE_RETENTION_DAYS', 7)
+        deleted, _ = BackgroundJob.objects.filter(
+            status=BackgroundJob.STATUS_SUCCEEDED,
+            finished_at__lt=timezone.now() - timedelta(days=days)
+        ).delete()
+        return deleted
+
+    @staticmethod
+    def stats(window_seconds: int = 3600, sample_size: int = 1000) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue depth and latency per queue.
+
+        depth counts due pending jobs and scheduled the ones waiting for
+        their run_at (retries). wait_ms (due -> started) and duration_ms are
+        percentiles over the last sample_size jobs started in the window.
+        """
+        now = timezone.now()
+        queues: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+            'depth': 0,
+            'scheduled': 0,
+            'running': 0,
+            'dead': 0,
+            'oldest_due_seconds': None,
+            'wait_ms': None,
+            'duration_ms': None,
+        })
+
+        counts = BackgroundJob.objects.filter(
+            status__in=[BackgroundJob.STATUS_RUNNING, BackgroundJob.STATUS_DEAD]
+        ).values('queue', 'status').annotate(count=Count('id')).order_by()
+        for row in counts:
+            queues[row['queue']][row['status']] = row['count']
+
+        pending = BackgroundJob.objects.filter(status=BackgroundJob.STATUS_PENDING)
+        due = pending.filter(run_at__lte=now).values('queue').annotate(
+            count=Count('id'), oldest=Min('run_at')
+        ).order_by()
+        for row in due:
+            queues[row['queue']]['depth'] = row['count']
+            queues[row['queue']]['oldest_due_seconds'] = round((now - row['oldest']).total_seconds(), 1)
+        scheduled = pending.filter(run_at__gt=now).values('queue').annotate(count=Count('id')).order_by()
+        for row in scheduled:
+            queues[row['queue']]['scheduled'] = row['count']
+
+        waits: Dict[str, List[float]] = defaultdict(list)
+        durations: Dict[str, List[float]] = defaultdict(list)
+        recent = BackgroundJob.objects.filter(
+            started_at__gte=now - timedelta(seconds=window_seconds)
+        ).order_by('-started_at').values_list('queue', 'run_at', 'started_at', 'finished_at')[:sample_size]
+        for queue, run_at, started_at, finished_at in recent:
+            waits[queue].append(max((started_at - run_at).total_seconds(), 0) * 1000)
+            if finished_at:
+                durations[queue].append((finished_at - started_at).total_seconds() * 1000)
+        for queue in set(waits) | set(durations):
+            queues[queue]['wait_ms'] = _percentiles(waits[queue])
+            queues[queue]['duration_ms'] = _percentiles(durations[queue])
+
+        return dict(queues)
+
+
+class JobWorker:
+    """
+    Polls for due jobs and runs them on one thread pool per queue, each
+    sized by JOB_QUEUE_CONCURRENCY (JOB_QUEUE_DEFAULT_CONCURRENCY for
+    queues not listed there).
+    """
+
+    def __init__(
+        self,
+        queues: Optional[List[str]] = None,
+        poll_interval: Optional[float] = None,
+        stale_after: Optional[float] = None
+    ):
+        self.queues = queues
+        self.poll_interval = (
+            poll_interval if poll_interval is not None
+            else getattr(settings, 'JOB_QUEUE_POLL_INTERVAL', 1.0)
+        )
+        self.stale_after = (
+            stale_after if stale_after is not None
+            else getattr(settings, 'JOB_QUEUE_STALE_AFTER', 600)
+        )
+        self._next_stale_check = 0.0
+        self._lock = threading.Lock()
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._running: Dict[str, int] = defaultdict(int)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def concurrency(queue: str) -> int:
+        limits = getattr(settings, 'JOB_QUEUE_CONCURRENCY', {})
+        return max(1, limits.get(queue, getattr(settings, 'JOB_QUEUE_DEFAULT_CONCURRENCY', 2)))
+
+    def _executor(self, queue: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if queue not in self._executors:
+                self._executors[queue] = ThreadPoolExecutor(
+                    max_workers=self.concurrency(queue),
+                    thread_name_prefix=f'job-{queue}'
+                )
+            return self._executors[queue]
+
+    @property
+    def running(self) -> int:
+        with self._lock:
+            return sum(self._running.values())
+
+    def poll(self) -> int:
+        """Claim and start due jobs up to each queue's free slots; returns how many were started."""
+        started = 0
+        for queue in self.queues or JobQueue.due_queues():
+            with self._lock:
+                free = self.concurrency(queue) - self._running[queue]
+            if free <= 0:
+                continue
+            for job_pk in JobQueue.due_job_ids(queue, free):
+                if not JobQueue.claim(job_pk):
+                    continue
+                with self._lock:
+                    self._running[queue] += 1
+                self._executor(queue).submit(self._run, queue, job_pk)
+                started += 1
+        return started
+
+    def requeue_stale(self) -> int:
+        """Requeue jobs left running by a crashed worker, at most every STALE_CHECK_INTERVAL seconds"""
+        now = time.monotonic()
+        if now < self._next_stale_check:
+            return 0
+        self._next_stale_check = now + min(STALE_CHECK_INTERVAL, self.stale_after)
+        requeued = JobQueue.requeue_stale(self.stale_after)
+        if requeued:
+            logger.warning(f"Requeued {requeued} job(s) running for more than {self.stale_after}s")
+        return requeued
+
+    def _run(self, queue: str, job_pk: int) -> None:
+        try:
+            close_old_connections()
+            JobQueue.execute(job_pk)
+        except Exception as e:
+            logger.error(f"Job #{job_pk} crashed the worker: {e}", exc_info=True)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running[queue] -= 1
+            # A slot is free
+            self._wake.set()
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.requeue_stale()
+                started = self.poll()
+            except Exception as e:
+                logger.error(f"Job worker poll failed: {e}", exc_info=True)
+                started = 0
+            finally:
+                close_old_connections()
+            if not started:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self) -> None:
+        """Run the poll loop on a daemon thread"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='job-worker', daemon=True)
+                self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            executors = list(self._executors.values())
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+
+_worker: Optional[JobWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> JobWorker:
+    """The web process's worker (JOB_QUEUE_MODE = 'thread'), started on first use"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = JobWorker()
+            _worker.start()
+        return _worker
+
+
+def _start_worker(**kwargs) -> None:
+    request_started.disconnect(_start_worker, dispatch_uid='crmApp.job_queue.start_worker')
+    if getattr(settings, 'JOB_QUEUE_MODE', 'thread') == 'thread':
+        get_worker()
+
+
+def start_worker_on_first_request() -> None:
+    """
+    In JOB_QUEUE_MODE = 'thread', start the web process's worker with its
+    first request, so jobs queued before a restart (and jobs a crashed
+    worker left running) are picked up without waiting for a new enqueue.
+    Management commands never start it.
+    """
+    if getattr(settings, 'JOB_QUEUE_MODE', 'thread') == 'thread':
+        request_started.connect(_start_worker, dispatch_uid='crmApp.job_queue.start_worker')
@@ -10,10 +10,12 @@ Handles lead-related business logic:
 
 from typing import Dict, List, Optional
 from django.db import transaction
-from django.db.models import Q, Avg
+from django.db.models import Avg
 from datetime import datetime
 
 from crmApp.models import Lead, Organization, Employee
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService
+from crmApp.services.search_index_service import SearchIndexService
 
 
 class LeadService:
@@ -210,7 +212,8 @@ class LeadService:
         Returns:
             Number of leads assigned
         """
-        return Lead.objects.filter(id__in=lead_ids).update(
+        return AnalyticsRollupService.bulk_update(
+            Lead.objects.filter(id__in=lead_ids),
             assigned_to=employee,
             qualification_status='contacted'
         )
@@ -234,14 +237,11 @@ class LeadService:
         """
         queryset = Lead.objects.filter(organization=organization)
         
-        # Apply search
-        if search_term:
-            queryset = queryset.filter(
-                Q(name__icontains=search_term) |
-                Q(email__icontains=search_term) |
-                Q(organization_name__icontains=search_term) |
-                Q(phone__icontains=search_term)
-            )
+        # Apply search (search index, or substring filters until it is built)
+        queryset = SearchIndexService.filter_queryset(
+            queryset, search_term, [organization.id],
+            fallback_fields=['name', 'email', 'organization_name', 'phone']
+        )
         
         # Apply filters
         if filters:
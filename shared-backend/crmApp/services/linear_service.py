@@ -1,15 +1,96 @@
 """
 Linear API Integration Service
 Handles creating, updating, and syncing issues with Linear.app
+
+Requests go through the shared 'linear' HTTP client (pooled connections,
+circuit breaker), are paced by Linear's rate-limit headers (shared by every
+LinearService in the process) and retried when Linear reports the limit
+was hit. Team workflow states are cached for LINEAR_TEAM_CACHE_TIMEOUT
+seconds.
 """
 
 import requests
 import logging
-from typing import Dict, Optional, Any
+import threading
+import time
+from typing import Dict, List, Optional, Any, Tuple
 from django.conf import settings
+from django.core.cache import cache
+
+from crmApp.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+ISSUE_FIELDS = """
+    id
+    identifier
+    title
+    url
+    state {
+        id
+        name
+    }
+"""
+
+
+class LinearRateLimiter:
+    """
+    Tracks X-RateLimit-Requests-Remaining / -Reset from Linear's responses
+    and holds requests back once the remaining budget is used up.
+    """
+    
+    # Keep a few requests in hand for concurrent callers
+    RESERVE = 2
+    # Never block a caller longer than this (Linear's window is an hour)
+    MAX_WAIT = 60.0
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._remaining: Optional[int] = None
+        self._reset_at = 0.0
+    
+    def wait(self) -> None:
+        """Sleep until the window resets if the budget is exhausted"""
+        with self._lock:
+            delay = 0.0
+            if self._remaining is not None and self._remaining <= self.RESERVE:
+                delay = self._reset_at - time.time()
+        if delay > 0:
+            delay = min(delay, self.MAX_WAIT)
+            logger.warning(f"Linear rate limit almost used up, waiting {delay:.1f}s")
+            time.sleep(delay)
+    
+    def update(self, headers) -> None:
+        remaining = headers.get('X-RateLimit-Requests-Remaining')
+        reset = headers.get('X-RateLimit-Requests-Reset')
+        with self._lock:
+            if remaining is not None:
+                try:
+                    self._remaining = int(remaining)
+                except ValueError:
+                    pass
+            if reset is not None:
+                try:
+                    # Milliseconds since the epoch
+                    self._reset_at = int(reset) / 1000
+                except ValueError:
+                    pass
+    
+    def backoff(self, response) -> float:
+        """Seconds to wait before retrying a rate-limited request"""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.MAX_WAIT)
+            except ValueError:
+                pass
+        with self._lock:
+            delay = self._reset_at - time.time()
+        return min(max(delay, 1.0), self.MAX_WAIT)
+
+
+rate_limiter = LinearRateLimiter()
+
 
 class LinearService:
     """Service class for Linear API integration"""
@@ -22,7 +103,7 @@ class LinearService:
             api_key: Linear API key (if not provided, uses settings.LINEAR_API_KEY)
         """
         self.api_key = api_key or getattr(settings, 'LINEAR_API_KEY', None)
-        self.api_url = 'https://api.linear.app/graphql'
+        self.api_url = getattr(settings, 'LINEAR_API_URL', 'https://api.linear.app/graphql')
         # Linear API uses the API key directly as Authorization header
         self.headers = {
             'Content-Type': 'application/json',
@@ -40,27 +121,60 @@ class LinearService:
         Returns:
             API response data
         """
+        data = self._request(query, variables)
+        
+        if 'errors' in data:
+            error_msg = str(data['errors'])
+            logger.error(f"Linear API errors: {error_msg}")
+            raise Exception(f"Linear API error: {error_msg}")
+        
+        return data.get('data', {})
+    
+    @staticmethod
+    def _is_rate_limited(response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code != 400:
+            return False
         try:
-            payload = {'query': query}
-            if variables:
-                payload['variables'] = variables
-            
-            response = requests.post(
+            errors = response.json().get('errors', [])
+        except ValueError:
+            return False
+        return any(error.get('extensions', {}).get('code') == 'RATELIMITED' for error in errors)
+    
+    def _post(self, payload: Dict[str, Any]):
+        """POST to Linear, pacing by and retrying on its rate limit"""
+        max_retries = getattr(settings, 'LINEAR_MAX_RETRIES', 3)
+        for attempt in range(max_retries + 1):
+            rate_limiter.wait()
+            response = get_http_client('linear', timeout=30).post(
                 self.api_url,
                 json=payload,
-                headers=self.headers,
-                timeout=30
+                headers=self.headers
             )
-            response.raise_for_status()
+            rate_limiter.update(response.headers)
             
-            data = response.json()
+            if attempt < max_retries and self._is_rate_limited(response):
+                delay = rate_limiter.backoff(response)
+                logger.warning(f"Linear rate limit hit, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            return response
+    
+    def _request(self, query: str, variables: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Send a GraphQL document and return the whole response body
+        (data and errors), raising on transport and HTTP errors only
+        """
+        try:
+            payload = {'query': query}
+            if variables:
+                payload['variables'] = variables
             
-            if 'errors' in data:
-                error_msg = str(data['errors'])
-                logger.error(f"Linear API errors: {error_msg}")
-                raise Exception(f"Linear API error: {error_msg}")
+            response = self._post(payload)
+            response.raise_for_status()
             
-            return data.get('data', {})
+            return response.json()
             
         except requests.exceptions.HTTPError as e:
             # Try to get error details from response
@@ -484,7 +598,8 @@ class LinearService:
         }
         return priority_map.get(crm_priority.lower(), 3)
     
-    def map_linear_priority_to_crm(self, linear_priority: int) -> str:
+    @staticmethod
+    def map_linear_priority_to_crm(linear_priority: int) -> str:
         """
         Map Linear priority to CRM priority
         
@@ -503,6 +618,40 @@ class LinearService:
         }
         return priority_map.get(linear_priority, 'medium')
     
+    @staticmethod
+    def map_linear_state_to_crm(state: Dict[str, Any]) -> Optional[str]:
+        """
+        Map a Linear workflow state to a CRM status
+        
+        Args:
+            state: Linear state with 'type' and/or 'name'
+            
+        Returns:
+            CRM status string, or None if the state is not recognised
+        """
+        state_type = (state.get('type') or '').lower()
+        state_name = (state.get('name') or '').lower()
+        
+        # Use state type if available (started, completed, canceled)
+        type_map = {
+            'started': 'in_progress',
+            'completed': 'resolved',
+            'canceled': 'closed',
+        }
+        if state_type in type_map:
+            return type_map[state_type]
+        
+        # Fallback to state name mapping
+        if state_name in ['backlog', 'todo', 'triage', 'unstarted']:
+            return 'open'
+        if state_name in ['in progress', 'in review', 'started']:
+            return 'in_progress'
+        if state_name in ['done', 'completed', 'resolved']:
+            return 'resolved'
+        if state_name in ['canceled', 'cancelled', 'duplicate']:
+            return 'closed'
+        return None
+    
     def get_viewer(self) -> Dict[str, Any]:
         """
         Get current user (viewer) information
@@ -559,16 +708,23 @@ class LinearService:
         teams = result.get('viewer', {}).get('teams', {}).get('nodes', [])
         return teams
     
-    def get_team_by_id(self, team_id: str) -> Dict[str, Any]:
+    def get_team_by_id(self, team_id: str, refresh: bool = False) -> Dict[str, Any]:
         """
-        Get team details by ID
+        Get team details by ID (cached for LINEAR_TEAM_CACHE_TIMEOUT seconds)
         
         Args:
             team_id: Linear team ID
+            refresh: Bypass the cache
             
         Returns:
             Team data with states
         """
+        cache_key = f'linear:team:{team_id}'
+        if not refresh:
+            team = cache.get(cache_key)
+            if team is not None:
+                return team
+        
         query = """
         query Team($id: String!) {
             team(id: $id) {
@@ -589,7 +745,77 @@ class LinearService:
         
         variables = {'id': team_id}
         result = self._execute_query(query, variables)
-        return result.get('team', {})
+        team = result.get('team') or {}
+        if team:
+            cache.set(cache_key, team, getattr(settings, 'LINEAR_TEAM_CACHE_TIMEOUT', 300))
+        return team
+    
+    def batch_issue_mutations(self, operations: List[Dict[str, Any]]) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        Run several issueCreate / issueUpdate mutations in one GraphQL request
+        
+        Args:
+            operations: [{'action': 'create', 'input': {...}}
+                         or {'action': 'update', 'id': ..., 'input': {...}}, ...]
+            
+        Returns:
+            One (issue data, error) pair per operation, in order; issue data
+            has the same shape as create_issue's result
+        """
+        if not operations:
+            return []
+        
+        declarations = []
+        fields = []
+        variables = {}
+        for index, operation in enumerate(operations):
+            variables[f'input{index}'] = operation['input']
+            if operation['action'] == 'create':
+                declarations.append(f'$input{index}: IssueCreateInput!')
+                fields.append(f'op{index}: issueCreate(input: $input{index}) {{ success issue {{ {ISSUE_FIELDS} }} }}')
+            else:
+                variables[f'id{index}'] = operation['id']
+                declarations.append(f'$id{index}: String!, $input{index}: IssueUpdateInput!')
+                fields.append(f'op{index}: issueUpdate(id: $id{index}, input: $input{index}) {{ success issue {{ {ISSUE_FIELDS} }} }}')
+        
+        query = f"mutation BatchIssues({', '.join(declarations)}) {{\n" + '\n'.join(fields) + '\n}'
+        body = self._request(query, variables)
+        data = body.get('data') or {}
+        
+        # Errors point at the alias of the mutation that failed
+        errors_by_alias = {}
+        for error in body.get('errors') or []:
+            path = error.get('path') or []
+            alias = path[0] if path else None
+            errors_by_alias.setdefault(alias, []).append(error.get('message', str(error)))
+        
+        results = []
+        for index in range(len(operations)):
+            alias = f'op{index}'
+            payload = data.get(alias) or {}
+            if payload.get('success') and payload.get('issue'):
+                results.append((self._format_issue(payload['issue']), None))
+                continue
+            messages = errors_by_alias.get(alias) or errors_by_alias.get(None) or ['Linear did not apply the change']
+            results.append((None, f"Linear API error: {'; '.join(messages)}"))
+        
+        logger.info(
+            f"Linear batch of {len(operations)} mutation(s): "
+            f"{sum(1 for data, _ in results if data)} applied"
+        )
+        return results
+    
+    @staticmethod
+    def _format_issue(issue_data: Dict[str, Any]) -> Dict[str, Any]:
+        state = issue_data.get('state') or {}
+        return {
+            'id': issue_data['id'],
+            'identifier': issue_data['identifier'],
+            'url': issue_data['url'],
+            'title': issue_data['title'],
+            'state': state.get('name'),
+            'state_id': state.get('id'),
+        }
     
     def find_state_by_name(self, team_id: str, state_name: str) -> Optional[str]:
         """
@@ -714,7 +940,7 @@ class LinearService:
         """
         all_issues = []
         after = None
-        page_size = 50
+        page_size = 100  # Linear's maximum
         
         while True:
             result = self.get_team_issues(
@@ -735,3 +961,17 @@ class LinearService:
         
         logger.info(f"Fetched {len(all_issues)} issues from Linear team {team_id}")
         return all_issues
+    
+    def get_issues_updated_since(self, team_id: str, since: Optional[str] = None) -> list:
+        """
+        Get the team issues changed at or after a point in time
+        
+        Args:
+            team_id: Linear team ID
+            since: ISO 8601 timestamp (None = all issues)
+            
+        Returns:
+            List of issues
+        """
+        filter = {'updatedAt': {'gte': since}} if since else None
+        return self.get_all_team_issues(team_id, filter=filter)
@@ -0,0 +1,117 @@
+"""
+Linear Sync Jobs
+
+POST /api/issues/bulk_sync_to_linear/ records a LinearSyncJob and returns
+right away; the sync itself (IssueLinearService.bulk_sync_issues_to_linear)
+runs in the background and writes its progress to the job after every
+batch, so clients can poll GET /api/issues/bulk_sync_to_linear/?job_id=...
+
+LINEAR_SYNC_WORKER_MODE selects who runs jobs:
+- 'thread': a small thread pool in the web process (default)
+- 'inline': synchronously, once the request's transaction commits
+            (tests and debugging)
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from crmApp.models import Issue, LinearSyncJob
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'LINEAR_SYNC_JOB_WORKERS', 2),
+                thread_name_prefix='linear-sync-job'
+            )
+        return _executor
+
+
+def start_sync_job(organization, user, team_id: str, issue_ids: List[int]) -> LinearSyncJob:
+    """Record a bulk sync job and hand it to the configured worker."""
+    job = LinearSyncJob.objects.create(
+        organization=organization,
+        created_by=user,
+        team_id=team_id,
+        issue_ids=list(issue_ids),
+        total=len(issue_ids)
+    )
+
+    if getattr(settings, 'LINEAR_SYNC_WORKER_MODE', 'thread') == 'inline':
+        transaction.on_commit(lambda: run_sync_job(job.pk))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+
+    return job
+
+
+def _run_in_thread(job_pk: int) -> None:
+    try:
+        close_old_connections()
+        run_sync_job(job_pk)
+    except Exception as e:
+        logger.error(f"Linear sync job #{job_pk} crashed: {e}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def run_sync_job(job_pk: int) -> bool:
+    """
+    Claim a pending job and run it.
+
+    Returns:
+        True if this call ran the job, False if it was already claimed
+    """
+    from crmApp.services.issue_linear_service import IssueLinearService
+
+    claimed = LinearSyncJob.objects.filter(
+        pk=job_pk,
+        status=LinearSyncJob.STATUS_PENDING
+    ).update(status=LinearSyncJob.STATUS_RUNNING, started_at=timezone.now())
+    if not claimed:
+        return False
+
+    job = LinearSyncJob.objects.get(pk=job_pk)
+    issues = Issue.objects.filter(organization_id=job.organization_id, id__in=job.issue_ids).order_by('id')
+
+    def report_progress(synced_count, failed_count, results):
+        LinearSyncJob.objects.filter(pk=job_pk).update(
+            synced_count=synced_count,
+            failed_count=failed_count,
+            results=list(results)
+        )
+
+    try:
+        result = IssueLinearService().bulk_sync_issues_to_linear(issues, job.team_id, on_progress=report_progress)
+    except Exception as e:
+        logger.error(f"Linear sync job #{job_pk} failed: {e}", exc_info=True)
+        LinearSyncJob.objects.filter(pk=job_pk).update(
+            status=LinearSyncJob.STATUS_FAILED,
+            error=str(e)[:2000],
+            finished_at=timezone.now()
+        )
+    else:
+        LinearSyncJob.objects.filter(pk=job_pk).update(
+            status=LinearSyncJob.STATUS_COMPLETED,
+            synced_count=result['synced_count'],
+            failed_count=result['failed_count'],
+            results=result['results'],
+            finished_at=timezone.now()
+        )
+        logger.info(
+            f"Linear sync job #{job_pk} done: {result['synced_count']} succeeded, {result['failed_count']} failed"
+        )
+    return True
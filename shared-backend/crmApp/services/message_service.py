@@ -6,11 +6,18 @@ Handles business logic for sending messages between users
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.db import models
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
 from crmApp.models import Message, Conversation, Organization
 from typing import Optional, List, Dict
+import logging
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 255
+
 
 class MessageService:
     """Service for handling messages"""
@@ -25,7 +32,8 @@ class MessageService:
         related_lead=None,
         related_deal=None,
         related_customer=None,
-        attachments: Optional[List[Dict]] = None
+        attachments: Optional[List[Dict]] = None,
+        conversation: Optional[Conversation] = None
     ) -> Message:
         """
         Send a message from one user to another
@@ -40,6 +48,7 @@ class MessageService:
             related_deal: Related deal (optional)
             related_customer: Related customer (optional)
             attachments: List of attachment dicts
+            conversation: The pair's conversation, if the caller already has it
         
         Returns:
             Created Message object
@@ -62,35 +71,62 @@ class MessageService:
             attachments=attachments or []
         )
         
-        # Get or create conversation
-        conversation = MessageService.get_or_create_conversation(
-            sender, recipient, organization
-        )
-        
-        # Update conversation
-        conversation.last_message = message
-        conversation.last_message_at = timezone.now()
-        
-        # Update unread count for recipient
-        if recipient == conversation.participant1:
-            conversation.unread_count_participant1 += 1
-        else:
-            conversation.unread_count_participant2 += 1
-        
-        conversation.save()
+        conversation = MessageService.record_message(message, conversation)
         
         # Send real-time notification via Pusher
         try:
             from crmApp.services.pusher_service import pusher_service
-            pusher_service.send_message(message, sender, recipient)
+            pusher_service.send_message(message, sender, recipient, conversation_id=conversation.id)
         except Exception as e:
             # Log error but don't fail message creation
-            import logging
-            logger = logging.getLogger(__name__)
             logger.warning(f"Failed to send Pusher notification: {e}")
         
         return message
     
+    @staticmethod
+    def record_message(message: Message, conversation: Optional[Conversation] = None) -> Conversation:
+        """
+        Make a new message the last one of its conversation and count it as
+        unread for the recipient, in a single UPDATE.
+        
+        Args:
+            message: The saved message
+            conversation: The pair's conversation (fetched or created if not given)
+        
+        Returns:
+            The conversation
+        """
+        if conversation is None:
+            conversation = MessageService.get_or_create_conversation(
+                message.sender, message.recipient, message.organization
+            )
+        
+        # Incremented in SQL so concurrent sends never lose a count
+        unread_field = Conversation.unread_field_for(message.recipient_id, message.sender_id)
+        Conversation.objects.filter(pk=conversation.pk).update(
+            last_message=message,
+            last_message_at=message.created_at,
+            last_message_preview=message.content[:PREVIEW_LENGTH],
+            updated_at=timezone.now(),
+            **{unread_field: F(unread_field) + 1}
+        )
+        return conversation
+    
+    @staticmethod
+    def find_conversation(
+        user1: User,
+        user2: User,
+        organization: Optional[Organization] = None
+    ) -> Optional[Conversation]:
+        """The conversation between two users, or None if they never exchanged a message"""
+        if user1.id > user2.id:
+            user1, user2 = user2, user1
+        return Conversation.objects.filter(
+            participant1=user1,
+            participant2=user2,
+            organization=organization
+        ).first()
+    
     @staticmethod
     def get_or_create_conversation(
         user1: User,
@@ -191,42 +227,99 @@ class MessageService:
             message: Message to mark as read
             user: User marking the message as read
         """
-        if message.recipient == user and not message.is_read:
-            message.mark_as_read()
-            
-            # Update conversation unread count
-            conversation = Conversation.objects.filter(
-                models.Q(participant1=user, participant2=message.sender) |
-                models.Q(participant1=message.sender, participant2=user),
-                organization=message.organization
-            ).first()
-            
-            if conversation:
-                if user == conversation.participant1:
-                    conversation.unread_count_participant1 = max(0, conversation.unread_count_participant1 - 1)
-                else:
-                    conversation.unread_count_participant2 = max(0, conversation.unread_count_participant2 - 1)
-                conversation.save()
-            
-            # Send real-time notification via Pusher
-            try:
-                from crmApp.services.pusher_service import pusher_service
-                pusher_service.mark_message_read(message, user)
-                
-                # Update unread count for user
-                unread_count = MessageService.get_unread_count(user, message.organization)
-                pusher_service.send_unread_count_update(user, unread_count)
-            except Exception as e:
-                # Log error but don't fail
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to send Pusher read notification: {e}")
+        if message.recipient_id != user.id or message.is_read:
+            return
+        
+        # Only the request that actually flips the row touches the counter
+        read_at = timezone.now()
+        if not Message.objects.filter(pk=message.pk, is_read=False).update(is_read=True, read_at=read_at):
+            return
+        message.is_read = True
+        message.read_at = read_at
+        
+        unread_field = Conversation.unread_field_for(user.id, message.sender_id)
+        low, high = sorted((user.id, message.sender_id))
+        Conversation.objects.filter(
+            participant1_id=low,
+            participant2_id=high,
+            organization_id=message.organization_id
+        ).update(**{unread_field: Greatest(F(unread_field) - 1, Value(0))})
+        
+        # Send real-time notification via Pusher
+        try:
+            from crmApp.services.pusher_service import pusher_service
+            pusher_service.mark_message_read(message, user)
+            MessageService._send_unread_count(user, message.organization)
+        except Exception as e:
+            # Log error but don't fail
+            logger.warning(f"Failed to send Pusher read notification: {e}")
+    
+    @staticmethod
+    def mark_conversation_read(
+        conversation: Conversation,
+        user: User,
+        up_to_message_id: Optional[int] = None
+    ) -> int:
+        """
+        Mark every message the user received in a conversation as read, up
+        to and including up_to_message_id (all of them if not given).
+        
+        Args:
+            conversation: The conversation
+            user: Participant reading the conversation
+            up_to_message_id: Last message the user has seen
+        
+        Returns:
+            Number of messages that were marked as read
+        """
+        if user.id == conversation.participant1_id:
+            other_id = conversation.participant2_id
+        else:
+            other_id = conversation.participant1_id
+        
+        unread = Message.objects.filter(
+            sender_id=other_id,
+            recipient=user,
+            organization_id=conversation.organization_id,
+            is_read=False
+        )
+        if up_to_message_id is not None:
+            unread = unread.filter(id__lte=up_to_message_id)
+        
+        read_at = timezone.now()
+        count = unread.update(is_read=True, read_at=read_at)
+        if not count:
+            return 0
+        
+        unread_field = Conversation.unread_field_for(user.id, other_id)
+        Conversation.objects.filter(pk=conversation.pk).update(
+            **{unread_field: Greatest(F(unread_field) - count, Value(0))}
+        )
+        
+        try:
+            from crmApp.services.pusher_service import pusher_service
+            pusher_service.mark_conversation_read(conversation, user, other_id, up_to_message_id, read_at)
+            MessageService._send_unread_count(user, conversation.organization)
+        except Exception as e:
+            logger.warning(f"Failed to send Pusher read notification: {e}")
+        
+        return count
+    
+    @staticmethod
+    def _send_unread_count(user: User, organization: Optional[Organization]):
+        """Push the user's unread total (summed when the event is sent, off the request)"""
+        from crmApp.services.pusher_service import pusher_service
+        pusher_service.send_unread_count_update(
+            user, lambda: MessageService.get_unread_count(user, organization)
+        )
     
     @staticmethod
     def get_unread_count(user: User, organization: Optional[Organization] = None) -> int:
         """
         Get total unread message count for a user
         
+        Sums the user's per-conversation counters instead of counting messages.
+        
         Args:
             user: User to get count for
             organization: Optional organization filter
@@ -234,15 +327,18 @@ class MessageService:
         Returns:
             Total unread message count
         """
-        queryset = Message.objects.filter(
-            recipient=user,
-            is_read=False
+        queryset = Conversation.objects.filter(
+            models.Q(participant1=user) | models.Q(participant2=user)
         )
         
         if organization:
             queryset = queryset.filter(organization=organization)
         
-        return queryset.count()
+        total = queryset.aggregate(total=Sum(Case(
+            When(participant1=user, then=F('unread_count_participant1')),
+            default=F('unread_count_participant2'),
+        )))['total']
+        return total or 0
     
     @staticmethod
     def get_available_recipients(sender: User, organization: Optional[Organization] = None) -> List[User]:
@@ -0,0 +1,295 @@
+"""
+Presence Service
+
+Tracks who is online without writing to the database on every heartbeat.
+
+Liveness lives in the cache: each online user has an entry that expires
+after PRESENCE_TTL_SECONDS unless a WebSocket ping (VideoCallConsumer) or
+an HTTP heartbeat refreshes it, plus a count of their open WebSocket
+connections. UserPresence is only written on transitions (offline -> online,
+online -> offline, explicit status changes), and every transition is pushed
+to the user's organizations over the channel layer group
+``presence_org_{organization_id}``.
+
+A user whose last connection closes goes offline right away. A user whose
+entry expired (a polling client that stopped heartbeating) is flushed to
+offline the next time online users are listed.
+
+All of this needs the cache shared between processes (see Cache Settings).
+With a per-process cache each worker would keep its own view of who is
+online and write the same transitions repeatedly, so presence then falls
+back to the database: every heartbeat saves UserPresence.last_seen, users
+are live while last_seen is within the TTL, and closing a connection does
+not take a user offline (other processes may hold more connections).
+"""
+
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from crmApp.models import UserPresence, UserProfile
+from crmApp.utils.shared_cache import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+
+def _live_key(user_id: int) -> str:
+    return f'presence:live:{user_id}'
+
+
+def _connections_key(user_id: int) -> str:
+    return f'presence:connections:{user_id}'
+
+
+class PresenceService:
+    """Service for tracking user presence"""
+
+    @staticmethod
+    def ttl() -> int:
+        return getattr(settings, 'PRESENCE_TTL_SECONDS', 90)
+
+    @staticmethod
+    def group_name(organization_id: int) -> str:
+        """Channel layer group receiving an organization's presence changes"""
+        return f'presence_org_{organization_id}'
+
+    @staticmethod
+    def organization_groups(user_id: int) -> List[str]:
+        """Presence groups a user's connection subscribes to"""
+        organization_ids = UserProfile.objects.filter(
+            user_id=user_id,
+            status='active',
+            organization__isnull=False
+        ).values_list('organization_id', flat=True).distinct()
+        return [PresenceService.group_name(organization_id) for organization_id in organization_ids]
+
+    @staticmethod
+    def touch(user_id: int) -> bool:
+        """
+        Record a ping or heartbeat.
+
+        Only refreshes the cache entry while the user is online; the database
+        is written when the user was offline.
+
+        Returns:
+            True if the user just came online
+        """
+        if not cache_is_shared():
+            return PresenceService._touch_database(user_id)
+        
+        ttl = PresenceService.ttl()
+        key = _live_key(user_id)
+        if cache.touch(key, ttl):
+            return False
+        if not cache.add(key, time.time(), ttl):
+            # Another request brought the user online first
+            return False
+
+        PresenceService._mark_online(user_id)
+        return True
+
+    @staticmethod
+    def connect(user_id: int) -> bool:
+        """A WebSocket connection opened; returns True if the user came online"""
+        if not cache_is_shared():
+            return PresenceService._touch_database(user_id)
+        
+        ttl = PresenceService.ttl()
+        key = _connections_key(user_id)
+        cache.add(key, 0, ttl)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            cache.set(key, 1, ttl)
+        return PresenceService.touch(user_id)
+
+    @staticmethod
+    def ping(user_id: int) -> bool:
+        """A WebSocket ping; keeps both the user and their connection count alive"""
+        cache.touch(_connections_key(user_id), PresenceService.ttl())
+        return PresenceService.touch(user_id)
+
+    @staticmethod
+    def disconnect(user_id: int) -> bool:
+        """
+        A WebSocket connection closed; the user goes offline with their last one.
+
+        Returns:
+            True if the user went offline
+        """
+        if not cache_is_shared():
+            # Connections are counted per process; the TTL takes the user offline
+            return False
+        
+        key = _connections_key(user_id)
+        try:
+            remaining = cache.decr(key)
+        except ValueError:
+            remaining = 0
+        if remaining > 0:
+            return False
+
+        cache.delete_many([key, _live_key(user_id)])
+        PresenceService._mark_offline([user_id])
+        return True
+
+    @staticmethod
+    def is_live(user_id: int, last_seen=None) -> bool:
+        """
+        Whether the user has pinged within the TTL. Without a shared cache
+        this reads last_seen (pass it when the UserPresence row is at hand).
+        """
+        if not cache_is_shared():
+            if last_seen is None:
+                last_seen = UserPresence.objects.filter(user_id=user_id).values_list('last_seen', flat=True).first()
+            return last_seen is not None and last_seen >= PresenceService._live_since()
+        return cache.get(_live_key(user_id)) is not None
+
+    @staticmethod
+    def live_user_ids(user_ids: Iterable[int]) -> Set[int]:
+        """
+        The given users that are still live. Users that are not are flushed
+        to offline.
+        """
+        user_ids = set(user_ids)
+        if not cache_is_shared():
+            live = set(
+                UserPresence.objects.filter(
+                    user_id__in=user_ids,
+                    last_seen__gte=PresenceService._live_since()
+                ).values_list('user_id', flat=True)
+            )
+            if user_ids - live:
+                PresenceService._mark_offline(list(user_ids - live))
+            return live
+        
+        keys = {_live_key(user_id): user_id for user_id in user_ids}
+        if not keys:
+            return set()
+        found = cache.get_many(list(keys))
+        live = {keys[key] for key in found}
+        expired = [user_id for key, user_id in keys.items() if key not in found]
+        if expired:
+            PresenceService._mark_offline(expired)
+        return live
+
+    @staticmethod
+    def set_status(
+        user,
+        status: str,
+        available_for_calls: Optional[bool] = None,
+        status_message: Optional[str] = None
+    ) -> UserPresence:
+        """Explicit status change by the user"""
+        presence, created = UserPresence.objects.get_or_create(user=user)
+        presence.status = status
+        if available_for_calls is not None:
+            presence.available_for_calls = available_for_calls
+        if status_message is not None:
+            presence.status_message = status_message
+        presence.save()
+
+        if status == 'offline':
+            cache.delete(_live_key(user.id))
+        else:
+            cache.set(_live_key(user.id), time.time(), PresenceService.ttl())
+
+        PresenceService.broadcast([presence.user_id], PresenceService._payload(presence))
+        return presence
+
+    @staticmethod
+    def broadcast(user_ids: List[int], payload: Dict) -> None:
+        """
+        Push a presence change to the organizations of the given users.
+
+        payload is sent as is, with user_id filled in per user.
+        """
+        channel_layer = get_channel_layer()
+        if not channel_layer:
+            logger.debug("Channel layer not available, skipping presence update")
+            return
+
+        try:
+            memberships = UserProfile.objects.filter(
+                user_id__in=user_ids,
+                status='active',
+                organization__isnull=False
+            ).values_list('user_id', 'organization_id').distinct()
+
+            for user_id, organization_id in memberships:
+                async_to_sync(channel_layer.group_send)(
+                    PresenceService.group_name(organization_id),
+                    {
+                        'type': 'presence_event',
+                        'data': {
+                            'event': 'presence-changed',
+                            'data': {**payload, 'user_id': user_id},
+                        }
+                    }
+                )
+        except Exception as e:
+            logger.error(f"Failed to send presence update for users {user_ids}: {e}")
+
+    @staticmethod
+    def _payload(presence: UserPresence) -> Dict:
+        return {
+            'user_id': presence.user_id,
+            'status': presence.status,
+            'available_for_calls': presence.available_for_calls,
+            'status_message': presence.status_message,
+        }
+
+    @staticmethod
+    def _live_since():
+        return timezone.now() - timedelta(seconds=PresenceService.ttl())
+
+    @staticmethod
+    def _touch_database(user_id: int) -> bool:
+        """Heartbeat without a shared cache: save last_seen, mark online if needed"""
+        presence = UserPresence.objects.filter(user_id=user_id).first()
+        if presence is not None and presence.status != 'offline':
+            presence.save(update_fields=['last_seen'])
+            return False
+        PresenceService._mark_online(user_id)
+        return True
+
+    @staticmethod
+    def _mark_online(user_id: int) -> None:
+        presence, created = UserPresence.objects.get_or_create(
+            user_id=user_id,
+            defaults={'status': 'online', 'available_for_calls': True}
+        )
+        if not created:
+            # busy/away are kept; they are cleared by the call flow or the user
+            if presence.status == 'offline':
+                presence.status = 'online'
+            presence.save(update_fields=['status', 'last_seen', 'updated_at'])
+
+        logger.debug(f"User {user_id} came online")
+        PresenceService.broadcast([user_id], PresenceService._payload(presence))
+
+    @staticmethod
+    def _mark_offline(user_ids: List[int]) -> None:
+        now = timezone.now()
+        went_offline = list(
+            UserPresence.objects.filter(user_id__in=user_ids).exclude(status='offline').values_list('user_id', flat=True)
+        )
+        if not went_offline:
+            return
+
+        UserPresence.objects.filter(user_id__in=went_offline).update(
+            status='offline',
+            last_seen=now,
+            updated_at=now
+        )
+
+        logger.debug(f"Users {went_offline} went offline")
+        PresenceService.broadcast(went_offline, {'status': 'offline'})
@@ -1,10 +1,15 @@
 """
 Pusher Service for Real-Time Messaging
+
+Builds the event payloads; delivery (batching, background sending,
+retries) is done by crmApp.services.realtime_dispatcher.
 """
 from django.conf import settings
 from django.db import models
 import logging
 
+from crmApp.services.realtime_dispatcher import realtime_dispatcher
+
 logger = logging.getLogger(__name__)
 
 # Try to import pusher, but handle gracefully if not installed
@@ -57,7 +62,16 @@ class PusherService:
                 self._pusher = None
         return self._pusher
     
-    def send_message(self, message, sender, recipient):
+    @property
+    def enabled(self):
+        """Whether realtime events are delivered anywhere"""
+        return realtime_dispatcher.enabled
+    
+    def trigger(self, channel_name, event_name, data, coalesce=False):
+        """Queue an event; it is sent after the request, batched with the request's other events"""
+        realtime_dispatcher.publish(channel_name, event_name, data, coalesce=coalesce)
+    
+    def send_message(self, message, sender, recipient, conversation_id=None):
         """
         Send real-time message notification
         
@@ -65,8 +79,9 @@ class PusherService:
             message: Message object
             sender: User who sent the message
             recipient: User who receives the message
+            conversation_id: ID of the message's conversation (looked up if not given)
         """
-        if not self.pusher:
+        if not self.enabled:
             logger.debug("Pusher not available, skipping real-time notification")
             return
         
@@ -94,30 +109,30 @@ class PusherService:
             }
             
             # Send to recipient
-            self.pusher.trigger(channel_name, 'new-message', message_data)
-            logger.info(f"Sent Pusher notification for message {message.id} to user {recipient.id}")
+            self.trigger(channel_name, 'new-message', message_data)
+            logger.info(f"Queued Pusher notification for message {message.id} to user {recipient.id}")
             
             # Also send to sender so they see their message immediately
             sender_channel = f'private-user-{sender.id}'
-            self.pusher.trigger(sender_channel, 'new-message', message_data)
-            logger.info(f"Sent Pusher notification for message {message.id} to sender {sender.id}")
+            self.trigger(sender_channel, 'new-message', message_data)
+            logger.info(f"Queued Pusher notification for message {message.id} to sender {sender.id}")
             
             # Also update conversation list for recipient
             # Get conversation ID from the conversation that contains this message
-            conversation_id = None
-            try:
-                from crmApp.models import Conversation
-                conversation = Conversation.objects.filter(
-                    models.Q(participant1=sender, participant2=recipient) |
-                    models.Q(participant1=recipient, participant2=sender),
-                    organization=message.organization
-                ).first()
-                if conversation:
-                    conversation_id = conversation.id
-            except Exception:
-                pass
+            if conversation_id is None:
+                try:
+                    from crmApp.models import Conversation
+                    conversation = Conversation.objects.filter(
+                        models.Q(participant1=sender, participant2=recipient) |
+                        models.Q(participant1=recipient, participant2=sender),
+                        organization=message.organization
+                    ).first()
+                    if conversation:
+                        conversation_id = conversation.id
+                except Exception:
+                    pass
             
-            self.pusher.trigger(channel_name, 'conversation-updated', {
+            self.trigger(channel_name, 'conversation-updated', {
                 'conversation_id': conversation_id,
                 'last_message': {
                     'content': message.content,
@@ -135,31 +150,57 @@ class PusherService:
     
     def mark_message_read(self, message, user):
         """Notify when message is marked as read"""
-        if not self.pusher:
+        if not self.enabled:
             return
         
         try:
             # Notify the sender that their message was read
             channel_name = f'private-user-{message.sender.id}'
-            self.pusher.trigger(channel_name, 'message-read', {
+            self.trigger(channel_name, 'message-read', {
                 'message_id': message.id,
                 'read_by': user.id,
                 'read_at': message.read_at.isoformat() if message.read_at else None,
             })
-            logger.info(f"Sent read notification for message {message.id}")
+            logger.info(f"Queued read notification for message {message.id}")
         except Exception as e:
             logger.error(f"Failed to send read notification: {e}", exc_info=True)
-    
+
+    def mark_conversation_read(self, conversation, user, other_user_id, up_to_message_id, read_at):
+        """Notify the other participant that their messages were read in bulk"""
+        if not self.enabled:
+            return
+
+        try:
+            channel_name = f'private-user-{other_user_id}'
+            self.trigger(channel_name, 'messages-read', {
+                'conversation_id': conversation.id,
+                'up_to_message_id': up_to_message_id,
+                'read_by': user.id,
+                'read_at': read_at.isoformat() if read_at else None,
+            })
+            logger.info(f"Queued read notification for conversation {conversation.id}")
+        except Exception as e:
+            logger.error(f"Failed to send read notification: {e}", exc_info=True)
+
     def send_unread_count_update(self, user, unread_count):
-        """Send unread message count update"""
-        if not self.pusher:
+        """
+        Send unread message count update
+        
+        Args:
+            user: User whose count changed
+            unread_count: The count, or a callable computing it when the event is sent
+        """
+        if not self.enabled:
             return
         
         try:
             channel_name = f'private-user-{user.id}'
-            self.pusher.trigger(channel_name, 'unread-count-updated', {
-                'unread_count': unread_count,
-            })
+            if callable(unread_count):
+                data = lambda: {'unread_count': unread_count()}
+            else:
+                data = {'unread_count': unread_count}
+            # Only the latest count of a request is sent
+            self.trigger(channel_name, 'unread-count-updated', data, coalesce=True)
         except Exception as e:
             logger.error(f"Failed to send unread count update: {e}", exc_info=True)
     
@@ -171,7 +212,7 @@ class PusherService:
             issue: Issue object
             user: User who should receive the notification
         """
-        if not self.pusher:
+        if not self.enabled:
             logger.debug("Pusher not available, skipping issue created notification")
             return
         
@@ -195,8 +236,8 @@ class PusherService:
                 }
             }
             
-            self.pusher.trigger(channel_name, 'issue-created', issue_data)
-            logger.info(f"Sent Pusher notification for issue {issue.issue_number} to user {user.id}")
+            self.trigger(channel_name, 'issue-created', issue_data)
+            logger.info(f"Queued Pusher notification for issue {issue.issue_number} to user {user.id}")
             
         except Exception as e:
             logger.error(f"Failed to send issue created notification: {e}", exc_info=True)
@@ -210,7 +251,7 @@ class PusherService:
             user: User who should receive the notification
             old_status: Previous status (if status changed)
         """
-        if not self.pusher:
+        if not self.enabled:
             logger.debug("Pusher not available, skipping issue updated notification")
             return
         
@@ -234,8 +275,8 @@ class PusherService:
                 'old_status': old_status,
             }
             
-            self.pusher.trigger(channel_name, 'issue-updated', issue_data)
-            logger.info(f"Sent Pusher notification for issue {issue.issue_number} update to user {user.id}")
+            self.trigger(channel_name, 'issue-updated', issue_data)
+            logger.info(f"Queued Pusher notification for issue {issue.issue_number} update to user {user.id}")
             
         except Exception as e:
             logger.error(f"Failed to send issue updated notification: {e}", exc_info=True)
@@ -249,7 +290,7 @@ class PusherService:
             old_status: Previous status
             user: User who should receive the notification
         """
-        if not self.pusher:
+        if not self.enabled:
             logger.debug("Pusher not available, skipping issue status changed notification")
             return
         
@@ -266,8 +307,8 @@ class PusherService:
                 }
             }
             
-            self.pusher.trigger(channel_name, 'issue-status-changed', issue_data)
-            logger.info(f"Sent Pusher notification for issue {issue.issue_number} status change to user {user.id}")
+            self.trigger(channel_name, 'issue-status-changed', issue_data)
+            logger.info(f"Queued Pusher notification for issue {issue.issue_number} status change to user {user.id}")
             
         except Exception as e:
             logger.error(f"Failed to send issue status changed notification: {e}", exc_info=True)
@@ -2,14 +2,197 @@
 RBAC Service for permission checking and role management
 """
 
-from typing import Optional, List
-from django.db.models import Q
+from typing import Optional, List, FrozenSet, Tuple
+from django.core.cache import cache
+from django.db.models import Q, Exists, Value, CharField
 from crmApp.models import Permission, Role, UserRole, Employee, User, Organization
+from crmApp.utils.shared_cache import shared_timeout
+
+# Shared cache settings for compiled permission sets
+PERMISSION_CACHE_PREFIX = "rbac_perms_"
+PERMISSION_CACHE_TIMEOUT = 60 * 60  # 1 hour; entries are also invalidated by signals (shared cache only)
+
+# Attribute used to memoize compiled permission sets on the request user
+_REQUEST_MEMO_ATTR = '_rbac_permission_sets'
+
+# Marker row used to flag vendor access in the compiled permission query
+_VENDOR_MARKER = '__vendor__'
+
+
+class PermissionSet:
+    """
+    Compiled permissions of a user in one organization.
+    
+    Vendors get every permission; employees get the union of the permissions
+    granted by their Employee.role and active UserRole assignments.
+    """
+    
+    __slots__ = ('is_vendor', 'permissions')
+    
+    def __init__(self, is_vendor: bool = False, permissions: FrozenSet[Tuple[str, str]] = frozenset()):
+        self.is_vendor = is_vendor
+        self.permissions = frozenset(permissions)
+    
+    def has(self, resource: str, action: str) -> bool:
+        """Return True if the set grants resource:action."""
+        return self.is_vendor or (resource, action) in self.permissions
+    
+    def __getstate__(self):
+        return {'is_vendor': self.is_vendor, 'permissions': self.permissions}
+    
+    def __setstate__(self, state):
+        self.is_vendor = state['is_vendor']
+        self.permissions = state['permissions']
+
+
+def _organization_version_key(organization_id: int) -> str:
+    return f"{PERMISSION_CACHE_PREFIX}org_version_{organization_id}"
+
+
+def _user_version_key(user_id: int) -> str:
+    return f"{PERMISSION_CACHE_PREFIX}user_version_{user_id}"
+
+
+def _bump_version(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Key missing or evicted - any new value invalidates old entries
+        cache.set(key, 2, None)
 
 
 class RBACService:
     """Service class for RBAC operations"""
     
+    @staticmethod
+    def invalidate_organization_permissions(organization_id: Optional[int]) -> None:
+        """
+        Invalidate cached permission sets of every user in an organization.
+        Called when roles or role permissions change.
+        """
+        if organization_id:
+            _bump_version(_organization_version_key(organization_id))
+    
+    @staticmethod
+    def invalidate_user_permissions(user_id: Optional[int]) -> None:
+        """
+        Invalidate cached permission sets of a user in all organizations.
+        Called when profiles, employee records or role assignments change.
+        """
+        if user_id:
+            _bump_version(_user_version_key(user_id))
+    
+    @staticmethod
+    def _compile_permission_set(user: User, organization: Organization) -> PermissionSet:
+        """
+        Build the permission set for user in organization with a single query.
+        
+        The vendor check and the employee role grants are combined in one
+        UNION so that cache misses cost exactly one round trip.
+        """
+        from crmApp.models import UserOrganization, UserProfile
+        
+        marker_field = CharField()
+        vendor_rows = UserProfile.objects.filter(
+            user=user,
+            organization=organization,
+            profile_type='vendor',
+            status='active'
+        ).values_list(
+            Value(_VENDOR_MARKER, output_field=marker_field),
+            Value('', output_field=marker_field)
+        )
+        # Organization owners are treated as vendors
+        owner_rows = UserOrganization.objects.filter(
+            user=user,
+            organization=organization,
+            is_owner=True,
+            is_active=True
+        ).values_list(
+            Value(_VENDOR_MARKER, output_field=marker_field),
+            Value('', output_field=marker_field)
+        )
+        
+        # Employees need an active employee profile AND an active Employee record;
+        # roles come from Employee.role and active UserRole assignments.
+        active_employee = Employee.objects.filter(
+            user=user,
+            organization=organization,
+            status='active'
+        )
+        employee_profile = UserProfile.objects.filter(
+            user=user,
+            organization=organization,
+            profile_type='employee',
+            status='active'
+        )
+        role_ids = Role.objects.filter(
+            Q(id__in=active_employee.values('role_id')) |
+            Q(id__in=UserRole.objects.filter(
+                user=user,
+                organization=organization,
+                is_active=True
+            ).values('role_id'))
+        ).values('id')
+        granted_rows = Permission.objects.filter(
+            Exists(employee_profile),
+            Exists(active_employee),
+            organization=organization,
+            role_permissions__role_id__in=role_ids
+        ).values_list('resource', 'action')
+        
+        is_vendor = False
+        permissions = set()
+        for resource, action in vendor_rows.union(owner_rows, granted_rows):
+            if resource == _VENDOR_MARKER:
+                is_vendor = True
+            else:
+                permissions.add((resource, action))
+        
+        return PermissionSet(is_vendor=is_vendor, permissions=frozenset(permissions))
+    
+    @staticmethod
+    def get_permission_set(user: User, organization: Organization) -> PermissionSet:
+        """
+        Get the compiled permission set of a user in an organization.
+        
+        Lookup order:
+        1. Memoized on the user object (lives for the current request)
+        2. Shared cache, keyed by organization and user versions
+        3. Compiled from the database with one query
+        
+        Args:
+            user: User instance
+            organization: Organization instance
+            
+        Returns:
+            PermissionSet instance
+        """
+        memo = getattr(user, _REQUEST_MEMO_ATTR, None)
+        if memo is None:
+            memo = {}
+            setattr(user, _REQUEST_MEMO_ATTR, memo)
+        
+        permission_set = memo.get(organization.id)
+        if permission_set is not None:
+            return permission_set
+        
+        org_key = _organization_version_key(organization.id)
+        user_key = _user_version_key(user.id)
+        versions = cache.get_many([org_key, user_key])
+        cache_key = (
+            f"{PERMISSION_CACHE_PREFIX}{organization.id}_{versions.get(org_key, 1)}"
+            f"_{user.id}_{versions.get(user_key, 1)}"
+        )
+        
+        permission_set = cache.get(cache_key)
+        if permission_set is None:
+            permission_set = RBACService._compile_permission_set(user, organization)
+            cache.set(cache_key, permission_set, shared_timeout(PERMISSION_CACHE_TIMEOUT))
+        
+        memo[organization.id] = permission_set
+        return permission_set
+    
     @staticmethod
     def check_permission(
         user: User,
@@ -44,91 +227,9 @@ class RBACService:
         if user.is_staff:
             return True
         
-        from crmApp.models import UserProfile
-        
-        # Check if user is vendor - vendors have all permissions
-        # First check with exact organization match
-        vendor_profile = UserProfile.objects.filter(
-            user=user,
-            organization=organization,
-            profile_type='vendor',
-            status='active'
-        ).first()
-        
-        # If not found, check if user has any active vendor profile for this organization
-        # (in case of data inconsistencies)
-        if not vendor_profile:
-            vendor_profile = UserProfile.objects.filter(
-                user=user,
-                profile_type='vendor',
-                status='active'
-            ).select_related('organization').first()
-            
-            # Only allow if the vendor profile's organization matches
-            if vendor_profile and vendor_profile.organization_id == organization.id:
-                pass  # Use this profile
-            else:
-                vendor_profile = None
-        
-        # Also check if user owns the organization (vendor indicator)
-        if not vendor_profile and hasattr(organization, 'owner') and organization.owner == user:
-            # User owns the organization, treat as vendor
-            return True
-        
-        if vendor_profile:
-            # Vendors have all permissions in their organization
-            return True
-        
-        # Check if user is employee - employees have permissions based on role
-        employee_profile = UserProfile.objects.filter(
-            user=user,
-            organization=organization,
-            profile_type='employee',
-            status='active'
-        ).first()
-        
-        if not employee_profile:
-            # Not a vendor or employee - no permissions
-            return False
-        
-        # Get all roles for the employee in this organization
-        role_ids = set()
-        
-        # 1. Check Employee.role (primary role)
-        try:
-            employee = Employee.objects.get(
-                user=user,
-                organization=organization,
-                status='active'
-            )
-            if employee.role:
-                role_ids.add(employee.role.id)
-        except Employee.DoesNotExist:
-            # Employee profile exists but no Employee record - no permissions
-            return False
-        
-        # 2. Check UserRole assignments (additional roles)
-        user_roles = UserRole.objects.filter(
-            user=user,
-            organization=organization,
-            is_active=True
-        ).values_list('role_id', flat=True)
-        
-        role_ids.update(user_roles)
-        
-        if not role_ids:
-            # Employee has no roles assigned - no permissions
-            return False
-        
-        # Check if any of the user's roles have the required permission
-        has_permission = Permission.objects.filter(
-            organization=organization,
-            resource=resource,
-            action=action,
-            role_permissions__role_id__in=role_ids
-        ).exists()
-        
-        return has_permission
+        # Vendors (and organization owners) have all permissions in their organization;
+        # employees have the permissions of their assigned role(s); anyone else has none.
+        return RBACService.get_permission_set(user, organization).has(resource, action)
     
     @staticmethod
     def get_user_permissions(
@@ -0,0 +1,259 @@
+"""
+Realtime Dispatcher
+
+Delivers Pusher events without making the request wait for Pusher.
+
+Events published while a request is handled are collected in a per-request
+batch (see RealtimeBatchMiddleware); events published inside a transaction
+only join it once the transaction commits. When the request finishes the
+batch is handed to a bounded queue drained by a few worker threads, which
+send it with Pusher's batch trigger API (REALTIME_BATCH_SIZE events per
+HTTP call) and retry failed calls with backoff. Outside a request
+(management commands, background workers) every event is queued on its own.
+
+Events published with ``coalesce=True`` replace an earlier event of the
+same name on the same channel in the batch (e.g. unread counts), and event
+data may be a callable that is only evaluated on the worker thread.
+
+REALTIME_BACKEND selects the transport:
+- 'crmApp.services.realtime_dispatcher.PusherBackend' (default)
+- 'crmApp.services.realtime_dispatcher.LocalBackend' keeps the events in
+  memory (tests, local development without Pusher)
+
+With REALTIME_DISPATCH_ASYNC = False batches are sent synchronously when
+the request finishes (useful for tests and one-off scripts).
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+EventData = Union[Dict[str, Any], Callable[[], Dict[str, Any]]]
+
+_current_batch: ContextVar[Optional['RealtimeBatch']] = ContextVar('realtime_batch', default=None)
+
+
+class PusherBackend:
+    """Sends events through the shared Pusher client."""
+
+    @property
+    def client(self):
+        from crmApp.services.pusher_service import pusher_service
+        return pusher_service.pusher
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        client = self.client
+        if client is None:
+            logger.debug(f"Pusher not available, dropping {len(events)} realtime event(s)")
+            return
+        client.trigger_batch(events)
+
+
+class LocalBackend:
+    """Records sent events instead of delivering them."""
+
+    enabled = True
+
+    def __init__(self):
+        self.batches: List[List[Dict[str, Any]]] = []
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        return [event for batch in self.batches for event in batch]
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        self.batches.append([dict(event) for event in events])
+
+    def clear(self) -> None:
+        self.batches = []
+
+
+class RealtimeBatch:
+    """Events collected while one request is handled."""
+
+    def __init__(self):
+        self._events: Dict[Any, Dict[str, Any]] = {}
+        self._sequence = itertools.count()
+
+    def add(self, channel: str, name: str, data: EventData, coalesce: bool = False) -> None:
+        key = (channel, name) if coalesce else next(self._sequence)
+        # A coalesced event moves to the position of its latest version
+        self._events.pop(key, None)
+        self._events[key] = {'channel': channel, 'name': name, 'data': data}
+
+    def events(self) -> List[Dict[str, Any]]:
+        return list(self._events.values())
+
+
+class RealtimeDispatcher:
+    """Per-request batching in front of a bounded, retrying sender pool"""
+
+    def __init__(self):
+        self._queue: Optional[queue.Queue] = None
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._backends: Dict[str, Any] = {}
+
+    @property
+    def asynchronous(self) -> bool:
+        return getattr(settings, 'REALTIME_DISPATCH_ASYNC', True)
+
+    @property
+    def workers(self) -> int:
+        return getattr(settings, 'REALTIME_DISPATCH_WORKERS', 2)
+
+    @property
+    def queue_size(self) -> int:
+        return getattr(settings, 'REALTIME_QUEUE_SIZE', 1000)
+
+    @property
+    def batch_size(self) -> int:
+        return getattr(settings, 'REALTIME_BATCH_SIZE', 10)
+
+    @property
+    def max_retries(self) -> int:
+        return getattr(settings, 'REALTIME_MAX_RETRIES', 3)
+
+    @property
+    def retry_backoff(self) -> float:
+        return getattr(settings, 'REALTIME_RETRY_BACKOFF', 0.5)
+
+    @property
+    def backend(self):
+        """The configured REALTIME_BACKEND (one instance per path)."""
+        path = getattr(settings, 'REALTIME_BACKEND', 'crmApp.services.realtime_dispatcher.PusherBackend')
+        backend = self._backends.get(path)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.setdefault(path, import_string(path)())
+        return backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend.enabled
+
+    def publish(self, channel: str, name: str, data: EventData, coalesce: bool = False) -> None:
+        """
+        Send an event once the current transaction commits, batched with the
+        rest of the current request's events.
+        """
+        transaction.on_commit(lambda: self._collect(channel, name, data, coalesce))
+
+    def _collect(self, channel: str, name: str, data: EventData, coalesce: bool) -> None:
+        batch = _current_batch.get()
+        if batch is not None:
+            batch.add(channel, name, data, coalesce)
+        else:
+            self.submit([{'channel': channel, 'name': name, 'data': data}])
+
+    @contextmanager
+    def batch(self):
+        """Collect the events published inside the block and submit them together."""
+        if _current_batch.get() is not None:
+            yield
+            return
+
+        batch = RealtimeBatch()
+        token = _current_batch.set(batch)
+        try:
+            yield
+        finally:
+            _current_batch.reset(token)
+            events = batch.events()
+            if events:
+                self.submit(events)
+
+    def submit(self, events: List[Dict[str, Any]]) -> bool:
+        """
+        Hand events to the sender pool (or send them right away when not
+        asynchronous).
+
+        Returns:
+            False if the queue is full and the events were dropped
+        """
+        if not self.asynchronous:
+            self._deliver(events)
+            return True
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(events)
+        except queue.Full:
+            logger.warning(f"Realtime queue full, dropping {len(events)} event(s)")
+            return False
+        return True
+
+    def join(self) -> None:
+        """Wait until every queued batch has been sent (or given up on)."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _deliver(self, events: List[Dict[str, Any]]) -> None:
+        resolved = []
+        for event in events:
+            data = event['data']
+            try:
+                resolved.append({**event, 'data': data() if callable(data) else data})
+            except Exception as e:
+                logger.error(f"Failed to build realtime event {event['name']}: {e}", exc_info=True)
+
+        for start in range(0, len(resolved), self.batch_size):
+            self._send_with_retry(resolved[start:start + self.batch_size])
+
+    def _send_with_retry(self, events: List[Dict[str, Any]]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.backend.send(events)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Giving up on {len(events)} realtime event(s) after {attempt + 1} attempts: {e}")
+                    return
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(f"Realtime send failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=self.queue_size)
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f'realtime-dispatcher-{len(self._threads) + 1}',
+                    daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def _run(self) -> None:
+        while True:
+            events = self._queue.get()
+            try:
+                # Lazy event data may query the database
+                close_old_connections()
+                self._deliver(events)
+            except Exception as e:
+                logger.error(f"Realtime dispatcher failed on {len(events)} event(s): {e}", exc_info=True)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+realtime_dispatcher = RealtimeDispatcher()
@@ -0,0 +1,533 @@
+"""
+Search Index Service
+
+Maintains a per-organization inverted index (SearchDocument + SearchToken
+postings) over customers, leads, deals, issues and activities, and answers
+searches from it.
+
+Text is normalized (accents stripped, case folded) and split into word
+tokens; every query term matches tokens by prefix, which is a range scan of
+the (organization, token) index on both SQLite and PostgreSQL, so lookups do
+not depend on the size of the searched tables. All terms of a query must
+match; results are ranked in SQL by the weights of the fields they matched
+in.
+
+Matching is by word prefix, not substring: "north" finds "Northwind" and
+"Acme North", but "wind" does not find "Northwind". The ?search= filter of
+list endpoints behaves the same way once an organization's index is built.
+
+Documents are kept current from model signals; the rebuild_search_index
+management command builds an organization's index from scratch. Searches
+only use the index for organizations that have been built and fall back to
+substring filters otherwise.
+"""
+
+import logging
+import re
+import unicodedata
+from functools import reduce
+from operator import or_
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Max, OuterRef, Q, QuerySet, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from crmApp.models import (
+    Activity, Customer, Deal, Issue, Lead, SearchDocument, SearchIndexState, SearchToken,
+)
+from crmApp.utils.write_transaction import write_transaction
+
+logger = logging.getLogger(__name__)
+
+TOKEN_MAX_LENGTH = 64
+MAX_TOKENS_PER_DOCUMENT = 256
+MAX_QUERY_TERMS = 8
+# Best matches a list search filter keeps (see filter_queryset)
+SEARCH_FILTER_LIMIT = 1000
+REBUILD_BATCH_SIZE = 1000
+
+# Upper bound for prefix ranges: sorts after every character tokens can contain
+_PREFIX_END = chr(0x10FFFF)
+
+_WORD_RE = re.compile(r'\w+')
+_DIGITS_RE = re.compile(r'\D+')
+
+
+def normalize(text: str) -> str:
+    """Strip accents and fold case."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text) -> List[str]:
+    """Split text into normalized word tokens (single letters are dropped)."""
+    if not text:
+        return []
+    return [
+        word[:TOKEN_MAX_LENGTH]
+        for word in _WORD_RE.findall(normalize(str(text)))
+        if len(word) > 1 or word.isdigit()
+    ]
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct search terms of a query, in order."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+class SearchSpec:
+    """
+    How one model is indexed.
+
+    fields maps a field name to its weight; phone_fields are additionally
+    indexed as a single digits-only token so formatted numbers match.
+    """
+
+    def __init__(
+        self,
+        entity_type: str,
+        model,
+        title: str,
+        fields: Dict[str, int],
+        subtitle: Callable = lambda instance: '',
+        phone_fields: Sequence[str] = (),
+        select_related: Sequence[str] = (),
+    ):
+        self.entity_type = entity_type
+        self.model = model
+        self.title = title
+        self.fields = fields
+        self.subtitle = subtitle
+        self.phone_fields = phone_fields
+        self.select_related = select_related
+
+    @property
+    def tracked_fields(self) -> set:
+        """Concrete fields whose change requires reindexing."""
+        names = {'organization', self.title, *self.fields, *self.phone_fields}
+        return {name.split('__')[0] for name in names}
+
+    def value(self, instance, path: str):
+        for part in path.split('__'):
+            instance = getattr(instance, part, None)
+            if instance is None:
+                return None
+        return instance
+
+    def tokens(self, instance) -> Dict[str, int]:
+        """token -> weight (highest weight of the fields it occurs in)."""
+        weights: Dict[str, int] = {}
+
+        def add(token, weight):
+            if weights.get(token, 0) < weight:
+                weights[token] = weight
+
+        for path, weight in sorted(self.fields.items(), key=lambda item: -item[1]):
+            for token in tokenize(self.value(instance, path)):
+                if token not in weights and len(weights) >= MAX_TOKENS_PER_DOCUMENT:
+                    break
+                add(token, weight)
+
+        for path in self.phone_fields:
+            digits = _DIGITS_RE.sub('', str(self.value(instance, path) or ''))
+            if len(digits) > 1:
+                add(digits[:TOKEN_MAX_LENGTH], self.fields.get(path, 1))
+
+        return weights
+
+
+def _customer_subtitle(customer) -> str:
+    return customer.company_name or customer.email or ''
+
+
+def _deal_subtitle(deal) -> str:
+    customer_name = deal.customer.name if deal.customer_id and deal.customer else ''
+    return ' · '.join(part for part in (customer_name, deal.code) if part)
+
+
+SEARCH_SPECS: List[SearchSpec] = [
+    SearchSpec(
+        entity_type='customer',
+        model=Customer,
+        title='name',
+        fields={
+            'name': 3, 'first_name': 3, 'last_name': 3,
+            'company_name': 2, 'email': 2, 'phone': 2, 'mobile': 2, 'code': 2,
+            'notes': 1,
+        },
+        phone_fields=('phone', 'mobile'),
+        subtitle=_customer_subtitle,
+    ),
+    SearchSpec(
+        entity_type='lead',
+        model=Lead,
+        title='name',
+        fields={
+            'name': 3,
+            'organization_name': 2, 'email': 2, 'phone': 2, 'mobile': 2, 'code': 2,
+            'job_title': 1, 'notes': 1,
+        },
+        phone_fields=('phone', 'mobile'),
+        subtitle=lambda lead: lead.organization_name or lead.email or '',
+    ),
+    SearchSpec(
+        entity_type='deal',
+        model=Deal,
+        title='title',
+        fields={
+            'title': 3,
+            'customer__name': 2, 'code': 2,
+            'description': 1, 'notes': 1,
+        },
+        subtitle=_deal_subtitle,
+        select_related=('customer',),
+    ),
+    SearchSpec(
+        entity_type='issue',
+        model=Issue,
+        title='title',
+        fields={
+            'title': 3,
+            'issue_number': 2,
+            'description': 1, 'resolution_notes': 1,
+        },
+        subtitle=lambda issue: issue.issue_number or '',
+    ),
+    SearchSpec(
+        entity_type='activity',
+        model=Activity,
+        title='title',
+        fields={
+            'title': 3,
+            'customer_name': 2, 'email_subject': 2,
+            'description': 1,
+        },
+        subtitle=lambda activity: activity.customer_name or activity.get_activity_type_display(),
+    ),
+]
+
+SPECS_BY_TYPE: Dict[str, SearchSpec] = {spec.entity_type: spec for spec in SEARCH_SPECS}
+SPECS_BY_MODEL: Dict[type, SearchSpec] = {spec.model: spec for spec in SEARCH_SPECS}
+
+ENTITY_TYPES = tuple(SPECS_BY_TYPE)
+
+
+_INSERT_POSTINGS_SQL = (
+    f"INSERT INTO {SearchToken._meta.db_table} "
+    f"(document_id, organization_id, entity_type, token, weight) VALUES (%s, %s, %s, %s, %s)"
+)
+
+
+class SearchIndexService:
+    """Service class for maintaining and querying the search index"""
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def spec_for(model) -> Optional[SearchSpec]:
+        return SPECS_BY_MODEL.get(model)
+
+    @staticmethod
+    def index_instance(instance) -> Optional[SearchDocument]:
+        """Create or refresh the document of a record, writing only changed postings."""
+        spec = SPECS_BY_MODEL[type(instance)]
+        if instance.organization_id is None:
+            SearchIndexService.remove_instance(instance)
+            return None
+
+        tokens = spec.tokens(instance)
+        with write_transaction():
+            document, created = SearchDocument.objects.update_or_create(
+                entity_type=spec.entity_type,
+                object_id=instance.pk,
+                defaults={
+                    'organization_id': instance.organization_id,
+                    'title': str(spec.value(instance, spec.title) or '')[:255],
+                    'subtitle': str(spec.subtitle(instance) or '')[:255],
+                },
+            )
+
+            existing = {}
+            if not created:
+                postings = list(document.tokens.values_list('token', 'weight', 'organization_id'))
+                if any(org_id != instance.organization_id for _, _, org_id in postings):
+                    # Moved to another organization: rewrite every posting
+                    document.tokens.all().delete()
+                else:
+                    existing = {token: weight for token, weight, _ in postings}
+
+            removed = [token for token in existing if token not in tokens]
+            if removed:
+                document.tokens.filter(token__in=removed).delete()
+
+            changed: Dict[int, List[str]] = {}
+            for token, weight in tokens.items():
+                if token in existing and existing[token] != weight:
+                    changed.setdefault(weight, []).append(token)
+            for weight, changed_tokens in changed.items():
+                document.tokens.filter(token__in=changed_tokens).update(weight=weight)
+
+            SearchToken.objects.bulk_create([
+                SearchToken(
+                    document=document,
+                    organization_id=instance.organization_id,
+                    entity_type=spec.entity_type,
+                    token=token,
+                    weight=weight,
+                )
+                for token, weight in tokens.items()
+                if token not in existing
+            ])
+        return document
+
+    @staticmethod
+    def remove_instance(instance) -> None:
+        spec = SPECS_BY_MODEL[type(instance)]
+        SearchDocument.objects.filter(entity_type=spec.entity_type, object_id=instance.pk).delete()
+
+    @staticmethod
+    def reindex_queryset(queryset: QuerySet) -> int:
+        """Refresh the documents of existing records (e.g. after a bulk update)."""
+        spec = SPECS_BY_MODEL[queryset.model]
+        count = 0
+        for instance in queryset.select_related(*spec.select_related).iterator(chunk_size=REBUILD_BATCH_SIZE):
+            SearchIndexService.index_instance(instance)
+            count += 1
+        return count
+
+    @staticmethod
+    def rebuild(organization_id: int) -> int:
+        """
+        Rebuild an organization's index from the raw tables and mark it built.
+
+        Returns:
+            Number of indexed documents
+        """
+        total = 0
+        with transaction.atomic():
+            SearchDocument.objects.filter(organization_id=organization_id).delete()
+
+            for spec in SEARCH_SPECS:
+                records = spec.model.objects.filter(
+                    organization_id=organization_id
+                ).select_related(*spec.select_related).order_by('pk')
+
+                batch = []
+                for instance in records.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                    batch.append(instance)
+                    if len(batch) >= REBUILD_BATCH_SIZE:
+                        total += SearchIndexService._bulk_index(spec, organization_id, batch)
+                        batch = []
+                if batch:
+                    total += SearchIndexService._bulk_index(spec, organization_id, batch)
+
+            SearchIndexState.objects.update_or_create(
+                organization_id=organization_id,
+                defaults={'built_at': timezone.now(), 'document_count': total}
+            )
+        return total
+
+    @staticmethod
+    def _bulk_index(spec: SearchSpec, organization_id: int, instances: List) -> int:
+        documents = SearchDocument.objects.bulk_create([
+            SearchDocument(
+                organization_id=organization_id,
+                entity_type=spec.entity_type,
+                object_id=instance.pk,
+                title=str(spec.value(instance, spec.title) or '')[:255],
+                subtitle=str(spec.subtitle(instance) or '')[:255],
+            )
+            for instance in instances
+        ])
+        rows = [
+            (document.pk, organization_id, spec.entity_type, token, weight)
+            for document, instance in zip(documents, instances)
+            for token, weight in spec.tokens(instance).items()
+        ]
+        # Postings are plain rows; skipping model instances makes rebuilds several times faster
+        with connection.cursor() as cursor:
+            cursor.executemany(_INSERT_POSTINGS_SQL, rows)
+        return len(documents)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_built(organization_ids: Iterable[int]) -> bool:
+        """True when every given organization has a built index."""
+        organization_ids = {org_id for org_id in organization_ids if org_id}
+        if not organization_ids:
+            return False
+        built = SearchIndexState.objects.filter(
+            organization_id__in=organization_ids,
+            built_at__isnull=False
+        ).count()
+        return built == len(organization_ids)
+
+    @staticmethod
+    def _term_condition(term: str) -> Q:
+        """Tokens starting with term (an index range scan)."""
+        return Q(token__gte=term, token__lt=term + _PREFIX_END)
+
+    @staticmethod
+    def _postings(organization_ids: Iterable[int], entity_types: Optional[Iterable[str]] = None) -> QuerySet:
+        postings = SearchToken.objects.filter(organization_id__in=list(organization_ids))
+        if entity_types is not None:
+            postings = postings.filter(entity_type__in=list(entity_types))
+        return postings
+
+    @staticmethod
+    def _ranked_documents(postings: QuerySet, terms: List[str], key: str = 'document_id') -> QuerySet:
+        """
+        key/score rows of documents matching every term, best first.
+
+        key is what rows are grouped by: 'document_id', or
+        'document__object_id' when the postings are of a single entity type.
+        Slice the result to let the database rank with ORDER BY ... LIMIT.
+        """
+        conditions = [SearchIndexService._term_condition(term) for term in terms]
+
+        # One flag per term: the document must match all of them
+        matched = {
+            f'term_{index}': Max(Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField()))
+            for index, condition in enumerate(conditions)
+        }
+        # Whole-word matches count double
+        score = Sum(Case(
+            When(token__in=terms, then=F('weight') * 2),
+            default=F('weight'),
+            output_field=IntegerField(),
+        ))
+
+        return postings.filter(reduce(or_, conditions)).values(key).annotate(
+            score=score, **matched
+        ).filter(
+            **{name: 1 for name in matched}
+        ).order_by('-score', f'-{key}')
+
+    @staticmethod
+    def _top_documents(postings: QuerySet, terms: List[str], limit: int) -> List[Tuple[int, int]]:
+        """
+        (document_id, score) of the best documents matching every term.
+
+        Ranked by the database in one grouped query; only the top limit rows
+        are returned, and no match is skipped before ranking.
+        """
+        return list(
+            SearchIndexService._ranked_documents(postings, terms).values_list('document_id', 'score')[:limit]
+        )
+
+    @staticmethod
+    def search(
+        organization_ids: Iterable[int],
+        query: str,
+        entity_types: Optional[Iterable[str]] = None,
+        limit: int = 20,
+    ) -> List[Dict]:
+        """
+        Ranked, typed results for a query.
+
+        Returns:
+            List of {'type', 'id', 'title', 'subtitle', 'score'} dicts
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+
+        if entity_types is None:
+            entity_types = ENTITY_TYPES
+        entity_types = [entity_type for entity_type in entity_types if entity_type in SPECS_BY_TYPE]
+
+        if not SearchIndexService.is_built(organization_ids):
+            return SearchIndexService._substring_search(organization_ids, query.strip(), entity_types, limit)
+
+        ranked = SearchIndexService._top_documents(
+            SearchIndexService._postings(organization_ids, entity_types), terms, limit
+        )
+        documents = SearchDocument.objects.in_bulk([document_id for document_id, _ in ranked])
+
+        results = []
+        for document_id, score in ranked:
+            document = documents.get(document_id)
+            if document is None:
+                continue
+            results.append({
+                'type': document.entity_type,
+                'id': document.object_id,
+                'title': document.title,
+                'subtitle': document.subtitle,
+                'organization_id': document.organization_id,
+                'score': score,
+            })
+        return results
+
+    @staticmethod
+    def _substring_search(
+        organization_ids: Iterable[int],
+        query: str,
+        entity_types: Iterable[str],
+        limit: int,
+    ) -> List[Dict]:
+        """Unranked results from __icontains filters, for organizations without an index."""
+        results = []
+        for entity_type in entity_types:
+            spec = SPECS_BY_TYPE[entity_type]
+            condition = reduce(or_, [Q(**{f'{field}__icontains': query}) for field in spec.fields])
+            records = spec.model.objects.filter(
+                condition,
+                organization_id__in=list(organization_ids)
+            ).select_related(*spec.select_related).order_by('-pk')[:limit - len(results)]
+            for instance in records:
+                results.append({
+                    'type': entity_type,
+                    'id': instance.pk,
+                    'title': str(spec.value(instance, spec.title) or ''),
+                    'subtitle': str(spec.subtitle(instance) or ''),
+                    'organization_id': instance.organization_id,
+                    'score': 0,
+                })
+            if len(results) >= limit:
+                break
+        return results
+
+    @staticmethod
+    def filter_queryset(
+        queryset: QuerySet,
+        query: str,
+        organization_ids: Iterable[int],
+        fallback_fields: Sequence[str],
+    ) -> QuerySet:
+        """
+        Restrict a queryset of an indexed model to records matching a search.
+
+        Uses the index when every organization has been built: records whose
+        words start with every search term, at most the SEARCH_FILTER_LIMIT
+        best matches, annotated with search_score and ordered best first.
+        Otherwise ORs __icontains filters over fallback_fields (substring
+        matches, unordered).
+        """
+        if not query:
+            return queryset
+
+        organization_ids = [org_id for org_id in organization_ids if org_id]
+        spec = SPECS_BY_MODEL.get(queryset.model)
+        if spec is None or not SearchIndexService.is_built(organization_ids):
+            return queryset.filter(reduce(or_, [Q(**{f'{field}__icontains': query}) for field in fallback_fields]))
+
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+
+        # Object ids are unique within one entity type, so documents are grouped by them
+        ranked = SearchIndexService._ranked_documents(
+            SearchIndexService._postings(organization_ids, [spec.entity_type]), terms, key='document__object_id'
+        )
+        object_ids = ranked.values('document__object_id')[:SEARCH_FILTER_LIMIT]
+        score = ranked.filter(document__object_id=OuterRef('pk')).values('score')[:1]
+        return queryset.filter(pk__in=object_ids).annotate(
+            search_score=Subquery(score, output_field=IntegerField())
+        ).order_by('-search_score', '-pk')
@@ -0,0 +1,149 @@
+"""
+Sequence Service
+
+Allocates the per-organization, per-year document numbers used by issues
+(ISS-YYYY-NNNN), orders (ORD-YYYY-NNNN) and payments (PAY-YYYY-NNNN).
+
+Each (organization, kind, year) has one NumberSequence row. A number is
+allocated by advancing that row with a single UPDATE ... RETURNING (or a
+select_for_update on databases without UPDATE RETURNING) in a write
+transaction, so concurrent creators are serialized by the lock instead of
+racing on
+"read the highest number, add one" and retrying on unique violations.
+A whole block can be reserved at once for bulk imports.
+"""
+
+import logging
+from typing import List, Optional
+
+from django.db import connection
+from django.utils import timezone
+
+from crmApp.models import Issue, NumberSequence, Order, Payment
+from crmApp.utils.write_transaction import write_transaction
+
+logger = logging.getLogger(__name__)
+
+# kind -> (model, number field, prefix)
+SEQUENCE_KINDS = {
+    'issue': (Issue, 'issue_number', 'ISS'),
+    'order': (Order, 'order_number', 'ORD'),
+    'payment': (Payment, 'payment_number', 'PAY'),
+}
+
+_ADVANCE_SQL = (
+    f'UPDATE {NumberSequence._meta.db_table} '
+    'SET last_value = last_value + %s '
+    'WHERE organization_id = %s AND kind = %s AND year = %s '
+    'RETURNING last_value'
+)
+
+
+def _supports_update_returning() -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    # SQLite added RETURNING (for INSERT and UPDATE alike) in 3.35
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+class SequenceService:
+    """Service for allocating document numbers"""
+
+    @staticmethod
+    def format_number(kind: str, year: int, value: int) -> str:
+        """e.g. ('issue', 2025, 7) -> 'ISS-2025-0007'"""
+        prefix = SEQUENCE_KINDS[kind][2]
+        return f'{prefix}-{year}-{value:04d}'
+
+    @staticmethod
+    def next_number(kind: str, organization_id: int, year: Optional[int] = None) -> str:
+        """Allocate and format the next number of a sequence."""
+        return SequenceService.allocate_numbers(kind, organization_id, count=1, year=year)[0]
+
+    @staticmethod
+    def allocate_numbers(kind: str, organization_id: int, count: int, year: Optional[int] = None) -> List[str]:
+        """
+        Reserve a contiguous block of ``count`` numbers in one round trip.
+
+        Meant for bulk imports: assign the returned numbers to the new
+        instances before bulk_create / save so each save skips allocation.
+        """
+        year = year or timezone.now().year
+        first = SequenceService.allocate(kind, organization_id, count=count, year=year)
+        return [SequenceService.format_number(kind, year, value) for value in range(first, first + count)]
+
+    @staticmethod
+    def allocate(kind: str, organization_id: int, count: int = 1, year: Optional[int] = None) -> int:
+        """
+        Advance a sequence by ``count`` and return the first allocated value.
+        """
+        if kind not in SEQUENCE_KINDS:
+            raise ValueError(f'Unknown sequence kind: {kind}')
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        year = year or timezone.now().year
+
+        last_value = SequenceService._advance(kind, organization_id, year, count)
+        if last_value is None:
+            SequenceService._create_sequence(kind, organization_id, year)
+            last_value = SequenceService._advance(kind, organization_id, year, count)
+        return last_value - count + 1
+
+    @staticmethod
+    def _advance(kind: str, organization_id: int, year: int, count: int) -> Optional[int]:
+        """
+        New last_value of the sequence, or None if its row does not exist yet.
+
+        Runs in a write transaction (BEGIN IMMEDIATE on SQLite), so parallel
+        allocations wait for the write lock instead of failing to upgrade.
+        """
+        if _supports_update_returning():
+            with write_transaction(), connection.cursor() as cursor:
+                cursor.execute(_ADVANCE_SQL, [count, organization_id, kind, year])
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        with write_transaction():
+            sequence = NumberSequence.objects.select_for_update().filter(
+                organization_id=organization_id,
+                kind=kind,
+                year=year
+            ).first()
+            if sequence is None:
+                return None
+            sequence.last_value += count
+            sequence.save(update_fields=['last_value'])
+            return sequence.last_value
+
+    @staticmethod
+    def _create_sequence(kind: str, organization_id: int, year: int) -> None:
+        """
+        Create a sequence row, continuing after numbers that were issued
+        before sequences existed. Losing a creation race is harmless.
+        """
+        NumberSequence.objects.bulk_create(
+            [NumberSequence(
+                organization_id=organization_id,
+                kind=kind,
+                year=year,
+                last_value=SequenceService._highest_existing(kind, organization_id, year)
+            )],
+            ignore_conflicts=True
+        )
+
+    @staticmethod
+    def _highest_existing(kind: str, organization_id: int, year: int) -> int:
+        """Largest NNNN already used for the year (runs once per sequence)."""
+        model, field, prefix = SEQUENCE_KINDS[kind]
+        numbers = model.objects.filter(
+            organization_id=organization_id,
+            **{f'{field}__startswith': f'{prefix}-{year}-'}
+        ).values_list(field, flat=True)
+
+        # Compared numerically: 'ISS-2025-10000' sorts before 'ISS-2025-9999'
+        highest = 0
+        for number in numbers.iterator():
+            suffix = number.rsplit('-', 1)[-1]
+            if suffix.isdigit():
+                highest = max(highest, int(suffix))
+        return highest
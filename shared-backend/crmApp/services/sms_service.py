@@ -8,6 +8,8 @@ from typing import Optional
 from django.conf import settings
 from django.utils import timezone
 
+from crmApp.services.job_queue import job
+
 logger = logging.getLogger(__name__)
 
 
@@ -143,3 +145,11 @@ class SMSService:
         
         return True, None
 
+
+@job(queue='sms', priority=10)
+def send_verification_code_sms(phone_number: str, code: str, verification_url: str) -> None:
+    """Background job: text a verification code, retried while the provider fails"""
+    success, error_msg = SMSService().send_verification_code(phone_number, code, verification_url)
+    if not success:
+        raise RuntimeError(f"Failed to send SMS to {phone_number}: {error_msg}")
+    logger.info(f"Verification code sent to {phone_number}")
@@ -4,12 +4,16 @@ Handles all interactions with Telegram Bot API
 """
 import os
 import logging
+import time
 import requests
+import httpx
 from typing import Optional, Dict, Any
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
+from crmApp.services.http_client import get_http_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,13 +52,38 @@ class TelegramService:
         url = f"{self.bot_api_url}/{method}"
         
         try:
-            response = requests.post(url, json=data, timeout=10)
+            response = get_http_client('telegram').post(url, json=data)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"Telegram API request failed: {str(e)}")
             return None
     
+    async def _amake_request(self, method: str, data: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Async variant of _make_request for code running on an event loop.
+        
+        Args:
+            method: Telegram Bot API method (e.g., 'sendMessage', 'sendPhoto')
+            data: Request payload
+            
+        Returns:
+            Response JSON or None if error
+        """
+        if not self.bot_api_url:
+            logger.error("Telegram bot token not configured")
+            return None
+        
+        url = f"{self.bot_api_url}/{method}"
+        
+        try:
+            response = await get_http_client('telegram').apost(url, json=data)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+            logger.error(f"Telegram API request failed: {str(e)}")
+            return None
+    
     def send_message(
         self,
         chat_id: int,
@@ -76,13 +105,37 @@ class TelegramService:
         Returns:
             True if successful, False otherwise
         """
+        return self.send_message_with_id(
+            chat_id,
+            text,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup,
+            disable_web_page_preview=disable_web_page_preview
+        ) is not None
+    
+    def send_message_with_id(
+        self,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str] = "HTML",
+        reply_markup: Optional[Dict] = None,
+        disable_web_page_preview: bool = True
+    ) -> Optional[int]:
+        """
+        Send a text message and return its message_id (needed to edit it later).
+        
+        Returns:
+            Telegram message_id if successful, None otherwise
+        """
         data = {
             "chat_id": chat_id,
             "text": text,
-            "parse_mode": parse_mode,
             "disable_web_page_preview": disable_web_page_preview,
         }
         
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        
         if reply_markup:
             data["reply_markup"] = reply_markup
         
@@ -90,11 +143,11 @@ class TelegramService:
         
         if result and result.get("ok"):
             logger.debug(f"Message sent to chat {chat_id}")
-            return True
+            return (result.get("result") or {}).get("message_id", 0)
         else:
             error_desc = result.get("description", "Unknown error") if result else "No response"
             logger.error(f"Failed to send message to chat {chat_id}: {error_desc}")
-            return False
+            return None
     
     def send_message_chunked(
         self,
@@ -118,7 +171,22 @@ class TelegramService:
         if len(text) <= max_length:
             return self.send_message(chat_id, text, **kwargs)
         
-        # Split text into chunks
+        # Send all chunks
+        all_sent = True
+        for chunk in self.split_text(text, max_length):
+            if not self.send_message(chat_id, chunk, **kwargs):
+                all_sent = False
+        
+        return all_sent
+    
+    @staticmethod
+    def split_text(text: str, max_length: int = 4096) -> list:
+        """
+        Split text into chunks of at most max_length characters on line boundaries.
+        """
+        if len(text) <= max_length:
+            return [text]
+        
         chunks = []
         lines = text.split('\n')
         current_chunk = ""
@@ -134,13 +202,7 @@ class TelegramService:
         if current_chunk:
             chunks.append(current_chunk.strip())
         
-        # Send all chunks
-        all_sent = True
-        for chunk in chunks:
-            if not self.send_message(chat_id, chunk, **kwargs):
-                all_sent = False
-        
-        return all_sent
+        return chunks
     
     def send_typing_action(self, chat_id: int) -> bool:
         """
@@ -219,7 +281,8 @@ class TelegramService:
         chat_id: int,
         message_id: int,
         text: str,
-        reply_markup: Optional[Dict] = None
+        reply_markup: Optional[Dict] = None,
+        parse_mode: Optional[str] = "HTML"
     ) -> bool:
         """
         Edit an existing message.
@@ -229,22 +292,49 @@ class TelegramService:
             message_id: Message ID to edit
             text: New message text
             reply_markup: New keyboard markup
+            parse_mode: HTML, Markdown or None for plain text
             
         Returns:
             True if successful, False otherwise
         """
+        data = self._edit_message_data(chat_id, message_id, text, reply_markup, parse_mode)
+        result = self._make_request("editMessageText", data)
+        return result and result.get("ok", False)
+    
+    async def aedit_message(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[Dict] = None,
+        parse_mode: Optional[str] = "HTML"
+    ) -> bool:
+        """Async variant of edit_message."""
+        data = self._edit_message_data(chat_id, message_id, text, reply_markup, parse_mode)
+        result = await self._amake_request("editMessageText", data)
+        return bool(result and result.get("ok", False))
+    
+    @staticmethod
+    def _edit_message_data(
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[Dict],
+        parse_mode: Optional[str]
+    ) -> Dict:
         data = {
             "chat_id": chat_id,
             "message_id": message_id,
             "text": text,
-            "parse_mode": "HTML"
         }
         
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        
         if reply_markup:
             data["reply_markup"] = reply_markup
         
-        result = self._make_request("editMessageText", data)
-        return result and result.get("ok", False)
+        return data
     
     def delete_message(self, chat_id: int, message_id: int) -> bool:
         """
@@ -361,3 +451,86 @@ class TelegramService:
         
         return text
 
+
+class TelegramMessageStream:
+    """
+    Streams a growing reply into a single Telegram message.
+    
+    A placeholder is sent first and then edited with the text received so far,
+    at most once every TELEGRAM_STREAM_EDIT_INTERVAL seconds (Telegram rate
+    limits edits). Partial text is sent as plain text because half-received
+    markup is not valid HTML; the final text replaces it in HTML, overflowing
+    into additional messages when it exceeds Telegram's length limit.
+    """
+    
+    MAX_LENGTH = 4096
+    
+    def __init__(self, telegram_service: TelegramService, chat_id: int, placeholder: str = "⏳ Thinking..."):
+        self.telegram_service = telegram_service
+        self.chat_id = chat_id
+        self.placeholder = placeholder
+        self.message_id = None
+        self.min_interval = getattr(settings, 'TELEGRAM_STREAM_EDIT_INTERVAL', 1.5)
+        self._last_edit = 0.0
+        self._last_text = None
+    
+    def start(self) -> Optional[int]:
+        """Send the placeholder message."""
+        self.message_id = self.telegram_service.send_message_with_id(
+            self.chat_id, self.placeholder, parse_mode=None
+        )
+        self._last_edit = time.monotonic()
+        return self.message_id
+    
+    def update(self, text: str) -> None:
+        """Show the partial reply (throttled)."""
+        preview = self._preview(text)
+        if preview is None:
+            return
+        
+        self.telegram_service.edit_message(self.chat_id, self.message_id, preview, parse_mode=None)
+        self._edited(preview)
+    
+    async def aupdate(self, text: str) -> None:
+        """Async variant of update, for streams consumed on an event loop."""
+        preview = self._preview(text)
+        if preview is None:
+            return
+        
+        await self.telegram_service.aedit_message(self.chat_id, self.message_id, preview, parse_mode=None)
+        self._edited(preview)
+    
+    def _preview(self, text: str) -> Optional[str]:
+        """The partial text to show, or None if no edit is due."""
+        if not self.message_id or not text.strip():
+            return None
+        if time.monotonic() - self._last_edit < self.min_interval:
+            return None
+        
+        preview = text.strip()
+        if len(preview) > self.MAX_LENGTH - 2:
+            preview = preview[:self.MAX_LENGTH - 2]
+        preview += " ▌"
+        if preview == self._last_text:
+            return None
+        return preview
+    
+    def _edited(self, preview: str) -> None:
+        self._last_edit = time.monotonic()
+        self._last_text = preview
+    
+    def finish(self, text: str) -> bool:
+        """Replace the placeholder with the final (HTML) reply."""
+        chunks = self.telegram_service.split_text(text, self.MAX_LENGTH)
+        if not self.message_id:
+            return self.telegram_service.send_message_chunked(self.chat_id, text, max_length=self.MAX_LENGTH)
+        
+        sent = self.telegram_service.edit_message(self.chat_id, self.message_id, chunks[0])
+        if not sent:
+            # E.g. the HTML was rejected - fall back to a fresh message
+            self.telegram_service.delete_message(self.chat_id, self.message_id)
+            return self.telegram_service.send_message_chunked(self.chat_id, text, max_length=self.MAX_LENGTH)
+        
+        for chunk in chunks[1:]:
+            sent = self.telegram_service.send_message(self.chat_id, chunk) and sent
+        return sent
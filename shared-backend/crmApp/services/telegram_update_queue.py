@@ -0,0 +1,317 @@
+"""
+Telegram Update Queue
+
+The webhook persists every update (TelegramUpdate, unique on update_id) and
+acknowledges it right away; processing (database work, Gemini, replies
+through the Telegram API) happens on worker threads.
+
+Updates of one chat are processed strictly in order, one at a time, while
+different chats are processed in parallel. A chat with
+TELEGRAM_CHAT_BACKLOG_LIMIT updates already waiting gets further updates
+dropped (and a single notice once it catches up) instead of letting one
+chat occupy every worker.
+
+TELEGRAM_WORKER_MODE selects who processes updates:
+- 'thread':   worker threads in the web process (default). With its first
+              request the process also queues the updates that were stored
+              but not processed before a restart (see recover())
+- 'external': only persisted; processed by `manage.py run_telegram_worker`
+- 'inline':   processed synchronously inside the webhook request
+              (local stand-in for tests and debugging)
+"""
+
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Set
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from crmApp.models import TelegramUpdate
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_update(payload: dict) -> None:
+    """Default handler: route the raw update to the bot's message/callback handlers."""
+    from crmApp.viewsets.telegram import dispatch_telegram_update
+    dispatch_telegram_update(payload)
+
+
+def run_update(update_pk: int, handler: Callable[[dict], None] = dispatch_update) -> bool:
+    """
+    Claim a pending update and process it.
+
+    Returns:
+        True if this call processed the update, False if it was already
+        claimed elsewhere (or is no longer pending)
+    """
+    claimed = TelegramUpdate.objects.filter(
+        pk=update_pk,
+        status=TelegramUpdate.STATUS_PENDING
+    ).update(
+        status=TelegramUpdate.STATUS_PROCESSING,
+        attempts=F('attempts') + 1,
+        started_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    update = TelegramUpdate.objects.get(pk=update_pk)
+    try:
+        handler(update.payload)
+    except Exception as e:
+        logger.error(f"Failed to process Telegram update {update.update_id}: {e}", exc_info=True)
+        TelegramUpdate.objects.filter(pk=update_pk).update(
+            status=TelegramUpdate.STATUS_FAILED,
+            error=str(e)[:2000],
+            processed_at=timezone.now()
+        )
+    else:
+        TelegramUpdate.objects.filter(pk=update_pk).update(
+            status=TelegramUpdate.STATUS_DONE,
+            processed_at=timezone.now()
+        )
+    return True
+
+
+def mark_dropped(update_pk: int) -> None:
+    """Record that an update was not processed because its chat's backlog was full."""
+    TelegramUpdate.objects.filter(
+        pk=update_pk,
+        status=TelegramUpdate.STATUS_PENDING
+    ).update(status=TelegramUpdate.STATUS_DROPPED, processed_at=timezone.now())
+
+
+def requeue_stale(stale_after: Optional[float] = None) -> int:
+    """Updates left in processing by a crashed worker go back to pending."""
+    if stale_after is None:
+        stale_after = getattr(settings, 'TELEGRAM_UPDATE_STALE_AFTER', 300)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return TelegramUpdate.objects.filter(
+        status=TelegramUpdate.STATUS_PROCESSING,
+        started_at__lt=cutoff
+    ).update(status=TelegramUpdate.STATUS_PENDING)
+
+
+class TelegramUpdateQueue:
+    """Thread pool that processes updates in order per chat"""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], None] = dispatch_update,
+        workers: Optional[int] = None,
+        chat_backlog_limit: Optional[int] = None,
+    ):
+        self._handler = handler
+        self._workers = workers
+        self._chat_backlog_limit = chat_backlog_limit
+
+        self._lock = threading.Lock()
+        self._has_work = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._backlogs: Dict[int, deque] = {}
+        self._ready: deque = deque()
+        self._active: Set[int] = set()
+        self._known: Set[int] = set()
+        self._dropped: Dict[int, int] = {}
+        self._threads = []
+        self._stopping = False
+
+    @property
+    def workers(self) -> int:
+        return self._workers or getattr(settings, 'TELEGRAM_WORKER_THREADS', 4)
+
+    @property
+    def chat_backlog_limit(self) -> int:
+        return self._chat_backlog_limit or getattr(settings, 'TELEGRAM_CHAT_BACKLOG_LIMIT', 5)
+
+    def submit(self, update_pk: int, chat_id: int) -> bool:
+        """
+        Queue an update for processing after the chat's earlier updates.
+
+        Returns:
+            False if the chat's backlog is full (the update is not queued)
+        """
+        with self._lock:
+            if update_pk in self._known:
+                return True
+
+            backlog = self._backlogs.setdefault(chat_id, deque())
+            if len(backlog) >= self.chat_backlog_limit:
+                self._dropped[chat_id] = self._dropped.get(chat_id, 0) + 1
+                logger.warning(f"Telegram chat {chat_id} backlog full, dropping update #{update_pk}")
+                return False
+
+            backlog.append(update_pk)
+            self._known.add(update_pk)
+            if len(backlog) == 1 and chat_id not in self._active:
+                self._ready.append(chat_id)
+                self._has_work.notify()
+
+        self._ensure_workers()
+        return True
+
+    def submit_pending(self, batch_size: Optional[int] = None) -> int:
+        """
+        Submit stored pending updates (oldest first) that this queue does
+        not know yet; returns how many were newly queued.
+        """
+        pending = TelegramUpdate.objects.filter(
+            status=TelegramUpdate.STATUS_PENDING
+        ).order_by('update_id').values_list('pk', 'chat_id')
+        if batch_size:
+            pending = pending[:batch_size]
+
+        submitted = 0
+        for update_pk, chat_id in pending:
+            if self.is_queued(update_pk):
+                continue
+            if self.submit(update_pk, chat_id):
+                submitted += 1
+            else:
+                mark_dropped(update_pk)
+        return submitted
+
+    def recover(self, stale_after: Optional[float] = None) -> int:
+        """
+        Queue updates that were stored and acknowledged but never processed
+        (pending, or left in processing by a crashed worker). Telegram does
+        not deliver them again.
+
+        Returns:
+            Number of updates queued
+        """
+        requeued = requeue_stale(stale_after)
+        if requeued:
+            logger.warning(f"Requeued {requeued} Telegram update(s) left in processing")
+        submitted = self.submit_pending()
+        if submitted:
+            logger.info(f"Queued {submitted} stored Telegram update(s)")
+        return submitted
+
+    def is_queued(self, update_pk: int) -> bool:
+        """Whether an update is waiting or being processed by this queue."""
+        with self._lock:
+            return update_pk in self._known
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued update has been processed."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._known, timeout)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Finish queued updates and stop the worker threads."""
+        with self._lock:
+            self._stopping = True
+            self._has_work.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping = False
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f'telegram-worker-{len(self._threads) + 1}',
+                    daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                self._has_work.wait_for(lambda: self._ready or self._stopping)
+                if not self._ready:
+                    return
+                chat_id = self._ready.popleft()
+                self._active.add(chat_id)
+                update_pk = self._backlogs[chat_id][0]
+
+            try:
+                close_old_connections()
+                run_update(update_pk, self._handler)
+            except Exception as e:
+                logger.error(f"Telegram worker failed on update #{update_pk}: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+            dropped = 0
+            with self._lock:
+                backlog = self._backlogs[chat_id]
+                backlog.popleft()
+                self._known.discard(update_pk)
+                self._active.discard(chat_id)
+                if backlog:
+                    self._ready.append(chat_id)
+                    self._has_work.notify()
+                else:
+                    del self._backlogs[chat_id]
+                    dropped = self._dropped.pop(chat_id, 0)
+                if not self._known:
+                    self._idle.notify_all()
+
+            if dropped:
+                self._notify_dropped(chat_id, dropped)
+
+    @staticmethod
+    def _notify_dropped(chat_id: int, count: int) -> None:
+        from crmApp.services.telegram_service import TelegramService
+        TelegramService().send_message(
+            chat_id,
+            f"⏳ I was still working on your earlier messages, so {count} message(s) were skipped. "
+            "Please send them again."
+        )
+
+
+telegram_update_queue = TelegramUpdateQueue()
+
+
+def _recover_stored_updates(**kwargs) -> None:
+    request_started.disconnect(_recover_stored_updates, dispatch_uid='crmApp.telegram_update_queue.recover')
+    if getattr(settings, 'TELEGRAM_WORKER_MODE', 'thread') != 'thread':
+        return
+    try:
+        telegram_update_queue.recover()
+    except Exception as e:
+        logger.error(f"Failed to recover stored Telegram updates: {e}", exc_info=True)
+
+
+def recover_on_first_request() -> None:
+    """
+    In TELEGRAM_WORKER_MODE = 'thread', queue the updates a previous web
+    process stored but did not process, with this process's first request.
+    """
+    if getattr(settings, 'TELEGRAM_WORKER_MODE', 'thread') == 'thread':
+        request_started.connect(_recover_stored_updates, dispatch_uid='crmApp.telegram_update_queue.recover')
+
+
+def enqueue_update(update: TelegramUpdate, queue: Optional[TelegramUpdateQueue] = None) -> None:
+    """
+    Hand a persisted update to the configured worker (see TELEGRAM_WORKER_MODE).
+    """
+    mode = getattr(settings, 'TELEGRAM_WORKER_MODE', 'thread')
+
+    if mode == 'external':
+        return
+
+    if mode == 'inline':
+        run_update(update.pk)
+        return
+
+    queue = queue or telegram_update_queue
+
+    def submit():
+        if not queue.submit(update.pk, update.chat_id):
+            mark_dropped(update.pk)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,251 @@
+"""
+Tool Result Projections
+Compact shapes of list tool results sent to language models (Gemini function
+calls and MCP tools).
+
+Each list tool declares the columns it returns, how long their text may be
+and how many rows one call can return. Rows are read with values(), so no
+model instances or serializers are built, and a page that was cut short
+carries a cursor for the next one.
+
+Cursors are keyset positions: the sort key of the last row returned. The
+next page starts strictly after it, so rows created or deleted between two
+calls do not shift later pages onto rows that were already returned.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db.models import Q
+
+DEFAULT_MAX_CHARS = 200
+TRUNCATION_MARK = '…'
+
+
+class InvalidToolCursor(ValueError):
+    """Cursor that was not returned by a previous page"""
+
+
+def truncate(value: str, max_chars: int) -> str:
+    """Shorten text to max_chars, marking the cut"""
+    if len(value) <= max_chars:
+        return value
+    return value[:max_chars - 1].rstrip() + TRUNCATION_MARK
+
+
+def _cursor_value(value: Any) -> Any:
+    # isoformat() keeps microseconds, which the position has to match exactly
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Cannot put {type(value).__name__} in a cursor')
+
+
+def encode_cursor(position: Sequence[Any]) -> str:
+    raw = json.dumps(list(position), default=_cursor_value)
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], length: int) -> Optional[List[Any]]:
+    """Sort key values after which the page starts (None for the first page)"""
+    if not cursor:
+        return None
+    try:
+        position = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        position = None
+    if not isinstance(position, list) or len(position) != length:
+        raise InvalidToolCursor('Invalid cursor. Call the tool without a cursor to start over.')
+    return position
+
+
+def _sort_keys(ordering: Iterable[str]) -> List[Tuple[str, bool]]:
+    """
+    (name, descending) pairs of an order_by() ordering, ending with the
+    primary key so that every row has a distinct position.
+    """
+    keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    if not any(name in ('pk', 'id') for name, _ in keys):
+        keys.append(('pk', True))
+    return keys
+
+
+def _after(queryset, keys: List[Tuple[str, bool]], position: List[Any]):
+    """Rows of queryset that come after position in the order of keys"""
+    clauses = []
+    for index, (name, descending) in enumerate(keys):
+        equal = {prior: value for (prior, _), value in zip(keys[:index], position)}
+        clauses.append(Q(**equal) & Q(**{f"{name}__{'lt' if descending else 'gt'}": position[index]}))
+    return queryset.filter(reduce(or_, clauses))
+
+
+@dataclass(frozen=True)
+class ToolProjection:
+    """
+    Declarative result shape of one list tool.
+
+    fields maps output names to values() lookups (which may follow foreign
+    keys, e.g. 'stage__name'). Strings are cut to max_chars[name] or
+    DEFAULT_MAX_CHARS, None values are left out, and a page never has more
+    than max_rows rows.
+    """
+    key: str
+    fields: Dict[str, str]
+    max_rows: int = 50
+    default_rows: int = 10
+    max_chars: Dict[str, int] = field(default_factory=dict)
+    ordering: Tuple[str, ...] = ('-created_at', '-id')
+
+    def clamp(self, limit: Optional[int]) -> int:
+        """Rows per page for a requested limit"""
+        if not limit:
+            return self.default_rows
+        return min(max(int(limit), 1), self.max_rows)
+
+    def compact(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Whitelisted, JSON-safe and truncated copy of one row"""
+        item = {}
+        for name in self.fields:
+            value = row.get(name)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = truncate(value, self.max_chars.get(name, DEFAULT_MAX_CHARS))
+            elif isinstance(value, Decimal):
+                value = float(value)
+            elif isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            item[name] = value
+        return item
+
+    def page(self, queryset, limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of the queryset in this shape.
+
+        A queryset that is already ordered (e.g. by search relevance from
+        SearchIndexService.filter_queryset) keeps its order; others are
+        sorted by self.ordering. The ordering must name non-null columns or
+        annotations. Reads at most one row more than the page size to tell
+        whether more rows are available.
+
+        Raises:
+            InvalidToolCursor: cursor was not returned by a previous page
+        """
+        size = self.clamp(limit)
+        keys = _sort_keys(queryset.query.order_by or self.ordering)
+        queryset = queryset.order_by(*(('-' if descending else '') + name for name, descending in keys))
+        position = decode_cursor(cursor, len(keys))
+        if position is not None:
+            queryset = _after(queryset, keys, position)
+
+        lookups = list(dict.fromkeys([*self.fields.values(), *(name for name, _ in keys)]))
+        rows = list(queryset.values(*lookups)[:size + 1])
+        more_available = len(rows) > size
+        rows = rows[:size]
+        return self.result(
+            [{name: row[lookup] for name, lookup in self.fields.items()} for row in rows],
+            encode_cursor([rows[-1][name] for name, _ in keys]) if more_available else None,
+        )
+
+    def result(self, rows: Iterable[Dict[str, Any]], next_cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Tool result of one page of rows; next_cursor is None on the last page"""
+        items = [self.compact(row) for row in rows]
+        return {
+            self.key: items,
+            "count": len(items),
+            "more_available": next_cursor is not None,
+            "next_cursor": next_cursor,
+        }
+
+
+TOOL_PROJECTIONS: Dict[str, ToolProjection] = {
+    'list_customers': ToolProjection(
+        key='customers',
+        fields={
+            'id': 'id',
+            'name': 'name',
+            'email': 'email',
+            'phone': 'phone',
+            'status': 'status',
+            'customer_type': 'customer_type',
+            'company_name': 'company_name',
+        },
+        max_rows=50,
+        max_chars={'name': 80, 'company_name': 80},
+    ),
+    'list_leads': ToolProjection(
+        key='leads',
+        fields={
+            'id': 'id',
+            'name': 'name',
+            'organization_name': 'organization_name',
+            'email': 'email',
+            'phone': 'phone',
+            'stage': 'stage__name',
+            'qualification_status': 'qualification_status',
+            'status': 'status',
+            'source': 'source',
+            'is_converted': 'is_converted',
+            'assigned_to_id': 'assigned_to_id',
+        },
+        max_rows=100,
+        max_chars={'name': 80, 'organization_name': 80},
+    ),
+    'list_deals': ToolProjection(
+        key='deals',
+        fields={
+            'id': 'id',
+            'title': 'title',
+            'value': 'value',
+            'stage': 'stage__name',
+            'status': 'status',
+            'customer_name': 'customer__name',
+        },
+        max_rows=50,
+        max_chars={'title': 120},
+    ),
+    'list_issues': ToolProjection(
+        key='issues',
+        fields={
+            'id': 'id',
+            'title': 'title',
+            'priority': 'priority',
+            'status': 'status',
+            'category': 'category',
+            'vendor_name': 'vendor__name',
+            'customer_name': 'raised_by_customer__name',
+            'created_at': 'created_at',
+        },
+        max_rows=100,
+        default_rows=20,
+        max_chars={'title': 120},
+    ),
+    'list_activities': ToolProjection(
+        key='activities',
+        fields={
+            'id': 'id',
+            'activity_type': 'activity_type',
+            'title': 'title',
+            'description': 'description',
+            'customer_name': 'customer_name',
+            'status': 'status',
+            'scheduled_at': 'scheduled_at',
+            'completed_at': 'completed_at',
+            'created_at': 'created_at',
+        },
+        max_rows=100,
+        default_rows=50,
+        max_chars={'title': 120, 'description': 160},
+    ),
+}
+
+
+def get_projection(tool_name: str) -> ToolProjection:
+    return TOOL_PROJECTIONS[tool_name]
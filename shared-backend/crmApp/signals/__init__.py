@@ -3,6 +3,10 @@ Signals package for CRM App
 Automatically registers all signal handlers
 """
 from .audit_signals import *
+from .rbac_signals import *
+from .analytics_signals import *
+from .context_signals import *
+from .search_signals import *
 
-__all__ = ['audit_signals']
+__all__ = ['audit_signals', 'rbac_signals', 'analytics_signals', 'context_signals', 'search_signals']
 
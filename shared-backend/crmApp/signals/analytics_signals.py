@@ -0,0 +1,85 @@
+"""
+Django signals that keep the daily analytics rollups in sync with
+Lead, Deal, Customer and Activity changes.
+
+The old contribution of a record comes from the values the instance was
+loaded with (get_loaded_values()), so a save costs no extra SELECT. A save
+from a stale copy (loaded before another request changed the row) moves the
+wrong old contribution; find_drift() reports such drift and rebuild()
+repairs it (backfill_analytics_rollups --check --fix).
+
+If a rollup update fails, the organization's rollups are marked as not
+covered, so reads fall back to the raw tables until they are rebuilt.
+"""
+import logging
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from crmApp.models import Activity, Customer, Deal, Lead
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService, tracked_fields
+
+logger = logging.getLogger(__name__)
+
+
+def _touches_tracked_fields(sender, update_fields):
+    """False when save(update_fields=...) cannot change the rollup contribution."""
+    if update_fields is None:
+        return True
+    attnames = {sender._meta.get_field(name).attname for name in update_fields}
+    return bool(attnames & set(tracked_fields(sender)))
+
+
+def _loaded_values(instance, current):
+    """Tracked values the instance was loaded with (deferred fields keep their current value)"""
+    loaded = instance.get_loaded_values() or {}
+    return {field: loaded.get(field, value) for field, value in current.items()}
+
+
+def _record_change(sender, instance, original, current):
+    """Apply the change, or stop trusting the organization's rollups if that fails"""
+    try:
+        with transaction.atomic():
+            AnalyticsRollupService.record_change(sender, original, current)
+    except Exception as e:
+        logger.error(f"Error updating analytics rollups for {sender.__name__} {instance.pk}: {e}", exc_info=True)
+        organization_ids = {values.get('organization_id') for values in (original, current) if values}
+        try:
+            AnalyticsRollupService.invalidate(organization_ids)
+        except Exception as e:
+            logger.error(f"Error invalidating analytics rollups for organizations {organization_ids}: {e}", exc_info=True)
+
+
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Deal)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Activity)
+def update_rollups_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Move the record's contribution from its old buckets to its new ones.
+    """
+    if not created and not _touches_tracked_fields(sender, update_fields):
+        return
+
+    current = AnalyticsRollupService.snapshot(instance)
+    original = None
+    if not created:
+        original = _loaded_values(instance, current)
+        if update_fields is not None:
+            # Fields left out of update_fields keep their loaded values
+            written = {sender._meta.get_field(name).attname for name in update_fields}
+            current = {field: current[field] if field in written else value for field, value in original.items()}
+
+    _record_change(sender, instance, original, current)
+
+
+@receiver(pre_delete, sender=Lead)
+@receiver(pre_delete, sender=Deal)
+@receiver(pre_delete, sender=Customer)
+@receiver(pre_delete, sender=Activity)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """
+    Remove the record's contribution before it is deleted.
+    """
+    original = _loaded_values(instance, AnalyticsRollupService.snapshot(instance))
+    _record_change(sender, instance, original, None)
@@ -1,15 +1,19 @@
 """
 Django signals for automatic audit logging of all CRUD operations.
+
+Entries are built in memory and handed to the batched AuditLogWriter,
+which writes them after the surrounding transaction commits.
 """
 import logging
-from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 
 from crmApp.models import (
     Customer, Lead, Deal, Employee, Issue, Order, Payment,
-    Activity, Pipeline, PipelineStage, AuditLog, UserProfile
+    Pipeline, PipelineStage, AuditLog, UserProfile
 )
+from crmApp.services.audit_log_writer import audit_log_writer
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +21,8 @@ logger = logging.getLogger(__name__)
 def get_changed_fields(instance, original_data):
     """
     Compare current instance with original data to find changed fields.
+    original_data holds raw column values keyed by attname (see
+    TrackedFieldsMixin), so foreign keys are compared by ID.
     Returns dict of changes: {'field': {'old': value, 'new': value}}
     """
     changes = {}
@@ -24,35 +30,25 @@ def get_changed_fields(instance, original_data):
     if not original_data:
         return changes
     
-    # List of fields to track
-    tracked_fields = []
-    for field in instance._meta.fields:
+    for field in instance._meta.concrete_fields:
         # Skip auto fields, timestamps, and internal fields
         if field.name in ['id', 'created_at', 'updated_at', 'code']:
             continue
-        if field.name.startswith('_'):
+        if field.name.startswith('_') or field.attname not in original_data:
             continue
-        tracked_fields.append(field.name)
-    
-    for field_name in tracked_fields:
+        
         try:
-            old_value = original_data.get(field_name)
-            new_value = getattr(instance, field_name, None)
-            
-            # Convert foreign key to ID for comparison
-            if hasattr(new_value, 'id'):
-                new_value = new_value.id
-            if hasattr(old_value, 'id'):
-                old_value = old_value.id
+            old_value = original_data.get(field.attname)
+            new_value = getattr(instance, field.attname, None)
             
             # Only log if value changed
             if old_value != new_value:
-                changes[field_name] = {
+                changes[field.name] = {
                     'old': str(old_value) if old_value is not None else None,
                     'new': str(new_value) if new_value is not None else None
                 }
         except Exception as e:
-            logger.warning(f"Error comparing field {field_name}: {e}")
+            logger.warning(f"Error comparing field {field.name}: {e}")
             continue
     
     return changes
@@ -72,46 +68,57 @@ def get_resource_name(instance):
 
 
 def get_related_entities(instance):
-    """Get related customer, lead, or deal from the instance."""
+    """Get related customer, lead, or deal IDs from the instance (no extra queries)."""
     related = {
-        'related_customer': None,
-        'related_lead': None,
-        'related_deal': None
+        'related_customer_id': getattr(instance, 'customer_id', None),
+        'related_lead_id': getattr(instance, 'lead_id', None),
+        'related_deal_id': getattr(instance, 'deal_id', None),
     }
     
-    # Direct relationship
-    if hasattr(instance, 'customer') and instance.customer:
-        related['related_customer'] = instance.customer
-    if hasattr(instance, 'lead') and instance.lead:
-        related['related_lead'] = instance.lead
-    if hasattr(instance, 'deal') and instance.deal:
-        related['related_deal'] = instance.deal
-    
     # Instance IS a customer/lead/deal
     if isinstance(instance, Customer):
-        related['related_customer'] = instance
+        related['related_customer_id'] = instance.pk
     elif isinstance(instance, Lead):
-        related['related_lead'] = instance
+        related['related_lead_id'] = instance.pk
     elif isinstance(instance, Deal):
-        related['related_deal'] = instance
+        related['related_deal_id'] = instance.pk
     
     return related
 
 
+def get_profile_type(user, organization_id):
+    """
+    Profile type the user acts as in the organization.
+    Memoized on the user object so repeated saves in one request cost one query.
+    """
+    active_profile = getattr(user, 'active_profile', None)
+    if active_profile:
+        return active_profile.profile_type
+    
+    memo = user.__dict__.setdefault('_audit_profile_types', {})
+    if organization_id not in memo:
+        memo[organization_id] = UserProfile.objects.filter(
+            user=user,
+            organization_id=organization_id,
+            status='active'
+        ).values_list('profile_type', flat=True).first()
+    return memo[organization_id]
+
+
 def log_audit(action, instance, user=None, changes=None, description=None):
     """
-    Create an audit log entry.
+    Build an audit log entry and queue it for the batched writer.
+    The entry is written after the current transaction commits.
     """
     try:
-        logger.info(f"🔔 log_audit called: {action} {instance.__class__.__name__} #{getattr(instance, 'id', 'N/A')}")
+        logger.debug(f"log_audit called: {action} {instance.__class__.__name__} #{getattr(instance, 'id', 'N/A')}")
         
         # Skip if no organization
-        if not hasattr(instance, 'organization') or not instance.organization:
+        organization_id = getattr(instance, 'organization_id', None)
+        if not organization_id:
             logger.warning(f"⚠️  Skipping audit log - no organization for {instance.__class__.__name__}")
             return
         
-        organization = instance.organization
-        
         # Get user from thread-local storage if not provided
         if not user:
             from crmApp.middleware import get_current_user
@@ -123,7 +130,7 @@ def log_audit(action, instance, user=None, changes=None, description=None):
             if hasattr(instance, '_audit_user'):
                 user = instance._audit_user
                 logger.debug(f"Got user from instance._audit_user: {user}")
-            elif hasattr(instance, 'created_by') and instance.created_by:
+            elif getattr(instance, 'created_by_id', None):
                 user = instance.created_by
                 logger.debug(f"Got user from instance.created_by: {user}")
         
@@ -133,21 +140,11 @@ def log_audit(action, instance, user=None, changes=None, description=None):
             return
         
         # Get user profile type
-        active_profile = getattr(user, 'active_profile', None)
-        if not active_profile:
-            profiles = UserProfile.objects.filter(
-                user=user,
-                organization=organization,
-                status='active'
-            )
-            active_profile = profiles.first()
-        
-        if not active_profile:
-            logger.warning(f"No active profile for user {user.email} in org {organization.id}")
+        user_profile_type = get_profile_type(user, organization_id)
+        if not user_profile_type:
+            logger.warning(f"No active profile for user {user.email} in org {organization_id}")
             return
         
-        user_profile_type = active_profile.profile_type
-        
         # Get resource info
         resource_type = instance.__class__.__name__.lower()
         resource_name = get_resource_name(instance)
@@ -166,9 +163,8 @@ def log_audit(action, instance, user=None, changes=None, description=None):
         if action != 'delete':
             related_entities = get_related_entities(instance)
         
-        # Create audit log
-        AuditLog.objects.create(
-            organization=organization,
+        audit_log_writer.enqueue(AuditLog(
+            organization_id=organization_id,
             user=user,
             user_email=user.email,
             user_profile_type=user_profile_type,
@@ -179,48 +175,14 @@ def log_audit(action, instance, user=None, changes=None, description=None):
             description=description,
             changes=changes or {},
             **related_entities
-        )
+        ))
         
-        logger.debug(f"Audit log created: {user.email} {action} {resource_type} #{instance.id}")
+        logger.debug(f"Audit log queued: {user.email} {action} {resource_type} #{instance.id}")
         
     except Exception as e:
         logger.error(f"Failed to create audit log: {e}", exc_info=True)
 
 
-# Store original data before save for comparison
-_original_data = {}
-
-
-@receiver(pre_save)
-def store_original_data(sender, instance, **kwargs):
-    """
-    Store original data before save to detect changes.
-    Only for models we want to audit.
-    """
-    audited_models = (
-        Customer, Lead, Deal, Employee, Issue, Order, Payment,
-        Activity, Pipeline, PipelineStage
-    )
-    
-    if not isinstance(instance, audited_models):
-        return
-    
-    # Only for updates (instance has pk)
-    if instance.pk:
-        try:
-            original = sender.objects.get(pk=instance.pk)
-            # Store as dict of field values
-            data = {}
-            for field in original._meta.fields:
-                try:
-                    data[field.name] = getattr(original, field.name)
-                except Exception:
-                    continue
-            _original_data[f"{sender.__name__}_{instance.pk}"] = data
-        except sender.DoesNotExist:
-            pass
-
-
 @receiver(post_save, sender=Customer)
 @receiver(post_save, sender=Lead)
 @receiver(post_save, sender=Deal)
@@ -232,25 +194,27 @@ def store_original_data(sender, instance, **kwargs):
 @receiver(post_save, sender=PipelineStage)
 def log_create_or_update(sender, instance, created, **kwargs):
     """
-    Log create or update actions.
+    Log create or update actions, plus deal stage moves and lead conversions
+    detected from the same diff.
     """
     try:
         if created:
             # New record created
             log_audit('create', instance)
-        else:
-            # Record updated
-            key = f"{sender.__name__}_{instance.pk}"
-            original_data = _original_data.get(key)
-            changes = get_changed_fields(instance, original_data)
-            
-            # Only log if there are actual changes
-            if changes:
-                log_audit('update', instance, changes=changes)
-            
-            # Clean up stored data
-            if key in _original_data:
-                del _original_data[key]
+            return
+        
+        # Record updated - diff against the values the instance was loaded with
+        original_data = instance.get_loaded_values()
+        changes = get_changed_fields(instance, original_data)
+        
+        # Only log if there are actual changes
+        if changes:
+            log_audit('update', instance, changes=changes)
+        
+        if sender is Deal and 'stage' in changes:
+            log_deal_stage_move(instance, original_data.get('stage_id'))
+        elif sender is Lead and 'is_converted' in changes:
+            log_lead_conversion(instance)
     
     except Exception as e:
         logger.error(f"Error in post_save signal: {e}", exc_info=True)
@@ -292,71 +256,50 @@ def log_delete(sender, instance, **kwargs):
 
 
 # Special handling for stage moves
-@receiver(post_save, sender=Deal)
-def log_deal_stage_move(sender, instance, created, **kwargs):
+def log_deal_stage_move(deal, old_stage_id):
     """
     Log when a deal is moved to a different stage.
     """
-    if created:
-        return
-    
     try:
-        key = f"{sender.__name__}_{instance.pk}"
-        original_data = _original_data.get(key)
+        if not old_stage_id or not deal.stage_id:
+            return
         
-        if original_data:
-            old_stage_id = original_data.get('stage_id')
-            new_stage_id = instance.stage_id
-            
-            if old_stage_id and new_stage_id and old_stage_id != new_stage_id:
-                # Stage changed - log as 'moved' action
-                old_stage_name = PipelineStage.objects.filter(id=old_stage_id).first()
-                new_stage_name = instance.stage.name if instance.stage else 'Unknown'
-                
-                description = f"Moved deal '{instance.title}' from '{old_stage_name}' to '{new_stage_name}'"
-                
-                log_audit(
-                    'moved',
-                    instance,
-                    description=description,
-                    changes={
-                        'stage': {
-                            'old': str(old_stage_name) if old_stage_name else None,
-                            'new': new_stage_name
-                        }
-                    }
-                )
+        # Stage changed - log as 'moved' action
+        old_stage_name = PipelineStage.objects.select_related('pipeline').filter(id=old_stage_id).first()
+        new_stage_name = deal.stage.name if deal.stage else 'Unknown'
+        
+        description = f"Moved deal '{deal.title}' from '{old_stage_name}' to '{new_stage_name}'"
+        
+        log_audit(
+            'moved',
+            deal,
+            description=description,
+            changes={
+                'stage': {
+                    'old': str(old_stage_name) if old_stage_name else None,
+                    'new': new_stage_name
+                }
+            }
+        )
     
     except Exception as e:
         logger.error(f"Error logging deal stage move: {e}", exc_info=True)
 
 
-@receiver(post_save, sender=Lead)
-def log_lead_conversion(sender, instance, created, **kwargs):
+def log_lead_conversion(lead):
     """
     Log when a lead is converted to a deal/customer.
     """
-    if created:
-        return
-    
     try:
-        key = f"{sender.__name__}_{instance.pk}"
-        original_data = _original_data.get(key)
-        
-        if original_data:
-            was_converted = original_data.get('is_converted', False)
-            is_now_converted = instance.is_converted
+        if lead.is_converted:
+            # Lead was just converted
+            description = f"Converted lead '{lead.name}' to customer/deal"
             
-            if not was_converted and is_now_converted:
-                # Lead was just converted
-                description = f"Converted lead '{instance.name}' to customer/deal"
-                
-                log_audit(
-                    'converted',
-                    instance,
-                    description=description
-                )
+            log_audit(
+                'converted',
+                lead,
+                description=description
+            )
     
     except Exception as e:
         logger.error(f"Error logging lead conversion: {e}", exc_info=True)
-
@@ -0,0 +1,57 @@
+"""
+Django signals that invalidate cached request contexts (active profile,
+organization and accessible organizations of a user).
+"""
+import logging
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from crmApp.models import Customer, CustomerOrganization, Organization, UserProfile
+from crmApp.utils.request_context import RequestContext
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_context(sender, instance, **kwargs):
+    """
+    Profile changes (switching primary profile, activation, organization) change the context.
+    """
+    RequestContext.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_customer_context(sender, instance, **kwargs):
+    """
+    Linking or unlinking a customer record changes the user's accessible vendor organizations.
+    """
+    RequestContext.invalidate(instance.user_id)
+
+    loaded = instance.get_loaded_values() or {}
+    previous_user_id = loaded.get('user_id')
+    if previous_user_id and previous_user_id != instance.user_id:
+        RequestContext.invalidate(previous_user_id)
+
+
+@receiver(post_save, sender=CustomerOrganization)
+@receiver(post_delete, sender=CustomerOrganization)
+def invalidate_customer_organization_context(sender, instance, **kwargs):
+    """
+    Customer/vendor links decide which organizations a customer user can access.
+    """
+    user_id = Customer.objects.filter(pk=instance.customer_id).values_list('user_id', flat=True).first()
+    RequestContext.invalidate(user_id)
+
+
+@receiver(post_save, sender=Organization)
+def invalidate_organization_context(sender, instance, created, **kwargs):
+    """
+    Cached contexts carry the organization object; refresh them for its members.
+    """
+    if created:
+        return
+    user_ids = UserProfile.objects.filter(organization=instance).values_list('user_id', flat=True)
+    for user_id in set(user_ids):
+        RequestContext.invalidate(user_id)
@@ -0,0 +1,50 @@
+"""
+Django signals that invalidate cached RBAC permission sets.
+"""
+import logging
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from crmApp.models import Role, RolePermission, UserRole, Employee, UserOrganization, UserProfile
+from crmApp.services.rbac_service import RBACService
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_permissions(sender, instance, **kwargs):
+    """
+    Role changes (e.g. deactivation or deletion) affect every user in the organization.
+    """
+    RBACService.invalidate_organization_permissions(instance.organization_id)
+
+
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+def invalidate_role_permission_grants(sender, instance, **kwargs):
+    """
+    Granting or revoking a permission on a role affects every user in the organization.
+    """
+    try:
+        organization_id = instance.role.organization_id
+    except Role.DoesNotExist:
+        # Role already deleted (cascade) - its own signal handles invalidation
+        return
+    RBACService.invalidate_organization_permissions(organization_id)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=UserOrganization)
+@receiver(post_delete, sender=UserOrganization)
+def invalidate_user_permission_sets(sender, instance, **kwargs):
+    """
+    Role assignments, employee records, profiles and memberships (organization
+    ownership) only affect their own user.
+    """
+    RBACService.invalidate_user_permissions(instance.user_id)
@@ -0,0 +1,79 @@
+"""
+Django signals that keep the search index in sync with Customer, Lead,
+Deal, Issue and Activity changes.
+"""
+import logging
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from crmApp.models import Activity, Customer, Deal, Issue, Lead, Organization, SearchIndexState
+from crmApp.services.search_index_service import SearchIndexService
+
+logger = logging.getLogger(__name__)
+
+
+def _indexed_attnames(sender):
+    spec = SearchIndexService.spec_for(sender)
+    return {sender._meta.get_field(name).attname for name in spec.tracked_fields}
+
+
+def _changed_indexed_fields(sender, instance, created, update_fields):
+    """Indexed attnames this save may have changed."""
+    attnames = _indexed_attnames(sender)
+    if update_fields is not None:
+        attnames &= {sender._meta.get_field(name).attname for name in update_fields}
+    loaded = instance.get_loaded_values()
+    if created or loaded is None:
+        return attnames
+    return {attname for attname in attnames if loaded.get(attname) != getattr(instance, attname, None)}
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Lead)
+@receiver(post_save, sender=Deal)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Activity)
+def update_search_index_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Reindex the record when a field that is searched changed.
+    """
+    changed = _changed_indexed_fields(sender, instance, created, update_fields)
+    if not changed:
+        return
+
+    try:
+        SearchIndexService.index_instance(instance)
+
+        # Deals are found by their customer's name as well
+        if sender is Customer and not created and 'name' in changed:
+            SearchIndexService.reindex_queryset(Deal.objects.filter(customer=instance))
+    except Exception as e:
+        logger.error(f"Error updating search index for {sender.__name__} {instance.pk}: {e}", exc_info=True)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Lead)
+@receiver(post_delete, sender=Deal)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Activity)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    """
+    Remove the record's document (its postings cascade).
+    """
+    try:
+        SearchIndexService.remove_instance(instance)
+    except Exception as e:
+        logger.error(f"Error removing {sender.__name__} {instance.pk} from search index: {e}", exc_info=True)
+
+
+@receiver(post_save, sender=Organization)
+def mark_new_organization_indexed(sender, instance, created, **kwargs):
+    """
+    A new organization has no records yet, so its (empty) index is complete.
+    """
+    if created:
+        SearchIndexState.objects.get_or_create(
+            organization=instance,
+            defaults={'built_at': timezone.now()}
+        )
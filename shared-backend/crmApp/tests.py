@@ -1,3 +1,3180 @@
-from django.test import TestCase
+import asyncio
+import gc
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from google.genai import types
+from rest_framework.test import APIClient
+
+from crmApp.middleware import set_current_user
+from crmApp.models import (
+    Activity, AnalyticsDailyRollup, AnalyticsRollupState, AuditLog, BackgroundJob, Conversation, ConversationTurn, Customer, Deal, Employee, GeminiConversation, Issue, JitsiCallSession, Lead, LinearSyncJob, LinearSyncState, LinearWebhookDelivery, Message, NumberSequence, Order, Organization, Permission, Pipeline,
+    PipelineStage, Role, RolePermission, SearchDocument, SearchIndexState, TelegramUpdate, TelegramUser, User, UserOrganization, UserPresence, UserProfile, UserRole,
+)
+from crmApp.serializers import LeadListSerializer
+from crmApp.services.analytics_rollup_service import AnalyticsRollupService
+from crmApp.services.analytics_service import AnalyticsService
+from crmApp.services.activity_timeline_service import ActivityTimelineService, InvalidTimelineCursor
+from crmApp.services.audit_log_writer import AuditLogWriter
+from crmApp.services.gemini_service import GeminiClientPool, GeminiService
+from crmApp.services.gemini_tools import CRMToolContext, list_activities_tool, list_leads_tool
+from crmApp.services.http_client import CircuitBreaker, CircuitOpenError, HTTPClient
+from crmApp.services.issue_linear_service import IssueLinearService
+from crmApp.services.jitsi_service import jitsi_service
+from crmApp.services.job_queue import JobQueue, JobWorker, job
+from crmApp.services.message_service import MessageService
+from crmApp.services.presence_service import PresenceService
+from crmApp.services.rbac_service import RBACService
+from crmApp.services.prompt_builder import (
+    SUMMARY_TURN_HEADER, build_conversation_context, fold_truncated_turns, render_system_prompt
+)
+from crmApp.services.realtime_dispatcher import RealtimeDispatcher, realtime_dispatcher
+from crmApp.services.search_index_service import SearchIndexService
+from crmApp.services.sequence_service import SequenceService
+from crmApp.services import telegram_update_queue
+from crmApp.services.telegram_update_queue import TelegramUpdateQueue
+from crmApp.services.tool_projections import TRUNCATION_MARK, InvalidToolCursor, get_projection
+from crmApp.signals import audit_signals
+from crmApp.utils.request_context import RequestContext
+from crmApp.utils.shared_cache import cache_is_shared, shared_timeout
+from mcp_tools.customer_tools import register_customer_tools
+
+# A cache shared between processes (the default cache is per-process)
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'crmapp-test-cache'),
+    }
+}
+
+
+class RBACPermissionCacheTest(TestCase):
+    """
+    Compiled permission sets are cached in the shared cache and invalidated
+    when roles, grants, assignments or ownership change.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.user = User.objects.create_user('employee@acme.test', 'employee', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='employee',
+            is_primary=True,
+        )
+        cls.role = Role.objects.create(organization=cls.organization, name='Sales', slug='sales')
+        cls.read_leads = Permission.objects.create(organization=cls.organization, resource='lead', action='read')
+        cls.grant = RolePermission.objects.create(role=cls.role, permission=cls.read_leads)
+        Employee.objects.create(
+            organization=cls.organization,
+            user=cls.user,
+            first_name='Em',
+            last_name='Ployee',
+            email='employee@acme.test',
+            role=cls.role,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def check(self, resource='lead', action='read'):
+        # A fresh user object per check, like a new request
+        user = User.objects.get(pk=self.user.pk)
+        return RBACService.check_permission(user, self.organization, resource, action)
+
+    def test_warm_permission_check_runs_no_queries(self):
+        self.assertTrue(self.check())
+
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(RBACService.check_permission(user, self.organization, 'lead', 'read'))
+            self.assertFalse(RBACService.check_permission(user, self.organization, 'lead', 'delete'))
+        self.assertEqual(len(queries), 0)
+
+        # Within a request the set is memoized on the user: no cache reads either
+        with CaptureQueriesContext(connection) as queries:
+            RBACService.check_permission(user, self.organization, 'deal', 'read')
+        self.assertEqual(len(queries), 0)
+
+    def test_revoked_and_granted_permissions_apply_immediately(self):
+        self.assertTrue(self.check())
+
+        self.grant.delete()
+        self.assertFalse(self.check())
+
+        UserRole.objects.create(
+            user=self.user,
+            organization=self.organization,
+            role=Role.objects.create(organization=self.organization, name='Readers', slug='readers'),
+        ).role.role_permissions.create(permission=self.read_leads)
+        self.assertTrue(self.check())
+
+    def test_ownership_change_invalidates(self):
+        self.assertFalse(self.check('deal', 'delete'))
+
+        membership = UserOrganization.objects.create(user=self.user, organization=self.organization, is_owner=True)
+        self.assertTrue(self.check('deal', 'delete'))
+
+        membership.is_owner = False
+        membership.save()
+        self.assertFalse(self.check('deal', 'delete'))
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_shared_cache_keeps_its_timeout(self):
+        self.assertTrue(cache_is_shared())
+        self.assertEqual(shared_timeout(3600), 3600)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        LOCAL_CACHE_MAX_TIMEOUT=5,
+    )
+    def test_per_process_cache_only_keeps_entries_briefly(self):
+        self.assertFalse(cache_is_shared())
+        self.assertEqual(shared_timeout(3600), 5)
+        self.assertEqual(shared_timeout(None), 5)
+
+        with mock.patch('crmApp.services.rbac_service.cache.set') as cache_set:
+            self.check()
+        self.assertEqual(cache_set.call_args.args[2], 5)
+
+
+class CustomerListQueryCountTest(TestCase):
+    """
+    /api/customers/ must cost a constant number of queries regardless of page size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+
+        for i in range(100):
+            lead = Lead.objects.create(
+                organization=cls.organization,
+                name=f'Lead {i}',
+                estimated_value=Decimal('50.00'),
+            )
+            customer = Customer.objects.create(
+                organization=cls.organization,
+                name=f'Customer {i}',
+                email=f'customer{i}@acme.test',
+                converted_from_lead=lead,
+            )
+            Deal.objects.create(
+                organization=cls.organization,
+                title=f'Direct deal {i}',
+                customer=customer,
+                value=Decimal('100.00'),
+                is_won=True,
+            )
+            Deal.objects.create(
+                organization=cls.organization,
+                title=f'Lead deal {i}',
+                lead=lead,
+                value=Decimal('25.00'),
+                is_won=True,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _list_customers(self, page_size):
+        # Compare cold requests: force_authenticate reuses the user object the
+        # request context is memoized on, and the context is cached across requests
+        RequestContext.forget(self.user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/customers/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return response, len(queries)
+
+    def test_query_count_is_constant_across_page_sizes(self):
+        _, queries_25 = self._list_customers(25)
+        _, queries_100 = self._list_customers(100)
+
+        self.assertEqual(queries_25, queries_100)
+
+    def test_total_value_includes_direct_and_converted_lead_deals(self):
+        response, _ = self._list_customers(25)
+
+        for row in response.data['results']:
+            self.assertEqual(row['total_value'], 125.0)
+
+    def test_total_value_falls_back_to_lead_estimate(self):
+        Deal.objects.all().delete()
+
+        response, _ = self._list_customers(25)
+
+        for row in response.data['results']:
+            self.assertEqual(row['total_value'], 50.0)
+
+
+class CursorPaginationTest(TestCase):
+    """
+    ?cursor= switches list endpoints to keyset pages on (-created_at, -id).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+        for i in range(30):
+            Customer.objects.create(organization=cls.organization, name=f'Customer {i}')
+
+        # Ties on created_at must be broken by id
+        Customer.objects.filter(name__in=[f'Customer {i}' for i in range(10, 20)]).update(
+            created_at=timezone.now()
+        )
+        cls.expected = list(Customer.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        RequestContext.forget(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_walks_every_row_once_in_both_directions(self):
+        seen, pages = [], []
+        url, params = '/api/customers/', {'cursor': '', 'page_size': 7}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([row['id'] for row in response.data['results']])
+            seen.extend(pages[-1])
+            url, params = response.data['next'], None
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 5)
+
+        # Step back from the last page
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([row['id'] for row in response.data['results']], pages[-2])
+
+    def test_no_count_query_unless_approximate_count_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/customers/', {'cursor': '', 'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+        with mock.patch('crmApp.pagination.CursorResultsSetPagination.approximate_count_limit', 20):
+            response = self.client.get('/api/customers/', {'cursor': '', 'count': 'approximate'})
+        self.assertEqual(response.data['count'], 20)
+        self.assertFalse(response.data['count_is_exact'])
+
+    def test_ordering_is_rejected_in_cursor_mode(self):
+        response = self.client.get('/api/activities/', {'cursor': '', 'ordering': 'scheduled_at'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data['details'])
+
+        response = self.client.get('/api/activities/', {'page': 1, 'ordering': 'scheduled_at'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.client.get('/api/customers/', {'page': 2, 'page_size': 7})
+
+        self.assertEqual(response.data['count'], 30)
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIn('page=3', response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/customers/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class AuditSnapshotTest(TestCase):
+    """
+    Audit diffs come from instance-scoped snapshots taken when the row is
+    loaded, not from a process-global dict filled by a pre_save SELECT.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+        cls.pipeline = Pipeline.objects.create(organization=cls.organization, name='Sales')
+        cls.first_stage = PipelineStage.objects.create(pipeline=cls.pipeline, name='Prospect', order=1)
+        cls.second_stage = PipelineStage.objects.create(pipeline=cls.pipeline, name='Proposal', order=2)
+        cls.deal = Deal.objects.create(
+            organization=cls.organization,
+            title='Deal',
+            pipeline=cls.pipeline,
+            stage=cls.first_stage,
+            value=Decimal('100.00'),
+        )
+
+    def setUp(self):
+        set_current_user(self.user)
+        self.addCleanup(set_current_user, None)
+
+    def test_no_global_snapshot_store(self):
+        self.assertFalse(hasattr(audit_signals, '_original_data'))
+
+    def test_update_does_not_reselect_row(self):
+        deal = Deal.objects.get(pk=self.deal.pk)
+        deal.title = 'Renamed'
+
+        with CaptureQueriesContext(connection) as queries:
+            deal.save()
+
+        deal_selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and '"deals"' in query['sql']
+        ]
+        self.assertEqual(deal_selects, [])
+
+    def test_consecutive_saves_diff_against_last_save(self):
+        deal = Deal.objects.get(pk=self.deal.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deal.stage = self.second_stage
+            deal.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            deal.title = 'Renamed'
+            deal.save()
+
+        updates = list(
+            AuditLog.objects.filter(action='update', resource_id=deal.pk).order_by('id')
+        )
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            updates[0].changes,
+            {'stage': {'old': str(self.first_stage.pk), 'new': str(self.second_stage.pk)}}
+        )
+        self.assertEqual(updates[1].changes, {'title': {'old': 'Deal', 'new': 'Renamed'}})
+        self.assertTrue(AuditLog.objects.filter(action='moved', resource_id=deal.pk).exists())
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class ConcurrentAuditSnapshotTest(TransactionTestCase):
+    """
+    Threads saving different rows at the same time each get audit entries
+    with only their own row's changes, and no snapshot outlives its instance.
+    """
+
+    THREADS = 8
+    ITERATIONS = 15
+
+    def test_concurrent_updates_have_no_cross_talk_or_leaks(self):
+        organization = Organization.objects.create(name='Acme', slug='acme')
+        user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(user=user, organization=organization, profile_type='vendor', is_primary=True)
+        deals = [
+            Deal.objects.create(organization=organization, title=f'Deal {index}', value=Decimal(index))
+            for index in range(self.THREADS)
+        ]
+        start = threading.Barrier(self.THREADS)
+        errors = []
+        alive = []
+        lock = threading.Lock()
+
+        def worker(thread_index):
+            set_current_user(user)
+            try:
+                start.wait()
+                for iteration in range(self.ITERATIONS):
+                    deal = Deal.objects.get(pk=deals[thread_index].pk)
+                    deal.title = f'Deal {thread_index} / {iteration}'
+                    deal.value = Decimal(thread_index * 1000 + iteration + 1)
+                    deal.save()
+                    with lock:
+                        alive.append(weakref.ref(deal))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                set_current_user(None)
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.collect()
+
+        self.assertEqual(errors, [])
+        for index, deal in enumerate(deals):
+            updates = list(
+                AuditLog.objects.filter(action='update', resource_type='deal', resource_id=deal.pk).order_by('id')
+            )
+            self.assertEqual(len(updates), self.ITERATIONS)
+            old_title = f'Deal {index}'
+            for iteration, entry in enumerate(updates):
+                new_title = f'Deal {index} / {iteration}'
+                self.assertEqual(set(entry.changes), {'title', 'value'})
+                self.assertEqual(entry.changes['title'], {'old': old_title, 'new': new_title})
+                self.assertEqual(Decimal(entry.changes['value']['new']), Decimal(index * 1000 + iteration + 1))
+                old_title = new_title
+
+        self.assertFalse(hasattr(audit_signals, '_original_data'))
+        self.assertEqual(len(alive), self.THREADS * self.ITERATIONS)
+        self.assertEqual([ref for ref in alive if ref() is not None], [])
+
+
+class AuditLogWriterTest(TransactionTestCase):
+    """
+    Audit entries are written after commit, in batches, and never lost to a
+    bad row or a shutdown.
+
+    The background worker writes on its own connection, so rows are committed.
+    """
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='Acme', slug='acme')
+        self.writer = AuditLogWriter()
+        self.addCleanup(self.writer.shutdown)
+
+    def _entry(self, description, **fields):
+        return AuditLog(**{
+            'organization': self.organization,
+            'user_email': 'vendor@acme.test',
+            'user_profile_type': 'vendor',
+            'action': 'update',
+            'resource_type': 'deal',
+            'resource_id': 1,
+            'description': description,
+            **fields,
+        })
+
+    def _written(self):
+        return sorted(AuditLog.objects.filter(organization=self.organization).values_list('description', flat=True))
+
+    def _wait_for(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self._written()) < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    @override_settings(AUDIT_LOG_ASYNC=False)
+    def test_rolled_back_entries_are_dropped(self):
+        with transaction.atomic():
+            self.writer.enqueue(self._entry('kept'))
+            try:
+                with transaction.atomic():
+                    self.writer.enqueue(self._entry('rolled back'))
+                    raise RuntimeError('abort')
+            except RuntimeError:
+                pass
+            # Nothing is written before the transaction commits
+            self.assertEqual(self._written(), [])
+
+        self.assertEqual(self._written(), ['kept'])
+        self.assertEqual(self.writer.pending, 0)
+
+    @override_settings(AUDIT_LOG_ASYNC=True, AUDIT_LOG_BATCH_SIZE=10, AUDIT_LOG_FLUSH_INTERVAL=60)
+    def test_bad_entry_falls_back_to_single_writes(self):
+        self.writer.enqueue(self._entry('first'))
+        self.writer.enqueue(self._entry('bad', user_email=None))
+        self.writer.enqueue(self._entry('second'))
+
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self._written(), ['first', 'second'])
+        self.assertEqual(self.writer.pending, 0)
+
+    @override_settings(AUDIT_LOG_ASYNC=True, AUDIT_LOG_BATCH_SIZE=3, AUDIT_LOG_FLUSH_INTERVAL=60)
+    def test_worker_flushes_at_batch_size(self):
+        self.writer.enqueue(self._entry('1'))
+        self.writer.enqueue(self._entry('2'))
+        time.sleep(0.1)
+        self.assertEqual(self._written(), [])
+        self.assertEqual(self.writer.pending, 2)
+
+        self.writer.enqueue(self._entry('3'))
+        self._wait_for(3)
+
+        self.assertEqual(self._written(), ['1', '2', '3'])
+        self.assertEqual(self.writer.pending, 0)
+
+    @override_settings(AUDIT_LOG_ASYNC=True, AUDIT_LOG_BATCH_SIZE=100, AUDIT_LOG_FLUSH_INTERVAL=60)
+    def test_shutdown_flushes_buffered_entries(self):
+        self.writer.enqueue(self._entry('1'))
+        self.writer.enqueue(self._entry('2'))
+        self.assertEqual(self.writer.pending, 2)
+
+        self.writer.shutdown()
+
+        self.assertEqual(self._written(), ['1', '2'])
+        self.assertEqual(self.writer.pending, 0)
+        self.assertIsNone(self.writer._thread)
+
+
+class RequestContextCacheTest(TestCase):
+    """
+    Cached request contexts are dropped as soon as memberships, profiles or
+    roles change.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.other_organization = Organization.objects.create(name='Globex', slug='globex')
+        cls.user = User.objects.create_user('employee@acme.test', 'employee', 'password')
+        cls.profile = UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='employee',
+            is_primary=True,
+        )
+        cls.role = Role.objects.create(organization=cls.organization, name='Sales', slug='sales')
+        Employee.objects.create(
+            organization=cls.organization,
+            user=cls.user,
+            first_name='Em',
+            last_name='Ployee',
+            email='employee@acme.test',
+            role=cls.role,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def context(self):
+        # A fresh user object per lookup, like a new request
+        return RequestContext.for_user(User.objects.get(pk=self.user.pk))
+
+    def test_cached_context_skips_the_database(self):
+        self.assertEqual(self.context().organization, self.organization)
+
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            context = RequestContext.for_user(user)
+        self.assertEqual(context.accessible_organization_ids, (self.organization.id,))
+        self.assertEqual(len(queries), 0)
+
+    def test_removed_membership_drops_the_organization(self):
+        self.assertEqual(self.context().accessible_organization_ids, (self.organization.id,))
+
+        self.profile.status = 'inactive'
+        self.profile.save()
+        context = self.context()
+        self.assertIsNone(context.organization)
+        self.assertEqual(context.accessible_organization_ids, ())
+
+        UserProfile.objects.filter(pk=self.profile.pk).update(status='active')
+        self.profile.delete()
+        self.assertIsNone(self.context().organization)
+
+    def test_switching_primary_profile(self):
+        self.assertEqual(self.context().organization, self.organization)
+
+        self.profile.is_primary = False
+        self.profile.save()
+        UserProfile.objects.create(
+            user=self.user,
+            organization=self.other_organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+        context = self.context()
+        self.assertEqual(context.organization, self.other_organization)
+        self.assertEqual(context.profile_type, 'vendor')
+
+    def test_role_change_updates_the_permission_set(self):
+        self.assertFalse(self.context().permission_set.has('lead', 'read'))
+
+        permission = Permission.objects.create(organization=self.organization, resource='lead', action='read')
+        RolePermission.objects.create(role=self.role, permission=permission)
+        self.assertTrue(self.context().permission_set.has('lead', 'read'))
+
+        employee = Employee.objects.get(user=self.user)
+        employee.role = None
+        employee.save()
+        self.assertFalse(self.context().permission_set.has('lead', 'read'))
+
+    def test_gemini_user_context_is_built_from_the_cached_context(self):
+        permission = Permission.objects.create(organization=self.organization, resource='lead', action='create')
+        RolePermission.objects.create(role=self.role, permission=permission)
+        vendor_profile = UserProfile.objects.create(
+            user=self.user, organization=self.other_organization, profile_type='vendor'
+        )
+        service = GeminiService(client=FakeGeminiClient([]))
+        telegram_user = SimpleNamespace(selected_profile_id=vendor_profile.pk)
+        service.get_user_context_sync(User.objects.get(pk=self.user.pk))
+        service.get_user_context_sync(User.objects.get(pk=self.user.pk), telegram_user)
+
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user_context = service.get_user_context_sync(user)
+            telegram_context = service.get_user_context_sync(user, telegram_user)
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(
+            (user_context['role'], user_context['organization_id'], user_context['permissions']),
+            ('employee', self.organization.id, ['lead:create'])
+        )
+        self.assertEqual(
+            (telegram_context['role'], telegram_context['organization_id']), ('vendor', self.other_organization.id)
+        )
+
+
+class FakeGeminiClient:
+    """
+    Stands in for genai.Client: every generate_content_stream call streams
+    the next scripted turn (a list of parts, one chunk per part).
+    """
+
+    def __init__(self, turns, usage=None):
+        self.turns = list(turns)
+        self.usage = usage
+        self.requests = []
+        self.aio = SimpleNamespace(models=self)
+
+    async def generate_content_stream(self, model, contents, config):
+        self.requests.append({'contents': list(contents), 'config': config})
+        parts = self.turns.pop(0)
+
+        async def stream():
+            for part in parts:
+                yield SimpleNamespace(
+                    candidates=[SimpleNamespace(
+                        content=types.Content(role='model', parts=[part]),
+                        finish_reason=None,
+                    )],
+                    usage_metadata=self.usage,
+                )
+
+        return stream()
+
+
+def function_call_part(function_name, **args):
+    return types.Part(function_call=types.FunctionCall(name=function_name, args=args))
+
+
+class GeminiToolLoopTest(SimpleTestCase):
+    """
+    chat_stream executes every function call of a turn, feeds all responses
+    back in one request and keeps going until Gemini answers in text.
+    """
+
+    def run_loop(self, client, handlers):
+        service = GeminiService(client=client)
+        service._tool_handlers = handlers
+        contents = [types.Content(role='user', parts=[types.Part(text='How are we doing?')])]
+
+        async def collect():
+            tool_context = CRMToolContext({'user_id': 1, 'organization_id': 1, 'role': 'vendor'})
+            return [
+                text async for text in service._run_tool_loop(client, contents, 'system', [], tool_context)
+            ]
+
+        return ''.join(async_to_sync(collect)())
+
+    def test_parallel_calls_are_answered_in_one_follow_up(self):
+        client = FakeGeminiClient([
+            [function_call_part('list_customers', limit=5), function_call_part('get_deal_stats')],
+            [types.Part(text='2 customers, 1 open deal.')],
+        ])
+        started = []
+        both_started = asyncio.Event()
+
+        def handler(name, result):
+            async def run(ctx, **kwargs):
+                started.append(name)
+                if len(started) == 2:
+                    both_started.set()
+                # Only completes if the other call is running at the same time
+                await asyncio.wait_for(both_started.wait(), timeout=2)
+                return result
+            return run
+
+        output = self.run_loop(client, {
+            'list_customers': handler('list_customers', [{'name': 'A'}, {'name': 'B'}]),
+            'get_deal_stats': handler('get_deal_stats', {'open': 1}),
+        })
+
+        self.assertEqual(output, '2 customers, 1 open deal.')
+        self.assertEqual(len(client.requests), 2)
+        model_turn, response_turn = client.requests[1]['contents'][-2:]
+        self.assertEqual([part.function_call.name for part in model_turn.parts], ['list_customers', 'get_deal_stats'])
+        self.assertEqual(
+            [(part.function_response.name, part.function_response.response) for part in response_turn.parts],
+            [
+                ('list_customers', {'customers': [{'name': 'A'}, {'name': 'B'}], 'count': 2}),
+                ('get_deal_stats', {'open': 1}),
+            ],
+        )
+
+    def test_calls_that_depend_on_earlier_results_take_more_rounds(self):
+        client = FakeGeminiClient([
+            [function_call_part('list_customers')],
+            [function_call_part('get_customer', customer_id=7)],
+            [types.Part(text='Customer 7 is active.')],
+        ])
+        calls = []
+
+        async def list_customers(ctx, **kwargs):
+            calls.append(('list_customers', kwargs))
+            return [{'id': 7}]
+
+        async def get_customer(ctx, **kwargs):
+            calls.append(('get_customer', kwargs))
+            return {'id': 7, 'status': 'active'}
+
+        output = self.run_loop(client, {'list_customers': list_customers, 'get_customer': get_customer})
+
+        self.assertEqual(output, 'Customer 7 is active.')
+        self.assertEqual(calls, [('list_customers', {}), ('get_customer', {'customer_id': 7})])
+        self.assertEqual(len(client.requests), 3)
+
+    def test_writes_run_in_request_order(self):
+        client = FakeGeminiClient([
+            [function_call_part('create_lead', name='First'), function_call_part('create_lead', name='Second')],
+            [types.Part(text='Created both.')],
+        ])
+        created = []
+
+        async def create_lead(ctx, name):
+            await asyncio.sleep(0.05 if name == 'First' else 0)
+            created.append(name)
+            return {'message': f'Created {name}'}
+
+        self.run_loop(client, {'create_lead': create_lead})
+
+        self.assertEqual(created, ['First', 'Second'])
+
+    @override_settings(GEMINI_MAX_TOOL_ROUNDS=1)
+    def test_function_calling_is_disabled_after_max_rounds(self):
+        client = FakeGeminiClient([
+            [function_call_part('get_deal_stats')],
+            [types.Part(text='Done.')],
+        ])
+
+        async def get_deal_stats(ctx):
+            return {'open': 1}
+
+        output = self.run_loop(client, {'get_deal_stats': get_deal_stats})
+
+        self.assertEqual(output, 'Done.')
+        modes = [
+            request['config'].tool_config.function_calling_config.mode
+            for request in client.requests
+        ]
+        self.assertEqual(modes, [types.FunctionCallingConfigMode.AUTO, types.FunctionCallingConfigMode.NONE])
+
+    def test_tool_errors_are_reported_to_gemini(self):
+        client = FakeGeminiClient([
+            [function_call_part('get_customer', customer_id=1), function_call_part('drop_database')],
+            [types.Part(text='Sorry.')],
+        ])
+
+        async def get_customer(ctx, customer_id):
+            raise ValueError('Customer not found')
+
+        self.run_loop(client, {'get_customer': get_customer})
+
+        responses = [part.function_response.response for part in client.requests[1]['contents'][-1].parts]
+        self.assertEqual(responses, [
+            {'error': 'Error executing get_customer: Customer not found'},
+            {'error': 'Unknown function: drop_database'},
+        ])
+
+
+class GeminiClientPoolTest(SimpleTestCase):
+    """
+    Clients are reused across requests, but never shared with a request
+    running on another live event loop.
+    """
+
+    def test_released_client_is_reused(self):
+        pool = GeminiClientPool()
+        client = pool.acquire('key')
+        pool.release('key', client)
+
+        self.assertIs(pool.acquire('key'), client)
+        self.assertIsNot(pool.acquire('key'), client)
+
+    def test_client_of_another_live_loop_is_not_reused(self):
+        pool = GeminiClientPool()
+
+        async def checkout():
+            return pool.acquire('key')
+
+        other_loop = asyncio.new_event_loop()
+        try:
+            client = other_loop.run_until_complete(checkout())
+
+            async def release():
+                pool.release('key', client)
+
+            other_loop.run_until_complete(release())
+            self.assertIsNot(async_to_sync(checkout)(), client)
+        finally:
+            other_loop.close()
+
+        # Once its loop has closed the client can be handed out again
+        self.assertIs(async_to_sync(checkout)(), client)
+
+
+
+class FakeChatStream:
+    """
+    Stands in for GeminiService.chat_stream: streams chunks only once
+    open_streams sessions are streaming at the same time.
+    """
+
+    def __init__(self, open_streams, chunks=3):
+        self.open_streams = open_streams
+        self.chunks = chunks
+        self.in_flight = 0
+        self.peak_threads = 0
+        self.closed = 0
+        self.all_open = asyncio.Event()
+
+    async def __call__(self, message, user, conversation_history=None, **options):
+        self.in_flight += 1
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+        if self.in_flight >= self.open_streams:
+            self.all_open.set()
+        try:
+            await asyncio.wait_for(self.all_open.wait(), timeout=20)
+            for index in range(self.chunks):
+                await asyncio.sleep(0.01)
+                yield f'chunk {index} '
+        finally:
+            self.in_flight -= 1
+            self.closed += 1
+
+
+@override_settings(GEMINI_API_KEY='test-key')
+class GeminiChatStreamTest(TestCase):
+    """
+    /api/gemini/chat/ streams on the event loop: concurrent chats do not
+    hold a thread each, and a disconnect closes the upstream stream.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('chat@acme.test', 'chat', 'password')
+
+    def setUp(self):
+        self.client = AsyncClient()
+        self.client.force_login(self.user)
+
+    async def open_chat(self, message):
+        response = await self.client.post('/api/gemini/chat/', {'message': message}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        return response
+
+    def test_concurrent_streams_share_one_event_loop(self):
+        sessions = 200
+        fake_stream = FakeChatStream(open_streams=sessions)
+        threads_before = threading.active_count()
+
+        async def chat(index):
+            response = await self.open_chat(f'question {index}')
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        async def run_all():
+            return await asyncio.gather(*(chat(index) for index in range(sessions)))
+
+        with mock.patch.object(GeminiService, 'chat_stream', fake_stream), \
+                self.assertLogs('crmApp.viewsets.gemini', level='INFO'):
+            bodies = async_to_sync(run_all)()
+
+        self.assertEqual(fake_stream.closed, sessions)
+        # All streams were open at once without a thread per stream
+        self.assertLess(fake_stream.peak_threads - threads_before, 10)
+        for body in bodies:
+            events = [json.loads(line[len('data: '):]) for line in body.split('\n\n') if line]
+            self.assertEqual([event['type'] for event in events], ['connected'] + ['message'] * 3 + ['completed'])
+        conversations = GeminiConversation.objects.filter(user=self.user)
+        self.assertEqual(conversations.count(), sessions)
+        self.assertEqual(
+            {tuple(message['role'] for message in conversation.all_messages()) for conversation in conversations},
+            {('user', 'assistant')}
+        )
+
+    def test_disconnect_closes_upstream_stream(self):
+        fake_stream = FakeChatStream(open_streams=1, chunks=100)
+
+        async def disconnect_after_first_chunk():
+            response = await self.open_chat('question')
+            received = []
+
+            async def consume():
+                async for chunk in response.streaming_content:
+                    received.append(chunk)
+
+            consumer = asyncio.ensure_future(consume())
+            while len(received) < 2:
+                await asyncio.sleep(0.005)
+            # What Django's ASGI handler does when the client goes away
+            consumer.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await consumer
+            return received
+
+        with mock.patch.object(GeminiService, 'chat_stream', fake_stream), \
+                self.assertLogs('crmApp.viewsets.gemini', level='INFO') as logs:
+            received = async_to_sync(disconnect_after_first_chunk)()
+
+        self.assertLess(len(received), 10)
+        self.assertEqual(fake_stream.closed, 1)
+        self.assertTrue(any('Client disconnected' in line for line in logs.output))
+        conversation = GeminiConversation.objects.get(user=self.user)
+        self.assertEqual([message['role'] for message in conversation.all_messages()], ['user'])
+
+
+
+class ConversationTurnTest(TestCase):
+    """
+    Conversation messages are appended as rows, read back as a window and
+    legacy JSON histories are moved over in order.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('turns@acme.test', 'turns', 'password')
+
+    def test_append_cost_does_not_grow_with_history(self):
+        conversation = GeminiConversation.objects.create(user=self.user, conversation_id='long')
+        conversation.add_message('user', 'First question about deals')
+
+        with CaptureQueriesContext(connection) as first:
+            conversation.add_message('assistant', 'answer 1')
+        for index in range(40):
+            conversation.add_message('user', f'question {index}')
+        with CaptureQueriesContext(connection) as later:
+            conversation.add_message('assistant', 'answer 2')
+
+        self.assertEqual(len(later), len(first))
+        self.assertFalse(any('gemini_conversations' in query['sql'] and 'messages' in query['sql']
+                             for query in later.captured_queries))
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 43)
+        self.assertEqual(conversation.title, 'First question about deals')
+        self.assertEqual(list(conversation.turns.order_by('seq').values_list('seq', flat=True)), list(range(1, 44)))
+
+    def test_window_returns_latest_turns_within_budget(self):
+        conversation = GeminiConversation.objects.create(user=self.user, conversation_id='window')
+        for index in range(6):
+            conversation.add_message('user' if index % 2 == 0 else 'assistant', f'message {index} ' + 'x' * 40)
+
+        self.assertEqual(
+            [turn['content'][:9] for turn in conversation.recent_messages(limit=3)],
+            ['message 3', 'message 4', 'message 5']
+        )
+        # Each message is ~13 tokens
+        self.assertEqual(
+            [turn['content'][:9] for turn in conversation.recent_messages(limit=10, token_budget=30)],
+            ['message 4', 'message 5']
+        )
+        with self.assertNumQueries(1):
+            conversation.recent_messages(limit=10)
+
+    def test_legacy_histories_are_moved_in_order(self):
+        conversation = GeminiConversation.objects.create(
+            user=self.user,
+            conversation_id='legacy',
+            messages=[
+                {'role': 'user', 'content': 'old question', 'timestamp': '2025-01-01T10:00:00+00:00'},
+                {'role': 'assistant', 'content': 'old answer', 'timestamp': '2025-01-01T10:00:05+00:00'},
+            ]
+        )
+        # A message written after the deploy, before the command ran
+        conversation.add_message('user', 'new question')
+        telegram_user = TelegramUser.objects.create(
+            chat_id=555,
+            user=self.user,
+            conversation_history=[{'role': 'user', 'content': 'hi bot'}, {'role': 'assistant', 'content': 'hello'}]
+        )
+
+        out = StringIO()
+        call_command('migrate_conversation_history', stdout=out)
+
+        self.assertIn('Moved 4 conversation turns', out.getvalue())
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.messages, [])
+        self.assertEqual(conversation.message_count, 3)
+        history = conversation.all_messages()
+        self.assertEqual([message['content'] for message in history], ['old question', 'old answer', 'new question'])
+        self.assertEqual(history[0]['timestamp'], '2025-01-01T10:00:00+00:00')
+
+        telegram_user.refresh_from_db()
+        self.assertEqual(telegram_user.conversation_history, [])
+        telegram_user.add_to_conversation_history('user', 'next')
+        self.assertEqual(
+            telegram_user.recent_conversation_history(limit=2),
+            [{'role': 'assistant', 'content': 'hello'}, {'role': 'user', 'content': 'next'}]
+        )
+
+        # Nothing left to move
+        call_command('migrate_conversation_history', stdout=StringIO())
+        self.assertEqual(ConversationTurn.objects.count(), 6)
+
+        telegram_user.clear_conversation_history()
+        self.assertEqual(telegram_user.recent_conversation_history(), [])
+        self.assertEqual(ConversationTurn.objects.filter(telegram_user=telegram_user).count(), 0)
+
+
+
+class PromptBuilderTest(TestCase):
+    """
+    Only role-relevant prompt sections are sent, history stays within its
+    budget and older turns end up in the conversation's rolling summary.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('prompt@acme.test', 'prompt', 'password')
+
+    def test_system_prompt_only_has_sections_for_the_role(self):
+        vendor = render_system_prompt('vendor', 1, 2, 0)
+        employee = render_system_prompt('employee', 1, 2, 5)
+        customer = render_system_prompt('customer', 1, 2, 3)
+
+        self.assertIn('### Role & Permission Management', vendor)
+        self.assertNotIn('### Role & Permission Management', employee)
+        self.assertIn('### Lead Management & Sales Pipeline', employee)
+        for section in ('### Lead Management', '### Deal Management', '### Analytics & Reporting', '## Example Interactions'):
+            self.assertNotIn(section, customer)
+        for section in ('### Issue/Support Management', '### Order & Payment Management', '## Response Guidelines'):
+            self.assertIn(section, customer)
+        self.assertIn('list_my_vendors_for_issues', customer)
+        self.assertIn('Full access (vendor role)', vendor)
+        self.assertIn('MCP tools available: Ready', customer)
+        self.assertLess(len(customer), len(vendor) * 0.7)
+        # Roles without a definition get every section
+        self.assertIn('### Role & Permission Management', render_system_prompt('admin', 1, 2, 0))
+
+    def test_cached_system_prompts_are_keyed_by_what_they_show(self):
+        service = GeminiService(client=FakeGeminiClient([]))
+        render = GeminiService._render_system_prompt
+        render.cache_clear()
+        self.addCleanup(render.cache_clear)
+        context = {'organization_id': 1, 'role': 'employee', 'permissions': ['lead:read', 'deal:read']}
+
+        first = service._build_system_prompt({**context, 'user_id': 7})
+        # Different permissions of the same count render the same prompt
+        second = service._build_system_prompt({**context, 'user_id': 8, 'permissions': ['lead:read', 'issue:read']})
+
+        self.assertIn('User ID**: 7', first)
+        self.assertIn('Authentication verified (User 8)', second)
+        self.assertEqual(first.replace('User ID**: 7', 'User ID**: 8').replace('(User 7)', '(User 8)'), second)
+        self.assertEqual((render.cache_info().hits, render.cache_info().currsize), (1, 1))
+
+        service._build_system_prompt({**context, 'user_id': 7, 'permissions': ['lead:read']})
+        self.assertEqual(render.cache_info().currsize, 2)
+
+    def test_turns_outside_the_window_are_folded_into_the_summary(self):
+        conversation = GeminiConversation.objects.create(user=self.user, conversation_id='rolling')
+        for index in range(12):
+            conversation.add_message('user' if index % 2 == 0 else 'assistant', f'turn {index}')
+
+        context = build_conversation_context(conversation, max_turns=4, token_budget=1000, summary_budget=1000)
+
+        self.assertEqual([turn['content'] for turn in context.history], ['turn 8', 'turn 9', 'turn 10', 'turn 11'])
+        self.assertEqual(context.stats['folded_turns'], 8)
+        self.assertEqual(context.summary.splitlines()[0], '- User: turn 0')
+        self.assertEqual(context.summary.splitlines()[-1], '- Assistant: turn 7')
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.history_summary, context.summary)
+        self.assertEqual(conversation.history_summary_seq, 8)
+
+        # Only the turns that fell out since the last call are folded
+        conversation.add_message('user', 'turn 12')
+        with self.assertNumQueries(3):
+            context = build_conversation_context(conversation, max_turns=4, token_budget=1000, summary_budget=1000)
+        self.assertEqual(context.stats['folded_turns'], 1)
+        self.assertEqual(context.summary.splitlines()[-1], '- User: turn 8')
+        self.assertEqual(context.history[0]['content'], 'turn 9')
+
+    def test_history_and_summary_stay_within_their_budgets(self):
+        conversation = GeminiConversation.objects.create(user=self.user, conversation_id='budget')
+        for index in range(6):
+            conversation.add_message('user', f'{index} ' + 'word ' * 100)
+
+        context = build_conversation_context(conversation, max_turns=10, token_budget=300, summary_budget=60)
+
+        self.assertEqual(len(context.history), 2)
+        self.assertLessEqual(context.stats['history_tokens'], 300)
+        self.assertLessEqual(context.stats['summary_tokens'], 60)
+        # Long turns are cut in the summary and the oldest lines dropped
+        self.assertTrue(context.summary.splitlines()[-1].startswith('- User: 3 word'))
+        self.assertTrue(context.summary.endswith('…'))
+        self.assertEqual(fold_truncated_turns('', [('user', 'a' * 1000)], 10), '')
+
+    @override_settings(GEMINI_API_KEY='test-key')
+    def test_chat_stream_reports_prompt_size(self):
+        client = FakeGeminiClient(
+            [[types.Part(text='Here you go.')]],
+            usage=SimpleNamespace(prompt_token_count=900, candidates_token_count=12),
+        )
+        service = GeminiService(client=client)
+        user_context = {'user_id': 2, 'organization_id': 1, 'role': 'customer', 'permissions': []}
+        stats = {}
+
+        async def collect():
+            return [text async for text in service.chat_stream(
+                'And my orders?',
+                self.user,
+                conversation_history=[{'role': 'user', 'content': 'Hi'}, {'role': 'assistant', 'content': 'Hello!'}],
+                conversation_summary='- User: asked about issue #4',
+                prompt_stats=stats,
+            )]
+
+        async def get_user_context(user, telegram_user=None):
+            return user_context
+
+        with mock.patch.object(service, 'get_user_context', get_user_context):
+            self.assertEqual(async_to_sync(collect)(), ['Here you go.'])
+
+        # The summary quotes users, so it is a marked user turn, not part of the system instruction
+        system_instruction = client.requests[0]['config'].system_instruction
+        self.assertNotIn('asked about issue #4', system_instruction)
+        contents = client.requests[0]['contents']
+        self.assertEqual(len(contents), 4)
+        self.assertEqual(contents[0].role, 'user')
+        self.assertTrue(contents[0].parts[0].text.startswith(SUMMARY_TURN_HEADER))
+        self.assertIn('- User: asked about issue #4', contents[0].parts[0].text)
+        self.assertEqual(contents[-1].parts[0].text, 'And my orders?')
+        self.assertEqual(stats['history_turns'], 2)
+        self.assertEqual(stats['rounds'], 1)
+        self.assertEqual((stats['gemini_prompt_tokens'], stats['gemini_output_tokens']), (900, 12))
+        self.assertEqual(
+            stats['estimated_prompt_tokens'],
+            stats['system_prompt_tokens'] + stats['summary_tokens'] + stats['history_tokens'] + stats['message_tokens']
+        )
+
+
+class FakeMCP:
+    """Tool registry with the helpers mcp_server attaches to FastMCP"""
+
+    def __init__(self, organization_id):
+        self.tools = {}
+        self.organization_id = organization_id
+
+    def tool(self):
+        def register(func):
+            self.tools[func.__name__] = func
+            return func
+        return register
+
+    def check_permission(self, resource, action):
+        return True
+
+    def get_organization_id(self):
+        return self.organization_id
+
+
+class ToolProjectionTest(TransactionTestCase):
+    """
+    List tools return whitelisted, truncated rows in bounded pages with a
+    cursor for the next one.
+    
+    Tools read on worker threads, so the rows must be committed.
+    """
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='Acme', slug='acme')
+        pipeline = Pipeline.objects.create(organization=self.organization, name='Sales')
+        stage = PipelineStage.objects.create(pipeline=pipeline, name='New', order=1)
+        for i in range(25):
+            Lead.objects.create(
+                organization=self.organization,
+                name=f'Lead {i} ' + 'x' * 300,
+                email=f'lead{i}@acme.test',
+                stage=stage,
+                notes='n' * 5000,
+            )
+        self.context = CRMToolContext({'organization_id': self.organization.id, 'role': 'vendor'})
+
+    def test_pages_are_bounded_and_chain_through_cursors(self):
+        list_leads = async_to_sync(list_leads_tool)
+
+        seen = []
+        cursor = None
+        while True:
+            page = list_leads(self.context, limit=10, cursor=cursor)
+            seen.extend(lead['id'] for lead in page['leads'])
+            if not page['more_available']:
+                break
+            cursor = page['next_cursor']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+        page = list_leads(self.context, limit=1000)
+        self.assertEqual(page['count'], 25)
+        lead = page['leads'][0]
+        self.assertEqual(set(lead), {
+            'id', 'name', 'email', 'stage', 'qualification_status', 'status', 'source', 'is_converted',
+        })
+        self.assertEqual(lead['stage'], 'New')
+        self.assertEqual(len(lead['name']), 80)
+        self.assertTrue(lead['name'].endswith(TRUNCATION_MARK))
+
+        serialized = LeadListSerializer(Lead.objects.filter(organization=self.organization), many=True).data
+        self.assertLess(len(json.dumps(page)), len(json.dumps(serialized, default=str)) / 2)
+
+    def test_page_is_one_query(self):
+        projection = get_projection('list_leads')
+        with CaptureQueriesContext(connection) as queries:
+            page = projection.page(Lead.objects.filter(organization=self.organization), limit=200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(page['count'], 25)
+        self.assertFalse(page['more_available'])
+
+    def test_page_keeps_the_queryset_ordering(self):
+        projection = get_projection('list_leads')
+        leads = Lead.objects.filter(organization=self.organization)
+        ids = list(leads.order_by('id').values_list('id', flat=True))
+
+        self.assertEqual([lead['id'] for lead in projection.page(leads, limit=3)['leads']], ids[:-4:-1])
+        self.assertEqual([lead['id'] for lead in projection.page(leads.order_by('id'), limit=3)['leads']], ids[:3])
+
+        # Search results stay in relevance order
+        best = Lead.objects.create(organization=self.organization, name='Zephyr', email='zephyr@acme.test')
+        Lead.objects.create(organization=self.organization, name='Other', email='zephyr.fan@acme.test')
+        SearchIndexService.rebuild(self.organization.id)
+        searched = SearchIndexService.filter_queryset(leads, 'zephyr', [self.organization.id], fallback_fields=['name'])
+        self.assertEqual(projection.page(searched)['leads'][0]['id'], best.id)
+
+    def test_cursor_is_not_shifted_by_rows_added_between_pages(self):
+        projection = get_projection('list_leads')
+        leads = Lead.objects.filter(organization=self.organization)
+        expected = list(leads.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        first = projection.page(leads, limit=10)
+        Lead.objects.create(organization=self.organization, name='Newer', email='newer@acme.test')
+        Lead.objects.filter(id=first['leads'][0]['id']).delete()
+        second = projection.page(leads, limit=10, cursor=first['next_cursor'])
+        third = projection.page(leads, limit=10, cursor=second['next_cursor'])
+
+        seen = [lead['id'] for page in (first, second, third) for lead in page['leads']]
+        self.assertEqual(seen, expected)
+        self.assertFalse(third['more_available'])
+
+    def test_search_results_page_in_relevance_order(self):
+        projection = get_projection('list_leads')
+        leads = Lead.objects.filter(organization=self.organization)
+        for name in ('Zephyr', 'Zephyr Two', 'Other'):
+            Lead.objects.create(organization=self.organization, name=name, email=f'{name.lower()}.zephyr@acme.test')
+        SearchIndexService.rebuild(self.organization.id)
+        searched = SearchIndexService.filter_queryset(leads, 'zephyr', [self.organization.id], fallback_fields=['name'])
+        expected = [lead['id'] for lead in projection.page(searched, limit=10)['leads']]
+
+        seen = []
+        cursor = None
+        while True:
+            page = projection.page(searched, limit=1, cursor=cursor)
+            seen.extend(lead['id'] for lead in page['leads'])
+            if not page['more_available']:
+                break
+            cursor = page['next_cursor']
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        leads = Lead.objects.filter(organization=self.organization)
+        for cursor in ('10', 'not a cursor', ActivityTimelineService.encode_cursor((timezone.now(), 1, 1))):
+            with self.assertRaises(InvalidToolCursor):
+                get_projection('list_leads').page(leads, cursor=cursor)
+
+    def test_mcp_list_customers_is_projected(self):
+        mcp = FakeMCP(self.organization.id)
+        register_customer_tools(mcp)
+        for i in range(3):
+            Customer.objects.create(organization=self.organization, name=f'Customer {i}', email=f'c{i}@acme.test', notes='n' * 5000)
+
+        page = mcp.tools['list_customers'](limit=2)
+        self.assertEqual(page['count'], 2)
+        self.assertTrue(page['more_available'])
+        self.assertEqual(set(page['customers'][0]) - set(get_projection('list_customers').fields), set())
+
+        rest = mcp.tools['list_customers'](limit=2, cursor=page['next_cursor'])
+        self.assertEqual([customer['name'] for customer in page['customers'] + rest['customers']],
+                         ['Customer 2', 'Customer 1', 'Customer 0'])
+        self.assertIn('error', mcp.tools['list_customers'](cursor='garbage'))
+
+    def test_activities_are_compact(self):
+        now = timezone.now()
+        AuditLog.objects.create(
+            organization=self.organization,
+            user_email='vendor@acme.test',
+            action='update',
+            resource_type='lead',
+            resource_name='Lead 1',
+            description='Updated lead ' + 'd' * 400,
+            created_at=now,
+        )
+        page = async_to_sync(list_activities_tool)(self.context, limit=5)
+
+        self.assertEqual(page['count'], 1)
+        self.assertFalse(page['more_available'])
+        activity = page['activities'][0]
+        self.assertEqual(activity['activity_type'], 'note')
+        self.assertLessEqual(len(activity['title']), 120)
+        json.dumps(page)
+
+
+class ActivityTimelineTest(TestCase):
+    """
+    The activity timeline merges activities, audit logs and calls newest
+    first, reading at most one page per source.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.other_organization = Organization.objects.create(name='Globex', slug='globex')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+        UserOrganization.objects.create(user=cls.user, organization=cls.organization)
+        cls.customer = Customer.objects.create(organization=cls.organization, name='Customer', email='c@acme.test')
+
+        start = timezone.now() - timezone.timedelta(days=1)
+        for i in range(30):
+            activity = Activity.objects.create(
+                organization=cls.organization,
+                activity_type='task' if i % 2 else 'note',
+                title=f'Activity {i}',
+                status='scheduled' if i % 3 else 'completed',
+                customer=cls.customer if i % 5 == 0 else None,
+            )
+            # Every third row shares its timestamp with an audit log entry
+            Activity.objects.filter(pk=activity.pk).update(created_at=start + timezone.timedelta(minutes=i))
+        for i in range(20):
+            log = AuditLog.objects.create(
+                organization=cls.organization,
+                user_email='vendor@acme.test',
+                action='update',
+                resource_type='lead',
+                resource_name=f'Lead {i}',
+                description=f'Audit {i}',
+            )
+            AuditLog.objects.filter(pk=log.pk).update(created_at=start + timezone.timedelta(minutes=i * 3 // 2))
+        for i in range(10):
+            call = JitsiCallSession.objects.create(
+                organization=cls.organization,
+                room_name=f'room-{i}',
+                call_type='audio',
+                status='completed' if i % 2 else 'missed',
+                initiator=cls.user,
+                duration_seconds=65,
+            )
+            JitsiCallSession.objects.filter(pk=call.pk).update(created_at=start + timezone.timedelta(minutes=i * 3))
+        Activity.objects.create(organization=cls.other_organization, activity_type='note', title='Elsewhere')
+
+    def test_pages_cover_every_source_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                page = ActivityTimelineService.page([self.organization.id], limit=7, cursor=cursor)
+            self.assertLessEqual(len(queries), 3)
+            self.assertLessEqual(len(page['activities']), 7)
+            seen.extend(page['activities'])
+            if not page['more_available']:
+                break
+            cursor = page['next_cursor']
+
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(len({row['id'] for row in seen}), 60)
+        timestamps = [row['created_at'] for row in seen]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertNotIn('Elsewhere', [row['title'] for row in seen])
+
+        call = next(row for row in seen if row['activity_type'] == 'call' and row['status'] == 'completed')
+        self.assertTrue(call['id'].startswith('call-'))
+        self.assertIn('(01:05)', call['description'])
+
+    def test_filters_are_applied_per_source(self):
+        def titles(**filters):
+            return [row['title'] for row in ActivityTimelineService.page([self.organization.id], limit=100, **filters)['activities']]
+
+        scheduled = titles(status='scheduled')
+        self.assertEqual(len(scheduled), 20)
+        self.assertTrue(all(title.startswith('Activity') for title in scheduled))
+
+        self.assertEqual(len(titles(activity_type='call')), 10)
+        self.assertEqual(len(titles(status='cancelled')), 5)
+        self.assertEqual(len(titles(customer_id=self.customer.id)), 6)
+        self.assertEqual(titles(search='Audit 7'), ['Audit 7'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidTimelineCursor):
+            ActivityTimelineService.page([self.organization.id], cursor='not-a-cursor')
+
+    def test_timeline_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get('/api/activities/timeline/', {'limit': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertTrue(response.data['more_available'])
+
+        response = client.get('/api/activities/timeline/', {'limit': 50, 'cursor': response.data['next_cursor']})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['next_cursor'])
+
+        self.assertEqual(client.get('/api/activities/timeline/', {'cursor': 'bogus'}).status_code, 400)
+        self.assertEqual(client.get('/api/activities/timeline/', {'customer': 'x'}).status_code, 400)
+
+
+def telegram_message_update(update_id, chat_id=1001, text='hello'):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'from': {'id': chat_id, 'first_name': 'Test'},
+            'chat': {'id': chat_id, 'type': 'private'},
+            'date': 0,
+            'text': text,
+        },
+    }
+
+
+@override_settings(TELEGRAM_WORKER_MODE='inline')
+class TelegramWebhookTest(TestCase):
+    """
+    The webhook persists and acknowledges updates; redeliveries are ignored.
+    """
+
+    def post_update(self, update):
+        return APIClient().post('/api/telegram/webhook/', update, format='json')
+
+    @mock.patch('crmApp.viewsets.telegram.dispatch_telegram_update')
+    def test_redelivered_update_is_processed_once(self, dispatch):
+        update = telegram_message_update(42)
+
+        self.assertEqual(self.post_update(update).status_code, 200)
+        self.assertEqual(self.post_update(update).status_code, 200)
+
+        dispatch.assert_called_once_with(update)
+        record = TelegramUpdate.objects.get(update_id=42)
+        self.assertEqual(record.status, TelegramUpdate.STATUS_DONE)
+        self.assertEqual(record.chat_id, 1001)
+        self.assertEqual(record.attempts, 1)
+
+    @mock.patch('crmApp.viewsets.telegram.dispatch_telegram_update', side_effect=RuntimeError('boom'))
+    def test_failed_update_is_recorded(self, dispatch):
+        self.assertEqual(self.post_update(telegram_message_update(43)).status_code, 200)
+
+        record = TelegramUpdate.objects.get(update_id=43)
+        self.assertEqual(record.status, TelegramUpdate.STATUS_FAILED)
+        self.assertEqual(record.error, 'boom')
+
+    @override_settings(TELEGRAM_WORKER_MODE='external')
+    @mock.patch('crmApp.viewsets.telegram.dispatch_telegram_update')
+    def test_external_mode_only_persists(self, dispatch):
+        self.post_update(telegram_message_update(44))
+
+        dispatch.assert_not_called()
+        self.assertEqual(TelegramUpdate.objects.get(update_id=44).status, TelegramUpdate.STATUS_PENDING)
+
+
+@override_settings(TELEGRAM_WORKER_MODE='thread')
+class TelegramUpdateRecoveryTest(TestCase):
+    """
+    Stored updates that a previous web process acknowledged but never
+    processed are queued again when the in-process queue starts.
+    """
+
+    def test_pending_and_stale_updates_are_queued(self):
+        now = timezone.now()
+        pending = TelegramUpdate.objects.create(update_id=1, chat_id=1001)
+        stale = TelegramUpdate.objects.create(
+            update_id=2, chat_id=1002, status=TelegramUpdate.STATUS_PROCESSING, started_at=now - timedelta(hours=1)
+        )
+        TelegramUpdate.objects.create(
+            update_id=3, chat_id=1003, status=TelegramUpdate.STATUS_PROCESSING, started_at=now
+        )
+        TelegramUpdate.objects.create(update_id=4, chat_id=1004, status=TelegramUpdate.STATUS_DONE)
+        queue = TelegramUpdateQueue()
+
+        with mock.patch.object(queue, 'submit', return_value=True) as submit:
+            self.assertEqual(queue.recover(stale_after=300), 2)
+
+        self.assertEqual(
+            [call.args for call in submit.call_args_list], [(pending.pk, 1001), (stale.pk, 1002)]
+        )
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, TelegramUpdate.STATUS_PENDING)
+
+    def test_recovery_runs_with_the_first_request(self):
+        self.addCleanup(
+            request_started.disconnect, dispatch_uid='crmApp.telegram_update_queue.recover'
+        )
+        telegram_update_queue.recover_on_first_request()
+
+        with mock.patch.object(telegram_update_queue.telegram_update_queue, 'recover') as recover:
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+
+        recover.assert_called_once_with()
+
+
+class TelegramUpdateQueueTest(SimpleTestCase):
+    """
+    Updates of a chat run in order, one at a time; a chat with a full backlog
+    gets further updates rejected and one notice afterwards.
+    """
+
+    def setUp(self):
+        self.processed = []
+        self.running = set()
+        self.overlap = False
+        self.release = threading.Event()
+        self.release.set()
+        self.lock = threading.Lock()
+
+        def run_update(update_pk, handler):
+            chat_id = update_pk // 100
+            with self.lock:
+                self.overlap |= chat_id in self.running
+                self.running.add(chat_id)
+            self.release.wait(5)
+            with self.lock:
+                self.running.discard(chat_id)
+                self.processed.append(update_pk)
+            return True
+
+        patcher = mock.patch.object(telegram_update_queue, 'run_update', run_update)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_updates_of_a_chat_run_in_order(self):
+        queue = TelegramUpdateQueue(workers=4, chat_backlog_limit=20)
+        self.addCleanup(queue.shutdown)
+        for index in range(10):
+            for chat_id in (1, 2, 3):
+                self.assertTrue(queue.submit(chat_id * 100 + index, chat_id))
+
+        self.assertTrue(queue.join(timeout=5))
+        self.assertFalse(self.overlap)
+        for chat_id in (1, 2, 3):
+            chat_updates = [pk for pk in self.processed if pk // 100 == chat_id]
+            self.assertEqual(chat_updates, [chat_id * 100 + index for index in range(10)])
+
+    def test_full_backlog_rejects_updates(self):
+        queue = TelegramUpdateQueue(workers=2, chat_backlog_limit=2)
+        self.addCleanup(queue.shutdown)
+        self.release.clear()
+
+        with mock.patch.object(TelegramUpdateQueue, '_notify_dropped') as notify:
+            self.assertTrue(queue.submit(101, 1))
+            self.assertTrue(queue.submit(102, 1))
+            self.assertFalse(queue.submit(103, 1))
+            self.assertFalse(queue.submit(104, 1))
+            # Other chats are unaffected
+            self.assertTrue(queue.submit(201, 2))
+
+            self.release.set()
+            self.assertTrue(queue.join(timeout=5))
+            queue.shutdown()
+
+        self.assertCountEqual(self.processed, [101, 102, 201])
+        notify.assert_called_once_with(1, 2)
+
+
+class SearchIndexTest(TestCase):
+    """
+    The search index follows model changes and answers ranked, typed searches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.other_organization = Organization.objects.create(name='Globex', slug='globex')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+
+        cls.customer = Customer.objects.create(
+            organization=cls.organization,
+            name='Zoë Müller',
+            email='zoe@northwind.test',
+            phone='+1 (555) 010-2030',
+            company_name='Northwind Traders',
+        )
+        cls.lead = Lead.objects.create(
+            organization=cls.organization,
+            name='Northwind Procurement',
+            email='buyer@northwind.test',
+        )
+        cls.deal = Deal.objects.create(
+            organization=cls.organization,
+            title='Annual renewal',
+            customer=cls.customer,
+            value=Decimal('100.00'),
+        )
+        Customer.objects.create(
+            organization=cls.other_organization,
+            name='Northwind Elsewhere',
+            email='other@globex.test',
+        )
+        for organization in (cls.organization, cls.other_organization):
+            SearchIndexService.rebuild(organization.id)
+
+    def search(self, query, **kwargs):
+        return [
+            (result['type'], result['id'])
+            for result in SearchIndexService.search([self.organization.id], query, **kwargs)
+        ]
+
+    def test_prefix_terms_accents_and_ranking(self):
+        # Name matches outrank company and e-mail matches
+        self.assertEqual(self.search('northw'), [('lead', self.lead.id), ('customer', self.customer.id)])
+        self.assertEqual(self.search('zoe muller'), [('customer', self.customer.id), ('deal', self.deal.id)])
+        self.assertEqual(self.search('northwind procurement'), [('lead', self.lead.id)])
+        self.assertEqual(self.search('555 010'), [('customer', self.customer.id)])
+        self.assertEqual(self.search('northwind', entity_types=['customer']), [('customer', self.customer.id)])
+        self.assertEqual(self.search('nothing'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.customer.name = 'Ada Lovelace'
+        self.customer.company_name = 'Contoso'
+        self.customer.save()
+
+        self.assertEqual(self.search('traders'), [])
+        self.assertEqual(self.search('contoso'), [('customer', self.customer.id)])
+        # Deals are found by their customer's current name
+        self.assertEqual(self.search('lovelace'), [('customer', self.customer.id), ('deal', self.deal.id)])
+
+        self.lead.delete()
+        self.assertEqual(self.search('procurement'), [])
+        self.assertFalse(SearchDocument.objects.filter(entity_type='lead', object_id=self.lead.id).exists())
+
+    def test_search_endpoint(self):
+        RequestContext.forget(self.user)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get('/api/search/', {'q': 'northwind'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result['type'], result['id']) for result in response.data['results']],
+            [('lead', self.lead.id), ('customer', self.customer.id)]
+        )
+        self.assertEqual(response.data['results'][1]['title'], 'Zoë Müller')
+
+    def test_list_search_uses_index_and_falls_back_until_built(self):
+        indexed = SearchIndexService.filter_queryset(
+            Customer.objects.all(), 'northw', [self.organization.id], fallback_fields=['name']
+        )
+        self.assertEqual(list(indexed), [self.customer])
+
+        # Organizations that existed before the index was introduced
+        SearchIndexState.objects.filter(organization=self.organization).delete()
+        fallback = SearchIndexService.filter_queryset(
+            Customer.objects.filter(organization=self.organization), 'raders', [self.organization.id],
+            fallback_fields=['company_name']
+        )
+        self.assertEqual(list(fallback), [self.customer])
+
+    def test_common_terms_are_ranked_without_dropping_matches(self):
+        organization = Organization.objects.create(name='Initech', slug='initech')
+        Customer.objects.bulk_create([
+            Customer(organization=organization, name=f'Customer {i}', company_name='Common Name Ltd')
+            for i in range(600)
+        ])
+        # Indexed last, after more than 500 postings of each term, but matching in a heavier field
+        best = Customer.objects.create(organization=organization, name='Common Name', email='best@initech.test')
+        SearchIndexService.rebuild(organization.id)
+
+        results = SearchIndexService.search([organization.id], 'common name', limit=1)
+        self.assertEqual([(result['type'], result['id']) for result in results], [('customer', best.id)])
+
+        # List filters keep the best matches, best first
+        with mock.patch('crmApp.services.search_index_service.SEARCH_FILTER_LIMIT', 3):
+            filtered = list(SearchIndexService.filter_queryset(
+                Customer.objects.all(), 'common name', [organization.id], fallback_fields=['name']
+            ))
+        self.assertEqual(len(filtered), 3)
+        self.assertEqual(filtered[0], best)
+        self.assertGreater(filtered[0].search_score, filtered[1].search_score)
+
+    def test_list_search_matches_word_prefixes_only(self):
+        # Substring matching is only the fallback for organizations without an index
+        self.assertEqual(
+            list(SearchIndexService.filter_queryset(
+                Customer.objects.all(), 'wind', [self.organization.id], fallback_fields=['company_name']
+            )),
+            []
+        )
+
+
+
+class AnalyticsServiceTest(TestCase):
+    """
+    The grouped aggregates return what counting record by record returns,
+    from the raw tables and from the rollups alike.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        other = Organization.objects.create(name='Globex', slug='globex')
+        pipeline = Pipeline.objects.create(organization=cls.organization, name='Sales')
+        cls.stages = [
+            PipelineStage.objects.create(pipeline=pipeline, name=name, order=order)
+            for order, name in enumerate(['Prospect', 'Proposal', 'Closing'])
+        ]
+        cls.today = timezone.localdate()
+
+        statuses = ['new', 'contacted', 'qualified', 'unqualified', 'lost']
+        sources = ['website', 'referral', 'email']
+        for i in range(12):
+            Lead.objects.create(
+                organization=cls.organization, name=f'Lead {i}',
+                qualification_status=statuses[i % 5], source=sources[i % 3], lead_score=i * 7,
+                estimated_value=Decimal(10 * i), is_converted=i % 4 == 0,
+            )
+        for i in range(3):
+            Customer.objects.create(organization=cls.organization, name=f'Customer {i}', email=f'c{i}@acme.test')
+        for i in range(10):
+            Deal.objects.create(
+                organization=cls.organization, title=f'Deal {i}', pipeline=pipeline, stage=cls.stages[i % 3],
+                value=Decimal(100 * (i + 1)), probability=Decimal(10 * i), priority=['low', 'medium', 'high'][i % 3],
+                is_won=i % 3 == 0, is_lost=i % 3 == 1,
+                actual_close_date=cls.today - timedelta(days=40 * i) if i % 3 == 0 else None,
+            )
+        for i in range(8):
+            Issue.objects.create(
+                organization=cls.organization, title=f'Issue {i}', description='-',
+                status=['open', 'in_progress', 'resolved', 'closed'][i % 4],
+                priority=['low', 'medium', 'high', 'critical'][i % 4],
+                category=['quality', 'delivery', 'payment'][i % 3],
+                is_client_issue=i % 2 == 0,
+            )
+        for i in range(6):
+            AuditLog.objects.create(
+                organization=cls.organization, user_email='vendor@acme.test',
+                user_profile_type=['vendor', 'employee'][i % 2], action=['create', 'update', 'delete'][i % 3],
+                resource_type=['lead', 'deal'][i % 2], description=f'Change {i}',
+            )
+        # Another organization's records never count
+        Lead.objects.create(organization=other, name='Elsewhere')
+        Deal.objects.create(organization=other, title='Elsewhere', value=Decimal('999'), is_won=True)
+
+    def setUp(self):
+        self.org_ids = [self.organization.id]
+        self.deals = list(Deal.objects.filter(organization=self.organization))
+
+    def test_lead_stats_match_per_row_counts(self):
+        leads = list(Lead.objects.filter(organization=self.organization))
+        stats = AnalyticsService.lead_stats(Lead.objects.filter(organization=self.organization))
+
+        self.assertEqual(stats['totalLeads'], len(leads))
+        for status in ['new', 'contacted', 'qualified', 'unqualified', 'lost']:
+            self.assertEqual(stats['statusCounts'][status], sum(lead.qualification_status == status for lead in leads))
+        converted = sum(lead.is_converted for lead in leads)
+        self.assertEqual(stats['statusCounts']['converted'], converted)
+        self.assertEqual(stats['averageScore'], round(sum(lead.lead_score for lead in leads) / len(leads), 2))
+        self.assertEqual(stats['totalEstimatedValue'], float(sum(lead.estimated_value for lead in leads)))
+        self.assertEqual(stats['conversionRate'], round(converted / len(leads) * 100, 2))
+        sources = {lead.source for lead in leads}
+        self.assertEqual(stats['by_source'], {source: sum(lead.source == source for lead in leads) for source in sources})
+
+    def test_deal_stats_match_per_row_counts(self):
+        stats = AnalyticsService.deal_stats(Deal.objects.filter(organization=self.organization))
+
+        self.assertEqual(stats['total_deals'], len(self.deals))
+        self.assertEqual(stats['total_value'], float(sum(deal.value for deal in self.deals)))
+        self.assertEqual(stats['expected_revenue'], float(sum(deal.expected_revenue or 0 for deal in self.deals)))
+        self.assertEqual(stats['won'], sum(deal.is_won for deal in self.deals))
+        self.assertEqual(stats['lost'], sum(deal.is_lost for deal in self.deals))
+        self.assertEqual(stats['open'], sum(not deal.is_won and not deal.is_lost for deal in self.deals))
+        for priority, count in stats['by_priority'].items():
+            self.assertEqual(count, sum(deal.priority == priority for deal in self.deals))
+        self.assertEqual(
+            sorted((row['stage_name'], row['count'], row['total_value']) for row in stats['by_stage']),
+            sorted(
+                (stage.name, len(matching), float(sum(deal.value for deal in matching)))
+                for stage in self.stages
+                for matching in [[deal for deal in self.deals if deal.stage_id == stage.id]]
+            )
+        )
+
+    def test_issue_and_audit_log_stats_match_per_row_counts(self):
+        issues = list(Issue.objects.filter(organization=self.organization))
+        stats = AnalyticsService.issue_stats(Issue.objects.filter(organization=self.organization))
+        self.assertEqual(stats['total'], len(issues))
+        for field in ('status', 'priority', 'category'):
+            for value, count in stats[f'by_{field}'].items():
+                self.assertEqual(count, sum(getattr(issue, field) == value for issue in issues))
+        self.assertEqual(stats['by_source']['client_raised'], sum(issue.is_client_issue for issue in issues))
+        self.assertEqual(stats['linear_sync']['not_synced'], len(issues))
+
+        logs = list(AuditLog.objects.filter(organization=self.organization))
+        stats = AnalyticsService.audit_log_stats(AuditLog.objects.filter(organization=self.organization))
+        self.assertEqual(stats['total_logs'], len(logs))
+        self.assertEqual(stats['recent_activity_24h'], len(logs))
+        self.assertEqual(
+            {action: entry['count'] for action, entry in stats['by_action'].items()},
+            {action: sum(log.action == action for log in logs) for action in {log.action for log in logs}}
+        )
+        self.assertEqual(
+            {resource: entry['count'] for resource, entry in stats['by_resource'].items()},
+            {resource: sum(log.resource_type == resource for log in logs) for resource in {'lead', 'deal'}}
+        )
+        self.assertEqual(stats['by_profile_type']['employee'], sum(log.user_profile_type == 'employee' for log in logs))
+
+    def test_dashboard_totals_match_per_row_counts_with_and_without_rollups(self):
+        won = [deal for deal in self.deals if deal.is_won]
+        lost = [deal for deal in self.deals if deal.is_lost and not deal.is_won]
+        active = [deal for deal in self.deals if not deal.is_won and not deal.is_lost]
+        expected = {
+            'total_leads': Lead.objects.filter(organization=self.organization).count(),
+            'total_customers': 3,
+            'total_deals': len(self.deals),
+            'total_revenue': float(sum(deal.value for deal in won)),
+            'active_deals_value': float(sum(deal.value for deal in active)),
+            'won_deals_count': len(won),
+            'lost_deals_count': len(lost),
+            'conversion_rate': round(len(won) / len(self.deals) * 100, 2),
+        }
+        start = timezone.now() - timedelta(days=30)
+
+        raw = AnalyticsService.dashboard_stats(self.org_ids, start, timezone.now())
+        AnalyticsRollupService.rebuild(self.organization.id)
+        with CaptureQueriesContext(connection) as queries:
+            from_rollups = AnalyticsService.dashboard_stats(self.org_ids, start, timezone.now())
+
+        for stats in (raw, from_rollups):
+            self.assertEqual({key: stats[key] for key in expected}, expected)
+        self.assertFalse(any('FROM "deals"' in query['sql'] for query in queries.captured_queries))
+
+    def test_funnel_and_revenue_match_per_row_sums_with_and_without_rollups(self):
+        start = timezone.make_aware(datetime.combine(self.today - timedelta(days=400), datetime.min.time()))
+        end = timezone.make_aware(datetime.combine(self.today, datetime.max.time()))
+        expected_funnel = [
+            (stage.name, len(matching), float(sum(deal.value for deal in matching)))
+            for stage in self.stages
+            for matching in [[deal for deal in self.deals if deal.stage_id == stage.id]]
+        ]
+        expected_revenue = {}
+        for deal in self.deals:
+            if deal.is_won and deal.actual_close_date:
+                period = deal.actual_close_date.replace(day=1).isoformat()
+                count, revenue = expected_revenue.get(period, (0, 0.0))
+                expected_revenue[period] = (count + 1, revenue + float(deal.value))
+
+        results = []
+        for rebuild in (False, True):
+            if rebuild:
+                AnalyticsRollupService.rebuild(self.organization.id)
+            funnel = AnalyticsService.sales_funnel(self.org_ids, start, end)
+            revenue = AnalyticsService.revenue_by_period(self.org_ids, start, end, 'month')
+            self.assertEqual([(row['stage'], row['count'], row['value']) for row in funnel], expected_funnel)
+            self.assertEqual({row['period']: (row['deals_count'], row['revenue']) for row in revenue}, expected_revenue)
+            results.append((funnel, revenue))
+        self.assertEqual(results[0], results[1])
+
+
+class AnalyticsRollupTest(TestCase):
+    """
+    Daily rollups stay equal to what compute() derives from the raw tables
+    through creates, updates, stage changes, bulk updates and deletes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.pipeline = Pipeline.objects.create(organization=cls.organization, name='Sales')
+        cls.first_stage = PipelineStage.objects.create(pipeline=cls.pipeline, name='Prospect', order=1)
+        cls.second_stage = PipelineStage.objects.create(pipeline=cls.pipeline, name='Proposal', order=2)
+
+    def assertInSync(self):
+        stored = {
+            (row.organization_id, row.date, row.metric, row.dimension, row.dimension_value): [row.count, row.value]
+            for row in AnalyticsDailyRollup.objects.filter(organization=self.organization).exclude(count=0)
+        }
+        self.assertEqual(stored, AnalyticsRollupService.compute(self.organization.id))
+        self.assertEqual(AnalyticsRollupService.find_drift(self.organization.id), [])
+
+    def _lead_total(self):
+        return AnalyticsRollupService.totals([self.organization.id], 'lead').get('', (0, Decimal('0')))
+
+    def test_saves_and_deletes_keep_rollups_equal_to_compute(self):
+        lead = Lead.objects.create(organization=self.organization, name='Lead', estimated_value=Decimal('40.00'))
+        customer = Customer.objects.create(organization=self.organization, name='Customer', email='c@acme.test')
+        deal = Deal.objects.create(
+            organization=self.organization, title='Deal', customer=customer,
+            pipeline=self.pipeline, stage=self.first_stage, value=Decimal('100.00')
+        )
+        Activity.objects.create(organization=self.organization, activity_type='note', title='Called', customer=customer)
+        self.assertInSync()
+
+        lead.qualification_status = 'contacted'
+        lead.estimated_value = Decimal('60.00')
+        lead.save()
+        self.assertInSync()
+
+        deal.stage = self.second_stage
+        deal.save(update_fields=['stage'])
+        self.assertInSync()
+
+        deal.is_won = True
+        deal.actual_close_date = timezone.now().date()
+        deal.save()
+        self.assertEqual(
+            AnalyticsRollupService.totals([self.organization.id], 'deal_won')[''], (1, Decimal('100.00'))
+        )
+        self.assertInSync()
+
+        customer.delete()
+        lead.delete()
+        self.assertInSync()
+        self.assertEqual(self._lead_total(), (0, Decimal('0')))
+
+    def test_save_reads_no_stored_row(self):
+        deal = Deal.objects.create(
+            organization=self.organization, title='Deal', stage=self.first_stage, value=Decimal('100.00')
+        )
+        deal = Deal.objects.get(pk=deal.pk)
+        deal.stage = self.second_stage
+
+        with CaptureQueriesContext(connection) as queries:
+            deal.save()
+
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "deals"' in query['sql']
+        ])
+        self.assertInSync()
+
+    def test_stale_copy_drift_is_found_and_rebuilt(self):
+        deal = Deal.objects.create(
+            organization=self.organization, title='Deal', stage=self.first_stage, value=Decimal('100.00')
+        )
+        first = Deal.objects.get(pk=deal.pk)
+        second = Deal.objects.get(pk=deal.pk)
+
+        first.stage = self.second_stage
+        first.save()
+        # Loaded before the first save: it moves its (stale) first-stage contribution
+        second.value = Decimal('250.00')
+        second.save()
+
+        drifted = {item['bucket'][3:] for item in AnalyticsRollupService.find_drift(self.organization.id)}
+        self.assertEqual(drifted, {('stage', str(self.first_stage.id)), ('stage', str(self.second_stage.id))})
+
+        call_command('backfill_analytics_rollups', check=True, fix=True, stdout=StringIO())
+        self.assertInSync()
+        stages = AnalyticsRollupService.totals([self.organization.id], 'deal', 'stage')
+        self.assertEqual(stages[str(self.first_stage.id)], (1, Decimal('250.00')))
+
+    def test_failed_update_falls_back_to_raw_tables_until_rebuilt(self):
+        lead = Lead.objects.create(organization=self.organization, name='Lead', estimated_value=Decimal('10.00'))
+        AnalyticsRollupService.rebuild(self.organization.id)
+        self.assertTrue(AnalyticsRollupService.is_covered([self.organization.id]))
+
+        lead.estimated_value = Decimal('30.00')
+        with mock.patch.object(AnalyticsRollupService, 'apply_deltas', side_effect=DatabaseError('disk I/O error')):
+            lead.save()
+
+        self.assertEqual(Lead.objects.get(pk=lead.pk).estimated_value, Decimal('30.00'))
+        self.assertFalse(AnalyticsRollupService.is_covered([self.organization.id]))
+        self.assertTrue(AnalyticsRollupService.find_drift(self.organization.id))
+
+        call_command('backfill_analytics_rollups', check=True, fix=True, stdout=StringIO())
+        self.assertTrue(AnalyticsRollupService.is_covered([self.organization.id]))
+        self.assertInSync()
+
+    def test_record_change_applies_deltas(self):
+        values = {
+            'organization_id': self.organization.id, 'created_at': timezone.now(), 'estimated_value': Decimal('10'),
+            'stage_id': None, 'source': 'web', 'qualification_status': 'new', 'assigned_to_id': None,
+        }
+
+        AnalyticsRollupService.record_change(Lead, None, values)
+        AnalyticsRollupService.record_change(Lead, None, values)
+        self.assertEqual(self._lead_total(), (2, Decimal('20')))
+
+        AnalyticsRollupService.record_change(Lead, values, {**values, 'source': 'referral'})
+        self.assertEqual(
+            AnalyticsRollupService.totals([self.organization.id], 'lead', 'source'),
+            {'web': (1, Decimal('10')), 'referral': (1, Decimal('10'))}
+        )
+
+        AnalyticsRollupService.record_change(Lead, values, None)
+        self.assertEqual(self._lead_total(), (1, Decimal('10')))
+
+        # A change that moves nothing writes nothing
+        with CaptureQueriesContext(connection) as queries:
+            AnalyticsRollupService.record_change(Lead, values, dict(values))
+        self.assertEqual(len(queries), 0)
+
+    def test_bulk_update_keeps_rollups_in_sync(self):
+        leads = [Lead.objects.create(organization=self.organization, name=f'Lead {i}') for i in range(3)]
+
+        updated = AnalyticsRollupService.bulk_update(
+            Lead.objects.filter(pk__in=[lead.pk for lead in leads[:2]]), qualification_status='qualified'
+        )
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            AnalyticsRollupService.totals([self.organization.id], 'lead', 'status')['qualified'], (2, Decimal('0'))
+        )
+        self.assertInSync()
+
+    def test_find_drift_reports_injected_drift_and_rebuild_repairs_it(self):
+        Lead.objects.create(organization=self.organization, name='Lead', estimated_value=Decimal('5.00'))
+        Lead.objects.create(organization=self.organization, name='Other', estimated_value=Decimal('5.00'))
+        AnalyticsDailyRollup.objects.filter(
+            organization=self.organization, metric='lead', dimension='total'
+        ).update(count=F('count') + 3)
+
+        drift = AnalyticsRollupService.find_drift(self.organization.id)
+
+        self.assertEqual(len(drift), 1)
+        self.assertEqual(drift[0]['bucket'][2:], ('lead', 'total', ''))
+        self.assertEqual(drift[0]['stored'][0], 5)
+        self.assertEqual(drift[0]['expected'], (2, Decimal('10.00')))
+
+        AnalyticsRollupService.rebuild(self.organization.id)
+        self.assertInSync()
+
+    def test_reads_use_rollups_only_once_covered(self):
+        today = timezone.now().date()
+        self.assertFalse(AnalyticsRollupService.is_covered([self.organization.id]))
+
+        AnalyticsRollupService.rebuild(self.organization.id, since=today)
+        self.assertFalse(AnalyticsRollupService.is_covered([self.organization.id]))
+        self.assertTrue(AnalyticsRollupService.is_covered([self.organization.id], today))
+        self.assertFalse(AnalyticsRollupService.is_covered([self.organization.id], today - timedelta(days=1)))
+
+        AnalyticsRollupService.rebuild(self.organization.id)
+        self.assertTrue(AnalyticsRollupService.is_covered([self.organization.id]))
+        self.assertIsNone(AnalyticsRollupState.objects.get(organization=self.organization).covered_from)
+        # Every organization must be covered
+        other = Organization.objects.create(name='Globex', slug='globex')
+        self.assertFalse(AnalyticsRollupService.is_covered([self.organization.id, other.id]))
+
+
+class SequenceServiceTest(TestCase):
+    """
+    Document numbers come from per-organization, per-year sequences.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.other_organization = Organization.objects.create(name='Globex', slug='globex')
+        cls.year = timezone.now().year
+
+    def test_numbers_are_per_organization(self):
+        first = Issue.objects.create(organization=self.organization, title='A', description='-')
+        second = Issue.objects.create(organization=self.organization, title='B', description='-')
+        other = Issue.objects.create(organization=self.other_organization, title='C', description='-')
+        order = Order.objects.create(organization=self.organization, title='Order', order_date=timezone.now().date())
+
+        self.assertEqual(first.issue_number, f'ISS-{self.year}-0001')
+        self.assertEqual(second.issue_number, f'ISS-{self.year}-0002')
+        self.assertEqual(other.issue_number, f'ISS-{self.year}-0001')
+        self.assertEqual(order.order_number, f'ORD-{self.year}-0001')
+
+    def test_sequence_continues_after_existing_numbers(self):
+        Issue.objects.create(
+            organization=self.organization, title='Old', description='-', issue_number=f'ISS-{self.year}-9999'
+        )
+        Issue.objects.create(
+            organization=self.organization, title='Older', description='-', issue_number=f'ISS-{self.year}-10000'
+        )
+
+        issue = Issue.objects.create(organization=self.organization, title='New', description='-')
+
+        self.assertEqual(issue.issue_number, f'ISS-{self.year}-10001')
+
+    def test_block_allocation_for_imports(self):
+        numbers = SequenceService.allocate_numbers('payment', self.organization.id, 3)
+        following = SequenceService.next_number('payment', self.organization.id)
+
+        self.assertEqual(numbers, [f'PAY-{self.year}-0001', f'PAY-{self.year}-0002', f'PAY-{self.year}-0003'])
+        self.assertEqual(following, f'PAY-{self.year}-0004')
+        self.assertEqual(
+            NumberSequence.objects.get(organization=self.organization, kind='payment', year=self.year).last_value,
+            4
+        )
+
+
+class ConcurrentSequenceTest(TransactionTestCase):
+    """
+    Parallel creators never get the same number and never retry.
+    """
+
+    CREATORS = 50
+
+    def test_parallel_issue_creation(self):
+        organization = Organization.objects.create(name='Acme', slug='acme')
+        start = threading.Barrier(self.CREATORS)
+        errors = []
+
+        def create_issue(index):
+            try:
+                start.wait()
+                Issue.objects.create(organization=organization, title=f'Issue {index}', description='-')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=create_issue, args=(index,)) for index in range(self.CREATORS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        year = timezone.now().year
+        self.assertEqual(
+            sorted(Issue.objects.filter(organization=organization).values_list('issue_number', flat=True)),
+            [f'ISS-{year}-{value:04d}' for value in range(1, self.CREATORS + 1)]
+        )
+
+    def test_only_allocation_takes_the_write_lock_up_front(self):
+        organization = Organization.objects.create(name='Acme', slug='acme')
+        SequenceService.next_number('issue', organization.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            SequenceService.next_number('issue', organization.id)
+            with transaction.atomic():
+                Organization.objects.filter(pk=organization.pk).update(name='Acme Inc')
+
+        begins = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('BEGIN')]
+        self.assertEqual(begins, ['BEGIN IMMEDIATE', 'BEGIN'])
+
+
+class ConcurrentRollupSaveTest(TransactionTestCase):
+    """
+    Parallel saves of stale copies of the same record do not fail, and the
+    drift they leave behind is repaired by the reconcile command.
+    """
+
+    SAVERS = 20
+
+    def test_parallel_saves_of_one_lead(self):
+        organization = Organization.objects.create(name='Acme', slug='acme')
+        lead = Lead.objects.create(organization=organization, name='Lead', estimated_value=Decimal('1'))
+        start = threading.Barrier(self.SAVERS)
+        errors = []
+
+        def save_lead(index):
+            try:
+                copy = Lead.objects.get(pk=lead.pk)
+                start.wait()
+                copy.estimated_value = Decimal(index)
+                copy.qualification_status = ['new', 'contacted', 'qualified'][index % 3]
+                copy.save()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=save_lead, args=(index,)) for index in range(self.SAVERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        call_command('backfill_analytics_rollups', check=True, fix=True, stdout=StringIO())
+        self.assertEqual(AnalyticsRollupService.find_drift(organization.id), [])
+
+
+class FlakyRealtimeBackend:
+    """Fails the first send, records the rest."""
+
+    enabled = True
+
+    def __init__(self):
+        self.calls = 0
+        self.batches = []
+
+    def send(self, events):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError('Pusher unavailable')
+        self.batches.append(events)
+
+
+class BlockingRealtimeBackend:
+    """Holds every send until released."""
+
+    enabled = True
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.batches = []
+
+    def send(self, events):
+        self.release.wait(5)
+        self.batches.append(events)
+
+
+@override_settings(
+    REALTIME_BACKEND='crmApp.services.realtime_dispatcher.LocalBackend',
+    REALTIME_DISPATCH_ASYNC=False,
+)
+class RealtimeDispatcherTest(TestCase):
+    """
+    Pusher events are coalesced per request and sent by the dispatcher,
+    not from inside the request.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.vendor = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        cls.employee = User.objects.create_user('employee@acme.test', 'employee', 'password')
+
+    def setUp(self):
+        self.backend = realtime_dispatcher.backend
+        self.backend.clear()
+
+    def test_message_events_go_out_as_one_batch(self):
+        with realtime_dispatcher.batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                message = MessageService.send_message(
+                    self.vendor, self.employee, 'Hello', organization=self.organization
+                )
+            # Nothing is sent before the request is done
+            self.assertEqual(self.backend.batches, [])
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(len(self.backend.batches), 1)
+        events = self.backend.batches[0]
+        self.assertEqual(
+            [(event['channel'], event['name']) for event in events],
+            [
+                (f'private-user-{self.employee.id}', 'new-message'),
+                (f'private-user-{self.vendor.id}', 'new-message'),
+                (f'private-user-{self.employee.id}', 'conversation-updated'),
+            ]
+        )
+        self.assertEqual(events[0]['data']['message']['id'], message.id)
+        self.assertEqual(events[2]['data']['conversation_id'], conversation.id)
+
+    def test_unread_counts_are_coalesced_and_computed_once(self):
+        counted = []
+
+        def unread_count():
+            counted.append(1)
+            return 7
+
+        with realtime_dispatcher.batch():
+            with self.captureOnCommitCallbacks(execute=True):
+                realtime_dispatcher.publish('private-user-1', 'unread-count-updated', {'unread_count': 6}, coalesce=True)
+                realtime_dispatcher.publish('private-user-1', 'message-read', {'message_id': 1})
+                realtime_dispatcher.publish(
+                    'private-user-1', 'unread-count-updated', lambda: {'unread_count': unread_count()}, coalesce=True
+                )
+
+        self.assertEqual(
+            [(event['name'], event['data']) for event in self.backend.events],
+            [('message-read', {'message_id': 1}), ('unread-count-updated', {'unread_count': 7})]
+        )
+        self.assertEqual(len(counted), 1)
+
+    def test_rolled_back_events_are_not_sent(self):
+        with realtime_dispatcher.batch():
+            with self.captureOnCommitCallbacks(execute=False):
+                realtime_dispatcher.publish('private-user-1', 'new-message', {})
+
+        self.assertEqual(self.backend.batches, [])
+
+    @override_settings(
+        REALTIME_BACKEND='crmApp.tests.FlakyRealtimeBackend',
+        REALTIME_DISPATCH_ASYNC=True,
+        REALTIME_RETRY_BACKOFF=0,
+    )
+    def test_background_sends_are_chunked_and_retried(self):
+        dispatcher = RealtimeDispatcher()
+        events = [{'channel': 'private-user-1', 'name': 'ping', 'data': {'n': n}} for n in range(25)]
+
+        self.assertTrue(dispatcher.submit(events))
+        dispatcher.join()
+
+        self.assertEqual(dispatcher.backend.calls, 4)
+        self.assertEqual([len(batch) for batch in dispatcher.backend.batches], [10, 10, 5])
+
+    @override_settings(
+        REALTIME_BACKEND='crmApp.tests.BlockingRealtimeBackend',
+        REALTIME_DISPATCH_ASYNC=True,
+        REALTIME_DISPATCH_WORKERS=1,
+        REALTIME_QUEUE_SIZE=1,
+    )
+    def test_full_queue_drops_instead_of_blocking(self):
+        dispatcher = RealtimeDispatcher()
+        event = [{'channel': 'private-user-1', 'name': 'ping', 'data': {}}]
+
+        self.assertTrue(dispatcher.submit(event))
+        # Wait for the worker to pick the first batch up
+        for _ in range(100):
+            if dispatcher._queue.empty():
+                break
+            time.sleep(0.01)
+        self.assertTrue(dispatcher.submit(event))
+        self.assertFalse(dispatcher.submit(event))
+
+        dispatcher.backend.release.set()
+        dispatcher.join()
+        self.assertEqual(len(dispatcher.backend.batches), 2)
+
+
+@override_settings(
+    REALTIME_BACKEND='crmApp.services.realtime_dispatcher.LocalBackend',
+    REALTIME_DISPATCH_ASYNC=False,
+)
+class ConversationInboxTest(TestCase):
+    """
+    The conversation row carries the inbox: last message, preview and
+    per-participant unread counters.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.vendor = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.vendor,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+        cls.contacts = [
+            User.objects.create_user(f'contact{i}@acme.test', f'contact{i}', 'password')
+            for i in range(6)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.vendor)
+        RequestContext.forget(self.vendor)
+
+    def _send(self, sender, recipient, content='Hello'):
+        return MessageService.send_message(sender, recipient, content, organization=self.organization)
+
+    def test_send_updates_last_message_and_recipient_counter(self):
+        employee = self.contacts[0]
+        self._send(self.vendor, employee, 'First')
+        last = self._send(self.vendor, employee, 'x' * 300)
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message_id, last.id)
+        self.assertEqual(conversation.last_message_preview, 'x' * 255)
+        self.assertEqual(conversation.get_unread_count(employee), 2)
+        self.assertEqual(conversation.get_unread_count(self.vendor), 0)
+        self.assertEqual(MessageService.get_unread_count(employee, self.organization), 2)
+
+    def test_mark_conversation_read_up_to_message(self):
+        employee = self.contacts[0]
+        messages = [self._send(self.vendor, employee, f'Message {i}') for i in range(5)]
+        conversation = Conversation.objects.get()
+
+        marked = MessageService.mark_conversation_read(conversation, employee, up_to_message_id=messages[2].id)
+
+        self.assertEqual(marked, 3)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.get_unread_count(employee), 2)
+        self.assertEqual(
+            list(Message.objects.filter(is_read=False).order_by('id').values_list('id', flat=True)),
+            [messages[3].id, messages[4].id]
+        )
+        self.assertEqual(MessageService.mark_conversation_read(conversation, employee), 2)
+        self.assertEqual(MessageService.get_unread_count(employee, self.organization), 0)
+
+    def test_mark_as_read_counts_each_message_once(self):
+        employee = self.contacts[0]
+        message = self._send(self.vendor, employee)
+        stale = Message.objects.get(pk=message.pk)
+
+        MessageService.mark_as_read(message, employee)
+        # A second request holding an unread copy must not decrement again
+        MessageService.mark_as_read(stale, employee)
+
+        self._send(self.vendor, employee)
+        self.assertEqual(MessageService.get_unread_count(employee, self.organization), 1)
+
+    def test_mark_read_endpoint(self):
+        employee = self.contacts[0]
+        for _ in range(3):
+            self._send(employee, self.vendor)
+        conversation = Conversation.objects.get()
+
+        response = self.client.post(f'/api/conversations/{conversation.id}/mark_read/', {}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'marked_read': 3, 'unread_count': 0})
+
+    def test_reply_does_not_scan_messages(self):
+        employee = self.contacts[0]
+        self._send(employee, self.vendor)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/messages/send/', {'recipient_id': employee.id, 'content': 'Reply'}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        message_reads = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "messages"' in query['sql']
+        ]
+        self.assertEqual(message_reads, [])
+        self.assertEqual(Conversation.objects.get().get_unread_count(employee), 1)
+
+    def _inbox_queries(self):
+        RequestContext.forget(self.vendor)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/conversations/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_inbox_query_count_is_constant(self):
+        self._send(self.contacts[0], self.vendor)
+        response, few = self._inbox_queries()
+        self.assertEqual(response.data['results'][0]['unread_count'], 1)
+
+        for contact in self.contacts[1:]:
+            self._send(contact, self.vendor)
+            self._send(self.vendor, contact)
+        response, many = self._inbox_queries()
+
+        self.assertEqual(len(response.data['results']), len(self.contacts))
+        self.assertEqual(few, many)
+
+
+class ConcurrentUnreadCounterTest(TransactionTestCase):
+    """
+    Parallel senders never lose an unread increment.
+    """
+
+    SENDERS = 20
+
+    @override_settings(
+        REALTIME_BACKEND='crmApp.services.realtime_dispatcher.LocalBackend',
+        REALTIME_DISPATCH_ASYNC=False,
+    )
+    def test_parallel_sends(self):
+        organization = Organization.objects.create(name='Acme', slug='acme')
+        vendor = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        employee = User.objects.create_user('employee@acme.test', 'employee', 'password')
+        MessageService.send_message(vendor, employee, 'First', organization=organization)
+        start = threading.Barrier(self.SENDERS)
+        errors = []
+
+        def send(index):
+            try:
+                start.wait()
+                MessageService.send_message(vendor, employee, f'Message {index}', organization=organization)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send, args=(index,)) for index in range(self.SENDERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.get_unread_count(employee), self.SENDERS + 1)
+        self.assertEqual(MessageService.get_unread_count(employee, organization), self.SENDERS + 1)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class PresenceServiceTest(TestCase):
+    """
+    Heartbeats and pings only touch the cache; UserPresence is written on
+    transitions, which are pushed to the user's organizations.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        cls.colleague = User.objects.create_user('employee@acme.test', 'employee', 'password')
+        for user in (cls.user, cls.colleague):
+            UserProfile.objects.create(
+                user=user,
+                organization=cls.organization,
+                profile_type='vendor' if user is cls.user else 'employee',
+                is_primary=True,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.channel_layer = get_channel_layer()
+        self.channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(PresenceService.group_name(self.organization.id), self.channel)
+
+    def tearDown(self):
+        async_to_sync(self.channel_layer.group_discard)(PresenceService.group_name(self.organization.id), self.channel)
+
+    def _next_event(self):
+        async def receive():
+            try:
+                return await asyncio.wait_for(self.channel_layer.receive(self.channel), 0.2)
+            except asyncio.TimeoutError:
+                return None
+        message = async_to_sync(receive)()
+        return message['data']['data'] if message else None
+
+    def test_heartbeats_only_write_when_coming_online(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        self.assertEqual(client.post('/api/user-presence/heartbeat/').status_code, 200)
+        self.assertEqual(UserPresence.objects.get(user=self.user).status, 'online')
+        self.assertEqual(self._next_event()['status'], 'online')
+
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                client.post('/api/user-presence/heartbeat/')
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if '"user_presence"' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(writes, [])
+        self.assertIsNone(self._next_event())
+
+    def test_user_goes_offline_with_last_connection(self):
+        PresenceService.connect(self.user.id)
+        PresenceService.connect(self.user.id)
+        self.assertEqual(self._next_event(), {
+            'user_id': self.user.id,
+            'status': 'online',
+            'available_for_calls': True,
+            'status_message': '',
+        })
+
+        self.assertFalse(PresenceService.disconnect(self.user.id))
+        self.assertIsNone(self._next_event())
+        self.assertTrue(UserPresence.objects.get(user=self.user).is_online)
+
+        self.assertTrue(PresenceService.disconnect(self.user.id))
+        self.assertEqual(self._next_event(), {'user_id': self.user.id, 'status': 'offline'})
+        self.assertEqual(UserPresence.objects.get(user=self.user).status, 'offline')
+
+    def test_expired_users_are_flushed_when_listed(self):
+        # The colleague's heartbeats stopped (no cache entry left)
+        UserPresence.objects.create(user=self.colleague, status='online')
+        PresenceService.touch(self.user.id)
+        self._next_event()
+
+        online = jitsi_service.get_online_users(organization=self.organization)
+
+        self.assertEqual([presence.user_id for presence in online], [self.user.id])
+        self.assertEqual(UserPresence.objects.get(user=self.colleague).status, 'offline')
+        self.assertEqual(self._next_event(), {'user_id': self.colleague.id, 'status': 'offline'})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_falls_back_to_the_database(self):
+        self.assertTrue(PresenceService.connect(self.user.id))
+        self.assertEqual(self._next_event()['status'], 'online')
+
+        # Heartbeats refresh last_seen and do not repeat the transition
+        self.assertFalse(PresenceService.ping(self.user.id))
+        self.assertIsNone(self._next_event())
+
+        # Another process may still hold a connection
+        self.assertFalse(PresenceService.disconnect(self.user.id))
+        presence = UserPresence.objects.get(user=self.user)
+        self.assertTrue(presence.is_online)
+
+        stale = timezone.now() - timedelta(seconds=PresenceService.ttl() + 1)
+        UserPresence.objects.filter(user=self.user).update(last_seen=stale)
+        self.assertFalse(UserPresence.objects.get(user=self.user).is_online)
+        self.assertEqual(PresenceService.live_user_ids([self.user.id]), set())
+        self.assertEqual(UserPresence.objects.get(user=self.user).status, 'offline')
+
+
+class FakeLinearHandler(BaseHTTPRequestHandler):
+    """Answers the team and batched issue mutation queries the sync engine sends."""
+
+    STATES = [
+        {'id': 'state-backlog', 'name': 'Backlog', 'type': 'unstarted', 'position': 0},
+        {'id': 'state-progress', 'name': 'In Progress', 'type': 'started', 'position': 1},
+        {'id': 'state-done', 'name': 'Done', 'type': 'completed', 'position': 2},
+    ]
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests.append(body)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            rate_limited = server.rate_limit_next
+            server.rate_limit_next = False
+        try:
+            if rate_limited:
+                reset = int((time.time() + 0.05) * 1000)
+                self._reply(400, {'errors': [{'message': 'Rate limit exceeded', 'extensions': {'code': 'RATELIMITED'}}]},
+                            remaining=0, reset=reset)
+                return
+            time.sleep(server.latency)
+            self._reply(200, self._respond(body))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _respond(self, body):
+        query = body['query']
+        variables = body.get('variables') or {}
+        if query.lstrip().startswith('query TeamIssues'):
+            since = ((variables.get('filter') or {}).get('updatedAt') or {}).get('gte')
+            nodes = [
+                issue for issue in self.server.team_issues
+                if not since or parse_datetime(issue['updatedAt']) >= parse_datetime(since)
+            ]
+            return {'data': {'team': {'issues': {'nodes': nodes, 'pageInfo': {
+                'hasNextPage': False, 'hasPreviousPage': False, 'startCursor': None, 'endCursor': None,
+            }}}}}
+        if query.lstrip().startswith('query Team'):
+            return {'data': {'team': {'id': variables['id'], 'name': 'Engineering', 'key': 'ENG',
+                                      'states': {'nodes': self.STATES}}}}
+
+        data, errors = {}, []
+        for index, action in re.findall(r'op(\d+): issue(Create|Update)', query):
+            issue_input = variables[f'input{index}']
+            if issue_input.get('title') == 'Broken':
+                data[f'op{index}'] = None
+                errors.append({'message': 'Title is invalid', 'path': [f'op{index}']})
+                continue
+            with self.server.lock:
+                self.server.created += 1
+                number = self.server.created
+            issue_id = variables.get(f'id{index}') or f'linear-{number}'
+            state = next(state for state in self.STATES if state['id'] == issue_input.get('stateId', 'state-backlog'))
+            data[f'op{index}'] = {'success': True, 'issue': {
+                'id': issue_id, 'identifier': f'ENG-{number}', 'title': issue_input['title'],
+                'url': f'https://linear.test/{issue_id}', 'state': {'id': state['id'], 'name': state['name']},
+            }}
+        return {'data': data, 'errors': errors} if errors else {'data': data}
+
+    def _reply(self, status_code, payload, remaining=1000, reset=None):
+        content = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('X-RateLimit-Requests-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Requests-Reset', str(reset or int((time.time() + 3600) * 1000)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeLinearServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.05):
+        super().__init__(('127.0.0.1', 0), FakeLinearHandler)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.created = 0
+        self.rate_limit_next = False
+        self.team_issues = []
+        self.url = f'http://127.0.0.1:{self.server_address[1]}/graphql'
+
+    def queries(self, prefix):
+        return [body for body in self.requests if body['query'].lstrip().startswith(prefix)]
+
+
+@override_settings(
+    LINEAR_API_KEY='lin_test',
+    LINEAR_SYNC_BATCH_SIZE=5,
+    LINEAR_SYNC_CONCURRENCY=3,
+    LINEAR_SYNC_WORKER_MODE='inline',
+)
+class LinearBulkSyncTest(TestCase):
+    """
+    Bulk sync batches mutations, runs batches concurrently, looks team states
+    up once and rides out Linear's rate limit.
+    """
+
+    TEAM_ID = 'team-eng'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme')
+        cls.user = User.objects.create_user('vendor@acme.test', 'vendor', 'password')
+        UserProfile.objects.create(
+            user=cls.user,
+            organization=cls.organization,
+            profile_type='vendor',
+            is_primary=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.server = FakeLinearServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings_override = override_settings(LINEAR_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _issues(self, count, **fields):
+        return [
+            Issue.objects.create(
+                organization=self.organization, title=f'Issue {index}', description='-', **fields
+            )
+            for index in range(count)
+        ]
+
+    def test_bulk_sync_batches_mutations_concurrently(self):
+        issues = self._issues(20, status='in_progress')
+        issues += self._issues(2, synced_to_linear=True, linear_issue_id='existing-1')
+        broken = Issue.objects.create(organization=self.organization, title='Broken', description='-')
+        issues.append(broken)
+
+        result = IssueLinearService().bulk_sync_issues_to_linear(issues, self.TEAM_ID)
+
+        self.assertEqual((result['synced_count'], result['failed_count']), (22, 1))
+        self.assertEqual([row['issue_id'] for row in result['results']], [issue.id for issue in issues])
+        self.assertIn('Title is invalid', result['results'][-1]['error'])
+        self.assertEqual(len(self.server.queries('query Team')), 1)
+        self.assertEqual(len(self.server.queries('mutation BatchIssues')), 5)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+
+        created = Issue.objects.get(pk=issues[0].pk)
+        self.assertTrue(created.synced_to_linear)
+        self.assertTrue(created.linear_issue_id.startswith('linear-'))
+        self.assertEqual(created.linear_team_id, self.TEAM_ID)
+        self.assertFalse(Issue.objects.get(pk=broken.pk).synced_to_linear)
+
+        updates = [
+            body['variables'] for body in self.server.queries('mutation BatchIssues')
+            if 'existing-1' in body['variables'].values()
+        ]
+        self.assertEqual(len(updates), 1)
+
+        # Team states come from the cache on the next sync
+        IssueLinearService().bulk_sync_issues_to_linear(issues[:3], self.TEAM_ID)
+        self.assertEqual(len(self.server.queries('query Team')), 1)
+
+    def test_rate_limited_request_is_retried(self):
+        issues = self._issues(2)
+        self.server.rate_limit_next = True
+
+        result = IssueLinearService().bulk_sync_issues_to_linear(issues, self.TEAM_ID)
+
+        self.assertEqual((result['synced_count'], result['failed_count']), (2, 0))
+        # The rate-limited team query was sent again
+        self.assertEqual(len(self.server.queries('query Team')), 2)
+
+    def test_endpoint_runs_sync_as_job(self):
+        issues = self._issues(7)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        RequestContext.forget(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                '/api/issues/bulk_sync_to_linear/',
+                {'issue_ids': [issue.id for issue in issues], 'team_id': self.TEAM_ID},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job']['total'], 7)
+
+        response = client.get('/api/issues/bulk_sync_to_linear/', {'job_id': response.data['job_id']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], LinearSyncJob.STATUS_COMPLETED)
+        self.assertEqual(response.data['processed_count'], 7)
+        self.assertEqual(response.data['synced_count'], 7)
+        self.assertEqual(len(self.server.queries('mutation BatchIssues')), 2)
+
+
+@override_settings(LINEAR_API_KEY='lin_test', LINEAR_WEBHOOK_SECRET='')
+class LinearPullSyncTest(TestCase):
+    """Pull sync only fetches changes since the team watermark; webhook redeliveries are ignored."""
+
+    TEAM_ID = 'team-eng'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name='Acme', slug='acme', linear_team_id=cls.TEAM_ID)
+
+    def setUp(self):
+        self.server = FakeLinearServer(latency=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        settings_override = override_settings(LINEAR_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _linear_issue(self, linear_id, updated_at, state_type='unstarted', title='Synced'):
+        return {
+            'id': linear_id, 'identifier': linear_id.upper(), 'title': title, 'description': 'From Linear',
+            'priority': 2, 'url': f'https://linear.test/{linear_id}', 'updatedAt': updated_at,
+            'state': {'id': f'state-{state_type}', 'name': state_type.title(), 'type': state_type},
+        }
+
+    def _pulled_since(self):
+        return [body['variables'].get('filter') for body in self.server.queries('query TeamIssues')]
+
+    def test_pull_only_fetches_changes_since_watermark(self):
+        linked = Issue.objects.create(
+            organization=self.organization, title='Old', description='-',
+            synced_to_linear=True, linear_issue_id='lin-1'
+        )
+        self.server.team_issues = [
+            self._linear_issue('lin-1', '2026-01-01T10:00:00.000Z', state_type='started'),
+            self._linear_issue('lin-2', '2026-01-01T11:00:00.000Z'),
+        ]
+
+        result = IssueLinearService().pull_team_changes(self.TEAM_ID)
+
+        self.assertEqual((result['fetched_count'], result['updated_count']), (2, 1))
+        linked.refresh_from_db()
+        self.assertEqual((linked.title, linked.status, linked.priority), ('Synced', 'in_progress', 'high'))
+        state = LinearSyncState.objects.get(team_id=self.TEAM_ID)
+        self.assertEqual(state.last_updated_at, parse_datetime('2026-01-01T11:00:00Z'))
+
+        # Nothing changed: only the watermark issue comes back, and nothing is written
+        result = IssueLinearService().pull_team_changes(self.TEAM_ID)
+        self.assertEqual((result['fetched_count'], result['updated_count']), (1, 0))
+
+        self.server.team_issues[0] = self._linear_issue('lin-1', '2026-01-02T09:00:00.000Z', state_type='completed')
+        result = IssueLinearService().pull_team_changes(self.TEAM_ID)
+
+        # The change plus the issue at the previous watermark
+        self.assertEqual((result['fetched_count'], result['updated_count']), (2, 1))
+        linked.refresh_from_db()
+        self.assertEqual(linked.status, 'resolved')
+        self.assertIsNotNone(linked.resolved_at)
+        self.assertIsNone(self._pulled_since()[0])
+        self.assertEqual(self._pulled_since()[2], {'updatedAt': {'gte': '2026-01-01T11:00:00+00:00'}})
+
+    def test_webhook_redelivery_is_ignored(self):
+        issue = Issue.objects.create(
+            organization=self.organization, title='Old', description='-',
+            synced_to_linear=True, linear_issue_id='lin-1'
+        )
+        payload = {'type': 'Issue', 'action': 'update', 'data': {'id': 'lin-1', 'title': 'Renamed in Linear'}}
+        client = APIClient()
+
+        first = client.post('/api/webhooks/linear/', payload, format='json', HTTP_LINEAR_DELIVERY='delivery-1')
+        Issue.objects.filter(pk=issue.pk).update(title='Renamed in CRM')
+        second = client.post('/api/webhooks/linear/', payload, format='json', HTTP_LINEAR_DELIVERY='delivery-1')
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(second.data['message'], 'Duplicate delivery ignored')
+        issue.refresh_from_db()
+        self.assertEqual(issue.title, 'Renamed in CRM')
+        self.assertEqual(LinearWebhookDelivery.objects.count(), 1)
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    """Keep-alive endpoint answering with the server's queued status codes (200 once they run out)."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            server.client_ports.add(self.client_address[1])
+            status_code = server.statuses.pop(0) if server.statuses else 200
+        content = json.dumps({'ok': status_code == 200}).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeUpstreamHandler)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.client_ports = set()
+        self.statuses = []
+        self.url = f'http://127.0.0.1:{self.server_address[1]}/'
+
+
+@override_settings(
+    HTTP_CLIENT_BACKOFF=0,
+    HTTP_CLIENT_MAX_RETRIES=2,
+    HTTP_CIRCUIT_FAILURE_THRESHOLD=2,
+    HTTP_CIRCUIT_RESET_TIMEOUT=0.1,
+)
+class HTTPClientTest(SimpleTestCase):
+    """The shared outbound client reuses connections, retries and trips its circuit breaker."""
+
+    def setUp(self):
+        self.server = FakeUpstreamServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = HTTPClient('upstream')
+        self.addCleanup(self.client.close)
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.server.url).status_code, 200)
+
+        self.assertEqual(self.server.hits, 5)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_gateway_errors_are_retried(self):
+        self.server.statuses = [503, 502]
+
+        response = self.client.get(self.server.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.hits, 3)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_circuit_opens_and_recovers(self):
+        self.server.statuses = [503, 503]
+
+        self.assertEqual(self.client.get(self.server.url, retries=0).status_code, 503)
+        self.assertEqual(self.client.get(self.server.url, retries=0).status_code, 503)
+        with self.assertRaises(CircuitOpenError):
+            self.client.get(self.server.url)
+        self.assertEqual(self.server.hits, 2)
+
+        time.sleep(0.15)
+        self.assertEqual(self.client.get(self.server.url).status_code, 200)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_connection_errors_count_towards_the_circuit(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            closed_url = f'http://127.0.0.1:{sock.getsockname()[1]}/'
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get(closed_url, retries=1)
+        # Retries within a call count as one failure
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get(closed_url, retries=1)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_async_requests_share_the_loop_client(self):
+        self.server.statuses = [504]
+
+        async def fetch():
+            first = await self.client.aget(self.server.url)
+            second = await self.client.aget(self.server.url)
+            same_client = self.client.async_client() is self.client.async_client()
+            await self.client.async_client().aclose()
+            return first.status_code, second.status_code, same_client
+
+        self.assertEqual(asyncio.run(fetch()), (200, 200, True))
+        self.assertEqual(self.server.hits, 3)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+
+job_calls = []
+job_failures = {'remaining': 0}
+
+
+@job(queue='test')
+def record_job_call(value):
+    job_calls.append(value)
+
+
+@job(queue='test', max_attempts=2)
+def flaky_job(value):
+    if job_failures['remaining'] > 0:
+        job_failures['remaining'] -= 1
+        raise RuntimeError('upstream unavailable')
+    job_calls.append(value)
+
+
+@override_settings(JOB_QUEUE_MODE='inline', JOB_QUEUE_RETRY_BACKOFF=0)
+class JobQueueTest(TestCase):
+    """Jobs run once their transaction commits, retry with backoff and end up dead-lettered."""
+
+    def setUp(self):
+        job_calls.clear()
+        job_failures['remaining'] = 0
+
+    def test_job_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            queued = record_job_call.delay('hello')
+            self.assertEqual(job_calls, [])
+        self.assertEqual(len(callbacks), 1)
+
+        queued.refresh_from_db()
+        self.assertEqual(job_calls, ['hello'])
+        self.assertEqual(queued.status, BackgroundJob.STATUS_SUCCEEDED)
+        self.assertEqual(queued.queue, 'test')
+        self.assertEqual(queued.attempts, 1)
+
+    def test_idempotency_key_queues_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = JobQueue.enqueue(record_job_call, args=['a'], idempotency_key='once')
+            second = JobQueue.enqueue(record_job_call, args=['b'], idempotency_key='once')
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(job_calls, ['a'])
+        self.assertEqual(BackgroundJob.objects.filter(idempotency_key='once').count(), 1)
+
+    def test_failed_job_is_retried_then_dead_lettered(self):
+        job_failures['remaining'] = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            queued = flaky_job.delay('x')
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, BackgroundJob.STATUS_PENDING)
+        self.assertIn('upstream unavailable', queued.last_error)
+
+        self.assertTrue(JobQueue.run_job(queued.pk))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, BackgroundJob.STATUS_DEAD)
+        self.assertEqual(queued.attempts, 2)
+        self.assertEqual(job_calls, [])
+        # Dead jobs are not picked up again
+        self.assertFalse(JobQueue.run_job(queued.pk))
+
+        admin = User.objects.create_user('ops@acme.test', 'ops', 'password', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=admin)
+
+        response = client.get('/api/background-jobs/', {'status': 'dead'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [queued.pk])
+
+        response = client.get('/api/background-jobs/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['queues']['test']['dead'], 1)
+        self.assertIsNotNone(response.data['queues']['test']['wait_ms'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(f'/api/background-jobs/{queued.pk}/retry/')
+        self.assertEqual(response.status_code, 200)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, BackgroundJob.STATUS_SUCCEEDED)
+        self.assertEqual(job_calls, ['x'])
+
+        response = client.post(f'/api/background-jobs/{queued.pk}/retry/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_jobs_are_claimed_by_priority(self):
+        low = JobQueue.enqueue(record_job_call, args=['low'])
+        high = JobQueue.enqueue(record_job_call, args=['high'], priority=10)
+        later = JobQueue.enqueue(record_job_call, args=['later'], priority=20, delay=60)
+
+        self.assertEqual(JobQueue.due_job_ids('test', 10), [high.pk, low.pk])
+        self.assertEqual(JobQueue.stats()['test']['scheduled'], 1)
+        self.assertFalse(JobQueue.run_job(later.pk))
+
+    @override_settings(JOB_QUEUE_CONCURRENCY={'test': 1})
+    def test_worker_respects_queue_concurrency(self):
+        for value in range(3):
+            JobQueue.enqueue(record_job_call, args=[value])
+        worker = JobWorker(queues=['test'])
+        with mock.patch.object(JobWorker, '_executor') as executor:
+            self.assertEqual(worker.poll(), 1)
+            self.assertEqual(worker.poll(), 0)
+        self.assertEqual(executor.return_value.submit.call_count, 1)
+        self.assertEqual(BackgroundJob.objects.filter(status=BackgroundJob.STATUS_RUNNING).count(), 1)
+
+    @override_settings(JOB_QUEUE_CONCURRENCY={'test': 3})
+    def test_jobs_with_the_same_lock_key_run_one_at_a_time(self):
+        older = JobQueue.enqueue(record_job_call, args=['older'], lock_key='issue-1')
+        newer = JobQueue.enqueue(record_job_call, args=['newer'], lock_key='issue-1')
+        other = JobQueue.enqueue(record_job_call, args=['other'], lock_key='issue-2')
+        worker = JobWorker(queues=['test'])
+
+        with mock.patch.object(JobWorker, '_executor') as executor:
+            self.assertEqual(worker.poll(), 2)
+            self.assertFalse(JobQueue.claim(newer.pk))
+            self.assertEqual(worker.poll(), 0)
+
+            JobQueue.execute(older.pk)
+            self.assertEqual(worker.poll(), 1)
+        self.assertEqual(
+            [call.args[2] for call in executor.return_value.submit.call_args_list],
+            [older.pk, other.pk, newer.pk]
+        )
+
+    def test_worker_requeues_stale_jobs_periodically(self):
+        stale = JobQueue.enqueue(record_job_call, args=['stale'])
+        BackgroundJob.objects.filter(pk=stale.pk).update(
+            status=BackgroundJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(minutes=20)
+        )
+        worker = JobWorker(queues=['test'], stale_after=600)
+
+        self.assertEqual(worker.requeue_stale(), 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, BackgroundJob.STATUS_PENDING)
+
+        # Not checked again until the next interval
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(worker.requeue_stale(), 0)
+        self.assertEqual(len(queries), 0)
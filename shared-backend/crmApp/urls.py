@@ -46,9 +46,13 @@ from crmApp.viewsets import (
     GeminiViewSet,
     # Analytics
     AnalyticsViewSet,
+    # Search
+    SearchViewSet,
     # Jitsi Calls
     JitsiCallViewSet,
     UserPresenceViewSet,
+    # Background Jobs
+    BackgroundJobViewSet,
 )
 
 # Import issue action views
@@ -134,10 +138,16 @@ router.register(r'gemini', GeminiViewSet, basename='gemini')
 # Analytics endpoints
 router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
+# Search endpoint
+router.register(r'search', SearchViewSet, basename='search')
+
 # Jitsi call endpoints
 router.register(r'jitsi-calls', JitsiCallViewSet, basename='jitsi-call')
 router.register(r'user-presence', UserPresenceViewSet, basename='user-presence')
 
+# Background job queue (dead letters, metrics)
+router.register(r'background-jobs', BackgroundJobViewSet, basename='background-job')
+
 # URL patterns
 urlpatterns = [
     # Dedicated issue action endpoints (MUST come BEFORE router.urls)
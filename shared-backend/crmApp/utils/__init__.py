@@ -9,6 +9,7 @@ from .profile_context import (
     get_user_accessible_organizations,
     get_user_active_profile,
 )
+from .request_context import RequestContext, get_request_context
 
 __all__ = [
     'PermissionChecker',
@@ -20,4 +21,6 @@ __all__ = [
     'get_customer_vendor_organizations',
     'get_user_accessible_organizations',
     'get_user_active_profile',
+    'RequestContext',
+    'get_request_context',
 ]
@@ -1,11 +1,15 @@
 """
 Profile Context Utilities
 Helper functions to get organization context based on user's active profile
+
+The active profile and accessible organizations are resolved once per request
+through RequestContext (see request_context.py); these helpers read from it.
 """
 
 from typing import Optional, List
 from django.contrib.auth import get_user_model
 from crmApp.models import UserProfile, Organization, Customer
+from crmApp.utils.request_context import get_request_context
 
 User = get_user_model()
 
@@ -25,29 +29,13 @@ def get_active_profile_organization(user: User) -> Optional[Organization]:
     Returns:
         Organization object or None
     """
-    if not user or not user.is_authenticated:
-        return None
-    
-    # Get primary/active profile
-    active_profile = UserProfile.objects.filter(
-        user=user,
-        is_primary=True,
-        status='active'
-    ).select_related('organization').first()
-    
-    # If no primary, get first active profile
-    if not active_profile:
-        active_profile = UserProfile.objects.filter(
-            user=user,
-            status='active'
-        ).select_related('organization').first()
-    
-    if not active_profile:
+    context = get_request_context(user)
+    if context is None or context.profile is None:
         return None
     
     # Vendor and Employee profiles have organization
-    if active_profile.profile_type in ['vendor', 'employee']:
-        return active_profile.organization
+    if context.profile_type in ['vendor', 'employee']:
+        return context.organization
     
     # Customer profile doesn't have a single organization
     # They see data from multiple vendor organizations
@@ -103,43 +91,11 @@ def get_user_accessible_organizations(user: User) -> List[int]:
     Returns:
         List of organization IDs
     """
-    if not user or not user.is_authenticated:
-        return []
-    
-    # Get active profile
-    active_profile = UserProfile.objects.filter(
-        user=user,
-        is_primary=True,
-        status='active'
-    ).first()
-    
-    if not active_profile:
-        active_profile = UserProfile.objects.filter(
-            user=user,
-            status='active'
-        ).first()
-    
-    if not active_profile:
+    context = get_request_context(user)
+    if context is None:
         return []
     
-    # Vendor: return their own organization
-    if active_profile.profile_type == 'vendor':
-        if active_profile.organization:
-            return [active_profile.organization.id]
-        return []
-    
-    # Employee: return the organization they work for
-    if active_profile.profile_type == 'employee':
-        if active_profile.organization:
-            return [active_profile.organization.id]
-        return []
-    
-    # Customer: return all vendor organizations where they are a customer
-    if active_profile.profile_type == 'customer':
-        customer_orgs = get_customer_vendor_organizations(user)
-        return [org.id for org in customer_orgs]
-    
-    return []
+    return list(context.accessible_organization_ids)
 
 
 def get_user_active_profile(user: User) -> Optional[UserProfile]:
@@ -152,22 +108,5 @@ def get_user_active_profile(user: User) -> Optional[UserProfile]:
     Returns:
         UserProfile object or None
     """
-    if not user or not user.is_authenticated:
-        return None
-    
-    # Get primary profile
-    profile = UserProfile.objects.filter(
-        user=user,
-        is_primary=True,
-        status='active'
-    ).select_related('organization').first()
-    
-    # If no primary, get first active profile
-    if not profile:
-        profile = UserProfile.objects.filter(
-            user=user,
-            status='active'
-        ).select_related('organization').first()
-    
-    return profile
-
+    context = get_request_context(user)
+    return context.profile if context else None
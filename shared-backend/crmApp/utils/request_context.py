@@ -0,0 +1,206 @@
+"""
+Request Context
+Resolves a user's profile/organization context once per request.
+
+The context (active profile, organization, accessible organization IDs and
+the compiled RBAC permission set) is memoized on the user object, which DRF
+and the middleware keep for the whole request, and optionally in the shared
+cache for REQUEST_CONTEXT_CACHE_TIMEOUT seconds keyed by user and a
+per-user version that signals bump whenever profiles or customer links change.
+With a per-process cache, entries expire after LOCAL_CACHE_MAX_TIMEOUT seconds
+because the version bumps do not reach other processes.
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from crmApp.utils.shared_cache import shared_timeout
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CONTEXT_CACHE_PREFIX = "request_ctx_"
+
+# Attribute used to memoize the context on the request user
+_REQUEST_MEMO_ATTR = '_request_context'
+
+
+def _version_key(user_id: int) -> str:
+    return f"{REQUEST_CONTEXT_CACHE_PREFIX}version_{user_id}"
+
+
+class RequestContext:
+    """
+    Profile/organization context of an authenticated user.
+
+    Rules (same as the profile_context helpers):
+    - Active profile: the primary active profile, else the first active one
+    - Vendor/Employee: organization of the active profile
+    - Customer: no single organization; accessible organizations are all
+      vendors the user is a customer of
+    """
+
+    __slots__ = ('user', 'profiles', 'profile', 'accessible_organization_ids', '_customer_organization')
+
+    def __init__(self, user, profiles: List, accessible_organization_ids: Tuple[int, ...]):
+        self.user = user
+        self.profiles = profiles
+        self.profile = self._pick_active_profile(profiles)
+        self.accessible_organization_ids = accessible_organization_ids
+        self._customer_organization = None
+
+    @staticmethod
+    def _pick_active_profile(profiles):
+        for profile in profiles:
+            if profile.is_primary:
+                return profile
+        return profiles[0] if profiles else None
+
+    # ------------------------------------------------------------------
+    # Derived values
+    # ------------------------------------------------------------------
+
+    @property
+    def profile_type(self) -> Optional[str]:
+        return self.profile.profile_type if self.profile else None
+
+    @property
+    def organization(self):
+        """Organization of the active profile (any profile type), or None."""
+        return self.profile.organization if self.profile else None
+
+    @property
+    def current_organization(self):
+        """
+        Organization the user is working in: the active profile's organization
+        for vendors/employees, the first vendor organization for customers.
+        """
+        if self.profile_type in ('vendor', 'employee'):
+            return self.organization
+        if self.profile_type == 'customer' and self.accessible_organization_ids:
+            if self._customer_organization is None:
+                from crmApp.models import Organization
+                self._customer_organization = Organization.objects.filter(
+                    id=self.accessible_organization_ids[0]
+                ).first()
+            return self._customer_organization
+        return None
+
+    @property
+    def profile_organization_ids(self) -> List[int]:
+        """Organization IDs of all of the user's active profiles."""
+        return [profile.organization_id for profile in self.profiles if profile.organization_id]
+
+    @property
+    def is_organization_owner(self) -> bool:
+        return self.profile_type == 'vendor' and self.organization is not None
+
+    @property
+    def permission_set(self):
+        """Compiled RBAC permission set for the active organization (memoized by RBACService)."""
+        from crmApp.services.rbac_service import PermissionSet, RBACService
+        organization = self.organization
+        if organization is None:
+            return PermissionSet()
+        return RBACService.get_permission_set(self.user, organization)
+
+    def profile_for_organization(self, organization_id: Optional[int]):
+        """The user's active profile in an organization, or None."""
+        for profile in self.profiles:
+            if profile.organization_id == organization_id:
+                return profile
+        return None
+
+    def apply(self, user) -> None:
+        """
+        Expose the context through the attributes existing code reads from
+        request.user (active_profile, current_organization, ...).
+        """
+        user.active_profile = self.profile
+        user.current_organization = self.current_organization
+        user.accessible_organization_ids = list(self.accessible_organization_ids)
+        user.is_organization_owner = self.is_organization_owner
+
+    # ------------------------------------------------------------------
+    # Resolution
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def resolve(cls, user) -> 'RequestContext':
+        """Load the context from the database (one query, one more for customers)."""
+        from crmApp.models import Customer, UserProfile
+
+        profiles = list(
+            UserProfile.objects.filter(user=user, status='active')
+            .select_related('organization')
+            .order_by('pk')
+        )
+        profile = cls._pick_active_profile(profiles)
+
+        accessible: Tuple[int, ...] = ()
+        if profile is not None:
+            if profile.profile_type in ('vendor', 'employee'):
+                accessible = (profile.organization_id,) if profile.organization_id else ()
+            elif profile.profile_type == 'customer':
+                # Vendor organizations linked through CustomerOrganization (ordered like the org table)
+                organization_ids = Customer.objects.filter(user=user).values_list(
+                    'organizations__id', flat=True
+                ).distinct()
+                accessible = tuple(sorted(org_id for org_id in organization_ids if org_id is not None))
+
+        return cls(user, profiles, accessible)
+
+    @classmethod
+    def for_user(cls, user) -> Optional['RequestContext']:
+        """
+        Context for an authenticated user: memoized on the user object, then
+        the shared cache (when REQUEST_CONTEXT_CACHE_TIMEOUT > 0), then the database.
+        """
+        if not user or not getattr(user, 'is_authenticated', False):
+            return None
+
+        context = user.__dict__.get(_REQUEST_MEMO_ATTR)
+        if context is not None:
+            return context
+
+        timeout = shared_timeout(getattr(settings, 'REQUEST_CONTEXT_CACHE_TIMEOUT', 60))
+        cache_key = None
+        if timeout:
+            version = cache.get(_version_key(user.pk), 1)
+            cache_key = f"{REQUEST_CONTEXT_CACHE_PREFIX}{user.pk}_{version}"
+            cached = cache.get(cache_key)
+            if cached is not None:
+                profiles, accessible = cached
+                context = cls(user, profiles, accessible)
+
+        if context is None:
+            context = cls.resolve(user)
+            if cache_key:
+                cache.set(cache_key, (context.profiles, context.accessible_organization_ids), timeout)
+
+        user.__dict__[_REQUEST_MEMO_ATTR] = context
+        return context
+
+    @staticmethod
+    def invalidate(user_id: Optional[int]) -> None:
+        """Invalidate the shared-cache context of a user (profiles or customer links changed)."""
+        if not user_id:
+            return
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key missing or evicted - any new value invalidates old entries
+            cache.set(key, 2, None)
+
+    @staticmethod
+    def forget(user) -> None:
+        """Drop the context memoized on a user object (e.g. after switching profile)."""
+        user.__dict__.pop(_REQUEST_MEMO_ATTR, None)
+
+
+def get_request_context(user) -> Optional[RequestContext]:
+    """Shortcut for RequestContext.for_user(user)."""
+    return RequestContext.for_user(user)
@@ -0,0 +1,37 @@
+"""
+Shared Cache
+Helpers for values that are cached and invalidated across processes.
+
+Invalidation (version bumps, deletes) only reaches other web workers and the
+run_jobs / run_telegram_worker processes when the cache backend is shared
+between them. A per-process backend (LocMem, Dummy) still works within one
+request or process, but entries must then expire quickly.
+"""
+
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Backends whose entries are only visible to the process that wrote them
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias: str = 'default') -> bool:
+    """Whether the cache is shared between processes"""
+    backend = type(caches[alias])
+    return f'{backend.__module__}.{backend.__name__}' not in PROCESS_LOCAL_BACKENDS
+
+
+def shared_timeout(timeout: Optional[int], alias: str = 'default') -> Optional[int]:
+    """
+    Cache timeout for a value invalidated across processes: timeout with a
+    shared cache, at most LOCAL_CACHE_MAX_TIMEOUT seconds with a per-process one.
+    """
+    if cache_is_shared(alias):
+        return timeout
+    local_max = getattr(settings, 'LOCAL_CACHE_MAX_TIMEOUT', 5)
+    return local_max if timeout is None else min(timeout, local_max)
@@ -0,0 +1,42 @@
+"""
+Write Transaction
+transaction.atomic() for blocks that read rows and then write them.
+
+On SQLite a plain (DEFERRED) transaction starts as a reader and upgrades to
+a writer at its first write. Two such transactions that both read first
+cannot both upgrade: one fails with "database is locked" immediately,
+without waiting on the busy timeout. write_transaction() starts SQLite
+transactions with BEGIN IMMEDIATE instead, so concurrent writers queue at
+BEGIN. Every other transaction keeps the default mode, so read-heavy
+requests never wait for the write lock.
+
+On other databases (row locks via select_for_update) and inside an
+already open transaction it is a plain transaction.atomic().
+"""
+
+from contextlib import contextmanager
+from typing import Optional
+
+from django.db import transaction
+
+
+@contextmanager
+def write_transaction(using: Optional[str] = None):
+    """transaction.atomic() that takes SQLite's write lock when it begins"""
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Connecting resets transaction_mode from settings, so connect first
+    connection.ensure_connection()
+    default_mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # Only the BEGIN of this block needs it
+            connection.transaction_mode = default_mode
+            yield
+    finally:
+        connection.transaction_mode = default_mode
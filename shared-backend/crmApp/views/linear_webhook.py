@@ -10,8 +10,8 @@ from django.db import transaction
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from crmApp.models import Issue
-from crmApp.services.linear_service import LinearService
+from crmApp.models import Issue, LinearWebhookDelivery
+from crmApp.services.issue_linear_service import IssueLinearService
 import logging
 import hmac
 import hashlib
@@ -87,21 +87,34 @@ class LinearWebhookView(APIView):
             event_type = data.get('type')
             action = data.get('action')
             issue_data = data.get('data', {})
+            delivery_id = request.headers.get('Linear-Delivery')
             
             logger.info(f"Received Linear webhook: type={event_type}, action={action}, issue_id={issue_data.get('id')}")
             
-            # Handle Issue events
-            if event_type == 'Issue':
-                return self.handle_issue_event(action, issue_data)
-            
-            # Handle Comment events
-            elif event_type == 'Comment':
-                logger.info(f"Comment event received (not implemented): {action}")
-                return Response({'message': 'Comment event received'}, status=status.HTTP_200_OK)
-            
-            else:
-                logger.info(f"Unhandled event type: {event_type}")
-                return Response({'message': 'Event received'}, status=status.HTTP_200_OK)
+            # The delivery is recorded in the same transaction as its effects,
+            # so a failed delivery is applied when Linear retries it
+            with transaction.atomic():
+                if delivery_id:
+                    _, created = LinearWebhookDelivery.objects.get_or_create(
+                        delivery_id=delivery_id,
+                        defaults={'event_type': event_type or '', 'action': action or ''}
+                    )
+                    if not created:
+                        logger.info(f"Duplicate Linear webhook delivery ignored: {delivery_id}")
+                        return Response({'message': 'Duplicate delivery ignored'}, status=status.HTTP_200_OK)
+                
+                # Handle Issue events
+                if event_type == 'Issue':
+                    return self.handle_issue_event(action, issue_data)
+                
+                # Handle Comment events
+                elif event_type == 'Comment':
+                    logger.info(f"Comment event received (not implemented): {action}")
+                    return Response({'message': 'Comment event received'}, status=status.HTTP_200_OK)
+                
+                else:
+                    logger.info(f"Unhandled event type: {event_type}")
+                    return Response({'message': 'Event received'}, status=status.HTTP_200_OK)
                 
         except Exception as e:
             logger.error(f"Error processing Linear webhook: {str(e)}", exc_info=True)
@@ -135,48 +148,7 @@ class LinearWebhookView(APIView):
                     # Issue was updated in Linear - sync changes to CRM
                     logger.info(f"Syncing Linear issue update to CRM: {issue.issue_number}")
                     
-                    # Update title and description if changed
-                    if 'title' in issue_data:
-                        issue.title = issue_data['title']
-                    
-                    if 'description' in issue_data:
-                        issue.description = issue_data['description']
-                    
-                    # Update priority
-                    if 'priority' in issue_data:
-                        from crmApp.services.linear_service import LinearService
-                        linear_service = LinearService()
-                        issue.priority = linear_service.map_linear_priority_to_crm(issue_data['priority'])
-                    
-                    # Update status based on Linear state
-                    if 'state' in issue_data:
-                        state = issue_data['state']
-                        state_name = state.get('name', '').lower()
-                        state_type = state.get('type', '').lower()
-                        
-                        # Map Linear states to CRM statuses
-                        # Use state type if available (started, completed, canceled)
-                        if state_type == 'started':
-                            issue.status = 'in_progress'
-                        elif state_type == 'completed':
-                            issue.status = 'resolved'
-                            if not issue.resolved_at:
-                                issue.resolved_at = timezone.now()
-                        elif state_type == 'canceled':
-                            issue.status = 'closed'
-                        else:
-                            # Fallback to state name mapping
-                            if state_name in ['backlog', 'todo', 'triage', 'unstarted']:
-                                issue.status = 'open'
-                            elif state_name in ['in progress', 'in review', 'started']:
-                                issue.status = 'in_progress'
-                            elif state_name in ['done', 'completed', 'resolved']:
-                                issue.status = 'resolved'
-                                if not issue.resolved_at:
-                                    issue.resolved_at = timezone.now()
-                            elif state_name in ['canceled', 'cancelled', 'duplicate']:
-                                issue.status = 'closed'
-                    
+                    IssueLinearService.apply_linear_issue(issue, issue_data)
                     issue.last_synced_at = timezone.now()
                     issue.save()
                     
@@ -66,6 +66,12 @@ from .gemini import GeminiViewSet
 # Analytics & Reporting
 from .analytics import AnalyticsViewSet
 
+# Search
+from .search import SearchViewSet
+
+# Background Jobs
+from .background_job import BackgroundJobViewSet
+
 
 __all__ = [
     # Authentication & Authorization
@@ -121,4 +127,10 @@ __all__ = [
     
     # Analytics
     'AnalyticsViewSet',
+    
+    # Search
+    'SearchViewSet',
+    
+    # Background Jobs
+    'BackgroundJobViewSet',
 ]
@@ -8,6 +8,8 @@ from rest_framework.response import Response
 # from django_filters.rest_framework import DjangoFilterBackend  # Not installed
 from django.utils import timezone
 from crmApp.models import Activity
+from crmApp.pagination import CursorResultsSetPagination
+from crmApp.services.activity_timeline_service import ActivityTimelineService, InvalidTimelineCursor
 from crmApp.serializers import (
     ActivitySerializer,
     ActivityListSerializer,
@@ -26,9 +28,16 @@ class ActivityViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'description', 'customer_name']
     ordering_fields = ['created_at', 'updated_at', 'scheduled_at', 'completed_at']
     ordering = ['-created_at']
+    pagination_class = CursorResultsSetPagination
     
     def get_queryset(self):
         """Filter activities by user's organizations"""
+        return Activity.objects.filter(
+            organization_id__in=self._organization_ids()
+        ).select_related('customer', 'lead', 'deal', 'assigned_to', 'created_by')
+    
+    def _organization_ids(self):
+        """Organizations whose activities the user sees"""
         user = self.request.user
         
         # Get active profile
@@ -37,19 +46,15 @@ class ActivityViewSet(viewsets.ModelViewSet):
         # Fallback to user_organizations for backward compatibility
         if active_profile and active_profile.organization:
             logger.debug(f"[ActivityViewSet] Filtering by organization: {active_profile.organization.id}")
-            return Activity.objects.filter(
-                organization_id=active_profile.organization.id
-            ).select_related('customer', 'lead', 'deal', 'assigned_to', 'created_by')
-        else:
-            # Fallback to old method
-            user_orgs = user.user_organizations.filter(
-                is_active=True
-            ).values_list('organization_id', flat=True)
-            
-            logger.debug(f"[ActivityViewSet] Filtering by user organizations: {list(user_orgs)}")
-            return Activity.objects.filter(
-                organization_id__in=user_orgs
-            ).select_related('customer', 'lead', 'deal', 'assigned_to', 'created_by')
+            return [active_profile.organization.id]
+        
+        # Fallback to old method
+        user_orgs = list(user.user_organizations.filter(
+            is_active=True
+        ).values_list('organization_id', flat=True))
+        
+        logger.debug(f"[ActivityViewSet] Filtering by user organizations: {user_orgs}")
+        return user_orgs
     
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
@@ -170,3 +175,45 @@ class ActivityViewSet(viewsets.ModelViewSet):
                 {'error': 'Internal Server Error', 'details': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @action(detail=False, methods=['get'])
+    def timeline(self, request):
+        """
+        Activities, audit log entries and video calls merged newest first.
+        
+        Query params: activity_type, status, customer, lead, deal,
+        assigned_to, search, limit (max 100) and cursor (next_cursor of the
+        previous page).
+        """
+        params = request.query_params
+        try:
+            filters = {
+                f'{name}_id' if name in ('customer', 'lead', 'deal') else name: int(params[name])
+                for name in ('customer', 'lead', 'deal', 'assigned_to')
+                if params.get(name)
+            }
+            limit = int(params.get('limit') or ActivityTimelineService.DEFAULT_LIMIT)
+        except ValueError:
+            return Response(
+                {'error': 'customer, lead, deal, assigned_to and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            page = ActivityTimelineService.page(
+                self._organization_ids(),
+                limit=limit,
+                cursor=params.get('cursor'),
+                activity_type=params.get('activity_type'),
+                status=params.get('status'),
+                search=params.get('search'),
+                **filters
+            )
+        except InvalidTimelineCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'results': page['activities'],
+            'more_available': page['more_available'],
+            'next_cursor': page['next_cursor'],
+        }, status=status.HTTP_200_OK)
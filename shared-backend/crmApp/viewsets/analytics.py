@@ -5,16 +5,17 @@ Provides analytics and reporting endpoints for dashboard statistics
 
 import logging
 from datetime import datetime, timedelta
-from django.db.models import Sum, Count, Q, Avg
+from django.db.models import Sum
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
-from crmApp.models import Customer, Lead, Deal, Activity, Employee
+from crmApp.models import Lead, Deal, Employee
 from crmApp.viewsets.mixins import OrganizationFilterMixin
-from crmApp.services import RBACService
+from crmApp.services import AnalyticsService
+from crmApp.services.analytics_service import REVENUE_PERIODS
 
 logger = logging.getLogger(__name__)
 
@@ -34,8 +35,10 @@ class AnalyticsViewSet(viewsets.ViewSet, OrganizationFilterMixin):
         if start_date:
             start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
         else:
-            # Default to 30 days ago
-            start_date = timezone.now() - timedelta(days=30)
+            # Default to the start of the day 30 days ago (whole days can be served from rollups)
+            start_date = timezone.localtime().replace(
+                hour=0, minute=0, second=0, microsecond=0
+            ) - timedelta(days=30)
         
         if end_date:
             end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
@@ -45,9 +48,8 @@ class AnalyticsViewSet(viewsets.ViewSet, OrganizationFilterMixin):
         return start_date, end_date
 
     def _get_accessible_organizations(self, request):
-        """Get organizations accessible to the user"""
-        rbac_service = RBACService(request.user)
-        return rbac_service.get_accessible_organizations()
+        """Get IDs of organizations accessible to the user"""
+        return self.get_accessible_organization_ids(request.user)
 
     @action(detail=False, methods=['get'], url_path='dashboard-stats')
     def dashboard_stats(self, request):
@@ -59,53 +61,7 @@ class AnalyticsViewSet(viewsets.ViewSet, OrganizationFilterMixin):
             organizations = self._get_accessible_organizations(request)
             start_date, end_date = self._get_date_range(request)
 
-            # Get filtered querysets
-            customers = Customer.objects.filter(organization__in=organizations)
-            leads = Lead.objects.filter(organization__in=organizations)
-            deals = Deal.objects.filter(organization__in=organizations)
-            activities = Activity.objects.filter(organization__in=organizations)
-
-            # Calculate statistics
-            total_customers = customers.count()
-            total_leads = leads.count()
-            total_deals = deals.count()
-
-            won_deals = deals.filter(is_won=True)
-            won_deals_count = won_deals.count()
-            lost_deals = deals.filter(is_closed=True, is_won=False)
-            lost_deals_count = lost_deals.count()
-
-            total_revenue = won_deals.aggregate(
-                total=Sum('value')
-            )['total'] or 0
-
-            active_deals_value = deals.filter(is_closed=False).aggregate(
-                total=Sum('value')
-            )['total'] or 0
-
-            conversion_rate = (won_deals_count / total_deals * 100) if total_deals > 0 else 0
-
-            # Get recent activities
-            recent_activities = activities.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date
-            ).order_by('-created_at')[:10]
-
-            # Serialize activities
-            from crmApp.serializers import ActivitySerializer
-            activities_data = ActivitySerializer(recent_activities, many=True).data
-
-            return Response({
-                'total_leads': total_leads,
-                'total_deals': total_deals,
-                'total_customers': total_customers,
-                'total_revenue': float(total_revenue),
-                'active_deals_value': float(active_deals_value),
-                'won_deals_count': won_deals_count,
-                'lost_deals_count': lost_deals_count,
-                'conversion_rate': round(conversion_rate, 2),
-                'recent_activities': activities_data
-            })
+            return Response(AnalyticsService.dashboard_stats(organizations, start_date, end_date))
 
         except Exception as e:
             logger.error(f"Error fetching dashboard stats: {str(e)}", exc_info=True)
@@ -124,31 +80,7 @@ class AnalyticsViewSet(viewsets.ViewSet, OrganizationFilterMixin):
             organizations = self._get_accessible_organizations(request)
             start_date, end_date = self._get_date_range(request)
 
-            deals = Deal.objects.filter(
-                organization__in=organizations,
-                created_at__gte=start_date,
-                created_at__lte=end_date
-            )
-
-            # Group by pipeline stage
-            from crmApp.models import PipelineStage
-            stages = PipelineStage.objects.filter(
-                pipeline__organization__in=organizations,
-                pipeline__is_active=True
-            ).order_by('order')
-
-            funnel_data = []
-            for stage in stages:
-                stage_deals = deals.filter(stage=stage)
-                count = stage_deals.count()
-                value = stage_deals.aggregate(total=Sum('value'))['total'] or 0
-                
-                funnel_data.append({
-                    'stage': stage.name,
-                    'count': count,
-                    'value': float(value),
-                    'conversion_rate': None  # Could calculate if needed
-                })
+            funnel_data = AnalyticsService.sales_funnel(organizations, start_date, end_date)
 
             return Response({'funnel_data': funnel_data})
 
@@ -170,83 +102,13 @@ class AnalyticsViewSet(viewsets.ViewSet, OrganizationFilterMixin):
             start_date, end_date = self._get_date_range(request)
             period = request.query_params.get('period', 'month')
 
-            deals = Deal.objects.filter(
-                organization__in=organizations,
-                is_won=True,
-                closed_at__gte=start_date,
-                closed_at__lte=end_date
-            )
-
-            # Group by period
-            revenue_data = []
-            
-            if period == 'day':
-                # Group by day
-                from django.db.models.functions import TruncDay
-                grouped = deals.annotate(
-                    period=TruncDay('closed_at')
-                ).values('period').annotate(
-                    revenue=Sum('value'),
-                    deals_count=Count('id'),
-                    average_deal_value=Avg('value')
-                ).order_by('period')
-                
-            elif period == 'week':
-                # Group by week
-                from django.db.models.functions import TruncWeek
-                grouped = deals.annotate(
-                    period=TruncWeek('closed_at')
-                ).values('period').annotate(
-                    revenue=Sum('value'),
-                    deals_count=Count('id'),
-                    average_deal_value=Avg('value')
-                ).order_by('period')
-                
-            elif period == 'month':
-                # Group by month
-                from django.db.models.functions import TruncMonth
-                grouped = deals.annotate(
-                    period=TruncMonth('closed_at')
-                ).values('period').annotate(
-                    revenue=Sum('value'),
-                    deals_count=Count('id'),
-                    average_deal_value=Avg('value')
-                ).order_by('period')
-                
-            elif period == 'quarter':
-                # Group by quarter
-                from django.db.models.functions import TruncQuarter
-                grouped = deals.annotate(
-                    period=TruncQuarter('closed_at')
-                ).values('period').annotate(
-                    revenue=Sum('value'),
-                    deals_count=Count('id'),
-                    average_deal_value=Avg('value')
-                ).order_by('period')
-                
-            elif period == 'year':
-                # Group by year
-                from django.db.models.functions import TruncYear
-                grouped = deals.annotate(
-                    period=TruncYear('closed_at')
-                ).values('period').annotate(
-                    revenue=Sum('value'),
-                    deals_count=Count('id'),
-                    average_deal_value=Avg('value')
-                ).order_by('period')
-            else:
+            if period not in REVENUE_PERIODS:
                 return Response(
                     {'error': 'Invalid period. Use: day, week, month, quarter, year'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            for item in grouped:
-                revenue_data.append({
-                    'period': item['period'].isoformat() if item['period'] else None,
-                    'revenue': float(item['revenue'] or 0),
-                    'deals_count': item['deals_count'],
-                    'average_deal_value': float(item['average_deal_value'] or 0)
-                })
+            revenue_data = AnalyticsService.revenue_by_period(organizations, start_date, end_date, period)
 
             return Response({'revenue_data': revenue_data})
 
@@ -384,32 +246,8 @@ class AnalyticsViewSet(viewsets.ViewSet, OrganizationFilterMixin):
         """
         try:
             organizations = self._get_accessible_organizations(request)
-            
-            # Get counts
-            total_customers = Customer.objects.filter(organization__in=organizations).count()
-            total_leads = Lead.objects.filter(organization__in=organizations).count()
-            total_deals = Deal.objects.filter(organization__in=organizations).count()
-            
-            active_deals = Deal.objects.filter(
-                organization__in=organizations,
-                is_closed=False
-            ).count()
-            
-            won_deals = Deal.objects.filter(
-                organization__in=organizations,
-                is_won=True
-            )
-            
-            total_revenue = won_deals.aggregate(total=Sum('value'))['total'] or 0
-
-            return Response({
-                'total_customers': total_customers,
-                'total_leads': total_leads,
-                'total_deals': total_deals,
-                'active_deals': active_deals,
-                'won_deals': won_deals.count(),
-                'total_revenue': float(total_revenue)
-            })
+
+            return Response(AnalyticsService.quick_stats(organizations))
 
         except Exception as e:
             logger.error(f"Error fetching quick stats: {str(e)}", exc_info=True)
@@ -9,6 +9,8 @@ from rest_framework.response import Response
 from django.db.models import Q
 
 from crmApp.models import AuditLog
+from crmApp.pagination import CursorResultsSetPagination
+from crmApp.services import AnalyticsService
 from crmApp.serializers.audit_log import AuditLogSerializer, AuditLogListSerializer
 from crmApp.viewsets.mixins import OrganizationFilterMixin, QueryFilterMixin
 
@@ -27,6 +29,7 @@ class AuditLogViewSet(
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CursorResultsSetPagination
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -102,48 +105,7 @@ class AuditLogViewSet(
         """
         Get audit log statistics for the current organization.
         """
-        queryset = self.get_queryset()
-        
-        # Count by action type
-        action_counts = {}
-        for action, label in AuditLog.ACTION_CHOICES:
-            count = queryset.filter(action=action).count()
-            if count > 0:
-                action_counts[action] = {
-                    'label': label,
-                    'count': count
-                }
-        
-        # Count by resource type
-        resource_counts = {}
-        for resource, label in AuditLog.RESOURCE_TYPE_CHOICES:
-            count = queryset.filter(resource_type=resource).count()
-            if count > 0:
-                resource_counts[resource] = {
-                    'label': label,
-                    'count': count
-                }
-        
-        # Count by user profile type
-        profile_type_counts = {
-            'vendor': queryset.filter(user_profile_type='vendor').count(),
-            'employee': queryset.filter(user_profile_type='employee').count(),
-            'customer': queryset.filter(user_profile_type='customer').count(),
-        }
-        
-        # Recent activity count (last 24 hours)
-        from django.utils import timezone
-        from datetime import timedelta
-        last_24h = timezone.now() - timedelta(hours=24)
-        recent_count = queryset.filter(created_at__gte=last_24h).count()
-        
-        return Response({
-            'total_logs': queryset.count(),
-            'recent_activity_24h': recent_count,
-            'by_action': action_counts,
-            'by_resource': resource_counts,
-            'by_profile_type': profile_type_counts,
-        })
+        return Response(AnalyticsService.audit_log_stats(self.get_queryset()))
     
     @action(detail=False, methods=['get'])
     def recent(self, request):
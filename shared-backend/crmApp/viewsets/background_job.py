@@ -0,0 +1,70 @@
+"""
+ViewSet for Background Jobs
+Dead-letter inspection, manual retries and queue metrics (staff only)
+"""
+import logging
+from rest_framework import viewsets, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from crmApp.models import BackgroundJob
+from crmApp.pagination import CursorResultsSetPagination
+from crmApp.serializers import BackgroundJobSerializer
+from crmApp.services.job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for background jobs.
+    
+    GET /api/background-jobs/?status=dead       - dead-letter queue
+    POST /api/background-jobs/{id}/retry/       - requeue a dead job
+    GET /api/background-jobs/stats/             - depth and latency per queue
+    """
+    queryset = BackgroundJob.objects.all()
+    serializer_class = BackgroundJobSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = CursorResultsSetPagination
+    
+    def get_queryset(self):
+        queryset = BackgroundJob.objects.all()
+        
+        job_status = self.request.query_params.get('status')
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+        
+        queue = self.request.query_params.get('queue')
+        if queue:
+            queryset = queryset.filter(queue=queue)
+        
+        task = self.request.query_params.get('task')
+        if task:
+            queryset = queryset.filter(task=task)
+        
+        return queryset
+    
+    @action(detail=True, methods=['post'])
+    def retry(self, request, pk=None):
+        """Put a dead job back in its queue with fresh attempts"""
+        job = self.get_object()
+        if not JobQueue.retry(job):
+            return Response(
+                {'error': 'Bad Request', 'details': f'Only dead jobs can be retried (job is {job.status})'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        logger.info(f"Job #{job.pk} {job.task} requeued by {request.user.email}")
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Queue depth, dead letters and wait/run latency percentiles per queue"""
+        try:
+            window = int(request.query_params.get('window', 3600))
+        except ValueError:
+            window = 3600
+        return Response({'window_seconds': window, 'queues': JobQueue.stats(window_seconds=window)})
@@ -9,12 +9,14 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
 
 from crmApp.models import Customer
+from crmApp.pagination import CursorResultsSetPagination
 from crmApp.serializers import (
     CustomerSerializer,
     CustomerCreateSerializer,
     CustomerListSerializer,
 )
-from crmApp.services import RBACService
+from crmApp.services import RBACService, CustomerService
+from crmApp.utils.request_context import get_request_context
 from crmApp.viewsets.mixins import (
     PermissionCheckMixin,
     OrganizationFilterMixin,
@@ -40,6 +42,7 @@ class CustomerViewSet(
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CursorResultsSetPagination
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -120,13 +123,8 @@ class CustomerViewSet(
         """
         from django.db.models import Q
         
-        # Get organization IDs from user's active profiles
-        user_orgs = list(self.request.user.user_profiles.filter(
-            status='active'
-        ).values_list('organization_id', flat=True))
-        
-        # Filter out None values
-        user_orgs = [org_id for org_id in user_orgs if org_id is not None]
+        # Get organization IDs from user's active profiles (request context)
+        user_orgs = get_request_context(self.request.user).profile_organization_ids
         
         if user_orgs:
             # Show customers that are linked to user's organization(s) either through:
@@ -174,23 +172,21 @@ class CustomerViewSet(
         if customer_type:
             queryset = queryset.filter(customer_type=customer_type)
         
-        return queryset.select_related('organization', 'assigned_to').prefetch_related(
+        queryset = queryset.select_related('organization', 'assigned_to', 'user').prefetch_related(
             'customer_organizations',
             'customer_organizations__organization',
             'customer_organizations__assigned_employee'
         )
+        
+        # Won-deal revenue as an annotation (avoids one SUM query per row in list serializers)
+        return CustomerService.annotate_total_value(queryset)
     
     def get_object(self):
         """Override get_object to ensure we can retrieve customers regardless of status"""
         from django.db.models import Q
         
         # Get the queryset without status filtering for retrieve/update/delete
-        user_orgs = list(self.request.user.user_profiles.filter(
-            status='active'
-        ).values_list('organization_id', flat=True))
-        
-        # Filter out None values
-        user_orgs = [org_id for org_id in user_orgs if org_id is not None]
+        user_orgs = get_request_context(self.request.user).profile_organization_ids
         
         if user_orgs:
             # Show customers linked to user's organizations via primary OR M2M
@@ -219,6 +215,7 @@ class CustomerViewSet(
             'customer_organizations__organization',
             'customer_organizations__assigned_employee'
         )
+        queryset = CustomerService.annotate_total_value(queryset)
         
         # Use the standard DRF get_object logic
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
@@ -271,9 +268,7 @@ class CustomerViewSet(
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get customer statistics"""
-        user_orgs = request.user.user_profiles.filter(
-            status='active'
-        ).values_list('organization_id', flat=True)
+        user_orgs = get_request_context(request.user).profile_organization_ids
         
         queryset = Customer.objects.filter(organization_id__in=user_orgs)
         
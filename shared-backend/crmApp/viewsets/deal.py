@@ -9,7 +9,6 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
 from django.utils import timezone
-from django.db.models import Sum, Count, Q
 
 from crmApp.models import Pipeline, PipelineStage, Deal
 from crmApp.serializers import (
@@ -20,7 +19,7 @@ from crmApp.serializers import (
     DealUpdateSerializer,
     DealListSerializer,
 )
-from crmApp.services import RBACService
+from crmApp.services import RBACService, AnalyticsService
 from crmApp.viewsets.mixins import (
     PermissionCheckMixin,
     OrganizationFilterMixin,
@@ -264,41 +263,7 @@ class DealViewSet(
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get deal statistics"""
-        queryset = self.get_queryset()
-        
-        total_value = queryset.aggregate(total=Sum('value'))['total'] or 0
-        expected_revenue = queryset.aggregate(total=Sum('expected_revenue'))['total'] or 0
-        
-        stats = {
-            'total_deals': queryset.count(),
-            'total_value': float(total_value),
-            'expected_revenue': float(expected_revenue),
-            'won': queryset.filter(is_won=True).count(),
-            'lost': queryset.filter(is_lost=True).count(),
-            'open': queryset.filter(is_won=False, is_lost=False).count(),
-            'by_stage': [],
-            'by_priority': {
-                'low': queryset.filter(priority='low').count(),
-                'medium': queryset.filter(priority='medium').count(),
-                'high': queryset.filter(priority='high').count(),
-                'urgent': queryset.filter(priority='urgent').count(),
-            }
-        }
-        
-        # Group by stage
-        stages = queryset.values('stage__name').annotate(
-            count=Count('id'),
-            total_value=Sum('value')
-        )
-        for stage in stages:
-            if stage['stage__name']:
-                stats['by_stage'].append({
-                    'stage_name': stage['stage__name'],
-                    'count': stage['count'],
-                    'total_value': float(stage['total_value'] or 0)
-                })
-        
-        return Response(stats)
+        return Response(AnalyticsService.deal_stats(self.get_queryset()))
     
     @action(detail=True, methods=['post'])
     def move_stage(self, request, pk=None):
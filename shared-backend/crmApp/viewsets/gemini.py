@@ -7,6 +7,7 @@ import json
 import asyncio
 import logging
 import uuid
+from contextlib import aclosing
 from django.http import StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import viewsets, status
@@ -16,6 +17,7 @@ from rest_framework.permissions import IsAuthenticated
 from asgiref.sync import sync_to_async
 
 from crmApp.services.gemini_service import GeminiService
+from crmApp.services.prompt_builder import build_conversation_context
 from crmApp.models import GeminiConversation
 
 logger = logging.getLogger(__name__)
@@ -84,18 +86,22 @@ class GeminiViewSet(viewsets.ViewSet):
             )
             
             # If conversation exists but belongs to different user, reject
-            if not created and conversation.user != user:
+            if not created and conversation.user_id != user.id:
                 return Response(
                     {'error': 'Conversation not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Load history from database if not provided
-            if not history and conversation.messages:
-                history = [
-                    {'role': msg['role'], 'content': msg['content']}
-                    for msg in conversation.messages
-                ]
+            # Load the latest turns that fit the prompt budget (older ones are
+            # folded into the conversation's summary) if history is not provided
+            if not created:
+                conversation.import_legacy_messages()
+            summary = ''
+            prompt_stats = {}
+            if not history and conversation.message_count:
+                context = build_conversation_context(conversation)
+                history, summary = context.history, context.summary
+                prompt_stats['folded_turns'] = context.stats['folded_turns']
             
             # Add user message to conversation
             conversation.add_message('user', message)
@@ -115,40 +121,55 @@ class GeminiViewSet(viewsets.ViewSet):
         logger.info(f"API key configured: {bool(self.gemini_service.api_key)}")
         
         async def event_stream():
-            """Generate Server-Sent Events stream"""
+            """
+            Generate Server-Sent Events stream.
+            
+            Under ASGI Django iterates this on the event loop, so an open chat
+            holds no worker thread; only the ORM write below runs in one. When
+            the client disconnects Django cancels the iteration, and closing
+            chat_stream closes the upstream Gemini stream with it.
+            """
             assistant_response = ""
+            chunk_count = 0
             try:
                 logger.info("Starting SSE event stream")
                 # Send initial connection message with conversation_id
                 yield f"data: {json.dumps({'type': 'connected', 'conversation_id': conversation_id})}\n\n"
                 
-                logger.info("Calling gemini_service.chat_stream")
                 # Stream Gemini responses
-                chunk_count = 0
-                async for chunk in self.gemini_service.chat_stream(
+                stream = self.gemini_service.chat_stream(
                     message=message,
                     user=user,
-                    conversation_history=history
-                ):
-                    chunk_count += 1
-                    logger.debug(f"Received chunk {chunk_count}: {chunk[:50]}...")
-                    assistant_response += chunk
-                    # Send each chunk as SSE event
-                    event_data = {
-                        'type': 'message',
-                        'content': chunk
-                    }
-                    yield f"data: {json.dumps(event_data)}\n\n"
+                    conversation_history=history,
+                    conversation_summary=summary,
+                    prompt_stats=prompt_stats
+                )
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        chunk_count += 1
+                        logger.debug(f"Received chunk {chunk_count}: {chunk[:50]}...")
+                        assistant_response += chunk
+                        # Send each chunk as SSE event
+                        event_data = {
+                            'type': 'message',
+                            'content': chunk
+                        }
+                        yield f"data: {json.dumps(event_data)}\n\n"
                 
                 logger.info(f"Stream completed after {chunk_count} chunks")
                 
-                # Save assistant response to conversation (use sync_to_async to avoid database errors)
+                # Save assistant response to conversation
                 if assistant_response:
-                    await sync_to_async(conversation.add_message, thread_sensitive=False)('assistant', assistant_response)
+                    await sync_to_async(conversation.add_message)('assistant', assistant_response)
                 
                 # Send completion message
-                yield f"data: {json.dumps({'type': 'completed', 'conversation_id': conversation_id})}\n\n"
+                yield f"data: {json.dumps({'type': 'completed', 'conversation_id': conversation_id, 'prompt_stats': prompt_stats})}\n\n"
                 
+            except (asyncio.CancelledError, GeneratorExit):
+                logger.info(
+                    f"Client disconnected from conversation {conversation_id} after {chunk_count} chunks"
+                )
+                raise
             except Exception as e:
                 error_msg = f"Error in stream: {str(e)}"
                 logger.error(error_msg, exc_info=True)
@@ -159,41 +180,10 @@ class GeminiViewSet(viewsets.ViewSet):
                 }
                 yield f"data: {json.dumps(error_data)}\n\n"
         
-        def sync_event_stream():
-            """Wrapper to run async stream in sync context"""
-            import asyncio
-            from asgiref.sync import async_to_sync
-            
-            # Create a new event loop for this thread
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # Run the async generator in the new loop
-                async def run_stream():
-                    async for chunk in event_stream():
-                        yield chunk
-                
-                gen = run_stream()
-                while True:
-                    try:
-                        chunk = loop.run_until_complete(gen.__anext__())
-                        yield chunk
-                    except StopAsyncIteration:
-                        break
-            except Exception as e:
-                logger.error(f"Error in sync_event_stream: {str(e)}", exc_info=True)
-                error_data = {
-                    'type': 'error',
-                    'error': str(e)
-                }
-                yield f"data: {json.dumps(error_data)}\n\n"
-            finally:
-                loop.close()
-        
-        # Return streaming response
+        # Return streaming response (an async iterator; WSGI servers still
+        # work, Django consumes it synchronously there)
         response = StreamingHttpResponse(
-            sync_event_stream(),
+            event_stream(),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
@@ -221,7 +211,7 @@ class GeminiViewSet(viewsets.ViewSet):
         try:
             conversations = GeminiConversation.objects.filter(
                 user=request.user
-            ).order_by('-last_message_at')[:50]  # Last 50 conversations
+            ).defer('messages').order_by('-last_message_at')[:50]  # Last 50 conversations
             
             data = []
             for conv in conversations:
@@ -229,7 +219,7 @@ class GeminiViewSet(viewsets.ViewSet):
                     'conversation_id': conv.conversation_id,
                     'title': conv.title or 'New Conversation',
                     'last_message_at': conv.last_message_at.isoformat(),
-                    'message_count': len(conv.messages),
+                    'message_count': conv.message_count,
                     'created_at': conv.created_at.isoformat()
                 })
             
@@ -264,11 +254,12 @@ class GeminiViewSet(viewsets.ViewSet):
                 conversation_id=conversation_id,
                 user=request.user
             )
+            conversation.import_legacy_messages()
             
             return Response({
                 'conversation_id': conversation.conversation_id,
                 'title': conversation.title or 'New Conversation',
-                'messages': conversation.messages,
+                'messages': conversation.all_messages(),
                 'last_message_at': conversation.last_message_at.isoformat(),
                 'created_at': conversation.created_at.isoformat()
             })
@@ -10,16 +10,22 @@ from django.db import transaction
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 
-from crmApp.models import Issue, Employee, IssueComment
+from crmApp.models import Issue, Employee, IssueComment, LinearSyncJob
 from crmApp.serializers import (
     IssueSerializer,
     IssueListSerializer,
     IssueCreateSerializer,
     IssueUpdateSerializer,
+    LinearSyncJobSerializer,
     IssueCommentSerializer,
     CreateIssueCommentSerializer
 )
-from crmApp.services import IssueLinearService, RBACService
+from crmApp.services import IssueLinearService, RBACService, AnalyticsService
+from crmApp.services.issue_linear_service import (
+    linear_sync_lock_key, sync_issue_update_to_linear, sync_new_issue_to_linear,
+)
+from crmApp.services.job_queue import JobQueue
+from crmApp.services.linear_sync_jobs import start_sync_job
 from crmApp.viewsets.mixins import (
     PermissionCheckMixin,
     OrganizationFilterMixin,
@@ -217,8 +223,6 @@ class IssueViewSet(
                 )
             except Customer.DoesNotExist:
                 # If customer record doesn't exist, still create issue but log warning
-                import logging
-                logger = logging.getLogger(__name__)
                 logger.warning(f"Customer record not found for user {self.request.user.email}")
                 issue = serializer.save(
                     organization_id=organization.id,
@@ -230,35 +234,17 @@ class IssueViewSet(
             linear_team_id = self.linear_service.get_team_id(self.request, organization, issue)
             
             if linear_team_id:
-                try:
-                    logger.info(
-                        f"Attempting to auto-sync issue {issue.issue_number} to Linear "
-                        f"(team_id: {linear_team_id}, status: {issue.status})"
-                    )
-                    
-                    # Sync issue to Linear (will map status to state)
-                    success, linear_data, error = self.linear_service.sync_issue_to_linear(
-                        issue=issue,
-                        team_id=linear_team_id,
-                        update_existing=False
-                    )
-                    
-                    if success and linear_data:
-                        logger.info(
-                            f"Issue {issue.issue_number} auto-synced to Linear: {linear_data.get('url', 'N/A')} "
-                            f"(Linear State: {linear_data.get('state', 'N/A')})"
-                        )
-                    else:
-                        logger.warning(
-                            f"Linear sync failed for issue {issue.issue_number}: {error or 'Unknown error'}"
-                        )
-                    
-                except Exception as e:
-                    logger.error(
-                        f"Failed to auto-sync issue {issue.issue_number} to Linear: {str(e)}",
-                        exc_info=True
-                    )
-                    # Don't fail the request if Linear sync fails - issue is still created
+                # Synced by a background job once the issue is committed
+                JobQueue.enqueue(
+                    sync_new_issue_to_linear,
+                    args=[issue.id, linear_team_id],
+                    idempotency_key=f'issue-linear-create-{issue.id}',
+                    lock_key=linear_sync_lock_key(issue.id)
+                )
+                logger.info(
+                    f"Queued auto-sync of issue {issue.issue_number} to Linear "
+                    f"(team_id: {linear_team_id}, status: {issue.status})"
+                )
             else:
                 # Check if Linear API key is configured
                 from django.conf import settings
@@ -311,93 +297,36 @@ class IssueViewSet(
         # Refresh instance to get updated data
         instance.refresh_from_db()
         
-        # Sync all changes to Linear
-        linear_synced = False
+        # Sync all changes to Linear in the background
+        linear_sync_queued = False
         organization = instance.organization
-        linear_team_id = organization.linear_team_id if organization else None
-        
-        # If issue is already synced, update it
-        if instance.synced_to_linear and instance.linear_issue_id:
-            try:
-                # Use IssueLinearService to sync status changes
-                success, error = self.linear_service.sync_issue_status_to_linear(
-                    issue=instance,
-                    old_status=old_status
-                )
-                if success:
-                    linear_synced = True
-                    logger.info(f"Issue {instance.issue_number} status change synced to Linear")
-                elif error:
-                    logger.warning(f"Linear status sync skipped: {error}")
-                
-                # Also sync other field changes (title, description, priority) if they changed
-                linear_update_data = {}
-                if 'title' in request.data:
-                    linear_update_data['title'] = instance.title
-                if 'description' in request.data:
-                    linear_update_data['description'] = instance.description
-                if 'priority' in request.data:
-                    linear_update_data['priority'] = self.linear_service.linear_service.map_priority_to_linear(instance.priority)
-                
-                # Update Linear if there are field changes (other than status)
-                if linear_update_data:
-                    try:
-                        self.linear_service.linear_service.update_issue(
-                            issue_id=instance.linear_issue_id,
-                            **linear_update_data
-                        )
-                        instance.last_synced_at = timezone.now()
-                        instance.save(update_fields=['last_synced_at'])
-                        logger.info(f"Issue {instance.issue_number} field changes synced to Linear")
-                    except Exception as e:
-                        logger.error(f"Failed to sync field changes to Linear: {str(e)}")
-                        
-            except Exception as e:
-                logger.error(f"Failed to sync issue changes to Linear: {str(e)}", exc_info=True)
+        linear_team_id = None
         
         # If issue is not synced, try to sync it now (always attempt auto-sync)
         if not instance.synced_to_linear:
-            # Try to get team_id from multiple sources if not already found
+            linear_team_id = organization.linear_team_id if organization else None
             if not linear_team_id:
                 linear_team_id = self.linear_service.get_team_id(request, organization, instance)
-            
-            if linear_team_id:
-                try:
-                    logger.info(
-                        f"Attempting to auto-sync issue {instance.issue_number} to Linear "
-                        f"(team_id: {linear_team_id}, status: {instance.status})"
-                    )
-                    
-                    # Sync issue to Linear (will map status to state)
-                    success, linear_data, error = self.linear_service.sync_issue_to_linear(
-                        issue=instance,
-                        team_id=linear_team_id,
-                        update_existing=False
-                    )
-                    
-                    if success and linear_data:
-                        linear_synced = True
-                        logger.info(
-                            f"Issue {instance.issue_number} auto-synced to Linear: {linear_data.get('url', 'N/A')} "
-                            f"(Linear State: {linear_data.get('state', 'N/A')})"
-                        )
-                    else:
-                        logger.warning(
-                            f"Linear sync failed for issue {instance.issue_number}: {error or 'Unknown error'}"
-                        )
-                        
-                except Exception as e:
-                    logger.error(
-                        f"Failed to auto-sync issue {instance.issue_number} to Linear: {str(e)}",
-                        exc_info=True
-                    )
-                    # Don't fail the request if Linear sync fails
+        
+        if (instance.synced_to_linear and instance.linear_issue_id) or linear_team_id:
+            JobQueue.enqueue(
+                sync_issue_update_to_linear,
+                args=[
+                    instance.id,
+                    old_status,
+                    [field for field in ('title', 'description', 'priority') if field in request.data],
+                    linear_team_id,
+                ],
+                # An older edit must not reach Linear after a newer one
+                lock_key=linear_sync_lock_key(instance.id)
+            )
+            linear_sync_queued = True
         
         response_serializer = self.get_serializer(instance)
         response_data = response_serializer.data
         
-        if linear_synced:
-            response_data['linear_synced'] = True
+        if linear_sync_queued:
+            response_data['linear_sync_queued'] = True
         
         # Send real-time notification via Pusher
         try:
@@ -806,38 +735,7 @@ class IssueViewSet(
     def stats(self, request):
         """Get issue statistics"""
         try:
-            queryset = self.get_queryset()
-            
-            stats = {
-                'total': queryset.count(),
-                'by_status': {
-                    'open': queryset.filter(status='open').count(),
-                    'in_progress': queryset.filter(status='in_progress').count(),
-                    'resolved': queryset.filter(status='resolved').count(),
-                    'closed': queryset.filter(status='closed').count(),
-                },
-                'by_priority': {
-                    'low': queryset.filter(priority='low').count(),
-                    'medium': queryset.filter(priority='medium').count(),
-                    'high': queryset.filter(priority='high').count(),
-                    'critical': queryset.filter(priority='critical').count(),
-                },
-                'by_category': {
-                    'quality': queryset.filter(category='quality').count(),
-                    'delivery': queryset.filter(category='delivery').count(),
-                    'payment': queryset.filter(category='payment').count(),
-                    'communication': queryset.filter(category='communication').count(),
-                    'other': queryset.filter(category='other').count(),
-                },
-                'by_source': {
-                    'client_raised': queryset.filter(is_client_issue=True).count(),
-                    'internal': queryset.filter(is_client_issue=False).count(),
-                },
-                'linear_sync': {
-                    'synced': queryset.filter(synced_to_linear=True).count(),
-                    'not_synced': queryset.filter(synced_to_linear=False).count(),
-                }
-            }
+            stats = AnalyticsService.issue_stats(self.get_queryset())
             
             return Response(stats, status=status.HTTP_200_OK)
         except Exception as e:
@@ -944,9 +842,14 @@ class IssueViewSet(
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['get', 'post'])
     def bulk_sync_to_linear(self, request):
-        """Bulk sync multiple issues to Linear - requires issue:update permission"""
+        """
+        Bulk sync multiple issues to Linear - requires issue:update permission
+        
+        POST starts a background sync and returns its job (202);
+        GET ?job_id=<id> reports the job's progress.
+        """
         try:
             # Get organization and check permission
             organization = self.get_organization_from_request(request)
@@ -960,6 +863,18 @@ class IssueViewSet(
             # Check permission
             self.check_permission(request, 'issue', 'update', organization=organization)
             
+            if request.method == 'GET':
+                job = LinearSyncJob.objects.filter(
+                    organization=organization,
+                    pk=request.query_params.get('job_id') or 0
+                ).first()
+                if not job:
+                    return Response(
+                        {'error': 'Not Found', 'details': 'Sync job not found'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                return Response(LinearSyncJobSerializer(job).data)
+            
             # Get parameters
             issue_ids = request.data.get('issue_ids', [])
             team_id = request.data.get('team_id') or self.linear_service.get_team_id(request, organization)
@@ -976,20 +891,19 @@ class IssueViewSet(
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Get issues
-            issues = self.get_queryset().filter(id__in=issue_ids)
+            # Only issues the user can see are synced
+            visible_ids = list(self.get_queryset().filter(id__in=issue_ids).values_list('id', flat=True))
             
-            # Bulk sync
-            result = self.linear_service.bulk_sync_issues_to_linear(issues, team_id)
+            # Sync in the background
+            job = start_sync_job(organization, request.user, team_id, visible_ids)
             
             return Response(
                 {
-                    'message': f'Bulk sync completed: {result["synced_count"]} succeeded, {result["failed_count"]} failed',
-                    'synced_count': result['synced_count'],
-                    'failed_count': result['failed_count'],
-                    'results': result['results']
+                    'message': f'Bulk sync of {job.total} issue(s) started',
+                    'job_id': job.id,
+                    'job': LinearSyncJobSerializer(job).data
                 },
-                status=status.HTTP_200_OK
+                status=status.HTTP_202_ACCEPTED
             )
             
         except Exception as e:
@@ -1042,6 +956,8 @@ class IssueViewSet(
             # Get optional parameters
             limit = int(request.query_params.get('limit', 50))
             sync_to_crm = request.query_params.get('sync', 'false').lower() == 'true'
+            # ISO 8601 timestamp: only issues changed since then
+            updated_since = request.query_params.get('updated_since')
             
             # Fetch issues from Linear
             from crmApp.services.linear_service import LinearService
@@ -1049,7 +965,8 @@ class IssueViewSet(
             
             linear_issues = linear_service.get_team_issues(
                 team_id=linear_team_id,
-                limit=limit
+                limit=limit,
+                filter={'updatedAt': {'gte': updated_since}} if updated_since else None
             )
             
             issues_data = linear_issues.get('nodes', [])
@@ -1059,34 +976,23 @@ class IssueViewSet(
             synced_issues = []
             if sync_to_crm:
                 from crmApp.services.issue_linear_service import IssueLinearService
-                sync_service = IssueLinearService()
                 
-                for linear_issue in issues_data:
-                    # Check if issue already exists in CRM
-                    existing_issue = Issue.objects.filter(
-                        linear_issue_id=linear_issue['id'],
+                # Look the linked CRM issues up in one query
+                existing_issues = {
+                    issue.linear_issue_id: issue
+                    for issue in Issue.objects.filter(
+                        linear_issue_id__in=[linear_issue['id'] for linear_issue in issues_data],
                         organization=organization
-                    ).first()
+                    )
+                }
+                
+                for linear_issue in issues_data:
+                    existing_issue = existing_issues.get(linear_issue['id'])
                     
                     if existing_issue:
                         # Update existing issue
                         try:
-                            # Map Linear state to CRM status
-                            linear_state = linear_issue.get('state', {}).get('name', '').lower()
-                            crm_status = 'open'
-                            if 'done' in linear_state or 'completed' in linear_state or 'resolved' in linear_state:
-                                crm_status = 'resolved'
-                            elif 'in progress' in linear_state or 'started' in linear_state:
-                                crm_status = 'in_progress'
-                            elif 'closed' in linear_state or 'canceled' in linear_state:
-                                crm_status = 'closed'
-                            
-                            existing_issue.title = linear_issue.get('title', existing_issue.title)
-                            existing_issue.description = linear_issue.get('description', existing_issue.description) or ''
-                            existing_issue.status = crm_status
-                            existing_issue.priority = linear_service.map_linear_priority_to_crm(
-                                linear_issue.get('priority', 3)
-                            )
+                            IssueLinearService.apply_linear_issue(existing_issue, linear_issue)
                             existing_issue.synced_to_linear = True
                             existing_issue.last_synced_at = timezone.now()
                             existing_issue.save()
@@ -1102,15 +1008,7 @@ class IssueViewSet(
                     else:
                         # Create new issue in CRM
                         try:
-                            # Map Linear state to CRM status
-                            linear_state = linear_issue.get('state', {}).get('name', '').lower()
-                            crm_status = 'open'
-                            if 'done' in linear_state or 'completed' in linear_state or 'resolved' in linear_state:
-                                crm_status = 'resolved'
-                            elif 'in progress' in linear_state or 'started' in linear_state:
-                                crm_status = 'in_progress'
-                            elif 'closed' in linear_state or 'canceled' in linear_state:
-                                crm_status = 'closed'
+                            crm_status = linear_service.map_linear_state_to_crm(linear_issue.get('state') or {}) or 'open'
                             
                             new_issue = Issue.objects.create(
                                 organization=organization,
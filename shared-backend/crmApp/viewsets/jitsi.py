@@ -17,6 +17,7 @@ from crmApp.serializers import (
     UpdatePresenceSerializer,
 )
 from crmApp.services.jitsi_service import jitsi_service
+from crmApp.services.presence_service import PresenceService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -349,17 +350,9 @@ class JitsiCallViewSet(viewsets.ModelViewSet):
     def heartbeat(self, request):
         """Update user's last seen timestamp (called periodically from frontend)"""
         try:
-            presence, created = UserPresence.objects.get_or_create(
-                user=request.user,
-                defaults={'status': 'online', 'available_for_calls': True}
-            )
-            
-            # Update status to online if not already
-            if presence.status != 'online':
-                presence.status = 'online'
-            
-            # Heartbeat automatically updates last_seen due to auto_now
-            presence.save()
+            # Only refreshes the user's presence TTL; the database is written
+            # when the user comes back online
+            PresenceService.touch(request.user.id)
             
             return Response({'status': 'ok'})
         except Exception as e:
@@ -425,7 +418,7 @@ class UserPresenceViewSet(viewsets.ModelViewSet):
             serializer = UpdatePresenceSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             
-            presence = jitsi_service.update_user_status(
+            presence = PresenceService.set_status(
                 user=request.user,
                 status=serializer.validated_data['status'],
                 available_for_calls=serializer.validated_data.get('available_for_calls'),
@@ -452,17 +445,9 @@ class UserPresenceViewSet(viewsets.ModelViewSet):
     def heartbeat(self, request):
         """Update user's last seen timestamp (called periodically from frontend)"""
         try:
-            presence, created = UserPresence.objects.get_or_create(
-                user=request.user,
-                defaults={'status': 'online', 'available_for_calls': True}
-            )
-            
-            # Update status to online if not already
-            if presence.status != 'online':
-                presence.status = 'online'
-            
-            # Heartbeat automatically updates last_seen due to auto_now
-            presence.save()
+            # Only refreshes the user's presence TTL; the database is written
+            # when the user comes back online
+            PresenceService.touch(request.user.id)
             
             return Response({'status': 'ok'})
         except Exception as e:
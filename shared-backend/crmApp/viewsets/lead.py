@@ -17,7 +17,7 @@ from crmApp.serializers import (
     LeadListSerializer,
     ConvertLeadSerializer,
 )
-from crmApp.services import RBACService
+from crmApp.services import RBACService, AnalyticsService
 from crmApp.viewsets.mixins import (
     PermissionCheckMixin,
     OrganizationFilterMixin,
@@ -123,43 +123,7 @@ class LeadViewSet(
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get lead statistics"""
-        queryset = self.get_queryset()
-        
-        total = queryset.count()
-        converted = queryset.filter(is_converted=True).count()
-        
-        # Calculate conversion rate
-        conversion_rate = (converted / total * 100) if total > 0 else 0
-        
-        # Calculate average score
-        from django.db.models import Avg, Sum
-        avg_score = queryset.aggregate(avg=Avg('lead_score'))['avg'] or 0
-        
-        # Calculate total estimated value
-        total_value = queryset.aggregate(total=Sum('estimated_value'))['total'] or 0
-        
-        stats = {
-            'totalLeads': total,
-            'statusCounts': {
-                'new': queryset.filter(qualification_status='new').count(),
-                'contacted': queryset.filter(qualification_status='contacted').count(),
-                'qualified': queryset.filter(qualification_status='qualified').count(),
-                'unqualified': queryset.filter(qualification_status='unqualified').count(),
-                'converted': converted,
-                'lost': queryset.filter(qualification_status='lost').count(),
-            },
-            'averageScore': round(avg_score, 2),
-            'totalEstimatedValue': float(total_value),
-            'conversionRate': round(conversion_rate, 2),
-            'by_source': {}
-        }
-        
-        # Group by source
-        sources = queryset.values_list('source', flat=True).distinct()
-        for source in sources:
-            stats['by_source'][source] = queryset.filter(source=source).count()
-        
-        return Response(stats)
+        return Response(AnalyticsService.lead_stats(self.get_queryset()))
     
     @action(detail=True, methods=['post'])
     def convert(self, request, pk=None):
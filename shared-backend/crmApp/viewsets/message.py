@@ -12,7 +12,9 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 from crmApp.models import Message, Conversation
+from crmApp.pagination import CursorResultsSetPagination
 from crmApp.serializers.message import (
     MessageSerializer,
     MessageCreateSerializer,
@@ -36,6 +38,7 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
     
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CursorResultsSetPagination
     
     def get_queryset(self):
         """Get messages for current user"""
@@ -56,6 +59,11 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
         
         return queryset.order_by('-created_at')
     
+    def perform_create(self, serializer):
+        """Keep the pair's conversation in step with messages created directly"""
+        message = serializer.save()
+        MessageService.record_message(message)
+    
     @action(detail=False, methods=['post'])
     def send(self, request):
         """
@@ -91,11 +99,10 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
             
             # Check if user is vendor - only vendors can initiate messages
             from crmApp.models import UserProfile
-            sender_profile = UserProfile.objects.filter(
-                user=request.user,
-                organization=organization,
-                status='active'
-            ).first()
+            from crmApp.utils.request_context import get_request_context
+            sender_profile = get_request_context(request.user).profile_for_organization(
+                organization.id if organization else None
+            )
             
             if not sender_profile:
                 logger.warning(f"[MESSAGE SEND] No active profile found for user {request.user.email} in org {organization.id if organization else 'None'}")
@@ -106,13 +113,19 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
             
             logger.info(f"[MESSAGE SEND] Sender profile type: {sender_profile.profile_type}")
             
-            # Check if this is a new conversation (no existing messages)
-            existing_messages = Message.objects.filter(
-                models.Q(sender=request.user, recipient=recipient) |
-                models.Q(sender=recipient, recipient=request.user),
-                organization=organization
-            ).exists()
-            
+            # Check if this is a new conversation (the pair's conversation row
+            # has no message yet; messages predating conversations are checked
+            # only when there is no row at all)
+            conversation = MessageService.find_conversation(request.user, recipient, organization)
+            if conversation is not None:
+                existing_messages = conversation.last_message_id is not None
+            else:
+                existing_messages = Message.objects.filter(
+                    models.Q(sender=request.user, recipient=recipient) |
+                    models.Q(sender=recipient, recipient=request.user),
+                    organization=organization
+                ).exists()
+
             logger.info(f"[MESSAGE SEND] Existing messages between users: {existing_messages}")
             
             # If it's a new conversation, check permissions:
@@ -165,7 +178,7 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
                 from crmApp.models import Customer
                 related_customer = Customer.objects.get(id=serializer.validated_data['related_customer_id'])
             
-            # Send message using service
+            # Send message using service (also sends the real-time notification)
             message = MessageService.send_message(
                 sender=request.user,
                 recipient=recipient,
@@ -175,16 +188,10 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
                 related_lead=related_lead,
                 related_deal=related_deal,
                 related_customer=related_customer,
-                attachments=serializer.validated_data.get('attachments', [])
+                attachments=serializer.validated_data.get('attachments', []),
+                conversation=conversation
             )
             
-            # Send real-time notification via Pusher
-            try:
-                from crmApp.services.pusher_service import pusher_service
-                pusher_service.send_message(message, request.user, recipient)
-            except Exception as e:
-                logger.warning(f"Failed to send Pusher notification: {e}")
-            
             return Response(
                 MessageSerializer(message, context={'request': request}).data,
                 status=status.HTTP_201_CREATED
@@ -291,10 +298,23 @@ class MessageViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewsets.Mod
             
             logger.info(f"Retrieved {len(messages)} messages between user {request.user.id} and {other_user.id} in org {organization.id if organization else None}")
             
-            # Mark messages as read
-            for message in messages:
-                if message.recipient == request.user and not message.is_read:
-                    MessageService.mark_as_read(message, request.user)
+            # Mark everything received up to the newest loaded message as read
+            unread = [
+                message for message in messages
+                if message.recipient_id == request.user.id and not message.is_read
+            ]
+            if unread:
+                conversation = MessageService.find_conversation(request.user, other_user, organization)
+                if conversation:
+                    MessageService.mark_conversation_read(
+                        conversation,
+                        request.user,
+                        up_to_message_id=max(message.id for message in unread)
+                    )
+                    read_at = timezone.now()
+                    for message in unread:
+                        message.is_read = True
+                        message.read_at = read_at
             
             # Serialize messages
             serialized_messages = MessageSerializer(messages, many=True, context={'request': request}).data
@@ -332,10 +352,44 @@ class ConversationViewSet(PermissionCheckMixin, OrganizationFilterMixin, viewset
         
         queryset = Conversation.objects.filter(
             models.Q(participant1=user) | models.Q(participant2=user)
+        ).select_related(
+            'participant1', 'participant2',
+            'last_message__sender', 'last_message__recipient'
         )
         
         if organization:
             queryset = queryset.filter(organization=organization)
         
         return queryset.order_by('-last_message_at')
+    
+    @action(detail=True, methods=['post'])
+    def mark_read(self, request, pk=None):
+        """
+        Mark the conversation as read, up to a message
+        
+        POST /api/conversations/{id}/mark_read/
+        {
+            "up_to_message_id": 123  // optional, defaults to everything
+        }
+        """
+        conversation = self.get_object()
+        
+        up_to_message_id = request.data.get('up_to_message_id')
+        if up_to_message_id is not None:
+            try:
+                up_to_message_id = int(up_to_message_id)
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'up_to_message_id must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        marked = MessageService.mark_conversation_read(
+            conversation, request.user, up_to_message_id=up_to_message_id
+        )
+        
+        return Response({
+            'marked_read': marked,
+            'unread_count': MessageService.get_unread_count(request.user, conversation.organization),
+        })
 
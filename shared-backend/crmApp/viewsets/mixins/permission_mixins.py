@@ -4,6 +4,7 @@ Permission-related mixins for ViewSets.
 
 from rest_framework.exceptions import PermissionDenied
 from crmApp.services import RBACService
+from crmApp.utils.request_context import get_request_context
 
 
 class PermissionCheckMixin:
@@ -14,7 +15,7 @@ class PermissionCheckMixin:
     def get_organization_from_request(self, request, instance=None):
         """
         Get organization from request user's active profile or instance.
-        Queries database directly to ensure organization is loaded.
+        The active profile (with its organization) comes from the request context.
         
         IMPORTANT: For vendor/employee users, always use THEIR organization (not the instance's organization).
         For Customer instances, use the vendor's organization if user is vendor, not the customer's organization.
@@ -29,22 +30,10 @@ class PermissionCheckMixin:
         import logging
         logger = logging.getLogger(__name__)
         
-        # Query database directly for active profile to ensure organization is loaded
-        from crmApp.models import UserProfile
+        # Active profile comes from the request context (resolved once per request)
         try:
-            # First, get the user's active profile to determine their organization
-            active_profile = UserProfile.objects.filter(
-                user=request.user,
-                status='active',
-                is_primary=True
-            ).select_related('organization').first()
-            
-            if not active_profile:
-                # Try any active profile if no primary
-                active_profile = UserProfile.objects.filter(
-                    user=request.user,
-                    status='active'
-                ).select_related('organization').first()
+            context = get_request_context(request.user)
+            active_profile = context.profile if context else None
             
             # For vendors and employees, ALWAYS use their organization (not the instance's organization)
             if active_profile and active_profile.organization:
@@ -107,30 +96,17 @@ class PermissionCheckMixin:
             raise PermissionDenied('Organization is required. Please ensure you have an active profile.')
         
         # Check if user is a vendor - vendors have all permissions in their organization
-        from crmApp.models import UserProfile
-        
-        # First check the active_profile set by middleware (most reliable)
+        # First check the active_profile set by the authentication/middleware layer
         active_profile = getattr(request.user, 'active_profile', None)
         logger.debug(f"🔐 Active profile: {active_profile.profile_type if active_profile else 'None'} (org_id={active_profile.organization_id if active_profile else None})")
         
-        # If active_profile is None, try to get it from database (middleware might not have set it)
+        # If active_profile is None, resolve the request context (memoized on the user)
         if not active_profile:
-            logger.debug(f"🔐 Active profile is None, querying database...")
-            active_profile = UserProfile.objects.filter(
-                user=request.user,
-                status='active',
-                is_primary=True
-            ).select_related('organization').first()
-            
-            if not active_profile:
-                # Try any active profile if no primary
-                active_profile = UserProfile.objects.filter(
-                    user=request.user,
-                    status='active'
-                ).select_related('organization').first()
+            context = get_request_context(request.user)
+            active_profile = context.profile if context else None
             
             if active_profile:
-                logger.debug(f"🔐 Found active profile from DB: {active_profile.profile_type} (org_id={active_profile.organization_id})")
+                logger.debug(f"🔐 Found active profile from request context: {active_profile.profile_type} (org_id={active_profile.organization_id})")
         
         if active_profile:
             if active_profile.profile_type == 'vendor':
@@ -169,17 +145,12 @@ class PermissionCheckMixin:
                 logger.debug(f"🔐 Permission GRANTED: Customer profile")
                 return True
         
-        # Fallback: Query database directly for vendor profile in the organization
-        vendor_profile = UserProfile.objects.filter(
-            user=request.user,
-            organization=organization,
-            profile_type='vendor',
-            status='active'
-        ).first()
+        # Fallback: Check the compiled (cached) permission set for vendor access in the organization
+        is_vendor = RBACService.get_permission_set(request.user, organization).is_vendor
         
-        logger.debug(f"🔐 Vendor profile query (org={organization.id}): found={vendor_profile is not None}")
+        logger.debug(f"🔐 Vendor profile check (org={organization.id}): found={is_vendor}")
         
-        if vendor_profile:
+        if is_vendor:
             # Vendors have all permissions in their organization
             logger.debug(f"🔐 Permission GRANTED: Vendor profile found in database")
             return True
@@ -189,26 +160,22 @@ class PermissionCheckMixin:
             from crmApp.models import CustomerOrganization
             logger.debug(f"🔐 Customer instance detected (ID={instance.id}). Checking CustomerOrganization links for user's vendor orgs...")
             
-            # Get all vendor profiles for this user
-            user_vendor_profiles = UserProfile.objects.filter(
-                user=request.user,
-                profile_type='vendor',
-                status='active'
-            ).select_related('organization')
+            # Vendor organizations of this user (from the request context)
+            context = get_request_context(request.user)
+            vendor_org_ids = [
+                profile.organization_id for profile in (context.profiles if context else [])
+                if profile.profile_type == 'vendor' and profile.organization_id
+            ]
             
-            logger.debug(f"🔐 User has {user_vendor_profiles.count()} vendor profile(s)")
+            logger.debug(f"🔐 User has {len(vendor_org_ids)} vendor profile(s)")
             
             # Check if customer is linked to any of the user's vendor organizations
-            for vendor_profile_check in user_vendor_profiles:
-                if vendor_profile_check.organization:
-                    customer_org_link = CustomerOrganization.objects.filter(
-                        customer=instance,
-                        organization_id=vendor_profile_check.organization_id
-                    ).first()
-                    
-                    if customer_org_link:
-                        logger.debug(f"🔐 Permission GRANTED: Customer is linked to user's vendor org {vendor_profile_check.organization_id} via CustomerOrganization")
-                        return True
+            if vendor_org_ids and CustomerOrganization.objects.filter(
+                customer=instance,
+                organization_id__in=vendor_org_ids
+            ).exists():
+                logger.debug(f"🔐 Permission GRANTED: Customer is linked to one of user's vendor orgs {vendor_org_ids} via CustomerOrganization")
+                return True
             
             logger.warning(f"🔐 Customer {instance.id} is NOT linked to any of user's vendor organizations")
         
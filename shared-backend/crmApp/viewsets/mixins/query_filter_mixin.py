@@ -2,6 +2,9 @@
 Mixin for common queryset filtering patterns.
 """
 
+from crmApp.services.search_index_service import SearchIndexService
+from crmApp.utils.profile_context import get_user_accessible_organizations
+
 
 class QueryFilterMixin:
     """
@@ -38,6 +41,12 @@ class QueryFilterMixin:
             Filtered queryset
         """
         search = request.query_params.get('search')
+        if search and SearchIndexService.spec_for(queryset.model):
+            # Indexed model: look up the search index of the user's organizations
+            return SearchIndexService.filter_queryset(
+                queryset, search, get_user_accessible_organizations(request.user),
+                fallback_fields=search_fields
+            )
         if search:
             from django.db.models import Q
             query = Q()
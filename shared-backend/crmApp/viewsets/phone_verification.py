@@ -11,7 +11,7 @@ from rest_framework.response import Response
 from django.conf import settings
 
 from crmApp.models import PhoneVerification, TelegramUser, User
-from crmApp.services.sms_service import SMSService
+from crmApp.services.sms_service import SMSService, send_verification_code_sms
 
 logger = logging.getLogger(__name__)
 
@@ -71,19 +71,15 @@ def send_verification_code(request):
         base_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:5173')
         verification_url = f"{base_url}/verify-telegram?code={verification.verification_code}&phone={normalized_phone}"
         
-        # Send SMS
-        success, error_msg = sms_service.send_verification_code(
+        # Send SMS in the background (retried if the provider fails); the
+        # code is created either way
+        send_verification_code_sms.delay(
             phone_number=normalized_phone,
             code=verification.verification_code,
             verification_url=verification_url
         )
         
-        if not success:
-            logger.error(f"Failed to send SMS to {normalized_phone}: {error_msg}")
-            # Still return success to user (code is created), but log the error
-            # In production, you might want to return an error if SMS fails
-        
-        logger.info(f"Verification code sent to {normalized_phone} for user {user.email}")
+        logger.info(f"Verification code queued for {normalized_phone} for user {user.email}")
         
         expires_in = int((verification.expires_at - timezone.now()).total_seconds())
         
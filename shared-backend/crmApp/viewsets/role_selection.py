@@ -11,6 +11,7 @@ from django.utils import timezone
 
 from crmApp.models import UserProfile
 from crmApp.serializers import UserProfileSerializer, UserSerializer
+from crmApp.utils.request_context import RequestContext
 
 
 class RoleSelectionViewSet(viewsets.ViewSet):
@@ -79,6 +80,10 @@ class RoleSelectionViewSet(viewsets.ViewSet):
         profile.is_primary = True
         profile.save(update_fields=['is_primary'])
         
+        # The request context was resolved for the previous profile
+        RequestContext.forget(request.user)
+        RequestContext.for_user(request.user).apply(request.user)
+        
         # Return updated user data
         user_serializer = UserSerializer(request.user)
         return Response({
@@ -0,0 +1,58 @@
+"""
+Search ViewSet
+Ranked search across customers, leads, deals, issues and activities
+"""
+
+import logging
+from rest_framework import viewsets, status
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+
+from crmApp.services.search_index_service import ENTITY_TYPES, SearchIndexService
+from crmApp.utils import get_request_context
+
+logger = logging.getLogger(__name__)
+
+MAX_SEARCH_RESULTS = 50
+
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    GET /api/search/?q=<text>[&types=customer,lead][&limit=20]
+
+    Searches the active organization of a vendor or employee. Employees only
+    get result types they have read permission for.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'query': query, 'results': []})
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), MAX_SEARCH_RESULTS)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entity_types = list(ENTITY_TYPES)
+        requested = request.query_params.get('types')
+        if requested:
+            entity_types = [entity_type for entity_type in requested.split(',') if entity_type in ENTITY_TYPES]
+
+        context = get_request_context(request.user)
+        if context is None or context.profile_type not in ('vendor', 'employee') or context.organization is None:
+            return Response({'query': query, 'results': []})
+
+        permissions = context.permission_set
+        entity_types = [entity_type for entity_type in entity_types if permissions.has(entity_type, 'read')]
+        if not entity_types:
+            return Response({'query': query, 'results': []})
+
+        results = SearchIndexService.search(
+            [context.organization.id],
+            query,
+            entity_types=entity_types,
+            limit=limit
+        )
+        return Response({'query': query, 'results': results})
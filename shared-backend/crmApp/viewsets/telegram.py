@@ -16,10 +16,12 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from asgiref.sync import async_to_sync
 
-from crmApp.models import TelegramUser, User
-from crmApp.services.telegram_service import TelegramService
+from crmApp.models import TelegramUpdate, TelegramUser, User
+from crmApp.services.telegram_service import TelegramMessageStream, TelegramService
+from crmApp.services.telegram_update_queue import enqueue_update
 from crmApp.services.telegram_auth_service import TelegramAuthService
 from crmApp.services.gemini_service import GeminiService
+from crmApp.services.prompt_builder import build_conversation_context
 from crmApp.services.telegram_rbac_service import TelegramRBACService
 from crmApp.viewsets.telegram_commands import (
     handle_permissions_command,
@@ -47,22 +49,20 @@ logger = logging.getLogger(__name__)
 def telegram_webhook(request):
     """
     Webhook endpoint for receiving Telegram updates.
-    Handles messages, commands, and forwards to Gemini AI.
+    
+    The update is persisted and acknowledged immediately; a background worker
+    processes it (see crmApp.services.telegram_update_queue). Redeliveries of
+    an update_id that was already received are acknowledged and ignored.
     """
     try:
         # Parse incoming update
         update = json.loads(request.body)
-        logger.info(f"Received Telegram update: {update.get('update_id')}, keys: {list(update.keys())}")
-        
-        # Log message details if present
-        if 'message' in update:
-            message = update['message']
-            logger.info(f"Message text: {message.get('text', 'N/A')}, entities: {message.get('entities', [])}")
+        update_id = update.get('update_id')
+        logger.info(f"Received Telegram update: {update_id}, keys: {list(update.keys())}")
         
-        # Parse update
         parsed = parse_telegram_update(update)
         
-        if not parsed:
+        if not parsed or update_id is None:
             logger.warning("Failed to parse Telegram update")
             return JsonResponse({'ok': True})  # Return 200 to acknowledge
         
@@ -71,11 +71,15 @@ def telegram_webhook(request):
             logger.info(f"Ignoring non-private message from chat type: {parsed.get('chat_type')}")
             return JsonResponse({'ok': True})
         
-        # Handle the message
-        if parsed['type'] == 'message':
-            handle_telegram_message(parsed)
-        elif parsed['type'] == 'callback_query':
-            handle_telegram_callback(parsed)
+        record, created = TelegramUpdate.objects.get_or_create(
+            update_id=update_id,
+            defaults={'chat_id': parsed.get('chat_id'), 'payload': update}
+        )
+        if not created:
+            logger.info(f"Ignoring duplicate Telegram update {update_id} ({record.status})")
+            return JsonResponse({'ok': True})
+        
+        enqueue_update(record)
         
         return JsonResponse({'ok': True})
     
@@ -88,6 +92,27 @@ def telegram_webhook(request):
         return JsonResponse({'ok': True})  # Still return 200 to avoid retries
 
 
+def dispatch_telegram_update(update: Dict[str, Any]):
+    """
+    Process one raw Telegram update (called by the update workers).
+    Handles messages, commands, and forwards to Gemini AI.
+    """
+    # Log message details if present
+    if 'message' in update:
+        message = update['message']
+        logger.info(f"Message text: {message.get('text', 'N/A')}, entities: {message.get('entities', [])}")
+    
+    parsed = parse_telegram_update(update)
+    if not parsed or parsed.get('chat_type') != 'private':
+        return
+    
+    # Handle the message
+    if parsed['type'] == 'message':
+        handle_telegram_message(parsed)
+    elif parsed['type'] == 'callback_query':
+        handle_telegram_callback(parsed)
+
+
 def handle_telegram_message(parsed: Dict[str, Any]):
     """
     Handle incoming Telegram message.
@@ -534,17 +559,18 @@ def handle_authenticated_message(telegram_user: TelegramUser, text: str, telegra
     org_id = TelegramRBACService.get_organization_context(telegram_user)
     logger.info(f"Processing message from {user.email} (org_id: {org_id})")
     
-    # Show typing indicator
-    telegram_service.send_typing_action(chat_id)
-    
-    # Add to conversation history
+    # Earlier messages (last 10 within the token budget, older ones
+    # summarized) for context, then record this one
+    telegram_user.import_legacy_history()
+    context = build_conversation_context(telegram_user, max_turns=10)
     telegram_user.add_to_conversation_history('user', text)
     
+    # Placeholder message that is edited while the reply streams in
+    reply_stream = TelegramMessageStream(telegram_service, chat_id)
+    reply_stream.start()
+    
     # Forward to Gemini
     try:
-        # Get conversation history (last 10 messages)
-        conversation_history = telegram_user.conversation_history[-10:] if telegram_user.conversation_history else []
-        
         # Call Gemini service
         gemini_service = GeminiService()
         
@@ -556,10 +582,12 @@ def handle_authenticated_message(telegram_user: TelegramUser, text: str, telegra
             async for chunk in gemini_service.chat_stream(
                 message=text,
                 user=user,
-                conversation_history=conversation_history,
-                telegram_user=telegram_user
+                conversation_history=context.history,
+                telegram_user=telegram_user,
+                conversation_summary=context.summary
             ):
                 response_text += chunk
+                await reply_stream.aupdate(response_text)
         
         # Run async function
         async_to_sync(process_gemini_stream)()
@@ -567,8 +595,8 @@ def handle_authenticated_message(telegram_user: TelegramUser, text: str, telegra
         # Format response for Telegram
         formatted_response = format_crm_response_for_telegram(response_text)
         
-        # Send response
-        telegram_service.send_message_chunked(chat_id, formatted_response)
+        # Replace the streamed preview with the final response
+        reply_stream.finish(formatted_response)
         
         # Add to conversation history
         telegram_user.add_to_conversation_history('assistant', response_text)
@@ -577,8 +605,7 @@ def handle_authenticated_message(telegram_user: TelegramUser, text: str, telegra
     
     except Exception as e:
         logger.error(f"Error processing Gemini request: {str(e)}", exc_info=True)
-        telegram_service.send_message(
-            chat_id,
+        reply_stream.finish(
             "❌ Sorry, I encountered an error processing your request.\n\nPlease try again or contact support."
         )
 
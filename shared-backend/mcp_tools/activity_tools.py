@@ -4,11 +4,11 @@ Provides tools for activity logging and tracking with RBAC
 """
 
 import logging
-from typing import Optional, List, Dict, Any
-from crmApp.models import Activity, Employee, AuditLog, JitsiCallSession
-from crmApp.serializers import ActivitySerializer, ActivityListSerializer
-from crmApp.serializers.audit_log import AuditLogListSerializer
-from crmApp.serializers.jitsi import JitsiCallSessionSerializer
+from typing import Optional, Dict, Any
+from crmApp.models import Activity, Employee
+from crmApp.serializers import ActivitySerializer
+from crmApp.services.activity_timeline_service import ActivityTimelineService, InvalidTimelineCursor
+from crmApp.services.tool_projections import get_projection
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +24,11 @@ def register_activity_tools(mcp):
         deal_id: Optional[int] = None,
         assigned_to: Optional[int] = None,
         search: Optional[str] = None,
-        limit: int = 20
-    ) -> List[Dict[str, Any]]:
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        List activities with filtering options.
+        List activities, audit log entries and video calls, newest first, one page at a time (pass next_cursor back as cursor).
         
         Args:
             activity_type: Filter by type (call, email, telegram, meeting, note, task)
@@ -38,9 +39,10 @@ def register_activity_tools(mcp):
             assigned_to: Filter by assigned employee ID
             search: Search by title or description
             limit: Maximum number of results (default: 20, max: 100)
+            cursor: next_cursor of the previous page
         
         Returns:
-            List of activity objects
+            {"activities": compact activity rows, "count", "more_available", "next_cursor"}
         """
         try:
             mcp.check_permission('activity', 'read')
@@ -49,175 +51,27 @@ def register_activity_tools(mcp):
             if not org_id:
                 return {"error": "No organization context found"}
             
-            from django.db.models import Q
-            
-            # 1. Get regular activities
-            activities_queryset = Activity.objects.filter(organization_id=org_id)
-            
-            # Apply filters to activities
-            if activity_type:
-                activities_queryset = activities_queryset.filter(activity_type=activity_type)
-            
-            if status:
-                activities_queryset = activities_queryset.filter(status=status)
-            
-            if customer_id:
-                activities_queryset = activities_queryset.filter(customer_id=customer_id)
-            
-            if lead_id:
-                activities_queryset = activities_queryset.filter(lead_id=lead_id)
-            
-            if deal_id:
-                activities_queryset = activities_queryset.filter(deal_id=deal_id)
-            
-            if assigned_to:
-                activities_queryset = activities_queryset.filter(assigned_to_id=assigned_to)
-            
-            if search:
-                activities_queryset = activities_queryset.filter(
-                    Q(title__icontains=search) |
-                    Q(description__icontains=search) |
-                    Q(customer_name__icontains=search)
-                )
-            
-            activities_queryset = activities_queryset.select_related(
-                'customer', 'lead', 'deal', 'assigned_to', 'created_by'
-            ).order_by('-created_at')
-            
-            # 2. Get audit logs (convert to activity format)
-            audit_logs_queryset = AuditLog.objects.filter(organization_id=org_id)
-            
-            if search:
-                audit_logs_queryset = audit_logs_queryset.filter(
-                    Q(description__icontains=search) |
-                    Q(resource_name__icontains=search) |
-                    Q(user_email__icontains=search)
-                )
-            
-            audit_logs_queryset = audit_logs_queryset.select_related(
-                'user', 'related_customer', 'related_lead', 'related_deal'
-            ).order_by('-created_at')
-            
-            # 3. Get video calls (convert to activity format)
-            video_calls_queryset = JitsiCallSession.objects.filter(organization_id=org_id)
-            
-            if activity_type:
-                # Filter video calls if activity_type is 'call'
-                if activity_type != 'call':
-                    video_calls_queryset = video_calls_queryset.none()
-            
-            if status:
-                # Map activity status to call status
-                status_map = {
-                    'scheduled': ['pending', 'ringing'],
-                    'in_progress': ['active'],
-                    'completed': ['completed'],
-                    'cancelled': ['cancelled', 'rejected', 'missed', 'failed']
-                }
-                if status in status_map:
-                    video_calls_queryset = video_calls_queryset.filter(status__in=status_map[status])
-            
-            if search:
-                video_calls_queryset = video_calls_queryset.filter(
-                    Q(room_name__icontains=search) |
-                    Q(notes__icontains=search)
-                )
-            
-            video_calls_queryset = video_calls_queryset.select_related(
-                'initiator', 'recipient', 'organization'
-            ).order_by('-created_at')
-            
-            # Serialize all three types
-            activities_serializer = ActivityListSerializer(activities_queryset, many=True)
-            activities_list = list(activities_serializer.data)
-            
-            audit_logs_serializer = AuditLogListSerializer(audit_logs_queryset, many=True)
-            audit_logs_list = list(audit_logs_serializer.data)
-            
-            video_calls_serializer = JitsiCallSessionSerializer(video_calls_queryset, many=True)
-            video_calls_list = list(video_calls_serializer.data)
-            
-            # Convert audit logs to activity format (matching frontend conversion)
-            audit_logs_as_activities = []
-            for log in audit_logs_list:
-                # Skip if activity_type filter excludes 'note'
-                if activity_type and activity_type != 'note':
-                    continue
-                
-                audit_logs_as_activities.append({
-                    'id': f"audit-{log['id']}",  # Prefix to avoid ID collision
-                    'activity_type': 'note',
-                    'title': log.get('description') or f"{log.get('action_display', '')} {log.get('resource_type_display', '')}",
-                    'description': log.get('resource_name') or log.get('description', ''),
-                    'customer_name': log.get('user_email', 'System'),
-                    'status': 'completed',  # Audit logs are always completed
-                    'created_at': log['created_at'],
-                    'updated_at': log.get('updated_at', log['created_at']),
-                    'scheduled_at': log['created_at'],
-                    'completed_at': log['created_at'],
-                    'organization': org_id,  # Use org_id from context (AuditLogListSerializer doesn't include organization field)
-                    'created_by': log.get('user'),
-                    'assigned_to': None,
-                })
-            
-            # Convert video calls to activity format (matching frontend conversion)
-            call_status_map = {
-                'pending': 'scheduled',
-                'ringing': 'scheduled',
-                'active': 'in_progress',
-                'completed': 'completed',
-                'missed': 'cancelled',
-                'rejected': 'cancelled',
-                'cancelled': 'cancelled',
-                'failed': 'cancelled',
-            }
+            projection = get_projection('list_activities')
+            page = ActivityTimelineService.page(
+                [org_id],
+                limit=projection.clamp(limit),
+                cursor=cursor,
+                activity_type=activity_type,
+                status=status,
+                customer_id=customer_id,
+                lead_id=lead_id,
+                deal_id=deal_id,
+                assigned_to=assigned_to,
+                search=search,
+            )
             
-            video_calls_as_activities = []
-            for call in video_calls_list:
-                call_status = call_status_map.get(call.get('status', 'completed'), 'completed')
-                
-                # Skip if status filter doesn't match
-                if status and call_status != status:
-                    continue
-                
-                recipient_name = call.get('recipient_name') or call.get('initiator_name', 'Unknown')
-                call_title = f"{call.get('call_type', 'audio').title()} Call"
-                if call.get('status') == 'completed':
-                    call_title += f" with {recipient_name}"
-                else:
-                    call_title += f" to {recipient_name}"
-                
-                    video_calls_as_activities.append({
-                        'id': call['id'],
-                        'activity_type': 'call',
-                        'title': call_title,
-                        'description': call.get('notes') or f"{call.get('call_type', 'audio')} call - {call.get('status', '')}{(' (' + call.get('duration_formatted', '') + ')') if call.get('duration_formatted') else ''}",
-                        'customer_name': recipient_name,
-                        'status': call_status,
-                        'created_at': call['created_at'],
-                        'updated_at': call.get('updated_at', call['created_at']),
-                        'scheduled_at': call.get('started_at') or call['created_at'],
-                        'completed_at': call.get('ended_at'),
-                        'organization': call.get('organization', org_id),  # Use org_id as fallback
-                        'created_by': call.get('initiator'),
-                        'assigned_to': call.get('recipient'),
-                    })
-            
-            # Merge all activities
-            all_activities = activities_list + audit_logs_as_activities + video_calls_as_activities
-            
-            # Sort by creation date (newest first)
-            all_activities.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            # Apply limit
-            limit = min(limit, 100)  # Cap at 100
-            result = all_activities[:limit]
-            
-            logger.info(f"Retrieved {len(result)} activities for org {org_id} (Regular: {len(activities_list)}, Audit Logs: {len(audit_logs_as_activities)}, Video Calls: {len(video_calls_as_activities)})")
-            return result
+            logger.info(f"Retrieved {len(page['activities'])} activities for org {org_id} (more_available={page['more_available']})")
+            return projection.result(page['activities'], page['next_cursor'])
             
         except PermissionError as e:
             return {"error": str(e)}
+        except InvalidTimelineCursor as e:
+            return {"error": str(e)}
         except Exception as e:
             logger.error(f"Error listing activities: {str(e)}", exc_info=True)
             return {"error": f"Failed to list activities: {str(e)}"}
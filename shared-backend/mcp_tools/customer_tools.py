@@ -4,9 +4,11 @@ Provides tools for customer CRUD operations with RBAC
 """
 
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, Dict, Any
 from crmApp.models import Customer, Employee
-from crmApp.serializers import CustomerSerializer, CustomerListSerializer
+from crmApp.serializers import CustomerSerializer
+from crmApp.services.search_index_service import SearchIndexService
+from crmApp.services.tool_projections import InvalidToolCursor, get_projection
 
 logger = logging.getLogger(__name__)
 
@@ -19,20 +21,22 @@ def register_customer_tools(mcp):
         search: Optional[str] = None,
         customer_type: Optional[str] = None,
         assigned_to: Optional[int] = None,
-        limit: int = 20
-    ) -> List[Dict[str, Any]]:
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        List customers with filtering options.
+        List customers with filtering options, one page at a time (pass next_cursor back as cursor).
         
         Args:
             status: Filter by status (active, inactive, all). Default: active
             search: Search by name, email, or company
             customer_type: Filter by type (individual, business)
             assigned_to: Filter by assigned employee ID
-            limit: Maximum number of results (default: 20, max: 100)
+            limit: Maximum number of results (default: 20, max: 50)
+            cursor: next_cursor of the previous page
         
         Returns:
-            List of customer objects with details
+            {"customers": compact customer rows, "count", "more_available", "next_cursor"}
         """
         try:
             mcp.check_permission('customer', 'read')
@@ -55,26 +59,16 @@ def register_customer_tools(mcp):
                 queryset = queryset.filter(assigned_to_id=assigned_to)
             
             if search:
-                from django.db.models import Q
-                queryset = queryset.filter(
-                    Q(name__icontains=search) |
-                    Q(email__icontains=search) |
-                    Q(company_name__icontains=search) |
-                    Q(first_name__icontains=search) |
-                    Q(last_name__icontains=search)
+                queryset = SearchIndexService.filter_queryset(
+                    queryset, search, [org_id],
+                    fallback_fields=['name', 'email', 'company_name', 'first_name', 'last_name']
                 )
             
-            # Limit results
-            limit = min(limit, 100)  # Cap at 100
-            queryset = queryset.select_related('assigned_to')[:limit]
-            
-            # Serialize
-            serializer = CustomerListSerializer(queryset, many=True)
+            result = get_projection('list_customers').page(queryset, limit, cursor)
+            logger.info(f"Retrieved {result['count']} customers for org {org_id}")
+            return result
             
-            logger.info(f"Retrieved {len(serializer.data)} customers for org {org_id}")
-            return serializer.data
-            
-        except PermissionError as e:
+        except (PermissionError, InvalidToolCursor) as e:
             return {"error": str(e)}
         except Exception as e:
             logger.error(f"Error listing customers: {str(e)}", exc_info=True)
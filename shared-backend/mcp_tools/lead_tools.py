@@ -4,9 +4,11 @@ Provides tools for lead operations with RBAC
 """
 
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, Dict, Any
 from crmApp.models import Lead, Employee, PipelineStage, LeadStageHistory
-from crmApp.serializers import LeadSerializer, LeadListSerializer
+from crmApp.serializers import LeadSerializer
+from crmApp.services.search_index_service import SearchIndexService
+from crmApp.services.tool_projections import InvalidToolCursor, get_projection
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +23,11 @@ def register_lead_tools(mcp):
         search: Optional[str] = None,
         assigned_to: Optional[int] = None,
         is_converted: Optional[bool] = None,
-        limit: int = 20
-    ) -> List[Dict[str, Any]]:
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        List leads with filtering options.
+        List leads with filtering options, one page at a time (pass next_cursor back as cursor).
         
         Args:
             status: Filter by status (active, inactive, all)
@@ -34,9 +37,10 @@ def register_lead_tools(mcp):
             assigned_to: Filter by assigned employee ID
             is_converted: Filter by conversion status (true/false)
             limit: Maximum number of results (default: 20, max: 100)
+            cursor: next_cursor of the previous page
         
         Returns:
-            List of lead objects
+            {"leads": compact lead rows, "count", "more_available", "next_cursor"}
         """
         try:
             mcp.check_permission('lead', 'read')
@@ -63,21 +67,16 @@ def register_lead_tools(mcp):
                 queryset = queryset.filter(is_converted=is_converted)
             
             if search:
-                from django.db.models import Q
-                queryset = queryset.filter(
-                    Q(name__icontains=search) |
-                    Q(email__icontains=search) |
-                    Q(organization_name__icontains=search)
+                queryset = SearchIndexService.filter_queryset(
+                    queryset, search, [org_id],
+                    fallback_fields=['name', 'email', 'organization_name']
                 )
             
-            limit = min(limit, 100)
-            queryset = queryset.select_related('assigned_to')[:limit]
-            
-            serializer = LeadListSerializer(queryset, many=True)
-            logger.info(f"Retrieved {len(serializer.data)} leads for org {org_id}")
-            return serializer.data
+            result = get_projection('list_leads').page(queryset, limit, cursor)
+            logger.info(f"Retrieved {result['count']} leads for org {org_id}")
+            return result
             
-        except PermissionError as e:
+        except (PermissionError, InvalidToolCursor) as e:
             return {"error": str(e)}
         except Exception as e:
             logger.error(f"Error listing leads: {str(e)}", exc_info=True)
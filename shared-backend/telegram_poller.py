@@ -12,12 +12,15 @@ load_dotenv()
 BOT_TOKEN = os.getenv('TG_BOT_TOKEN')
 BACKEND_URL = 'http://localhost:8000/api/telegram/webhook/'
 
+# Reused for every call so connections to Telegram and the backend stay open
+session = requests.Session()
+
 def get_updates(offset=None):
     """Get updates from Telegram"""
     url = f'https://api.telegram.org/bot{BOT_TOKEN}/getUpdates'
     params = {'timeout': 30, 'offset': offset}
     try:
-        response = requests.get(url, params=params, timeout=35)
+        response = session.get(url, params=params, timeout=35)
         return response.json()
     except Exception as e:
         print(f'Error getting updates: {e}')
@@ -26,7 +29,7 @@ def get_updates(offset=None):
 def forward_to_backend(update):
     """Forward update to Django backend"""
     try:
-        response = requests.post(BACKEND_URL, json=update, timeout=10)
+        response = session.post(BACKEND_URL, json=update, timeout=10)
         if response.status_code == 200:
             try:
                 print(f'[OK] Processed update {update["update_id"]}')
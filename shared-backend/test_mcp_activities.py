@@ -199,8 +199,9 @@ def test_mcp_list_activities():
                     print(f"   ❌ ERROR: {result1['error']}")
                     return False
                 
-                if isinstance(result1, list):
-                    count1 = len(result1)
+                if isinstance(result1, dict) and 'activities' in result1:
+                    activities1 = result1['activities']
+                    count1 = len(activities1)
                     print(f"   📊 Returned {count1} activities")
                     
                     if count1 == 0:
@@ -214,7 +215,7 @@ def test_mcp_list_activities():
                     # Show first few results
                     if count1 > 0:
                         print(f"\n   First {min(3, count1)} activity/activities returned:")
-                        for idx, act in enumerate(result1[:3], 1):
+                        for idx, act in enumerate(activities1[:3], 1):
                             if isinstance(act, dict):
                                 title = act.get('title', 'N/A')
                                 act_type = act.get('activity_type', 'N/A')
@@ -244,8 +245,13 @@ def test_mcp_list_activities():
                     print(f"   ❌ ERROR: {result2['error']}")
                     return False
                 
-                if isinstance(result2, list):
-                    count2 = len(result2)
+                if isinstance(result2, dict) and 'activities' in result2:
+                    # Follow next_cursor until the last page
+                    activities2 = list(result2['activities'])
+                    while result2.get('more_available'):
+                        result2 = await call_list_activities(limit=100, cursor=result2['next_cursor'])
+                        activities2.extend(result2.get('activities', []))
+                    count2 = len(activities2)
                     print(f"   📊 Returned {count2} activities")
                     
                     if count2 == total_activities:
@@ -261,7 +267,7 @@ def test_mcp_list_activities():
                         print(f"\n   Activity summary:")
                         by_type = {}
                         by_status = {}
-                        for act in result2:
+                        for act in activities2:
                             if isinstance(act, dict):
                                 act_type = act.get('activity_type', 'unknown')
                                 status = act.get('status', 'unknown')
@@ -50,7 +50,8 @@ async def test():
         try:
             result = list_leads_tool.function()
             print(f"  Result type: {type(result)}")
-            print(f"  Result length: {len(result) if isinstance(result, (list, dict)) else 'N/A'}")
+            print(f"  Leads returned: {result.get('count', 'N/A') if isinstance(result, dict) else 'N/A'}")
+            print(f"  More available: {result.get('more_available') if isinstance(result, dict) else 'N/A'}")
             print(f"  Result: {result}")
         except Exception as e:
             print(f"  ERROR: {e}")